@@ -85,6 +85,9 @@ function App() {
     const [userLocation, setUserLocation] = useState(null);
     const [userLocationAvailable, setUserLocationAvailable] = useState(false);
 
+    // Transient objects from the last fetch, kept up to date with only the changes since its snapshot
+    const transientCache = useRef({ types: "", snapshots: {}, objects: new Map() });
+
     useEffect(() => {
         if ("geolocation" in navigator) {
             navigator.geolocation.getCurrentPosition(
@@ -162,6 +165,40 @@ function App() {
         return R * c; // Distance in km
     }
 
+    const fetchTransientData = async (types) => {
+        const cache = transientCache.current;
+        if (cache.types !== types) {
+            cache.types = types;
+            cache.snapshots = {};
+            cache.objects = new Map();
+        }
+
+        // Each object type's own snapshot, so that one lagging behind the others isn't resent in full
+        const since = Object.entries(cache.snapshots)
+            .filter(([, snapshot]) => snapshot !== null)
+            .map(([objectType, snapshot]) => `${objectType}:${snapshot}`)
+            .join(",");
+        const response = await fetch(`${TRANSIENT_DATA_API}?objectType=${types}&since=${since || 0}`);
+        if (!response.ok) throw new Error("Network response was not ok");
+        const delta = await response.json();
+
+        // Object types sent in full replace what was held for them; otherwise apply the changes
+        for (const [objectID, item] of cache.objects) {
+            if (delta.full.includes(item.objectType)) {
+                cache.objects.delete(objectID);
+            }
+        }
+        for (const objectID of delta.removed) {
+            cache.objects.delete(objectID);
+        }
+        for (const item of delta.items) {
+            cache.objects.set(item.objectID, item);
+        }
+        cache.snapshots = delta.snapshots;
+
+        return Array.from(cache.objects.values());
+    };
+
     const fetchData = async (enabledSources, numberInputValue) => {
         if (numberInputValue <= 0) {
             numberInputValue = undefined;
@@ -186,7 +223,7 @@ function App() {
             const requests = [];
             if (transientTypes.length) {
                 requests.push(
-                    fetch(`${TRANSIENT_DATA_API}?objectType=${transientTypes.join(",")}`).then(res => res.json())
+                    fetchTransientData(transientTypes.join(","))
                 );
             }
             if (permanentTypes.length) {
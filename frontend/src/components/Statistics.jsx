@@ -21,7 +21,8 @@ const Statistics = () => {
     useEffect(() => {
         const fetchTransientData = async () => {
             try {
-                const transientResponse = await fetch("https://281bc6mcm5.execute-api.us-east-1.amazonaws.com/transient_data");
+                // Only the attributes summarised below are read and sent
+                const transientResponse = await fetch("https://281bc6mcm5.execute-api.us-east-1.amazonaws.com/transient_data?fields=objectType,trainTypeFull,trainStatusFull,trainPunctualityStatus");
                 if (!transientResponse.ok) throw new Error("Network response was not ok");
                 const transientData = await transientResponse.json();
 
@@ -58,10 +59,11 @@ const Statistics = () => {
     useEffect(() => {
         const fetchCoordinates = async () => {
             try {
-                const coordsResponse = await fetch("https://kc0re7ep0b.execute-api.us-east-1.amazonaws.com/return_all_coordinates");
+                // Pre-binned [latitude, longitude, count] cells of the latest snapshot
+                const coordsResponse = await fetch("https://kc0re7ep0b.execute-api.us-east-1.amazonaws.com/return_all_coordinates?precision=5");
                 if (!coordsResponse.ok) throw new Error("Network response was not ok");
                 const coordsData = await coordsResponse.json();
-                setCoordinates(coordsData["coordinates"]);
+                setCoordinates(coordsData["cells"]);
             } catch (err) {
                 setError("Failed to fetch heatmap data");
             } finally {
@@ -81,8 +83,8 @@ const Statistics = () => {
                 const data = await response.json();
 
                 const formattedData = data.map(item => ({
-                    time: new Date(parseInt(item.timestamp) * 1000).toLocaleString(),
-                    punctuality: parseFloat(item.average_punctuality)
+                    time: new Date(item.timestamp * 1000).toLocaleString(),
+                    punctuality: Number(item.average_punctuality)
                 }));
 
                 setPunctualityData(formattedData);
@@ -10,10 +10,12 @@ const Heatmap = ({ data }) => {
     useEffect(() => {
         if (!map || data.length === 0) return;
 
+        // Scale intensities to the densest cell
         const heatmapLayer = L.heatLayer(data, {
             radius: 20,
             blur: 15,
             maxZoom: 17,
+            max: Math.max(...data.map((point) => point[2] ?? 1)),
         }).addTo(map);
 
         return () => {
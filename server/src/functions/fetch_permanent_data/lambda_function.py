@@ -1,21 +1,23 @@
 import json
 import csv
-import xmltodict
 import requests
 import zipfile
 import io
 import os
-import boto3
 from concurrent.futures import ThreadPoolExecutor
+from shared.geohash import add_geohash
+from shared.irishrail_xml import iter_stations
+from shared.storage import get_table
+from shared.storage import schemas
 
 # Create a reusable session for requests
 session = requests.Session()
 
-# Setup DynamoDB client for Lambda
-os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
-dynamodb = boto3.resource("dynamodb")
+# Setup the table on the configured storage backend
 table_name = os.environ.get("DYNAMODB_TABLE", "permanent_data")
-table = dynamodb.Table(table_name)
+table = get_table(table_name, schemas.permanent_data)
+version_table = get_table(os.environ.get("VERSION_TABLE", "dataset_versions"), schemas.dataset_versions)
+bulk_write_workers = int(os.environ.get("BULK_WRITE_WORKERS", 8))
 
 irishrail_url = "http://api.irishrail.ie/realtime/realtime.asmx/"
 
@@ -30,21 +32,7 @@ def fetch_train_stations_with_type():
     stations = []
     for station_type in station_types:
         response = session.get(irishrail_url + f"getAllStationsXML_WithStationType?StationType={station_type}")
-        stations_xml = response.text
-        stations_json = xmltodict.parse(stations_xml)
-
-        for station in stations_json["ArrayOfObjStation"]["objStation"]:
-            stations.append({
-                "objectID": "IrishRailStation-" + station["StationCode"],
-                "objectType": "IrishRailStation",
-                "latitude": station["StationLatitude"],
-                "longitude": station["StationLongitude"],
-                "trainStationID": station["StationId"],
-                "trainStationCode": station["StationCode"],
-                "trainStationAlias": station.get("StationAlias", ""),
-                "trainStationDesc": station["StationDesc"],
-                "trainStationType": station_type
-            })
+        stations.extend(iter_stations(response.text, station_type))
     return stations
 
 def fetch_train_stations():
@@ -55,19 +43,7 @@ def fetch_train_stations():
         list: A list of dictionaries containing train station data.
     """
     response = session.get(irishrail_url + "getAllStationsXML")
-    stations_xml = response.text
-    stations_json = xmltodict.parse(stations_xml)
-    stations = [{
-        "objectID": "IrishRailStation-" + station["StationCode"],
-        "objectType": "IrishRailStation",
-        "latitude": station["StationLatitude"],
-        "longitude": station["StationLongitude"],
-        "trainStationID": station["StationId"],
-        "trainStationCode": station["StationCode"],
-        "trainStationAlias": station.get("StationAlias", ""),
-        "trainStationDesc": station["StationDesc"]
-    } for station in stations_json["ArrayOfObjStation"]["objStation"]]
-    return stations
+    return list(iter_stations(response.text))
 
 def fetch_luas():
     """
@@ -291,10 +267,23 @@ def batch_upload_to_dynamodb(data):
 
     Args:
         data (list): A list of dictionaries containing data to be uploaded.
+
+    Returns:
+        dict: The number of items written, retries made, seconds taken and items per second.
+    """
+    return table.put_batch(data, workers=bulk_write_workers)
+
+def bump_dataset_versions(object_types):
     """
-    with table.batch_writer() as batch:
-        for item in data:
-            batch.put_item(Item=item)
+    Bumps the dataset version of each objectType that was loaded, and of the table as a whole,
+    so that return_permanent_data reloads its cached copies and clients' ETags change.
+
+    Args:
+        object_types (iterable): The objectTypes that were loaded.
+    """
+    for object_type in sorted(set(object_types)):
+        version_table.increment({"dataset": f"permanent_data#{object_type}"}, {"version": 1})
+    version_table.increment({"dataset": "permanent_data"}, {"version": 1})
 
 def lambda_handler(event, context):
     """
@@ -319,6 +308,10 @@ def lambda_handler(event, context):
         for future in futures:
             data.extend(future.result())
 
+    # Index each item by position so that return_permanent_data can answer bounding box queries
+    for item in data:
+        add_geohash(item)
+
     print(f"Retrieved {len(data)} records.")
     print("Uploading to DynamoDB...")
     # chunk_size = 25
@@ -326,6 +319,7 @@ def lambda_handler(event, context):
     #     batch_upload_to_dynamodb(data[i:i + chunk_size])
 
     batch_upload_to_dynamodb(data)
+    bump_dataset_versions(item["objectType"] for item in data)
 
     print("Upload completed.")
 
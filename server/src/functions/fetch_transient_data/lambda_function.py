@@ -1,120 +1,157 @@
 import json
-import csv
-import xmltodict
 import requests
 import os
-import boto3
 import time
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import struct
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
-import re
+from google.transit import gtfs_realtime_pb2
+from shared.geohash import add_geohash
+from shared.heatmap import bin_items
+from shared.irishrail_xml import iter_trains
+from shared.punctuality import average_punctuality, punctuality_attributes
+from shared.blob_store import get_blob_store
+from shared.snapshots import (
+    fingerprint, artifact_key, columnar_artifact_key, render_snapshot, render_columnar_snapshot, combined_artifact_name,
+    objects_chunks, load_objects
+)
+from shared.storage import get_table
+from shared.storage import schemas
+
 # Create a reusable session for requests
 session = requests.Session()
 
-# Setup DynamoDB client
-os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
-dynamodb = boto3.resource("dynamodb")
+# Setup tables on the configured storage backend
 table_name = os.environ.get("DYNAMODB_TABLE", "transient_data2")
-table = dynamodb.Table(table_name)
-
-timestamp = int(time.time())
+table = get_table(table_name, schemas.transient_data)
+bulk_write_workers = int(os.environ.get("BULK_WRITE_WORKERS", 8))
+snapshot_table_name = os.environ.get("SNAPSHOT_TABLE", "transient_snapshots")
+snapshot_table = get_table(snapshot_table_name, schemas.transient_snapshots)
+heatmap_table = get_table(os.environ.get("HEATMAP_TABLE", "transient_heatmaps"), schemas.transient_heatmaps)
+history_table = get_table(os.environ.get("SNAPSHOT_HISTORY_TABLE", "transient_snapshot_history"), schemas.transient_snapshot_history)
+objects_table = get_table(os.environ.get("SNAPSHOT_OBJECTS_TABLE", "transient_snapshot_objects"), schemas.transient_snapshot_objects)
+punctuality_table = get_table(os.environ.get("PUNCTUALITY_TABLE", "punctuality_by_objectID"), schemas.punctuality_by_objectID)
+version_table = get_table(os.environ.get("VERSION_TABLE", "dataset_versions"), schemas.dataset_versions)
+
+# Store for pre-rendered snapshot bodies, or None if artifacts aren't published
+blob_store = get_blob_store()
+
+# Object types written by each ingest, each of which gets its own commit marker
+object_types = ["IrishRailTrain", "Bus"]
+train_types = ["M", "S", "D"]
+
+# Number of upstream sources fetched for each objectType
+source_counts = {"IrishRailTrain": len(train_types), "Bus": 1}
+
+# Item attribute holding the source suffix of objectTypes fetched from several sources, e.g. trainType M of IrishRailTrain-M
+source_attributes = {"IrishRailTrain": "trainType"}
+
+# Per-request timeout for each upstream source and overall deadline for fetching, in seconds
+source_timeout = float(os.environ.get("SOURCE_TIMEOUT", 10))
+ingest_deadline = float(os.environ.get("INGEST_DEADLINE", 20))
+
+# Punctuality lookup cached across invocations in a warm container.
+# Once the TTL expires, the cached lookup is only reloaded if its dataset version has changed.
+punctuality_cache_ttl = float(os.environ.get("PUNCTUALITY_CACHE_TTL", 300))
+punctuality_cache = {"data": None, "version": None, "expires": 0}
+punctuality_cache_lock = threading.Lock()
+
+# Objects of the last committed snapshot of each objectType, cached in a warm container.
+# Maps objectType -> {"timestamp": int, "objects": {objectID: [baseTimestamp, fingerprint, geohashPrefix]}}
+previous_snapshots = {}
+
+# Unchanged objects are carried forward by reference for at most this many seconds before
+# being rewritten in full, so that references never point past the table's retention
+delta_max_age = int(os.environ.get("DELTA_MAX_AGE", 3600))
+
+# How long the objects of each snapshot are kept for return_transient_data to answer since requests against, in seconds.
+# Rows carry an expiresAt attribute for the table's TTL
+snapshot_history_retention = int(os.environ.get("SNAPSHOT_HISTORY_RETENTION", 3600))
+
+# How long the objects listed by each commit marker are kept, in seconds. Readers resolve the current marker's objects,
+# so this only has to outlast the gap between two commits; items carry an expiresAt attribute for the table's TTL
+snapshot_objects_retention = int(os.environ.get("SNAPSHOT_OBJECTS_RETENTION", 86400))
 
 # API URLs
 irishrail_url = "http://api.irishrail.ie/realtime/realtime.asmx/"
-punctuality_api_url = "https://fv7l6v5he4.execute-api.us-east-1.amazonaws.com/return_punctuality_by_objectID"
+gtfsr_urls = {
+    "json": "https://api.nationaltransport.ie/gtfsr/v2/Vehicles?format=json",
+    "protobuf": "https://api.nationaltransport.ie/gtfsr/v2/Vehicles"
+}
+
+# Format of the GTFS-Realtime vehicles feed to request: json or protobuf
+gtfs_format = os.environ.get("GTFS_FORMAT", "json")
 
 def fetch_punctuality_data():
     """
-    Fetches punctuality data for trains from an external API.
+    Fetches punctuality data for trains directly from the punctuality_by_objectID table.
+
     Returns:
         dict: A dictionary mapping objectID to average punctuality.
     """
-    response = session.get(punctuality_api_url)
-    response.raise_for_status()
-    punctuality_data = response.json()
-    return {item["objectID"]: round(float(item["average_punctuality"])) for item in punctuality_data}
+    items = punctuality_table.scan(projection=["objectID", *punctuality_attributes])
+    averages = {item["objectID"]: average_punctuality(item)[0] for item in items}
+    return {object_id: round(average) for object_id, average in averages.items() if average is not None}
 
-def fetch_trains():
+def fetch_punctuality_version():
     """
-    Fetches train data from the Irish Rail API and parses additional attributes.
+    Fetches the current version of the punctuality_by_objectID dataset, bumped by update_average_punctuality.
+
+    Returns:
+        int: The dataset version, or None if it is unavailable.
+    """
+    try:
+        item = version_table.get({"dataset": "punctuality_by_objectID"})
+    except Exception as e:
+        print(f"Failed to fetch punctuality version: {e}")
+        return None
+
+    if item is None:
+        return None
+    return int(item["version"])
+
+def get_punctuality_data():
+    """
+    Returns the punctuality lookup, loading it at most once per TTL in a warm container.
+    Concurrent callers share a single load.
+
+    Returns:
+        dict: A dictionary mapping objectID to average punctuality.
+    """
+    with punctuality_cache_lock:
+        now = time.time()
+        if punctuality_cache["data"] is not None and now < punctuality_cache["expires"]:
+            return punctuality_cache["data"]
+
+        version = fetch_punctuality_version()
+        if punctuality_cache["data"] is None or version is None or version != punctuality_cache["version"]:
+            print("Loading punctuality data.")
+            punctuality_cache["data"] = fetch_punctuality_data()
+            punctuality_cache["version"] = version
+
+        punctuality_cache["expires"] = now + punctuality_cache_ttl
+        return punctuality_cache["data"]
+
+def fetch_trains_by_type(train_type, timestamp):
+    """
+    Fetches the trains of a single train type from the Irish Rail API and parses additional attributes.
+
+    Args:
+        train_type (str): The Irish Rail train type code (M, S or D).
+        timestamp (int): The snapshot epoch to stamp on each train.
 
     Returns:
         list: A list of dictionaries containing processed train data.
     """
-    print("Fetching Irish Rail data.")
     api_function = "getCurrentTrainsXML_WithTrainType?TrainType="
-    train_types = ["M", "S", "D"]
-    trains = []
-
-    for train_type in train_types:
-        response = session.get(irishrail_url + api_function + train_type)
-        response.raise_for_status()
-
-        trains_xml = response.text
-        trains_json = xmltodict.parse(trains_xml)
-
-        punctuality_data = fetch_punctuality_data()
-
-        for train in trains_json["ArrayOfObjTrainPositions"].get("objTrainPositions", []):
-            train_code = str(train["TrainCode"])
-            train_status = train["TrainStatus"]
-            public_message = train["PublicMessage"]
-            avg_punctuality = punctuality_data.get("IrishRailTrain-" + train_code, 0)  # Default to 0 if not found
-
-            split_message = public_message.split("\\n")
-            trainDetails = split_message[1].split("(")[0]
-            trainUpdate = split_message[2]
-
-            # Regex to extract punctuality: Matches positive/negative number followed by "mins late"
-            match = re.search(r"(-?\d+)\s+mins\s+late", public_message)
-            punctuality = int(match.group(1)) if match else 0  # Default to 0 if no match
-
-            if punctuality < 0:
-                punctuality_status = "early"
-                lateness_message = f"{-punctuality} minute{'s' if punctuality != -1 else ''} early"
-            elif punctuality == 0:
-                punctuality_status = "on-time"
-                lateness_message = "On time"
-            else:
-                punctuality_status = "late"
-                lateness_message = f"{punctuality} minute{'s' if punctuality != 1 else ''} late"
-
-            train_type_full = {
-                "M": "Mainline",
-                "S": "Suburban",
-                "D": "DART"
-            }.get(train_type, "Unknown")
-
-            train_status_full = {
-                "R": "Running",
-                "T": "Terminated",
-                "N": "Not yet running"
-            }.get(train_status, "Unknown")
-
-            trains.append({
-                "objectID": "IrishRailTrain-" + train_code,
-                "objectType": "IrishRailTrain",
-                "timestamp": timestamp,
-                "latitude": str(train["TrainLatitude"]),
-                "longitude": str(train["TrainLongitude"]),
-                "trainCode": train_code,
-                "trainType": train_type,
-                "trainTypeFull": train_type_full,
-                "trainStatus": train_status,
-                "trainStatusFull": train_status_full,
-                "trainDate": str(train["TrainDate"]),
-                "trainPublicMessage": public_message,
-                "trainDirection": train["Direction"],
-                "trainPunctuality": punctuality,
-                "trainPunctualityStatus": punctuality_status,
-                "latenessMessage": lateness_message,
-                "trainDetails":  trainDetails,
-                "trainUpdate": trainUpdate,
-                "averagePunctuality": avg_punctuality
-            })
-
-    return trains
 
+    response = session.get(irishrail_url + api_function + train_type, timeout=source_timeout)
+    response.raise_for_status()
+
+    punctuality_data = get_punctuality_data()
+
+    return list(iter_trains(response.text, train_type, timestamp, punctuality_data))
 
 def fetch_bus_routes():
     """
@@ -124,65 +161,449 @@ def fetch_bus_routes():
         list: A list of dictionaries containing bus route data.
     """
     permanent_data_api = os.environ["PERMANENT_DATA_API"]
-    response = session.get(permanent_data_api + "?objectType=BusRoute")
+    response = session.get(permanent_data_api + "?objectType=BusRoute", timeout=source_timeout)
     response.raise_for_status()
     return response.json()
 
-def fetch_buses():
+def decode_buses_json(buses_json):
+    """
+    Decodes the vehicle positions of the JSON GTFS-Realtime feed.
+
+    Args:
+        buses_json (dict): The decoded JSON feed.
+
+    Yields:
+        tuple: The vehicle ID, route ID, trip ID, start time, start date, schedule relationship,
+        direction, latitude and longitude of each bus, all as strings.
+    """
+    for bus in buses_json["entity"]:
+        trip = bus["vehicle"]["trip"]
+        position = bus["vehicle"]["position"]
+        yield (
+            str(bus["id"]),
+            str(trip["route_id"]),
+            str(trip["trip_id"]),
+            str(trip["start_time"]),
+            str(trip["start_date"]),
+            str(trip["schedule_relationship"]),
+            str(trip["direction_id"]),
+            str(position["latitude"]),
+            str(position["longitude"])
+        )
+
+# A float32 has at most 9 significant digits, and never needs fewer than 6
+pack_float32 = struct.Struct("f").pack
+float32_formats = ("%.6g", "%.7g", "%.8g", "%.9g")
+
+def float32_to_str(value):
     """
-    Fetches bus data from the National Transport API.
+    Formats a protobuf float32 field the way the JSON feed does, i.e. as the shortest decimal
+    that round-trips to the same float32, rather than the full expansion of its float64 value.
+
+    Args:
+        value (float): The float32 value as read from protobuf.
+
+    Returns:
+        str: The shortest representation of the value.
+    """
+    packed = pack_float32(value)
+    for float_format in float32_formats:
+        number = float(float_format % value)
+        if pack_float32(number) == packed:
+            return repr(number)
+    return repr(value)
+
+# Names of the TripDescriptor.ScheduleRelationship enum values, as rendered in the JSON feed
+schedule_relationships = {
+    value.number: value.name for value in gtfs_realtime_pb2.TripDescriptor.ScheduleRelationship.DESCRIPTOR.values
+}
+
+def decode_buses_protobuf(content):
+    """
+    Decodes the vehicle positions of the protobuf GTFS-Realtime feed.
+
+    Args:
+        content (bytes): The serialized FeedMessage.
+
+    Yields:
+        tuple: The same fields as decode_buses_json, formatted identically.
+    """
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(content)
+
+    for bus in feed.entity:
+        trip = bus.vehicle.trip
+        position = bus.vehicle.position
+        yield (
+            bus.id,
+            trip.route_id,
+            trip.trip_id,
+            trip.start_time,
+            trip.start_date,
+            schedule_relationships[trip.schedule_relationship],
+            str(trip.direction_id),
+            float32_to_str(position.latitude),
+            float32_to_str(position.longitude)
+        )
+
+def fetch_buses(timestamp):
+    """
+    Fetches bus data from the National Transport API, in the format set by GTFS_FORMAT.
+
+    Args:
+        timestamp (int): The snapshot epoch to stamp on each bus.
 
     Returns:
         list: A list of dictionaries containing bus data.
     """
     print("Fetching bus data.")
     buses = []
-    api_url = "https://api.nationaltransport.ie/gtfsr/v2/Vehicles?format=json"
     headers = {
         "Cache-Control": "no-cache",
         "x-api-key": os.getenv("GTFS_KEY")
     }
 
-    response = session.get(api_url, headers=headers)
+    response = session.get(gtfsr_urls[gtfs_format], headers=headers, timeout=source_timeout)
     response.raise_for_status()
-    buses_json = response.json()
+    if gtfs_format == "protobuf":
+        decoded_buses = decode_buses_protobuf(response.content)
+    else:
+        decoded_buses = decode_buses_json(response.json())
 
     bus_routes_list = fetch_bus_routes()
     bus_routes_hashmap = {route["busRouteID"]: route for route in bus_routes_list if "busRouteID" in route}
 
-    for bus in buses_json["entity"]:
-        busRouteID = str(bus["vehicle"]["trip"]["route_id"])
-        route_info = bus_routes_hashmap.get(busRouteID, {})
+    for bus_id, route_id, trip_id, start_time, start_date, schedule_relationship, direction, latitude, longitude in decoded_buses:
+        route_info = bus_routes_hashmap.get(route_id, {})
         buses.append({
-            "objectID": "Bus-" + bus["id"],
+            "objectID": "Bus-" + bus_id,
             "objectType": "Bus",
             "timestamp": timestamp,
-            "latitude": str(bus["vehicle"]["position"]["latitude"]),
-            "longitude": str(bus["vehicle"]["position"]["longitude"]),
-            "busID": str(bus["id"]),
-            "busTripID": str(bus["vehicle"]["trip"]["trip_id"]),
-            "busStartTime": str(bus["vehicle"]["trip"]["start_time"]),
-            "busStartDate": str(bus["vehicle"]["trip"]["start_date"]),
-            "busScheduleRelationship": str(bus["vehicle"]["trip"]["schedule_relationship"]),
-            "busRoute": busRouteID,
+            "latitude": latitude,
+            "longitude": longitude,
+            "busID": bus_id,
+            "busTripID": trip_id,
+            "busStartTime": start_time,
+            "busStartDate": start_date,
+            "busScheduleRelationship": schedule_relationship,
+            "busRoute": route_id,
             "busRouteAgencyName": route_info.get("busRouteAgencyName", ""),
             "busRouteLongName": route_info.get("busRouteLongName", ""),
             "busRouteShortName": route_info.get("busRouteShortName", ""),
-            "busDirection": str(bus["vehicle"]["trip"]["direction_id"]),
+            "busDirection": direction,
         })
 
     return buses
 
+def fetch_all_sources(timestamp):
+    """
+    Fetches every upstream source concurrently, bounded by the overall ingest deadline.
+    Sources that fail or miss the deadline are reported as missing rather than failing the ingest.
+
+    Args:
+        timestamp (int): The snapshot epoch to stamp on each item.
+
+    Returns:
+        tuple: A list of the items fetched and a dictionary mapping each objectType to its missing sources.
+    """
+    # Each source is named after the objectType it produces so that partial results can be tagged
+    sources = {f"IrishRailTrain-{train_type}": (fetch_trains_by_type, train_type, timestamp) for train_type in train_types}
+    sources["Bus"] = (fetch_buses, timestamp)
+
+    executor = ThreadPoolExecutor(max_workers=len(sources))
+    futures = {executor.submit(*source): name for name, source in sources.items()}
+    done, not_done = wait(futures, timeout=ingest_deadline)
+
+    data = []
+    missing_sources = {object_type: [] for object_type in object_types}
+    for future, name in futures.items():
+        object_type = name.split("-")[0]
+        if future in not_done:
+            print(f"Source {name} missed the {ingest_deadline}s ingest deadline.")
+            missing_sources[object_type].append(name)
+        elif future.exception() is not None:
+            print(f"Source {name} failed: {future.exception()}")
+            missing_sources[object_type].append(name)
+        else:
+            data.extend(future.result())
+
+    # Don't block on sources that are still running; their request timeouts will end them
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    return data, missing_sources
+
 def batch_upload_to_dynamodb(data):
     """
-    Uploads data to DynamoDB in batches.
+    Uploads data to the transient data table in batches.
 
     Args:
         data (list): A list of dictionaries containing data to be uploaded.
+
+    Returns:
+        dict: The number of items written, retries made, seconds taken and items per second.
+    """
+    return table.put_batch(data, workers=bulk_write_workers)
+
+def fetch_previous_objects(object_type):
+    """
+    Fetches the per-object base timestamps and fingerprints of the last committed snapshot of an objectType.
+    The warm-container copy is used if it is still the committed snapshot, otherwise the marker's objects are read.
+    If they have expired, every object is treated as new and so rewritten in full.
+
+    Args:
+        object_type (str): The objectType to look up.
+
+    Returns:
+        dict: A dictionary mapping objectID to [baseTimestamp, fingerprint, ...].
     """
-    with table.batch_writer() as batch:
-        for item in data:
-            batch.put_item(Item=item)
+    committed = snapshot_table.get({"objectType": object_type})
+    if committed is None:
+        return {}
+
+    cached = previous_snapshots.get(object_type)
+    if cached and cached["timestamp"] == int(committed["timestamp"]):
+        return cached["objects"]
+
+    try:
+        objects = load_objects(objects_table, committed).get("objects", {})
+    except RuntimeError as e:
+        print(f"{e}; rewriting every {object_type} object.")
+        return {}
+    return {object_id: [int(entry[0])] + list(entry[1:]) for object_id, entry in objects.items()}
+
+def fetch_missing_source_items(data, missing_sources):
+    """
+    Carries forward the objects of the previous snapshot whose source is missing from this one, so that a single failed
+    source doesn't make its objects look removed. Their stored rows are returned with the timestamp they were written under.
+    An objectType whose sources are all missing isn't committed, so its objects don't need carrying.
+
+    Args:
+        data (list): The items fetched for the snapshot.
+        missing_sources (dict): A dictionary mapping each objectType to its missing sources.
+
+    Returns:
+        list: The stored items of the objects to carry forward.
+    """
+    present = {item["objectID"] for item in data}
+    carried = []
+    for object_type, missing in missing_sources.items():
+        attribute = source_attributes.get(object_type)
+        if not missing or attribute is None or len(missing) >= source_counts.get(object_type, 1):
+            continue
+
+        # Only the absent objects can be from a missing source; their rows say which source they came from
+        keys = [{"objectID": object_id, "timestamp": entry[0]}
+                for object_id, entry in fetch_previous_objects(object_type).items() if object_id not in present]
+        for item in table.get_many(keys):
+            if f"{object_type}-{item.get(attribute)}" in missing:
+                carried.append(item)
+    return carried
+
+def split_changed_items(timestamp, data):
+    """
+    Compares each item with the previous snapshot of its objectType, so that only changed objects are written in full.
+    Unchanged objects keep the base timestamp of their last full write, unless it is older than DELTA_MAX_AGE.
+    Items carried forward from a missing source keep the timestamp they were written under.
+    Objects that have left the snapshot get a removal row, so that return_historical_data knows where their last row stops holding.
+
+    Args:
+        timestamp (int): The snapshot epoch.
+        data (list): The items of the snapshot.
+
+    Returns:
+        tuple: The list of items and removal rows to write and a dictionary mapping each objectType to its snapshot objects.
+    """
+    previous = {object_type: fetch_previous_objects(object_type) for object_type in {item["objectType"] for item in data}}
+    snapshot_objects = {object_type: {} for object_type in object_types}
+    changed_items = []
+
+    for item in data:
+        object_fingerprint = fingerprint(item)
+        previous_object = previous[item["objectType"]].get(item["objectID"])
+
+        if previous_object and int(item["timestamp"]) != timestamp:
+            # Carried forward from a missing source, so its row and entry are unchanged
+            base_timestamp, object_fingerprint = previous_object[0], previous_object[1]
+        elif previous_object and previous_object[1] == object_fingerprint and timestamp - previous_object[0] <= delta_max_age:
+            base_timestamp = previous_object[0]
+        else:
+            base_timestamp = timestamp
+            changed_items.append(item)
+
+        # Record the geohash prefix so that readers can pick out the carried objects in a bounding box
+        entry = [base_timestamp, object_fingerprint]
+        if "geohashPrefix" in item:
+            entry.append(item["geohashPrefix"])
+        snapshot_objects.setdefault(item["objectType"], {})[item["objectID"]] = entry
+
+    # Removal rows have no objectType or geohashPrefix, so they stay out of the indexes the snapshot readers query
+    for object_type, objects in previous.items():
+        for object_id in objects:
+            if object_id not in snapshot_objects[object_type]:
+                changed_items.append({"objectID": object_id, "timestamp": timestamp, "removed": True})
+
+    return changed_items, snapshot_objects
+
+def put_artifacts(key, items):
+    """
+    Writes the row and columnar renderings of a snapshot to the blob store.
+
+    Args:
+        key (str): The blob key of the row rendering.
+        items (list): The items of the snapshot.
+    """
+    blob_store.put(key, render_snapshot(items))
+    blob_store.put(columnar_artifact_key(key), render_columnar_snapshot(items))
+
+def publish_artifacts(timestamp, data, committed_types):
+    """
+    Renders the snapshot of each committed objectType, and of every objectType together when all are committed,
+    into compressed response bodies that the read endpoints can serve verbatim.
+    Artifacts are keyed by timestamp and written before the markers that reference them, so a reader never sees a marker
+    pointing at a missing or partial artifact.
+
+    Args:
+        timestamp (int): The snapshot epoch.
+        data (list): The items of the snapshot, including unchanged objects.
+        committed_types (list): The objectTypes whose snapshots are about to be committed.
+
+    Returns:
+        dict: A dictionary mapping each objectType to the artifact keys to record in its marker.
+    """
+    if blob_store is None:
+        return {}
+
+    items_by_type = {object_type: [] for object_type in committed_types}
+    for item in data:
+        if item["objectType"] in items_by_type:
+            items_by_type[item["objectType"]].append(item)
+
+    artifact_keys = {}
+    for object_type, items in items_by_type.items():
+        key = artifact_key(object_type, timestamp)
+        put_artifacts(key, items)
+        artifact_keys[object_type] = {"artifactKey": key}
+
+    if sorted(committed_types) == sorted(object_types):
+        key = artifact_key(combined_artifact_name, timestamp)
+        put_artifacts(key, [item for object_type in object_types for item in items_by_type[object_type]])
+        for object_type in committed_types:
+            artifact_keys[object_type]["combinedArtifactKey"] = key
+
+    return artifact_keys
+
+def publish_heatmaps(timestamp, data, committed_types):
+    """
+    Bins the snapshot of each committed objectType into heatmap cell counts, so that return_all_coordinates
+    can aggregate any window of snapshots from these small grids without reading their items.
+    The grids are written before the markers, so every committed snapshot has one.
+
+    Args:
+        timestamp (int): The snapshot epoch.
+        data (list): The items of the snapshot, including unchanged objects.
+        committed_types (list): The objectTypes whose snapshots are about to be committed.
+    """
+    items_by_type = {object_type: [] for object_type in committed_types}
+    for item in data:
+        if item["objectType"] in items_by_type:
+            items_by_type[item["objectType"]].append(item)
+
+    for object_type, items in items_by_type.items():
+        counts = bin_items(items)
+        heatmap_table.put({"objectType": object_type, "timestamp": timestamp, "itemCount": sum(counts.values()), "cells": dict(counts)})
+
+def publish_history(timestamp, snapshot_objects, committed_types):
+    """
+    Records which objects each committed snapshot contains, so that return_transient_data can tell a client
+    which objects have been removed since a snapshot it already holds.
+    The rows are written before the markers, so every snapshot a reader is handed has one until it expires.
+
+    Args:
+        timestamp (int): The snapshot epoch.
+        snapshot_objects (dict): A dictionary mapping each objectType to its snapshot objects.
+        committed_types (list): The objectTypes whose snapshots are about to be committed.
+    """
+    for object_type in committed_types:
+        history_table.put({
+            "objectType": object_type,
+            "timestamp": timestamp,
+            "objectIDs": sorted(snapshot_objects[object_type]),
+            "expiresAt": timestamp + snapshot_history_retention
+        })
+
+def commit_snapshot(object_type, timestamp, objects, missing_sources=None, artifact_keys=None):
+    """
+    Marks the snapshot of an objectType as completely written so that readers can
+    resolve it with a single GetItem rather than scanning for the newest timestamp.
+    Every object in the snapshot is recorded with the timestamp it was last written under, so readers
+    can fetch unchanged objects from earlier snapshots. They are written to objects_table before the marker,
+    which records only how many items they fill, so it stays the same size however many objects there are.
+
+    The write is conditional so that an overlapping, older invocation can never
+    move the marker backwards.
+
+    Args:
+        object_type (str): The objectType whose snapshot has been written.
+        timestamp (int): The snapshot epoch.
+        objects (dict): A dictionary mapping objectID to [baseTimestamp, fingerprint], followed by its geohashPrefix if it has a position.
+        missing_sources (list): The sources of the objectType that could not be fetched, if any.
+        artifact_keys (dict): The keys of the pre-rendered artifacts of the snapshot, if any.
+
+    Returns:
+        bool: Whether the snapshot was committed.
+    """
+    chunks = objects_chunks(object_type, timestamp, objects, timestamp + snapshot_objects_retention)
+    if chunks:
+        objects_table.put_batch(chunks, workers=bulk_write_workers)
+
+    item = {
+        "objectType": object_type,
+        "timestamp": timestamp,
+        "itemCount": len(objects),
+        "writtenCount": sum(1 for entry in objects.values() if entry[0] == timestamp),
+        "objectChunks": len(chunks),
+        "missingSources": missing_sources or [],
+        "committedAt": int(time.time())
+    }
+    item.update(artifact_keys or {})
+
+    if not snapshot_table.put_if_newer(item, "timestamp"):
+        print(f"Newer {object_type} snapshot already committed; skipping commit of {timestamp}.")
+        return False
+
+    previous_snapshots[object_type] = {"timestamp": timestamp, "objects": objects}
+    return True
+
+def commit_snapshots(timestamp, snapshot_objects, missing_sources=None, data=None):
+    """
+    Writes a commit marker for every objectType in the snapshot, publishing its history, pre-rendered artifacts and heatmap first.
+    An objectType whose sources are all missing is not committed, so readers keep serving its previous snapshot.
+
+    Args:
+        timestamp (int): The snapshot epoch.
+        snapshot_objects (dict): A dictionary mapping each objectType to its snapshot objects.
+        missing_sources (dict): A dictionary mapping each objectType to its missing sources, if any.
+        data (list): The items of the snapshot, to render into artifacts and heatmaps, if any.
+    """
+    missing_sources = missing_sources or {}
+
+    committed_types = []
+    for object_type in snapshot_objects:
+        if len(missing_sources.get(object_type, [])) >= source_counts.get(object_type, 1):
+            print(f"All {object_type} sources are missing; keeping the previous snapshot.")
+            continue
+        committed_types.append(object_type)
+
+    publish_history(timestamp, snapshot_objects, committed_types)
+
+    artifact_keys = {}
+    if data is not None:
+        artifact_keys = publish_artifacts(timestamp, data, committed_types)
+        publish_heatmaps(timestamp, data, committed_types)
+
+    for object_type in committed_types:
+        commit_snapshot(object_type, timestamp, snapshot_objects[object_type],
+                        missing_sources.get(object_type, []), artifact_keys.get(object_type))
 
 def lambda_handler(event, context):
     """
@@ -196,24 +617,33 @@ def lambda_handler(event, context):
         dict: A dictionary containing the status code and message.
     """
     print("Lambda handler triggered; fetching data.")
-    with ThreadPoolExecutor() as executor:
-        futures = [
-            executor.submit(fetch_trains),
-            executor.submit(fetch_buses)
-        ]
-        data = []
-        for future in futures:
-            data.extend(future.result())
+    # Each invocation gets its own snapshot epoch, even in a warm container
+    timestamp = int(time.time())
+
+    data, missing_sources = fetch_all_sources(timestamp)
+    # Index each item by position so that return_transient_data can answer bounding box queries
+    for item in data:
+        add_geohash(item)
+
+    if sum(len(missing) for missing in missing_sources.values()) == sum(source_counts.values()):
+        return {
+            'statusCode': 502,
+            'body': json.dumps({'message': 'No upstream sources could be fetched.', 'missingSources': missing_sources})
+        }
 
     print(f"Retrieved {len(data)} records.")
-    print("Uploading to DynamoDB...")
-    batch_upload_to_dynamodb(data)
+    data += fetch_missing_source_items(data, missing_sources)
+    changed_items, snapshot_objects = split_changed_items(timestamp, data)
+
+    print(f"Uploading {len(changed_items)} changed records to DynamoDB...")
+    batch_upload_to_dynamodb(changed_items)
 
-    print("Upload completed.")
+    print("Upload completed; committing snapshot.")
+    commit_snapshots(timestamp, snapshot_objects, missing_sources, data)
 
     return {
         'statusCode': 200,
-        'body': json.dumps({'message': 'Data uploaded successfully!'})
+        'body': json.dumps({'message': 'Data uploaded successfully!', 'missingSources': missing_sources})
     }
 
 if __name__ == "__main__":
@@ -221,14 +651,6 @@ if __name__ == "__main__":
     Main function to fetch and print data locally.
     """
     load_dotenv()
-
-    with ThreadPoolExecutor() as executor:
-        futures = [
-            executor.submit(fetch_trains),
-            executor.submit(fetch_buses)
-        ]
-        data = []
-        for future in futures:
-            data.extend(future.result())
+    data, missing_sources = fetch_all_sources(int(time.time()))
 
     print(json.dumps(data))
@@ -1,59 +1,228 @@
 import json
 import os
-import boto3
-from boto3.dynamodb.conditions import Attr
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from shared.heatmap import bin_items, coarsen, heatmap_points, heatmap_precision
+from shared.http import compress_response
+from shared.serialization import to_json
+from shared.snapshots import fetch_carried_items, load_objects
+from shared.storage import get_table
+from shared.storage import schemas
+
+gsi_name = "objectType-index"
+snapshot_table_name = os.environ.get("SNAPSHOT_TABLE", "transient_snapshots")
+heatmap_table_name = os.environ.get("HEATMAP_TABLE", "transient_heatmaps")
+objects_table_name = os.environ.get("SNAPSHOT_OBJECTS_TABLE", "transient_snapshot_objects")
+
+# Longest window of snapshots a heatmap may aggregate, in seconds
+heatmap_max_window = int(os.environ.get("HEATMAP_MAX_WINDOW", 86400))
+
+# Object types written by fetch_transient_data
+object_types = ["IrishRailTrain", "Bus"]
+
+
+def fetch_latest_snapshot(table, snapshot_table, object_type):
+    """
+    Resolves the latest committed snapshot of an objectType, falling back to the
+    newest timestamp on the GSI if no snapshot has been committed.
+
+    Args:
+        table: The transient data table.
+        snapshot_table: The table holding snapshot commit markers.
+        object_type (str): The objectType to look up.
+
+    Returns:
+        dict: The snapshot commit marker, or just its timestamp if uncommitted, or None if the objectType has no items.
+    """
+    snapshot = snapshot_table.get({'objectType': object_type})
+    if snapshot is not None:
+        return snapshot
+
+    items = table.query(object_type, index=gsi_name, descending=True, limit=1, projection=['timestamp'])
+    if not items:
+        return None
+    return {'timestamp': items[0]['timestamp']}
+
+
+def fetch_snapshot_positions(table, objects_table, snapshot, object_type):
+    """
+    Retrieves the positions of every item in a snapshot of an objectType, including carried objects.
+
+    Args:
+        table: The transient data table.
+        objects_table: The table holding the objects of each committed snapshot.
+        snapshot (dict): The snapshot commit marker, or just its timestamp if uncommitted.
+        object_type (str): The objectType to retrieve.
+
+    Returns:
+        list: The items, with only their latitude, longitude and geohash.
+    """
+    projection = ['latitude', 'longitude', 'geohash']
+    items = table.query(object_type, sort=('eq', int(snapshot['timestamp'])), index=gsi_name, projection=projection)
+    snapshot = load_objects(objects_table, snapshot)
+    if 'objects' in snapshot:
+        items.extend(fetch_carried_items(table, snapshot, projection=projection))
+    return items
+
+
+def fetch_coordinates(table, snapshot_table, objects_table, object_type):
+    """
+    Retrieves the coordinates of every item in the latest snapshot of an objectType.
+
+    Args:
+        table: The transient data table.
+        snapshot_table: The table holding snapshot commit markers.
+        objects_table: The table holding the objects of each committed snapshot.
+        object_type (str): The objectType to retrieve.
+
+    Returns:
+        list: A list of [latitude, longitude] pairs.
+    """
+    snapshot = fetch_latest_snapshot(table, snapshot_table, object_type)
+    if snapshot is None:
+        return []
+
+    coordinates = []
+    for item in fetch_snapshot_positions(table, objects_table, snapshot, object_type):
+        if 'latitude' in item and 'longitude' in item:
+            coordinates.append([item['latitude'], item['longitude']])
+
+    return coordinates
+
+
+def fetch_latest_heatmap(table, snapshot_table, objects_table, heatmap_table, object_type, precision):
+    """
+    Retrieves the heatmap cell counts of the latest snapshot of an objectType from the grid binned at ingest,
+    binning the snapshot's items instead if it has no grid.
+
+    Args:
+        table: The transient data table.
+        snapshot_table: The table holding snapshot commit markers.
+        objects_table: The table holding the objects of each committed snapshot.
+        heatmap_table: The table holding the binned grid of each snapshot.
+        object_type (str): The objectType to retrieve.
+        precision (int): The geohash precision of the grid's cells.
+
+    Returns:
+        tuple: The cell counts and the number of snapshots they cover.
+    """
+    snapshot = fetch_latest_snapshot(table, snapshot_table, object_type)
+    if snapshot is None:
+        return Counter(), 0
+
+    heatmap = heatmap_table.get({'objectType': object_type, 'timestamp': int(snapshot['timestamp'])}, projection=['cells'])
+    if heatmap is not None:
+        return coarsen(heatmap['cells'], precision), 1
+    return bin_items(fetch_snapshot_positions(table, objects_table, snapshot, object_type), precision), 1
+
+
+def fetch_window_heatmap(heatmap_table, object_type, start, end, precision):
+    """
+    Sums the heatmap cell counts of every snapshot of an objectType within a time window.
+
+    Args:
+        heatmap_table: The table holding the binned grid of each snapshot.
+        object_type (str): The objectType to retrieve.
+        start (int): The earliest snapshot epoch.
+        end (int): The latest snapshot epoch.
+        precision (int): The geohash precision of the grid's cells.
+
+    Returns:
+        tuple: The cell counts and the number of snapshots they cover.
+    """
+    heatmaps = heatmap_table.query(object_type, sort=('between', start, end), projection=['cells'])
+    counts = Counter()
+    for heatmap in heatmaps:
+        counts.update(coarsen(heatmap['cells'], precision))
+    return counts, len(heatmaps)
+
+
+def parse_heatmap_request(query_params):
+    """
+    Reads the grid precision and time window of a heatmap request.
+
+    Args:
+        query_params (dict): The query string parameters.
+
+    Returns:
+        tuple: The precision, and the start and end of the window, or None for the latest snapshot.
+
+    Raises:
+        ValueError: If a parameter is malformed or the window is too long.
+    """
+    try:
+        precision = int(query_params.get('precision') or heatmap_precision)
+        start = int(query_params['from']) if query_params.get('from') else None
+        end = int(query_params['to']) if query_params.get('to') else None
+    except ValueError:
+        raise ValueError("precision, from and to must be integers")
+
+    if not 1 <= precision <= heatmap_precision:
+        raise ValueError(f"precision must be between 1 and {heatmap_precision}")
+    if start is None:
+        if end is not None:
+            raise ValueError("to requires from")
+        return precision, None, None
+
+    end = end if end is not None else int(time.time())
+    if start > end or end - start > heatmap_max_window:
+        raise ValueError(f"The window must run forwards and span at most {heatmap_max_window} seconds")
+    return precision, start, end
 
-os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
-dynamodb = boto3.resource('dynamodb')
 
 def lambda_handler(event, context):
-    table = dynamodb.Table(os.environ['TABLE_NAME'])
+    table = get_table(os.environ.get('TRANSIENT_TABLE') or os.environ['TABLE_NAME'], schemas.transient_data)
+    snapshot_table = get_table(snapshot_table_name, schemas.transient_snapshots)
+    objects_table = get_table(objects_table_name, schemas.transient_snapshot_objects)
+    query_params = event.get('queryStringParameters') or {}
+
+    # Heatmap requests get pre-binned cell counts instead of every coordinate
+    heatmap = any(parameter in query_params for parameter in ('precision', 'from', 'to'))
+    if heatmap:
+        try:
+            precision, start, end = parse_heatmap_request(query_params)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
 
     try:
-        # Step 1: Retrieve the latest timestamp
-        items = []
-        response = table.scan(
-            ProjectionExpression="#ts",
-            ExpressionAttributeNames={"#ts": "timestamp"}
-        )
-        items.extend(response.get('Items', []))
-
-        while 'LastEvaluatedKey' in response:
-            response = table.scan(
-                ProjectionExpression="#ts",
-                ExpressionAttributeNames={"#ts": "timestamp"},
-                ExclusiveStartKey=response['LastEvaluatedKey']
-            )
-            items.extend(response.get('Items', []))
-
-        if not items:
-            return {'statusCode': 200, 'body': json.dumps({'coordinates': []})}
-
-        newest_timestamp = max(int(item['timestamp']) for item in items)
-
-        # Step 2: Get only items with that latest timestamp
+        if heatmap:
+            heatmap_table = get_table(heatmap_table_name, schemas.transient_heatmaps)
+            with ThreadPoolExecutor(max_workers=len(object_types)) as executor:
+                if start is None:
+                    results = list(executor.map(
+                        lambda object_type: fetch_latest_heatmap(table, snapshot_table, objects_table, heatmap_table, object_type, precision), object_types))
+                else:
+                    results = list(executor.map(
+                        lambda object_type: fetch_window_heatmap(heatmap_table, object_type, start, end, precision), object_types))
+
+            counts = Counter()
+            for result, _ in results:
+                counts.update(result)
+
+            return compress_response(event, {
+                'statusCode': 200,
+                'body': to_json({
+                    'precision': precision,
+                    'snapshots': max(snapshots for _, snapshots in results),
+                    'cells': heatmap_points(counts)
+                })
+            })
+
+        with ThreadPoolExecutor(max_workers=len(object_types)) as executor:
+            results = list(executor.map(lambda object_type: fetch_coordinates(table, snapshot_table, objects_table, object_type), object_types))
+
         coordinates = []
-        response = table.scan(
-            FilterExpression=Attr('timestamp').eq(newest_timestamp)
-        )
-
-        for item in response.get('Items', []):
-            if 'latitude' in item and 'longitude' in item:
-                coordinates.append([item['latitude'], item['longitude']])
-
-        while 'LastEvaluatedKey' in response:
-            response = table.scan(
-                FilterExpression=Attr('timestamp').eq(newest_timestamp),
-                ExclusiveStartKey=response['LastEvaluatedKey']
-            )
-            for item in response.get('Items', []):
-                if 'latitude' in item and 'longitude' in item:
-                    coordinates.append([item['latitude'], item['longitude']])
+        for result in results:
+            coordinates.extend(result)
 
-        return {
+        return compress_response(event, {
             'statusCode': 200,
-            'body': json.dumps({'coordinates': coordinates})
-        }
+            'body': to_json({'coordinates': coordinates})
+        })
 
     except Exception as e:
         return {
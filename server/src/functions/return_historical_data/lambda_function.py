@@ -1,48 +1,251 @@
 import json
+import math
 import os
-import boto3
-from boto3.dynamodb.conditions import Key, Attr
+import time
+from shared.http import compress_response, encode_cursor, parse_page_request
+from shared.projection import parse_fields, projection_attributes, select_fields
+from shared.serialization import to_json
+from shared.storage import get_table, parallel_scan
+from shared.storage import schemas
+
+# fetch_transient_data rewrites an unchanged object at the first snapshot after its row is DELTA_MAX_AGE seconds old,
+# so a row with no successor this much older than its timestamp is of an object that is no longer reported
+row_max_age = int(os.environ.get('DELTA_MAX_AGE', 3600)) + int(os.environ.get('TRANSIENT_INGEST_INTERVAL', 60))
+
+
+def parse_history_request(query_params):
+    """
+    Reads the time range and downsampling parameters of a per-object history request.
+
+    Args:
+        query_params (dict): The query string parameters.
+
+    Returns:
+        dict: The from and to epochs, the resolution in seconds, and the maximum number of points, each None if not given.
+
+    Raises:
+        ValueError: If a parameter is not a non-negative integer, or the range is empty.
+    """
+    history = {}
+    for parameter in ('from', 'to', 'resolution', 'maxPoints'):
+        value = query_params.get(parameter)
+        if value is None or value == '':
+            history[parameter] = None
+            continue
+        try:
+            history[parameter] = int(value)
+        except ValueError:
+            raise ValueError(f"{parameter} must be an integer")
+        if history[parameter] < 0:
+            raise ValueError(f"{parameter} must not be negative")
+
+    if history['from'] is not None and history['to'] is not None and history['from'] > history['to']:
+        raise ValueError("from must not be after to")
+    if history['resolution'] == 0 or history['maxPoints'] == 0:
+        raise ValueError("resolution and maxPoints must be at least 1")
+    return history
+
+
+def time_range_condition(start, end):
+    """
+    Builds the sort key condition that limits a query to a time range.
+
+    Args:
+        start (int): The earliest epoch, or None for no lower bound.
+        end (int): The latest epoch, or None for no upper bound.
+
+    Returns:
+        tuple: The sort key condition, or None for the whole history.
+    """
+    if start is not None and end is not None:
+        return ("between", start, end)
+    if start is not None:
+        return ("gte", start)
+    if end is not None:
+        return ("lte", end)
+    return None
+
+
+def history_spans(items, carried=None, end=None):
+    """
+    Works out how long each row of an object's history describes it. fetch_transient_data writes a row only when the
+    object changes, or when its last row is older than DELTA_MAX_AGE, and a removal row when it leaves its snapshot,
+    so a row holds until the object's next row, or for at most row_max_age seconds if it has none.
+
+    Args:
+        items (list): The object's rows, in ascending timestamp order.
+        carried (dict): The object's row before them, or None.
+        end (int): The latest epoch to describe, or None for no limit.
+
+    Returns:
+        list: A (row, start, until) tuple for each row other than removal rows, describing the object from start until before until.
+    """
+    rows = ([carried] if carried is not None else []) + items
+    spans = []
+    for index, row in enumerate(rows):
+        if row.get('removed'):
+            continue
+        start = int(row['timestamp'])
+        until = start + row_max_age
+        if index + 1 < len(rows):
+            until = min(until, int(rows[index + 1]['timestamp']))
+        if end is not None:
+            until = min(until, end + 1)
+        spans.append((row, start, until))
+    return spans
+
+
+def restamp(row, timestamp):
+    """
+    Copies a row that still describes its object at a later epoch, stamped with that epoch.
+
+    Args:
+        row (dict): The row.
+        timestamp (int): The epoch it is carried to.
+
+    Returns:
+        dict: The row with its timestamp replaced.
+    """
+    return dict(row, timestamp=timestamp)
+
+
+def downsample(items, resolution=None, max_points=None, start=None, end=None, carried=None):
+    """
+    Reduces a time-ordered history to at most one sample per interval, keeping the first row written in each.
+    Intervals are aligned to the start of the range, and are resolution seconds long or wide enough
+    that the range fits in max_points of them, whichever is coarser. Unchanged objects are written sparsely,
+    so an interval with no row of its own is sampled with the row that still holds at its start, as is the start of the range.
+
+    Args:
+        items (list): The rows, in ascending timestamp order.
+        resolution (int): The interval length in seconds, or None.
+        max_points (int): The maximum number of samples to return, or None.
+        start (int): The start of the requested range, or None to start at the first row.
+        end (int): The end of the requested range, or None to end at the last row.
+        carried (dict): The row before items, which has already been returned or precedes the range, or None.
+
+    Returns:
+        list: The downsampled history, without removal rows.
+    """
+    if end is None and items:
+        end = int(items[-1]['timestamp'])
+    spans = history_spans(items, carried, end)
+
+    if resolution is None and max_points is None:
+        samples = []
+        for row, row_start, until in spans:
+            if row is not carried:
+                samples.append(row)
+            elif start is not None and row_start < start < until:
+                samples.append(restamp(row, start))
+        return samples
+
+    if not spans:
+        return []
+    origin = start if start is not None else spans[0][1]
+    width = resolution or 1
+    if max_points is not None:
+        span = end - origin + 1 if end is not None else 1
+        width = max(width, math.ceil(span / max_points))
+
+    samples = []
+    last_interval = None
+    for index, (row, row_start, until) in enumerate(spans):
+        if row_start < origin:
+            # The row holds into the range, so it samples the first interval
+            interval = -1
+        else:
+            interval = (row_start - origin) // width
+            # The carried row has already been returned with the previous page
+            if row is not carried and interval != last_interval:
+                samples.append(row)
+            last_interval = interval
+        # Carry the row through the intervals in which the object didn't change
+        next_interval = (spans[index + 1][1] - origin) // width if index + 1 < len(spans) else None
+        interval += 1
+        while origin + interval * width < until and interval != next_interval:
+            samples.append(restamp(row, origin + interval * width))
+            last_interval = interval
+            interval += 1
+    return samples
 
-os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
-dynamodb = boto3.resource('dynamodb')
 
 def lambda_handler(event, context):
-    table = dynamodb.Table(os.environ['TABLE_NAME'])
+    table = get_table(os.environ.get('TRANSIENT_TABLE') or os.environ['TABLE_NAME'], schemas.transient_data)
+    query_params = event.get('queryStringParameters') or {}
+
+    try:
+        limit, start_key = parse_page_request(event, table.key)
+        if start_key is not None and 'objectID' in query_params and start_key['objectID'] != query_params['objectID']:
+            raise ValueError("Invalid cursor")
+        history = parse_history_request(query_params)
+        fields = parse_fields(query_params)
+        if limit is not None and history['maxPoints'] is not None:
+            raise ValueError("maxPoints can't be combined with limit or cursor")
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': str(e)})
+        }
 
     try:
-        if 'queryStringParameters' in event and event['queryStringParameters'] and 'objectType' in event[
-            'queryStringParameters']:
+        if 'objectID' in query_params:
+            # Read one object's history with a key query on its partition, in time order
+            object_id = query_params['objectID']
+            sort = time_range_condition(history['from'], history['to'])
+            # Downsampling reads each row's timestamp, and skips removal rows
+            projection = projection_attributes(fields, ('timestamp', 'removed'))
+            # Rows are written only when the object changes, so the row before the range describes it at the start
+            carried = None
+            if history['from'] is not None:
+                before = table.query(object_id, sort=('lt', history['from']), descending=True, limit=1, projection=projection)
+                carried = before[0] if before else None
+            end = history['to'] if history['to'] is not None else int(time.time())
+
+            if limit is not None:
+                items, last_key = table.query_page(object_id, limit, start_key, sort=sort, projection=projection)
+                if start_key is not None:
+                    carried = table.get(start_key, projection=projection)
+                # A page describes the object up to its last row, which the next page carries on from
+                if last_key is not None:
+                    end = int(items[-1]['timestamp'])
+                # Align intervals to the epoch when no range is given, so that every page buckets samples alike
+                items = downsample(items, history['resolution'], start=history['from'] if history['from'] is not None else 0,
+                                   end=end, carried=carried)
+                body = to_json({'items': select_fields(items, fields, projection), 'next': encode_cursor(last_key)})
+            else:
+                items = table.query(object_id, sort=sort, projection=projection)
+                items = downsample(items, history['resolution'], history['maxPoints'], history['from'], end, carried)
+                body = to_json(select_fields(items, fields, projection))
 
-            objectType = event['queryStringParameters']['objectType']
+            return compress_response(event, {
+                'statusCode': 200,
+                'body': body
+            })
+
+        filters = None
+        if 'objectType' in query_params:
+            objectType = query_params['objectType']
             object_types = objectType.split(',')
+            filters = {'objectType': object_types}
 
-            items = []
-            response = table.scan(
-                FilterExpression=Attr('objectType').is_in(object_types)
-            )
-            items.extend(response.get('Items', []))
-
-            # Handle pagination
-            while 'LastEvaluatedKey' in response:
-                response = table.scan(
-                    FilterExpression=Attr('objectType').is_in(object_types),
-                    ExclusiveStartKey=response['LastEvaluatedKey']
-                )
-                items.extend(response.get('Items', []))
+        # Export the stored rows, one for each time an object changed or was rewritten, leaving out removal rows
+        projection = projection_attributes(fields, ('removed',))
+        if limit is not None:
+            # Return a single page, with a cursor to the next one
+            items, last_key = table.scan_page(limit, start_key, filters=filters, projection=projection)
+            items = [item for item in items if not item.get('removed')]
+            body = to_json({'items': select_fields(items, fields, projection), 'next': encode_cursor(last_key)})
         else:
-            # Fallback to scanning the entire table
-            items = []
-            response = table.scan()
-            items.extend(response.get('Items', []))
-
-            while 'LastEvaluatedKey' in response:
-                response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-                items.extend(response.get('Items', []))
+            # Fallback to scanning the entire table in parallel segments
+            items = parallel_scan(table, filters=filters, projection=projection)
+            items = [item for item in items if not item.get('removed')]
+            body = to_json(select_fields(items, fields, projection))
 
-        return {
+        return compress_response(event, {
             'statusCode': 200,
-            'body': json.dumps(items)
-        }
+            'body': body
+        })
 
     except Exception as e:
         return {
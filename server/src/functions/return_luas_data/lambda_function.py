@@ -3,10 +3,16 @@ import json
 import os
 import requests
 
+# Reusable session, so that a warm container keeps its connection to the API open between requests
+session = requests.Session()
+
+# Longest to wait for the API to respond, in seconds
+upstream_timeout = float(os.environ.get("UPSTREAM_TIMEOUT", 10))
+
 def lambda_handler(event, context):
     try:
         luas_stop_code = event['queryStringParameters']['luasStopCode']
-        response = requests.get(f"http://luasforecasts.rpa.ie/xml/get.ashx?action=forecast&stop={luas_stop_code}&encrypt=false")
+        response = session.get(f"http://luasforecasts.rpa.ie/xml/get.ashx?action=forecast&stop={luas_stop_code}&encrypt=false", timeout=upstream_timeout)
         xml_dict = xmltodict.parse(response.text)
 
         return {
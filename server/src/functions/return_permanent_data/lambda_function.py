@@ -1,48 +1,353 @@
+import hashlib
 import json
 import os
-import boto3
-from boto3.dynamodb.conditions import Key, Attr
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from shared.columnar import concat_columnar, parse_format, to_columnar
+from shared.geohash import covering_prefixes, in_bbox, parse_bbox, prefix_precision
+from shared.http import compress_response, encode_cursor, etag_matches, parse_page_request
+from shared.projection import parse_fields, projection_attributes, select_fields, strip_index_attributes
+from shared.serialization import to_json
+from shared.storage import get_table, parallel_scan
+from shared.storage import schemas
+
+version_table_name = os.environ.get("VERSION_TABLE", "dataset_versions")
+geohash_gsi_name = "geohash-index"
+
+# Most geohash cells, and so index queries, a bounding box is answered with before falling back to a full read
+bbox_max_cells = int(os.environ.get("BBOX_MAX_CELLS", 16))
+
+# Finest geohash cells a bounding box is covered with, about 150m x 150m
+bbox_max_precision = 7
+
+# Attributes a bounding box request reads from each item to filter it, whichever fields are requested
+bbox_attributes = ('objectType', 'latitude', 'longitude')
+
+# Threads reading objectType partitions and geohash cells, shared by every request in the process
+# so that the number of threads doesn't grow with the objectTypes requested or with concurrent requests.
+# Tasks run on it must not wait for further tasks on it, which could deadlock under concurrent requests
+max_fetch_workers = int(os.environ.get("PERMANENT_FETCH_WORKERS", 16))
+fetch_executor = ThreadPoolExecutor(max_workers=max_fetch_workers, thread_name_prefix="permanent-fetch")
+
+# How long clients may reuse a response before revalidating it, in seconds
+cache_max_age = int(os.environ.get("PERMANENT_CACHE_MAX_AGE", 300))
+
+# Serialized items of each objectType, or of the whole table under None, cached in a warm container
+# and reused for as long as their dataset version is unchanged.
+# Maps objectType -> {"version": int, "body": str}, and ("columnar", objectType) -> {"version": int, "columns": dict}
+# for its columnar encoding, which is combined with those of the other objectTypes requested at serve time.
+permanent_cache = {}
+permanent_cache_lock = threading.Lock()
+
+
+def dataset_name(object_type):
+    """
+    Names the dataset version bumped by fetch_permanent_data for an objectType.
+
+    Args:
+        object_type (str): The objectType, or None for the whole table.
+
+    Returns:
+        str: The dataset name in the version table.
+    """
+    return "permanent_data" if object_type is None else f"permanent_data#{object_type}"
+
+
+def fetch_versions(version_table, object_types):
+    """
+    Retrieves the current dataset version of each objectType in a single batch read.
+
+    Args:
+        version_table: The dataset version table.
+        object_types (list): The objectTypes, or [None] for the whole table.
+
+    Returns:
+        list: The version of each objectType, or None where it has never been loaded.
+    """
+    items = version_table.get_many([{"dataset": dataset_name(object_type)} for object_type in object_types])
+    versions = {item["dataset"]: int(item["version"]) for item in items}
+    return [versions.get(dataset_name(object_type)) for object_type in object_types]
+
+
+def fetch_object_type(table, object_type, projection=None):
+    """
+    Retrieves every item of an objectType with a query on its partition,
+    so that only the requested objectType is read.
+
+    Args:
+        table: The permanent data table, partitioned by objectType.
+        object_type (str): The objectType to retrieve.
+        projection (list): The attributes to retrieve, or None for whole items.
+
+    Returns:
+        list: The items of the objectType.
+    """
+    return table.query(object_type, projection=projection)
+
+
+def fetch_items(table, object_types, projection=None):
+    """
+    Retrieves every item of the requested objectTypes, reading their partitions concurrently and merging them in the order requested.
+
+    Args:
+        table: The permanent data table.
+        object_types (list): The objectTypes, or [None] for the whole table.
+        projection (list): The attributes to retrieve, or None for whole items.
+
+    Returns:
+        list: The items.
+    """
+    if object_types == [None]:
+        return parallel_scan(table, projection=projection)
+    results = fetch_executor.map(lambda object_type: fetch_object_type(table, object_type, projection), object_types)
+    return [item for items in results for item in items]
+
+
+def get_serialized_items(table, object_type, version):
+    """
+    Returns the serialized items of an objectType, from the warm-container cache if its version is unchanged.
+
+    Args:
+        table: The permanent data table.
+        object_type (str): The objectType, or None for the whole table.
+        version (int): The current dataset version, or None if unknown, in which case nothing is cached.
+
+    Returns:
+        str: The items as the comma-separated contents of a JSON array.
+    """
+    with permanent_cache_lock:
+        cached = permanent_cache.get(object_type)
+        if version is not None and cached is not None and cached["version"] == version:
+            return cached["body"]
+
+    items = parallel_scan(table) if object_type is None else fetch_object_type(table, object_type)
+    body = to_json(strip_index_attributes(items))[1:-1]
+
+    if version is not None:
+        with permanent_cache_lock:
+            permanent_cache[object_type] = {"version": version, "body": body}
+    return body
+
+
+def get_columnar_items(table, object_type, version):
+    """
+    Returns the columnar encoding of an objectType's items, from the warm-container cache if its version is unchanged.
+
+    Args:
+        table: The permanent data table.
+        object_type (str): The objectType, or None for the whole table.
+        version (int): The current dataset version, or None if unknown, in which case nothing is cached.
+
+    Returns:
+        dict: The items, as returned by to_columnar.
+    """
+    cache_key = ("columnar", object_type)
+    with permanent_cache_lock:
+        cached = permanent_cache.get(cache_key)
+        if version is not None and cached is not None and cached["version"] == version:
+            return cached["columns"]
+
+    items = parallel_scan(table) if object_type is None else fetch_object_type(table, object_type)
+    columns = to_columnar(strip_index_attributes(items))
+
+    if version is not None:
+        with permanent_cache_lock:
+            permanent_cache[cache_key] = {"version": version, "columns": columns}
+    return columns
+
+
+def get_columnar_body(table, object_types, versions):
+    """
+    Returns the columnar body of the requested objectTypes, combining the cached encoding of each
+    so that the cache holds one entry per objectType however they are requested together.
+
+    Args:
+        table: The permanent data table.
+        object_types (list): The objectTypes, or [None] for the whole table.
+        versions (list): The current dataset version of each objectType, or None where unknown.
+
+    Returns:
+        str: The columnar JSON body.
+    """
+    bodies = list(fetch_executor.map(lambda args: get_columnar_items(table, *args), zip(object_types, versions)))
+    return to_json(bodies[0] if len(bodies) == 1 else concat_columnar(bodies))
+
+
+def fetch_page(table, object_types, limit, start_key, projection=None):
+    """
+    Retrieves one page of the requested objectTypes, querying their partitions in the order requested
+    and moving on to the next objectType whenever one is exhausted before the page is full.
+
+    Args:
+        table: The permanent data table.
+        object_types (list): The objectTypes, or [None] for the whole table.
+        limit (int): The maximum number of items in the page.
+        start_key (dict): The key the previous page ended on, or None for the first page.
+        projection (list): The attributes to retrieve, including the table's key, or None for whole items.
+
+    Returns:
+        tuple: The items of the page, and the key to resume after, or None if there are no more items.
+    """
+    if object_types == [None]:
+        return table.scan_page(limit, start_key, projection=projection)
+
+    position = object_types.index(start_key["objectType"]) if start_key is not None else 0
+    items = []
+    for object_type in object_types[position:]:
+        page, start_key = table.query_page(object_type, limit - len(items), start_key, projection=projection)
+        items.extend(page)
+        if len(items) == limit:
+            # A page that ends exactly on the last item of an objectType resumes after it, in the next objectType
+            if start_key is None and object_type != object_types[-1]:
+                start_key = {attribute: items[-1][attribute] for attribute in table.key}
+            return items, start_key
+    return items, None
+
+
+def fetch_cell(table, cell, projection=None):
+    """
+    Retrieves every item in a geohash cell from the geohash GSI, querying the partition of the cell's prefix
+    and, for cells finer than the prefix, only the part of it within the cell.
+
+    Args:
+        table: The permanent data table.
+        cell (str): The geohash of the cell.
+        projection (list): The attributes to retrieve, or None for whole items.
+
+    Returns:
+        list: The items in the cell.
+    """
+    sort = ('begins_with', cell) if len(cell) > prefix_precision else None
+    return table.query(cell[:prefix_precision], sort=sort, index=geohash_gsi_name, projection=projection)
+
+
+def fetch_bbox(table, object_types, bbox, projection=None):
+    """
+    Retrieves the items of the requested objectTypes within a bounding box, querying the geohash GSI
+    for the few cells that cover it and filtering their items to the exact box.
+    Falls back to reading the objectTypes in full if the box is too large to cover in bbox_max_cells cells.
+
+    Args:
+        table: The permanent data table.
+        object_types (list): The objectTypes, or [None] for every objectType.
+        bbox (tuple): The west, south, east and north edges.
+        projection (list): The attributes to retrieve, including bbox_attributes, or None for whole items.
+
+    Returns:
+        list: The items within the bounding box.
+    """
+    cells = covering_prefixes(bbox, bbox_max_cells, bbox_max_precision)
+    if cells is None:
+        items = fetch_items(table, object_types, projection)
+    else:
+        results = fetch_executor.map(lambda cell: fetch_cell(table, cell, projection), cells)
+        items = [item for cell_items in results for item in cell_items]
+        if object_types != [None]:
+            items = [item for item in items if item['objectType'] in object_types]
+
+    return [item for item in items if in_bbox(item, bbox)]
+
+
+def make_etag(object_types, versions, fields=None, response_format='json', bbox=None, limit=None, start_key=None):
+    """
+    Derives the ETag of a response from the datasets and versions it contains, and every parameter that shapes its body:
+    the fields it is limited to, its format, its bounding box and its page.
+    The tag is weak, since the same body is sent with whichever content encoding the client accepts.
+
+    Args:
+        object_types (list): The objectTypes in the response, or [None] for the whole table.
+        versions (list): The version of each objectType.
+        fields (list): The attributes the items are limited to, or None for whole items.
+        response_format (str): "json" or "columnar".
+        bbox (tuple): The bounding box the items are limited to, or None for every position.
+        limit (int): The page size, or None for every item.
+        start_key (dict): The key the page resumes after, or None for the first page.
+
+    Returns:
+        str: The weak ETag, or None if any version is unknown.
+    """
+    if any(version is None for version in versions):
+        return None
+    tag = ",".join(f"{dataset_name(object_type)}={version}" for object_type, version in zip(object_types, versions))
+    if fields is not None:
+        tag += ";fields=" + ",".join(fields)
+    tag += f";format={response_format}"
+    if bbox is not None:
+        tag += ";bbox=" + ",".join(str(edge) for edge in bbox)
+    if limit is not None:
+        tag += f";limit={limit};cursor={json.dumps(start_key, sort_keys=True, default=str)}"
+    return 'W/"' + hashlib.blake2b(tag.encode("utf-8"), digest_size=8).hexdigest() + '"'
 
-os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
-dynamodb = boto3.resource('dynamodb')
 
 def lambda_handler(event, context):
-    table = dynamodb.Table(os.environ['TABLE_NAME'])
+    table = get_table(os.environ.get('PERMANENT_TABLE') or os.environ['TABLE_NAME'], schemas.permanent_data)
+    version_table = get_table(version_table_name, schemas.dataset_versions)
 
     try:
         if 'queryStringParameters' in event and event['queryStringParameters'] and 'objectType' in event[
             'queryStringParameters']:
 
             objectType = event['queryStringParameters']['objectType']
-            object_types = objectType.split(',')
-
-            items = []
-            response = table.scan(
-                FilterExpression=Attr('objectType').is_in(object_types)
-            )
-            items.extend(response.get('Items', []))
-
-            # Handle pagination
-            while 'LastEvaluatedKey' in response:
-                response = table.scan(
-                    FilterExpression=Attr('objectType').is_in(object_types),
-                    ExclusiveStartKey=response['LastEvaluatedKey']
-                )
-                items.extend(response.get('Items', []))
+            # Ignore repeated types so that their partitions aren't read twice
+            object_types = list(dict.fromkeys(object_type.strip() for object_type in objectType.split(',')))
         else:
-            # Fallback to scanning the entire table
-            items = []
-            response = table.scan()
-            items.extend(response.get('Items', []))
+            # Fallback to the entire table, scanned in parallel segments
+            object_types = [None]
 
-            while 'LastEvaluatedKey' in response:
-                response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-                items.extend(response.get('Items', []))
+        try:
+            limit, start_key = parse_page_request(event, table.key)
+            if start_key is not None and object_types != [None] and start_key.get("objectType") not in object_types:
+                raise ValueError("Invalid cursor")
+            bbox = None
+            if (event.get('queryStringParameters') or {}).get('bbox'):
+                bbox = parse_bbox(event['queryStringParameters']['bbox'])
+            response_format = parse_format(event.get('queryStringParameters') or {})
+            fields = parse_fields(event.get('queryStringParameters') or {})
+            if bbox is not None and limit is not None:
+                raise ValueError("bbox can't be combined with limit or cursor")
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
 
-        return {
+        versions = fetch_versions(version_table, object_types)
+        etag = make_etag(object_types, versions, fields, response_format, bbox, limit, start_key)
+        headers = {'Content-Type': 'application/json', 'Cache-Control': f'public, max-age={cache_max_age}', 'Vary': 'Accept-Encoding'}
+        if etag is not None:
+            headers['ETag'] = etag
+            if etag_matches(event, etag):
+                return {'statusCode': 304, 'headers': headers, 'body': ''}
+
+        if limit is not None:
+            # Return a single page, with a cursor to the next one
+            projection = projection_attributes(fields, table.key)
+            items, last_key = fetch_page(table, object_types, limit, start_key, projection)
+            items = select_fields(items, fields, projection)
+            if response_format == 'columnar':
+                body = to_json(dict(to_columnar(items), next=encode_cursor(last_key)))
+            else:
+                body = to_json({'items': items, 'next': encode_cursor(last_key)})
+        elif bbox is not None:
+            projection = projection_attributes(fields, bbox_attributes)
+            items = select_fields(fetch_bbox(table, object_types, bbox, projection), fields, projection)
+            body = to_json(to_columnar(items) if response_format == 'columnar' else items)
+        elif fields is not None:
+            # Projected reads bypass the warm-container cache, which holds whole items
+            items = fetch_items(table, object_types, fields)
+            body = to_json(to_columnar(items) if response_format == 'columnar' else items)
+        elif response_format == 'columnar':
+            body = get_columnar_body(table, object_types, versions)
+        else:
+            # Read each requested partition concurrently, merging them in the order requested
+            bodies = fetch_executor.map(lambda args: get_serialized_items(table, *args), zip(object_types, versions))
+            body = '[' + ', '.join(body for body in bodies if body) + ']'
+
+        return compress_response(event, {
             'statusCode': 200,
-            'body': json.dumps(items, default=str)
-        }
+            'headers': headers,
+            'body': body
+        })
 
     except Exception as e:
         return {
@@ -1,13 +1,27 @@
 import json
-import boto3
+from shared.projection import parse_fields, projection_attributes, select_fields
+from shared.punctuality import punctuality_attributes, with_average
+from shared.serialization import to_json
+from shared.storage import get_table
+from shared.storage import schemas
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table("punctuality_by_objectID")
+table = get_table("punctuality_by_objectID", schemas.punctuality_by_objectID)
 
 def lambda_handler(event, context):
     try:
-        response = table.scan()
-        data = response.get("Items", [])
+        fields = parse_fields(event.get("queryStringParameters") or {})
+    except ValueError as e:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": str(e)})
+        }
+
+    try:
+        projection = fields
+        if fields is not None and any(field in punctuality_attributes for field in fields):
+            # The average and count are derived from every punctuality attribute, whichever of them were requested
+            projection = projection_attributes(fields, punctuality_attributes)
+        data = select_fields([with_average(item) for item in table.scan(projection=projection)], fields, projection)
 
         return {
             "statusCode": 200,
@@ -15,7 +29,7 @@ def lambda_handler(event, context):
                 "Content-Type": "application/json",
                 "Access-Control-Allow-Origin": "*"
             },
-            "body": json.dumps(data, default=str)  # Convert to JSON-safe format
+            "body": to_json(data)
         }
     except Exception as e:
         print(f"Error fetching data: {e}")
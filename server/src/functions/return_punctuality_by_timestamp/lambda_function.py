@@ -1,25 +1,26 @@
 import json
-import os
-import boto3
-
-os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
-dynamodb = boto3.resource('dynamodb')
+from shared.projection import parse_fields
+from shared.serialization import to_json
+from shared.storage import get_table
+from shared.storage import schemas
 
 def lambda_handler(event, context):
-    table = dynamodb.Table("punctuality_by_timestamp")
+    table = get_table("punctuality_by_timestamp", schemas.punctuality_by_timestamp)
 
     try:
-        items = []
-        response = table.scan()
-        items.extend(response.get('Items', []))
+        fields = parse_fields(event.get('queryStringParameters') or {})
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': str(e)})
+        }
 
-        while 'LastEvaluatedKey' in response:
-            response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-            items.extend(response.get('Items', []))
+    try:
+        items = table.scan(projection=fields)
 
         return {
             'statusCode': 200,
-            'body': json.dumps(items, default=str)
+            'body': to_json(items)
         }
 
     except Exception as e:
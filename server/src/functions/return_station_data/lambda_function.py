@@ -1,11 +1,18 @@
 import xmltodict
 import json
+import os
 import requests
 
+# Reusable session, so that a warm container keeps its connection to the API open between requests
+session = requests.Session()
+
+# Longest to wait for the API to respond, in seconds
+upstream_timeout = float(os.environ.get("UPSTREAM_TIMEOUT", 10))
+
 def lambda_handler(event, context):
     try:
         station_code = event['queryStringParameters']['stationCode']
-        response = requests.get(f"http://api.irishrail.ie/realtime/realtime.asmx/getStationDataByCodeXML?StationCode={station_code}")
+        response = session.get(f"http://api.irishrail.ie/realtime/realtime.asmx/getStationDataByCodeXML?StationCode={station_code}", timeout=upstream_timeout)
         xml_dict = xmltodict.parse(response.text)
 
         return {
@@ -1,104 +1,353 @@
-import boto3
+import base64
+import gzip
 import json
 import os
-from boto3.dynamodb.conditions import Key, Attr
+from concurrent.futures import ThreadPoolExecutor
+from shared.blob_store import get_blob_store
+from shared.columnar import parse_format, to_columnar
+from shared.geohash import covering_prefixes, in_bbox, parse_bbox
+from shared.http import accepted_encodings, compress_response, etag_matches
+from shared.projection import parse_fields, projection_attributes, select_fields
+from shared.snapshots import fetch_carried_items, load_objects, select_artifact_key, artifact_etag, columnar_artifact_key
+from shared.serialization import to_json
+from shared.storage import get_table
+from shared.storage import schemas
 
-os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
-dynamodb = boto3.resource('dynamodb')
 gsi_name = "objectType-index"
+geohash_gsi_name = "geohash-index"
+snapshot_table_name = os.environ.get("SNAPSHOT_TABLE", "transient_snapshots")
+history_table_name = os.environ.get("SNAPSHOT_HISTORY_TABLE", "transient_snapshot_history")
+objects_table_name = os.environ.get("SNAPSHOT_OBJECTS_TABLE", "transient_snapshot_objects")
+
+# How long fetch_transient_data keeps the objects of each snapshot, and so the oldest snapshot
+# a since request can be answered against, in seconds
+snapshot_history_retention = int(os.environ.get("SNAPSHOT_HISTORY_RETENTION", 3600))
+
+# Object types written by fetch_transient_data, used when no objectType is requested
+default_object_types = ["IrishRailTrain", "Bus"]
+
+# Most threads a request reads its objectTypes' snapshots with
+max_fetch_workers = 8
+
+# Attributes a bounding box request reads from each item to filter it, whichever fields are requested
+bbox_attributes = ('objectType', 'latitude', 'longitude')
+
+# Most geohash cells, and so index queries per snapshot, a bounding box is answered with before falling back to a full read
+bbox_max_cells = int(os.environ.get("BBOX_MAX_CELLS", 16))
+
+# Store of pre-rendered snapshot bodies published by fetch_transient_data, or None if not configured
+blob_store = get_blob_store()
+
+
+def fetch_newest_timestamp(table, object_type):
+    """
+    Retrieves the newest timestamp for an objectType from the objectType GSI.
+
+    Args:
+        table: The transient data table.
+        object_type (str): The objectType to look up.
+
+    Returns:
+        int: The newest timestamp, or None if the objectType has no items.
+    """
+    items = table.query(object_type, index=gsi_name, descending=True, limit=1, projection=['timestamp'])
+    if not items:
+        return None
+    return int(items[0]['timestamp'])
+
+
+def fetch_committed_snapshot(snapshot_table, object_type):
+    """
+    Retrieves the commit marker of the latest completely written snapshot of an objectType.
+
+    Args:
+        snapshot_table: The table holding snapshot commit markers.
+        object_type (str): The objectType to look up.
+
+    Returns:
+        dict: The commit marker, or None if no snapshot has been committed.
+    """
+    return snapshot_table.get({'objectType': object_type})
+
+
+def fetch_latest_snapshot(table, object_type, snapshot, projection=None):
+    """
+    Retrieves every item of an objectType belonging to its latest committed snapshot,
+    including unchanged objects carried forward from earlier snapshots.
+    Falls back to the newest timestamp on the GSI if no snapshot has been committed.
+
+    Args:
+        table: The transient data table.
+        object_type (str): The objectType to retrieve.
+        snapshot (dict): The commit marker of the objectType, or None if no snapshot has been committed.
+        projection (list): The attributes to retrieve, or None for whole items.
+
+    Returns:
+        list: The items belonging to the newest snapshot of the objectType.
+    """
+    if snapshot is not None:
+        newest_timestamp = int(snapshot['timestamp'])
+    else:
+        newest_timestamp = fetch_newest_timestamp(table, object_type)
+    if newest_timestamp is None:
+        return []
+
+    items = table.query(object_type, sort=('eq', newest_timestamp), index=gsi_name, projection=projection)
+
+    if snapshot is not None:
+        items.extend(fetch_carried_items(table, snapshot, projection=projection))
+
+    return items
+
+
+def fetch_snapshot_delta(table, history_table, object_type, marker, since, projection=None):
+    """
+    Retrieves the changes to an objectType between a snapshot a client already holds and its latest committed snapshot:
+    the objects added or rewritten since, which are those last written after it, and the objects removed since,
+    which are those recorded in its history but missing from the latest snapshot.
+    Falls back to the latest snapshot in full if no snapshot has been committed, if the client holds no snapshot,
+    or if the client's snapshot is newer than it or has aged out of the history.
+
+    Args:
+        table: The transient data table.
+        history_table: The table recording the objects of each committed snapshot.
+        object_type (str): The objectType to retrieve.
+        marker (dict): The commit marker of the objectType, or None if no snapshot has been committed.
+        since (int): The timestamp of the snapshot the client holds, or None if it holds none.
+        projection (list): The attributes to retrieve, or None for whole items.
+
+    Returns:
+        tuple: The changed items, the objectIDs removed, and whether the items are the full snapshot instead of changes.
+    """
+    if marker is None or 'objects' not in marker or since is None:
+        return fetch_latest_snapshot(table, object_type, marker, projection), [], True
+
+    timestamp = int(marker['timestamp'])
+    if since == timestamp:
+        return [], [], False
+
+    history = None
+    if timestamp - snapshot_history_retention <= since < timestamp:
+        history = history_table.get({'objectType': object_type, 'timestamp': since}, projection=['objectIDs'])
+    if history is None:
+        return fetch_latest_snapshot(table, object_type, marker, projection), [], True
+
+    items = table.query(object_type, sort=('eq', timestamp), index=gsi_name, projection=projection)
+    items.extend(fetch_carried_items(table, marker, projection=projection, since=since))
+    removed = [object_id for object_id in history['objectIDs'] if object_id not in marker['objects']]
+    return items, removed, False
+
+
+def parse_since(query_params, object_types):
+    """
+    Reads the snapshot a client already holds of each objectType, to send only the changes since them.
+    The since parameter is either one timestamp for every objectType, or objectType:timestamp pairs separated by commas,
+    as returned in the snapshots of a previous response, in which case objectTypes not listed are sent in full.
+
+    Args:
+        query_params (dict): The query string parameters.
+        object_types (list): The requested objectTypes.
+
+    Returns:
+        dict: A dictionary mapping each objectType to the timestamp of the snapshot held, or None to send it in full,
+        or None if no since was requested.
+
+    Raises:
+        ValueError: If a timestamp is malformed or names an objectType that wasn't requested.
+    """
+    if not query_params.get('since'):
+        return None
+
+    pairs = [pair.strip().rpartition(':') for pair in query_params['since'].split(',')]
+    if len(pairs) == 1 and not pairs[0][1]:
+        timestamps = {object_type: pairs[0][2] for object_type in object_types}
+    else:
+        timestamps = {object_type.strip(): timestamp for object_type, _, timestamp in pairs}
+        if not all(timestamps) or not set(timestamps) <= set(object_types):
+            raise ValueError("since must name requested objectTypes")
+
+    since = {object_type: None for object_type in object_types}
+    for object_type, timestamp in timestamps.items():
+        try:
+            since[object_type] = int(timestamp)
+        except ValueError:
+            raise ValueError("since must be a snapshot timestamp")
+        if since[object_type] < 0:
+            raise ValueError("since must be a snapshot timestamp")
+    return since
+
+
+def fetch_bbox_snapshots(table, object_types, markers, bbox, projection=None):
+    """
+    Retrieves the items of the latest committed snapshots of the requested objectTypes within a bounding box.
+    Objects written under a snapshot's timestamp are read from the geohash GSI for the few cells that cover the box,
+    and carried objects are picked out by the geohash prefixes recorded in the marker, before filtering to the exact box.
+    ObjectTypes without a committed snapshot, or boxes too large to cover in bbox_max_cells cells, fall back to a full read.
+
+    Args:
+        table: The transient data table.
+        object_types (list): The requested objectTypes.
+        markers (list): The commit marker of each objectType, or None if uncommitted.
+        bbox (tuple): The west, south, east and north edges.
+        projection (list): The attributes to retrieve, including bbox_attributes, or None for whole items.
+
+    Returns:
+        list: The items within the bounding box.
+    """
+    cells = covering_prefixes(bbox, bbox_max_cells)
+    items = []
+    # Maps each snapshot timestamp to the objectTypes committed under it, so that each cell is queried once per timestamp
+    indexed_types = {}
+    for object_type, marker in zip(object_types, markers):
+        if cells is None or marker is None:
+            items.extend(fetch_latest_snapshot(table, object_type, marker, projection))
+        else:
+            indexed_types.setdefault(int(marker['timestamp']), set()).add(object_type)
+            items.extend(fetch_carried_items(table, marker, projection=projection, prefixes=set(cells)))
+
+    queries = [(cell, timestamp) for timestamp in indexed_types for cell in cells]
+    if queries:
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            results = executor.map(
+                lambda query: table.query(query[0], sort=('eq', query[1]), index=geohash_gsi_name, projection=projection), queries)
+            for (_, timestamp), cell_items in zip(queries, results):
+                items.extend(item for item in cell_items if item['objectType'] in indexed_types[timestamp])
+
+    return [item for item in items if in_bbox(item, bbox)]
+
+
+def serve_artifact(event, key, body):
+    """
+    Builds a response that returns a pre-rendered snapshot verbatim, without re-serializing it.
+    The body is decompressed only for clients that don't accept gzip, and then recompressed with any encoding they do accept.
+
+    Args:
+        event (dict): The API Gateway event.
+        key (str): The blob key of the artifact.
+        body (bytes): The gzip-compressed artifact.
+
+    Returns:
+        dict: The API Gateway response.
+    """
+    etag = artifact_etag(key)
+    headers = {'Content-Type': 'application/json', 'ETag': etag, 'Vary': 'Accept-Encoding'}
+
+    if etag_matches(event, etag):
+        return {'statusCode': 304, 'headers': headers, 'body': ''}
+
+    encodings = accepted_encodings(event)
+    if encodings.get('gzip', encodings.get('*', 0)) <= 0:
+        return compress_response(event, {'statusCode': 200, 'headers': headers, 'body': gzip.decompress(body).decode('utf-8')})
+
+    headers['Content-Encoding'] = 'gzip'
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': base64.b64encode(body).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
 
 def lambda_handler(event, context):
-    table = dynamodb.Table(os.environ['TABLE_NAME'])
+    table = get_table(os.environ.get('TRANSIENT_TABLE') or os.environ['TABLE_NAME'], schemas.transient_data)
+    snapshot_table = get_table(snapshot_table_name, schemas.transient_snapshots)
 
     try:
         query_params = event.get('queryStringParameters', {}) or {}
         object_type_param = query_params.get('objectType')
 
-        # Handle multiple object types if provided
+        # Handle multiple object types if provided, ignoring repeats so that no snapshot is read twice
         if object_type_param:
-            object_types = [obj.strip() for obj in object_type_param.split(',')]
+            object_types = list(dict.fromkeys(obj.strip() for obj in object_type_param.split(',')))
         else:
-            object_types = []
-
-        # Step 1: Retrieve the latest timestamp
-        items = []
-
-        if object_types:
-            # Scan with a filter for multiple object types to get timestamps
-            response = table.scan(
-                FilterExpression=Attr('objectType').is_in(object_types),
-                ProjectionExpression="#ts",
-                ExpressionAttributeNames={"#ts": "timestamp"}
-            )
-            items.extend(response.get('Items', []))
-
-            # Handle pagination if necessary
-            while 'LastEvaluatedKey' in response:
-                response = table.scan(
-                    FilterExpression=Attr('objectType').is_in(object_types),
-                    ProjectionExpression="#ts",
-                    ExpressionAttributeNames={"#ts": "timestamp"},
-                    ExclusiveStartKey=response['LastEvaluatedKey']
-                )
-                items.extend(response.get('Items', []))
-        else:
-            # Scan the entire table if no object types are specified
-            response = table.scan(
-                ProjectionExpression="#ts",
-                ExpressionAttributeNames={"#ts": "timestamp"}
-            )
-            items.extend(response.get('Items', []))
-
-            # Handle pagination if necessary
-            while 'LastEvaluatedKey' in response:
-                response = table.scan(
-                    ProjectionExpression="#ts",
-                    ExpressionAttributeNames={"#ts": "timestamp"},
-                    ExclusiveStartKey=response['LastEvaluatedKey']
-                )
-                items.extend(response.get('Items', []))
-
-        if not items:
-            return {'statusCode': 200, 'body': json.dumps([])}
-
-        # Extract the newest timestamp
-        newest_timestamp = max(int(item['timestamp']) for item in items)
-
-        # Step 2: Fetch items with the newest timestamp for the specified object types
+            object_types = default_object_types
+
+        try:
+            unknown_types = [object_type for object_type in object_types if object_type not in default_object_types]
+            if unknown_types:
+                raise ValueError(f"Unknown objectType: {', '.join(unknown_types)}")
+            bbox = parse_bbox(query_params['bbox']) if query_params.get('bbox') else None
+            response_format = parse_format(query_params)
+            fields = parse_fields(query_params)
+            since = parse_since(query_params, object_types)
+            if since is not None and bbox is not None:
+                raise ValueError("since can't be combined with bbox")
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
+
+        # Clients apply changes by objectID, so deltas always include it
+        if since is not None and fields is not None and 'objectID' not in fields:
+            fields = fields + ['objectID']
+        projection = projection_attributes(fields, bbox_attributes if bbox is not None else ())
+
+        with ThreadPoolExecutor(max_workers=min(max_fetch_workers, len(object_types))) as executor:
+            markers = list(executor.map(lambda object_type: fetch_committed_snapshot(snapshot_table, object_type), object_types))
+
+            if since is None and bbox is None:
+                # Serve the pre-rendered snapshot if one answers the request exactly; they hold whole items
+                key = None
+                if blob_store is not None and fields is None:
+                    key = select_artifact_key(object_types, markers, default_object_types)
+                if key is not None and response_format == 'columnar':
+                    key = columnar_artifact_key(key)
+                body = blob_store.get(key) if key is not None else None
+                if body is not None:
+                    return serve_artifact(event, key, body)
+
+            # Otherwise read the objects each marker lists, to find those carried from earlier snapshots
+            objects_table = get_table(objects_table_name, schemas.transient_snapshot_objects)
+            markers = list(executor.map(lambda marker: load_objects(objects_table, marker), markers))
+
+            if since is not None:
+                # Read only the changes since the client's snapshot
+                history_table = get_table(history_table_name, schemas.transient_snapshot_history)
+                deltas = list(executor.map(
+                    lambda args: fetch_snapshot_delta(table, history_table, args[0], args[1], since[args[0]], projection),
+                    zip(object_types, markers)))
+            elif bbox is not None:
+                # Read only the objects in the geohash cells covering the bounding box
+                snapshots = [fetch_bbox_snapshots(table, object_types, markers, bbox, projection)]
+            else:
+                # Query the newest snapshot of each object type concurrently
+                snapshots = list(executor.map(
+                    lambda args: fetch_latest_snapshot(table, *args, projection=projection), zip(object_types, markers)))
+
+        if since is not None:
+            items = select_fields([item for items, _, _ in deltas for item in items], fields, projection)
+            # Each objectType's own snapshot, for the client to send back as since, so that one lagging behind the rest isn't resent in full
+            snapshots = {object_type: int(marker['timestamp']) if marker is not None else None
+                         for object_type, marker in zip(object_types, markers)}
+            committed = [timestamp for timestamp in snapshots.values() if timestamp is not None]
+            return compress_response(event, {
+                'statusCode': 200,
+                'body': to_json({
+                    'snapshot': max(committed) if committed else None,
+                    'snapshots': snapshots,
+                    'since': since,
+                    # ObjectTypes sent in full, whose objects the client replaces rather than updates
+                    'full': [object_type for object_type, (_, _, full) in zip(object_types, deltas) if full],
+                    'items': to_columnar(items) if response_format == 'columnar' else items,
+                    'removed': [object_id for _, removed, _ in deltas for object_id in removed]
+                })
+            })
+
         items_with_latest_timestamp = []
+        for snapshot in snapshots:
+            items_with_latest_timestamp.extend(snapshot)
+        items_with_latest_timestamp = select_fields(items_with_latest_timestamp, fields, projection)
 
-        if object_types:
-            response = table.scan(
-                FilterExpression=Attr('objectType').is_in(object_types) & Attr('timestamp').eq(newest_timestamp)
-            )
-            items_with_latest_timestamp.extend(response.get('Items', []))
-
-            # Handle pagination if necessary
-            while 'LastEvaluatedKey' in response:
-                response = table.scan(
-                    FilterExpression=Attr('objectType').is_in(object_types) & Attr('timestamp').eq(newest_timestamp),
-                    ExclusiveStartKey=response['LastEvaluatedKey']
-                )
-                items_with_latest_timestamp.extend(response.get('Items', []))
+        if response_format == 'columnar':
+            body = to_json(to_columnar(items_with_latest_timestamp))
         else:
-            # Scan the entire table for the latest timestamp if no object types are specified
-            response = table.scan(
-                FilterExpression=Attr('timestamp').eq(newest_timestamp)
-            )
-            items_with_latest_timestamp.extend(response.get('Items', []))
-
-            # Handle pagination if necessary
-            while 'LastEvaluatedKey' in response:
-                response = table.scan(
-                    FilterExpression=Attr('timestamp').eq(newest_timestamp),
-                    ExclusiveStartKey=response['LastEvaluatedKey']
-                )
-                items_with_latest_timestamp.extend(response.get('Items', []))
+            body = to_json(items_with_latest_timestamp)
 
-        return {
+        return compress_response(event, {
             'statusCode': 200,
-            'body': json.dumps(items_with_latest_timestamp, default=str)
-        }
+            'body': body
+        })
 
     except Exception as e:
         return {
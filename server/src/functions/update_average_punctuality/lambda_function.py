@@ -1,16 +1,22 @@
 import json
-import boto3
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from shared.punctuality import punctuality_increment
+from shared.storage import get_table
+from shared.storage import schemas
 
-# Initialize DynamoDB resource
-dynamodb = boto3.resource("dynamodb")
-table_train = dynamodb.Table("punctuality_by_objectID")
-table_timestamp = dynamodb.Table("punctuality_by_timestamp")
+# Initialize tables on the configured storage backend
+table_train = get_table("punctuality_by_objectID", schemas.punctuality_by_objectID)
+table_timestamp = get_table("punctuality_by_timestamp", schemas.punctuality_by_timestamp)
+table_versions = get_table(os.environ.get("VERSION_TABLE", "dataset_versions"), schemas.dataset_versions)
 
 API_URL = "https://281bc6mcm5.execute-api.us-east-1.amazonaws.com/transient_data?objectType=IrishRailTrain"
 
+# Counter updates issued at once; each is a single round trip, so a pass takes about as long as one per worker
+update_workers = int(os.environ.get("PUNCTUALITY_UPDATE_WORKERS", 16))
+
 
 def fetch_train_data():
     """Fetch train data from API."""
@@ -31,30 +37,25 @@ def fetch_train_data():
 
 
 def update_punctuality(objectID, new_punctuality):
-    """Update punctuality data for a specific train."""
-    new_punctuality = Decimal(str(new_punctuality))  # Ensure Decimal type for DynamoDB
-    response = table_train.get_item(Key={"objectID": objectID})
-    if "Item" in response:
-        item = response["Item"]
-        old_avg = Decimal(str(item["average_punctuality"]))
-        count = int(item["count"])
-
-        # Calculate new average
-        new_avg = ((old_avg * count) + new_punctuality) / (count + 1)
-        count += 1
-
-        # Update the DynamoDB table, renaming 'count' to avoid reserved keyword issues
-        table_train.update_item(
-            Key={"objectID": objectID},
-            UpdateExpression="SET average_punctuality = :avg, #cnt = :cnt",
-            ExpressionAttributeValues={":avg": new_avg, ":cnt": count},
-            ExpressionAttributeNames={"#cnt": "count"}  # Alias 'count' to avoid reserved keyword issue
-        )
-    else:
-        # Insert new train punctuality record
-        table_train.put_item(
-            Item={"objectID": objectID, "average_punctuality": new_punctuality, "count": 1}
-        )
+    """
+    Add a train's punctuality to its running sum and count with a single atomic ADD update,
+    so that overlapping invocations can't lose each other's updates. The average is derived when read.
+    """
+    table_train.increment({"objectID": objectID}, punctuality_increment(new_punctuality))
+
+
+def update_punctualities(punctualities):
+    """
+    Update the punctuality of every train concurrently, across at most update_workers updates at once.
+
+    Args:
+        punctualities (list): The (objectID, punctuality) pair of each train.
+    """
+    if not punctualities:
+        return
+    with ThreadPoolExecutor(max_workers=min(update_workers, len(punctualities))) as executor:
+        # Consume the results so that a failed update raises, as it did when updates were sequential
+        list(executor.map(lambda train: update_punctuality(*train), punctualities))
 
 
 def update_punctuality_by_timestamp(timestamp, punctualities):
@@ -65,13 +66,16 @@ def update_punctuality_by_timestamp(timestamp, punctualities):
     avg_punctuality = Decimal(str(sum(punctualities) / len(punctualities)))  # Ensure Decimal type
     timestamp = Decimal(str(timestamp))  # Ensure Decimal type
 
-    # Insert or update record in DynamoDB
-    table_timestamp.put_item(
-        Item={
-            "timestamp": timestamp,
-            "average_punctuality": avg_punctuality
-        }
-    )
+    # Insert or update the timestamp's record
+    table_timestamp.put({
+        "timestamp": timestamp,
+        "average_punctuality": avg_punctuality
+    })
+
+
+def bump_punctuality_version():
+    """Bump the punctuality_by_objectID dataset version so that cached lookups are reloaded."""
+    table_versions.increment({"dataset": "punctuality_by_objectID"}, {"version": 1})
 
 
 def lambda_handler(event, context):
@@ -86,17 +90,20 @@ def lambda_handler(event, context):
     if not timestamp:
         return {"statusCode": 500, "body": json.dumps("Missing timestamp in train data")}
 
-    punctualities = []
+    train_punctualities = []
     for train in train_data:
         objectID = train.get("objectID")
         punctuality = int(train.get("trainPunctuality", 0))
 
         if objectID:
-            update_punctuality(objectID, punctuality)
-            punctualities.append(punctuality)
+            train_punctualities.append((objectID, punctuality))
+
+    update_punctualities(train_punctualities)
+    punctualities = [punctuality for _, punctuality in train_punctualities]
 
     # Update average punctuality for the timestamp
     update_punctuality_by_timestamp(timestamp, punctualities)
+    bump_punctuality_version()
 
     return {
         "statusCode": 200,
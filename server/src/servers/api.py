@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import base64
+import importlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from servers.connection import format_response, keep_alive, read_request
+
+# Threads running handlers; each request holds one for as long as its handler runs, including its DynamoDB reads
+api_workers = int(os.environ.get("API_WORKERS", 32))
+
+# Most requests handled at once; beyond it requests are refused with a 503, as a throttled Lambda would be, rather than queued
+max_in_flight = int(os.environ.get("API_MAX_IN_FLIGHT", 256))
+
+# Connections waiting to be accepted
+listen_backlog = 1024
+
+# The path each handler is served at, matching the API Gateway routes, as (path, module) pairs.
+# Every handler is also served at its function name.
+routes = [
+    ("/transient_data", "return_transient_data"),
+    ("/permanent_data", "return_permanent_data"),
+    ("/return_all_coordinates", "return_all_coordinates"),
+    ("/return_historical_data", "return_historical_data"),
+    ("/return_luas_data", "return_luas_data"),
+    ("/return_station_data", "return_station_data"),
+    ("/return_punctuality_by_objectID", "return_punctuality_by_objectID"),
+    ("/return_punctuality_by_timestamp", "return_punctuality_by_timestamp"),
+]
+
+# Handlers run on a schedule rather than per request, as (module, environment variable, default interval in seconds)
+scheduled_handlers = [
+    ("fetch_transient_data", "TRANSIENT_INGEST_INTERVAL", 60),
+    ("update_average_punctuality", "PUNCTUALITY_UPDATE_INTERVAL", 3600),
+    ("fetch_permanent_data", "PERMANENT_INGEST_INTERVAL", 86400),
+]
+
+cors_headers = {"Access-Control-Allow-Origin": "*"}
+
+
+def load_handler(module):
+    """
+    Imports a function's module, so that its module-level tables, sessions and caches are created once and shared by every request.
+
+    Args:
+        module (str): The function's directory under functions.
+
+    Returns:
+        The function's lambda_handler.
+    """
+    return importlib.import_module(f"functions.{module}.lambda_function").lambda_handler
+
+
+def load_routes():
+    """
+    Imports every request handler.
+
+    Returns:
+        dict: A dictionary mapping each path to its handler.
+    """
+    handlers = {}
+    for path, module in routes:
+        handlers[path] = handlers[f"/{module}"] = load_handler(module)
+    return handlers
+
+
+def to_event(request):
+    """
+    Converts a request to the API Gateway proxy event the handlers expect.
+
+    Args:
+        request (dict): The request, as returned by read_request.
+
+    Returns:
+        dict: The event.
+    """
+    return {
+        "httpMethod": request["method"],
+        "path": request["path"],
+        "headers": request["headers"],
+        "queryStringParameters": request["query_params"] or None,
+        "body": request["body"].decode("utf-8", "replace") if request["body"] else None,
+        "isBase64Encoded": False,
+    }
+
+
+def from_response(response):
+    """
+    Converts a handler's response to the status, headers and body to send, as API Gateway would.
+
+    Args:
+        response (dict): The handler's response.
+
+    Returns:
+        tuple: The status code, headers and body.
+    """
+    headers = dict(cors_headers)
+    headers.update(response.get("headers") or {})
+    headers.setdefault("Content-Type", "application/json")
+    body = response.get("body") or ""
+    body = base64.b64decode(body) if response.get("isBase64Encoded") else body.encode("utf-8")
+    return response.get("statusCode", 200), headers, body
+
+
+class ApiServer:
+    """
+    Serves every request handler from one process. Handlers run in a shared thread pool, so they share
+    the storage backend, its connection pool, and the caches each keeps between warm invocations.
+    """
+
+    def __init__(self, handlers, workers=api_workers):
+        self.handlers = handlers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="handler")
+        self.in_flight = 0
+        self.requests = 0
+        self.rejected = 0
+
+    async def invoke(self, handler, event):
+        """
+        Runs a handler in the thread pool.
+
+        Args:
+            handler: The lambda_handler.
+            event (dict): The API Gateway event.
+
+        Returns:
+            tuple: The status code, headers and body.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(self.executor, handler, event, None)
+            return from_response(response)
+        except Exception as e:
+            return 500, dict(cors_headers, **{"Content-Type": "application/json"}), json.dumps({'error': str(e)}).encode("utf-8")
+
+    async def dispatch(self, request):
+        """
+        Routes a request to its handler.
+
+        Args:
+            request (dict): The request, as returned by read_request.
+
+        Returns:
+            tuple: The status code, headers and body.
+        """
+        path = request["path"].rstrip("/") or "/"
+        if path == "/health":
+            return json_response(200, {'in_flight': self.in_flight, 'requests': self.requests, 'rejected': self.rejected})
+
+        handler = self.handlers.get(path)
+        if handler is None:
+            return json_response(404, {'error': "Not found"})
+        if request["method"] == "OPTIONS":
+            return 204, dict(cors_headers, **{
+                "Access-Control-Allow-Methods": "GET, OPTIONS",
+                "Access-Control-Allow-Headers": "*",
+            }), b""
+        if request["method"] != "GET":
+            return json_response(405, {'error': "Method not allowed"})
+        if self.in_flight >= max_in_flight:
+            self.rejected += 1
+            return json_response(503, {'error': "Too many requests"})
+
+        self.in_flight += 1
+        self.requests += 1
+        try:
+            return await self.invoke(handler, to_event(request))
+        finally:
+            self.in_flight -= 1
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves the requests on one connection, keeping it open between them unless the client asks otherwise.
+
+        Args:
+            reader (asyncio.StreamReader): The connection's reader.
+            writer (asyncio.StreamWriter): The connection's writer.
+        """
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except ValueError as e:
+                    status, headers, body = json_response(400, {'error': str(e)})
+                    writer.write(format_response(status, headers, body, close=True))
+                    await writer.drain()
+                    return
+                if request is None:
+                    return
+
+                status, headers, body = await self.dispatch(request)
+                close = not keep_alive(request)
+                writer.write(format_response(status, headers, b"" if status == 304 else body, close=close))
+                await writer.drain()
+                if close:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def run_scheduled(self, module, interval):
+        """
+        Runs a scheduled handler every interval seconds, as its EventBridge schedule would.
+
+        Args:
+            module (str): The function's directory under functions.
+            interval (float): The seconds between runs.
+        """
+        handler = await asyncio.to_thread(load_handler, module)
+        while True:
+            try:
+                await asyncio.get_running_loop().run_in_executor(self.executor, handler, {}, None)
+            except Exception as e:
+                print(f"Scheduled {module} failed: {e}")
+            await asyncio.sleep(interval)
+
+
+def json_response(status, body):
+    """
+    Builds a JSON response from the server itself rather than a handler.
+
+    Args:
+        status (int): The status code.
+        body (dict): The response body.
+
+    Returns:
+        tuple: The status code, headers and body.
+    """
+    return status, dict(cors_headers, **{"Content-Type": "application/json"}), json.dumps(body).encode("utf-8")
+
+
+async def serve(host, port, schedule=False):
+    """
+    Runs the API server until it is interrupted.
+
+    Args:
+        host (str): The address to listen on.
+        port (int): The port to listen on.
+        schedule (bool): Whether to also run the ingest handlers on their schedules.
+    """
+    server = ApiServer(load_routes())
+    jobs = []
+    if schedule:
+        for module, variable, default in scheduled_handlers:
+            jobs.append(asyncio.create_task(server.run_scheduled(module, float(os.environ.get(variable, default)))))
+
+    listener = await asyncio.start_server(server.handle_connection, host, port, backlog=listen_backlog)
+    print(f"Serving {len(routes)} handlers on http://{host}:{port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        for job in jobs:
+            job.cancel()
+        server.executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves every API handler from one process, sharing their storage connections and caches.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--schedule", action="store_true", help="also run the ingest handlers on their schedules")
+    args = parser.parse_args()
+
+    # Each Lambda reads its own table from TABLE_NAME, which can only name one table per process
+    os.environ.setdefault("TRANSIENT_TABLE", "transient_data2")
+    os.environ.setdefault("PERMANENT_TABLE", "permanent_data")
+    try:
+        asyncio.run(serve(args.host, args.port, args.schedule))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import urllib.parse
+
+# Largest request body accepted, in bytes
+max_body_size = int(os.environ.get("MAX_BODY_SIZE", 1048576))
+
+# Longest a connection may take to send a request, and how long an idle keep-alive connection is held open, in seconds
+request_timeout = float(os.environ.get("REQUEST_TIMEOUT", 30))
+
+status_reasons = {
+    200: "OK",
+    204: "No Content",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+async def read_request(reader):
+    """
+    Reads one HTTP/1.1 request from a connection.
+
+    Args:
+        reader (asyncio.StreamReader): The connection's reader.
+
+    Returns:
+        dict: The method, path, query string parameters, headers, body and HTTP version of the request,
+        or None if the connection was closed, or left idle for request_timeout, before a request began.
+
+    Raises:
+        ValueError: If the request is malformed or too large.
+    """
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), request_timeout)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ValueError("Incomplete request")
+    except asyncio.LimitOverrunError:
+        raise ValueError("Request headers too large")
+    except (asyncio.TimeoutError, ConnectionError):
+        return None
+
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = request_line.split(" ")
+    except ValueError:
+        raise ValueError("Malformed request line")
+
+    headers = {}
+    for line in header_lines:
+        name, separator, value = line.partition(":")
+        if separator:
+            headers[name.strip()] = value.strip()
+
+    path, _, query = target.partition("?")
+    query_params = dict(urllib.parse.parse_qsl(query, keep_blank_values=True))
+
+    lengths = [value for name, value in headers.items() if name.lower() == "content-length"]
+    try:
+        length = int(lengths[0]) if lengths else 0
+    except ValueError:
+        raise ValueError("Malformed Content-Length")
+    if length < 0 or length > max_body_size:
+        raise ValueError("Request body too large")
+    try:
+        body = await asyncio.wait_for(reader.readexactly(length), request_timeout) if length else b""
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+        raise ValueError("Incomplete request")
+
+    return {
+        "method": method.upper(),
+        "path": urllib.parse.unquote(path),
+        "query_params": query_params,
+        "headers": headers,
+        "body": body,
+        "version": version,
+    }
+
+
+def keep_alive(request):
+    """
+    Decides whether a connection stays open after a request, following the HTTP/1.1 default unless the client asked otherwise.
+
+    Args:
+        request (dict): The request, as returned by read_request.
+
+    Returns:
+        bool: Whether to read another request from the connection.
+    """
+    connection = next((value for name, value in request["headers"].items() if name.lower() == "connection"), "")
+    if request["version"] == "HTTP/1.0":
+        return connection.lower() == "keep-alive"
+    return connection.lower() != "close"
+
+
+def format_head(status, headers):
+    """
+    Formats the status line and headers of a response.
+
+    Args:
+        status (int): The status code.
+        headers (dict): The response headers.
+
+    Returns:
+        bytes: The response head, ending with the blank line before the body.
+    """
+    lines = [f"HTTP/1.1 {status} {status_reasons.get(status, 'Unknown')}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def format_response(status, headers, body, close=False):
+    """
+    Formats a complete response with a Content-Length, so that the connection can be reused for the next request.
+
+    Args:
+        status (int): The status code.
+        headers (dict): The response headers.
+        body (bytes): The body.
+        close (bool): Whether the connection is closed after the response.
+
+    Returns:
+        bytes: The response.
+    """
+    headers = dict(headers, **{"Content-Length": str(len(body))})
+    if close:
+        headers["Connection"] = "close"
+    return format_head(status, headers) + body
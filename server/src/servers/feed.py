@@ -0,0 +1,208 @@
+from shared.geohash import item_position
+from shared.projection import strip_index_attributes
+from shared.snapshots import fetch_carried_items, load_objects
+
+gsi_name = "objectType-index"
+
+
+def fetch_snapshot_items(table, object_type, marker, since=None):
+    """
+    Retrieves the objects of a committed snapshot: those written under its timestamp, and those it carries forward.
+    Given the previous snapshot, carried objects are limited to those rewritten after it, so that only the changes are read.
+
+    Args:
+        table: The transient data table.
+        object_type (str): The objectType of the snapshot.
+        marker (dict): The snapshot commit marker.
+        since (int): The timestamp of the previous snapshot, or None to read the whole snapshot.
+
+    Returns:
+        list: The items, without their index attributes.
+    """
+    items = table.query(object_type, sort=('eq', int(marker['timestamp'])), index=gsi_name)
+    items.extend(fetch_carried_items(table, marker, since=since))
+    return strip_index_attributes(items)
+
+
+class Change:
+    """
+    The change to one object between two snapshots, with its position before and after so that
+    viewport subscribers can tell whether it entered, moved within or left their bounding box.
+    """
+
+    __slots__ = ("object_id", "object_type", "item", "position", "previous_position")
+
+    def __init__(self, object_id, object_type, item, position, previous_position):
+        self.object_id = object_id
+        self.object_type = object_type
+        self.item = item
+        self.position = position
+        self.previous_position = previous_position
+
+
+class SnapshotFeed:
+    """
+    Follows the committed snapshots of each objectType, keeping their objects in memory so that
+    any number of subscribers can be sent the changes, or the whole snapshot, without reading the tables again.
+    """
+
+    def __init__(self, table, snapshot_table, objects_table, object_types):
+        self.table = table
+        self.snapshot_table = snapshot_table
+        self.objects_table = objects_table
+        self.object_types = list(object_types)
+        # Maps objectType -> the timestamp of the snapshot held, or None before the first
+        self.timestamps = {object_type: None for object_type in self.object_types}
+        # Maps objectType -> {objectID: item}
+        self.objects = {object_type: {} for object_type in self.object_types}
+        # Maps objectType -> {objectID: (latitude, longitude) or None}
+        self.positions = {object_type: {} for object_type in self.object_types}
+
+    def snapshot(self):
+        """
+        Returns the newest snapshot timestamp held across every objectType.
+
+        Returns:
+            int: The timestamp, or None if no snapshot has been read yet.
+        """
+        timestamps = [timestamp for timestamp in self.timestamps.values() if timestamp is not None]
+        return max(timestamps) if timestamps else None
+
+    def snapshots(self, object_types):
+        """
+        Returns the snapshot timestamp held of each of some objectTypes, for clients to resume from with since.
+
+        Args:
+            object_types (frozenset): The objectTypes.
+
+        Returns:
+            dict: A dictionary mapping each objectType, in the feed's order, to its timestamp, or None before its first snapshot.
+        """
+        return {object_type: self.timestamps[object_type] for object_type in self.object_types if object_type in object_types}
+
+    def read_updates(self):
+        """
+        Reads the commit marker of each objectType and, for those with a newer snapshot, the objects changed since the one held.
+        Markers are read with a projection of just their timestamp until one moves, so an idle poll costs one small read per objectType.
+        Only reads, so that it can run in a worker thread while subscribers are served from the objects held.
+
+        Returns:
+            list: A (objectType, marker, items) tuple for each objectType with a newer snapshot, to pass to apply.
+        """
+        updates = []
+        for object_type in self.object_types:
+            key = {'objectType': object_type}
+            committed = self.snapshot_table.get(key, projection=['timestamp'])
+            if committed is None or int(committed['timestamp']) == self.timestamps[object_type]:
+                continue
+
+            marker = load_objects(self.objects_table, self.snapshot_table.get(key))
+            # Markers list every object in the snapshot, so only objects rewritten since the previous one need reading
+            since = self.timestamps[object_type] if 'objects' in marker else None
+            updates.append((object_type, marker, fetch_snapshot_items(self.table, object_type, marker, since=since)))
+        return updates
+
+    def apply(self, object_type, marker, items):
+        """
+        Updates the objects held for an objectType to a newer snapshot.
+
+        Args:
+            object_type (str): The objectType.
+            marker (dict): The commit marker of the newer snapshot.
+            items (list): The objects read by read_updates.
+
+        Returns:
+            list: The Changes, including a removal for every object no longer in the snapshot.
+        """
+        objects = self.objects[object_type]
+        positions = self.positions[object_type]
+        current_ids = set(marker['objects']) if 'objects' in marker else {item['objectID'] for item in items}
+
+        changes = []
+        for item in items:
+            object_id = item['objectID']
+            position = item_position(item)
+            changes.append(Change(object_id, object_type, item, position, positions.get(object_id)))
+            objects[object_id] = item
+            positions[object_id] = position
+
+        for object_id in [object_id for object_id in objects if object_id not in current_ids]:
+            changes.append(Change(object_id, object_type, None, None, positions.pop(object_id)))
+            del objects[object_id]
+
+        self.timestamps[object_type] = int(marker['timestamp'])
+        return changes
+
+    def poll(self):
+        """
+        Reads and applies every newer snapshot.
+
+        Returns:
+            dict: A dictionary mapping each objectType with a new snapshot to its list of Changes. Removed objects have an item of None.
+        """
+        return {object_type: self.apply(object_type, marker, items) for object_type, marker, items in self.read_updates()}
+
+
+def in_box(position, bbox):
+    """
+    Tests whether a position lies within a bounding box.
+
+    Args:
+        position (tuple): The latitude and longitude, or None if the object has no position.
+        bbox (tuple): The west, south, east and north edges, or None for no bounding box.
+
+    Returns:
+        bool: Whether the position is within the bounding box, or True if there is no bounding box.
+    """
+    if bbox is None:
+        return True
+    if position is None:
+        return False
+    west, south, east, north = bbox
+    return south <= position[0] <= north and west <= position[1] <= east
+
+
+def filter_changes(changes, object_types, bbox):
+    """
+    Picks out the changes a subscriber sees: objects of its objectTypes that are now in its bounding box are updated,
+    and those that have left it, or the snapshot, are removed.
+
+    Args:
+        changes (dict): A dictionary mapping each objectType to its list of Changes.
+        object_types (frozenset): The subscriber's objectTypes.
+        bbox (tuple): The subscriber's bounding box, or None for every position.
+
+    Returns:
+        tuple: The items to update and the objectIDs to remove.
+    """
+    items = []
+    removed = []
+    for object_type, object_changes in changes.items():
+        if object_type not in object_types:
+            continue
+        for change in object_changes:
+            if change.item is not None and in_box(change.position, bbox):
+                items.append(change.item)
+            elif bbox is None or in_box(change.previous_position, bbox):
+                # Removed from the snapshot, or moved out of a box it was in
+                removed.append(change.object_id)
+    return items, removed
+
+
+def filter_objects(feed, object_types, bbox):
+    """
+    Picks out the objects a subscriber sees in the snapshots held.
+
+    Args:
+        feed (SnapshotFeed): The feed.
+        object_types (frozenset): The subscriber's objectTypes.
+        bbox (tuple): The subscriber's bounding box, or None for every position.
+
+    Returns:
+        list: The items.
+    """
+    return [
+        item
+        for object_type in feed.object_types if object_type in object_types
+        for object_id, item in feed.objects[object_type].items() if in_box(feed.positions[object_type][object_id], bbox)
+    ]
@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import json
+import os
+from servers.connection import format_head, format_response, read_request
+from servers.feed import SnapshotFeed, filter_changes, filter_objects
+from shared.geohash import parse_bbox
+from shared.serialization import to_json
+from shared.storage import get_table
+from shared.storage import schemas
+
+table_name = os.environ.get("TABLE_NAME", "transient_data2")
+snapshot_table_name = os.environ.get("SNAPSHOT_TABLE", "transient_snapshots")
+objects_table_name = os.environ.get("SNAPSHOT_OBJECTS_TABLE", "transient_snapshot_objects")
+
+# How often the snapshot commit markers are checked for a new snapshot, in seconds
+poll_interval = float(os.environ.get("PUSH_POLL_INTERVAL", 5))
+
+# Most events queued for a subscriber; one that falls further behind is resynchronised with the whole snapshot instead
+subscriber_queue_size = int(os.environ.get("PUSH_QUEUE_SIZE", 8))
+
+# Longest a subscriber may take to accept an event before it is disconnected, in seconds
+send_timeout = float(os.environ.get("PUSH_SEND_TIMEOUT", 10))
+
+# How often an idle stream is sent a comment, so that proxies and clients don't time it out, in seconds
+heartbeat_interval = float(os.environ.get("PUSH_HEARTBEAT_INTERVAL", 15))
+
+# Most concurrent subscribers; further connections are refused with a 503
+max_subscribers = int(os.environ.get("PUSH_MAX_SUBSCRIBERS", 10000))
+
+# Connections waiting to be accepted, so that viewers reconnecting together after a restart aren't refused
+listen_backlog = 1024
+
+# Object types written by fetch_transient_data
+object_types = ["IrishRailTrain", "Bus"]
+
+json_headers = {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"}
+event_stream_headers = {
+    "Content-Type": "text/event-stream",
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Access-Control-Allow-Origin": "*",
+}
+
+heartbeat = b": keepalive\n\n"
+
+
+def parse_subscription(query_params, known_types):
+    """
+    Reads the objectTypes and bounding box a subscriber wants changes to.
+
+    Args:
+        query_params (dict): The query string parameters.
+        known_types (list): The objectTypes the feed follows.
+
+    Returns:
+        tuple: The objectTypes as a frozenset, and the bounding box, or None for every position.
+
+    Raises:
+        ValueError: If an objectType is unknown or the bounding box is malformed.
+    """
+    requested = query_params.get("objectType")
+    if requested:
+        subscribed = frozenset(object_type.strip() for object_type in requested.split(","))
+        if not subscribed <= set(known_types):
+            raise ValueError(f"objectType must be one or more of {', '.join(known_types)}")
+    else:
+        subscribed = frozenset(known_types)
+    bbox = parse_bbox(query_params["bbox"]) if query_params.get("bbox") else None
+    return subscribed, bbox
+
+
+def format_event(snapshots, full, items, removed):
+    """
+    Formats a server-sent event in the same shape as a since request to return_transient_data,
+    so that clients apply pushed and polled changes alike.
+
+    Args:
+        snapshots (dict): A dictionary mapping each subscribed objectType to its snapshot timestamp, or None before its first.
+        full (list): The objectTypes whose objects are all included, replacing those the client holds.
+        items (list): The new or changed objects.
+        removed (list): The objectIDs of objects to drop.
+
+    Returns:
+        bytes: The event.
+    """
+    committed = [timestamp for timestamp in snapshots.values() if timestamp is not None]
+    snapshot = max(committed) if committed else None
+    data = to_json({"snapshot": snapshot, "snapshots": snapshots, "full": full, "items": items, "removed": removed})
+    event_id = f"id: {snapshot}\n" if snapshot is not None else ""
+    return f"{event_id}event: snapshot\ndata: {data}\n\n".encode("utf-8")
+
+
+class Subscriber:
+    """
+    A connected client and the events queued for it. Its first event, and the event after it falls
+    behind, is the whole snapshot, represented in the queue by None and rendered when it is sent.
+    """
+
+    def __init__(self, object_types, bbox):
+        self.object_types = object_types
+        self.bbox = bbox
+        self.queue = asyncio.Queue(maxsize=subscriber_queue_size)
+        self.resync = True
+        self.queue.put_nowait(None)
+
+    def offer(self, event):
+        """
+        Queues an event without waiting. A subscriber whose queue is full is falling behind, so its
+        pending events are dropped and replaced by a resynchronisation with the whole snapshot.
+
+        Args:
+            event (bytes): The event.
+
+        Returns:
+            bool: Whether the subscriber had to be resynchronised.
+        """
+        if self.resync:
+            # The whole snapshot it is about to be sent already includes the change
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return False
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.resync = True
+            self.queue.put_nowait(None)
+            return True
+
+
+class PushServer:
+    """
+    Serves a SnapshotFeed as server-sent events. Each new snapshot is read once, whatever the number of
+    subscribers, and each distinct objectType and bounding box filter is rendered once per snapshot.
+    """
+
+    def __init__(self, feed):
+        self.feed = feed
+        self.subscribers = set()
+        self.resyncs = 0
+        # Whole-snapshot events rendered for each filter since the last snapshot was applied
+        self.snapshot_events = {}
+
+    async def refresh(self):
+        """
+        Reads any newer snapshots in a worker thread and publishes their changes.
+        """
+        try:
+            updates = await asyncio.to_thread(self.feed.read_updates)
+        except Exception as e:
+            print(f"Failed to read snapshots: {e}")
+            return
+        self.publish(updates)
+
+    async def follow(self):
+        """
+        Publishes new snapshots as they are committed, checking every poll_interval seconds.
+        """
+        while True:
+            await asyncio.sleep(poll_interval)
+            await self.refresh()
+
+    def publish(self, updates):
+        """
+        Applies newer snapshots to the feed and queues their changes for every subscriber they concern.
+
+        Args:
+            updates (list): The updates returned by SnapshotFeed.read_updates.
+        """
+        changes = {object_type: self.feed.apply(object_type, marker, items) for object_type, marker, items in updates}
+        if not changes:
+            return
+        self.snapshot_events.clear()
+
+        events = {}
+        for subscriber in self.subscribers:
+            key = (subscriber.object_types, subscriber.bbox)
+            if key not in events:
+                items, removed = filter_changes(changes, subscriber.object_types, subscriber.bbox)
+                events[key] = format_event(self.feed.snapshots(subscriber.object_types), [], items, removed) if items or removed else None
+            if events[key] is not None and subscriber.offer(events[key]):
+                self.resyncs += 1
+
+    def snapshot_event(self, subscriber):
+        """
+        Renders the whole snapshot a subscriber sees from the objects held in memory,
+        once per filter until the next snapshot is applied.
+
+        Args:
+            subscriber (Subscriber): The subscriber.
+
+        Returns:
+            bytes: The event.
+        """
+        key = (subscriber.object_types, subscriber.bbox)
+        if key not in self.snapshot_events:
+            items = filter_objects(self.feed, subscriber.object_types, subscriber.bbox)
+            full = [object_type for object_type in self.feed.object_types if object_type in subscriber.object_types]
+            self.snapshot_events[key] = format_event(self.feed.snapshots(subscriber.object_types), full, items, [])
+        return self.snapshot_events[key]
+
+    async def stream(self, subscriber, reader, writer):
+        """
+        Sends a subscriber its events until it disconnects or stops accepting them for send_timeout seconds.
+
+        Args:
+            subscriber (Subscriber): The subscriber.
+            reader (asyncio.StreamReader): The connection's reader, watched for the client closing it.
+            writer (asyncio.StreamWriter): The connection's writer.
+        """
+        closed = asyncio.ensure_future(wait_closed(reader))
+        self.subscribers.add(subscriber)
+        try:
+            writer.write(format_head(200, event_stream_headers))
+            while True:
+                queued = asyncio.ensure_future(subscriber.queue.get())
+                done, _ = await asyncio.wait({queued, closed}, timeout=heartbeat_interval, return_when=asyncio.FIRST_COMPLETED)
+                if closed in done:
+                    queued.cancel()
+                    return
+                if queued in done:
+                    event = queued.result()
+                    if event is None:
+                        subscriber.resync = False
+                        event = self.snapshot_event(subscriber)
+                else:
+                    queued.cancel()
+                    event = heartbeat
+
+                writer.write(event)
+                # Waits only while the connection's send buffer is full
+                await asyncio.wait_for(writer.drain(), send_timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            self.subscribers.discard(subscriber)
+            closed.cancel()
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves one connection: a GET /events stream, or the GET /health summary.
+
+        Args:
+            reader (asyncio.StreamReader): The connection's reader.
+            writer (asyncio.StreamWriter): The connection's writer.
+        """
+        try:
+            try:
+                request = await read_request(reader)
+            except ValueError as e:
+                await respond(writer, 400, {'error': str(e)})
+                return
+            if request is None:
+                return
+
+            if request["method"] != "GET":
+                await respond(writer, 405, {'error': "Method not allowed"})
+            elif request["path"] == "/health":
+                await respond(writer, 200, {
+                    'snapshot': self.feed.snapshot(),
+                    'subscribers': len(self.subscribers),
+                    'resyncs': self.resyncs
+                })
+            elif request["path"] == "/events":
+                try:
+                    subscribed, bbox = parse_subscription(request["query_params"], self.feed.object_types)
+                except ValueError as e:
+                    await respond(writer, 400, {'error': str(e)})
+                    return
+                if len(self.subscribers) >= max_subscribers:
+                    await respond(writer, 503, {'error': "Too many subscribers"})
+                    return
+                await self.stream(Subscriber(subscribed, bbox), reader, writer)
+            else:
+                await respond(writer, 404, {'error': "Not found"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def respond(writer, status, body):
+    """
+    Sends a JSON response and lets the connection close after it.
+
+    Args:
+        writer (asyncio.StreamWriter): The connection's writer.
+        status (int): The status code.
+        body (dict): The response body.
+    """
+    writer.write(format_response(status, json_headers, json.dumps(body).encode("utf-8"), close=True))
+    await asyncio.wait_for(writer.drain(), send_timeout)
+
+
+async def wait_closed(reader):
+    """
+    Waits for the client to close its end of a stream, discarding anything it sends.
+
+    Args:
+        reader (asyncio.StreamReader): The connection's reader.
+    """
+    try:
+        while await reader.read(4096):
+            pass
+    except ConnectionError:
+        pass
+
+
+async def serve(host, port):
+    """
+    Runs the push server until it is interrupted.
+
+    Args:
+        host (str): The address to listen on.
+        port (int): The port to listen on.
+    """
+    feed = SnapshotFeed(
+        get_table(table_name, schemas.transient_data),
+        get_table(snapshot_table_name, schemas.transient_snapshots),
+        get_table(objects_table_name, schemas.transient_snapshot_objects),
+        object_types
+    )
+    server = PushServer(feed)
+    await server.refresh()
+    follower = asyncio.create_task(server.follow())
+    listener = await asyncio.start_server(server.handle_connection, host, port, backlog=listen_backlog)
+    print(f"Streaming snapshots on http://{host}:{port}/events")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        follower.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pushes each committed transient snapshot to subscribers as server-sent events.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+import boto3
+
+
+class S3BlobStore:
+    """
+    Stores blobs as objects in an S3 bucket.
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.s3 = boto3.client("s3")
+
+    def get(self, key):
+        """
+        Retrieves a blob.
+
+        Args:
+            key (str): The key of the blob.
+
+        Returns:
+            bytes: The blob, or None if it doesn't exist.
+        """
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+    def put(self, key, data, content_type="application/json", content_encoding="gzip"):
+        """
+        Stores a blob.
+
+        Args:
+            key (str): The key of the blob.
+            data (bytes): The blob.
+            content_type (str): The MIME type of the blob's contents.
+            content_encoding (str): The encoding the blob's contents are compressed with.
+        """
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type, ContentEncoding=content_encoding)
+
+
+class LocalBlobStore:
+    """
+    Stores blobs as files under a local directory, for tests and running locally.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get(self, key):
+        """
+        Retrieves a blob.
+
+        Args:
+            key (str): The key of the blob.
+
+        Returns:
+            bytes: The blob, or None if it doesn't exist.
+        """
+        try:
+            with open(os.path.join(self.directory, key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data, content_type="application/json", content_encoding="gzip"):
+        """
+        Stores a blob, writing it to a temporary file first so that readers never see a partial blob.
+
+        Args:
+            key (str): The key of the blob.
+            data (bytes): The blob.
+            content_type (str): Unused; kept for interface compatibility with S3BlobStore.
+            content_encoding (str): Unused; kept for interface compatibility with S3BlobStore.
+        """
+        path = os.path.join(self.directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as file:
+            file.write(data)
+        os.replace(path + ".tmp", path)
+
+
+def get_blob_store():
+    """
+    Creates the blob store configured by the environment: BLOB_BACKEND selects "s3" (using SNAPSHOT_BUCKET)
+    or "local" (using SNAPSHOT_BLOB_DIR), defaulting to whichever of the two is set.
+
+    Returns:
+        The configured blob store, or None if none is configured.
+    """
+    backend = os.environ.get("BLOB_BACKEND")
+    if backend is None:
+        if os.environ.get("SNAPSHOT_BUCKET"):
+            backend = "s3"
+        elif os.environ.get("SNAPSHOT_BLOB_DIR"):
+            backend = "local"
+        else:
+            return None
+
+    if backend == "s3":
+        return S3BlobStore(os.environ["SNAPSHOT_BUCKET"])
+    if backend == "local":
+        return LocalBlobStore(os.environ["SNAPSHOT_BLOB_DIR"])
+    raise ValueError(f"Unknown blob backend: {backend}")
@@ -0,0 +1,128 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+# Maximum number of items DynamoDB accepts in a single BatchWriteItem request
+batch_size = 25
+
+# Error codes that mean the whole request was throttled and should be retried
+throttle_error_codes = {"ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded"}
+
+# Bounds of the backoff delay between retries, in seconds
+base_delay = 0.05
+max_delay = 5.0
+
+
+def dedupe_items(items, key_attributes):
+    """
+    Removes items with duplicate primary keys, keeping the last occurrence,
+    as DynamoDB rejects a batch that writes the same key twice.
+
+    Args:
+        items (list): The items to write.
+        key_attributes (tuple): The names of the table's primary key attributes.
+
+    Returns:
+        list: The items with unique keys, in their original order.
+    """
+    unique_items = {}
+    for item in items:
+        unique_items[tuple(item[attribute] for attribute in key_attributes)] = item
+    return list(unique_items.values())
+
+
+def backoff(delay):
+    """
+    Sleeps for a full-jitter delay before retrying a throttled request.
+
+    Args:
+        delay (float): The current upper bound of the delay, in seconds.
+
+    Returns:
+        float: The upper bound for the next retry, doubled up to max_delay.
+    """
+    time.sleep(random.uniform(0, delay))
+    return min(max_delay, delay * 2)
+
+
+def write_batches(table, batches, max_retries):
+    """
+    Writes a shard of batches sequentially, retrying unprocessed items with adaptive backoff:
+    the full-jitter delay doubles while DynamoDB keeps throttling and halves once requests go through,
+    so each worker settles near the rate the table can absorb.
+
+    Args:
+        table: The DynamoDB table to write to.
+        batches (list): A list of batches, each a list of at most 25 items.
+        max_retries (int): The number of consecutive retries allowed for a batch before giving up.
+
+    Returns:
+        int: The number of retries made.
+    """
+    client = table.meta.client
+    delay = base_delay
+    retries = 0
+
+    for batch in batches:
+        request_items = {table.name: [{"PutRequest": {"Item": item}} for item in batch]}
+        attempts = 0
+
+        while request_items:
+            try:
+                response = client.batch_write_item(RequestItems=request_items)
+                request_items = response.get("UnprocessedItems")
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in throttle_error_codes:
+                    raise
+
+            if not request_items:
+                delay = max(base_delay, delay / 2)
+                break
+
+            attempts += 1
+            retries += 1
+            if attempts > max_retries:
+                raise RuntimeError(f"Gave up writing to {table.name} after {max_retries} retries.")
+            delay = backoff(delay)
+
+    return retries
+
+
+def bulk_write(table, items, key_attributes, workers=8, max_retries=10):
+    """
+    Writes items to a DynamoDB table, sharding batches across concurrent workers.
+    Items are deduplicated by key, unprocessed items are retried with jittered adaptive backoff,
+    and throughput and retry counts are reported at the end.
+
+    Args:
+        table: The DynamoDB table to write to.
+        items (list): The items to write.
+        key_attributes (tuple): The names of the table's primary key attributes.
+        workers (int): The maximum number of concurrent writers.
+        max_retries (int): The number of consecutive retries allowed for a batch before giving up.
+
+    Returns:
+        dict: The number of items written, retries made, seconds taken and items per second.
+    """
+    start = time.time()
+    items = dedupe_items(items, key_attributes)
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+    # Deal batches round-robin so that each worker gets an even share
+    shard_count = max(1, min(workers, len(batches)))
+    shards = [batches[i::shard_count] for i in range(shard_count)]
+
+    with ThreadPoolExecutor(max_workers=shard_count) as executor:
+        retries = sum(executor.map(lambda shard: write_batches(table, shard, max_retries), shards))
+
+    seconds = time.time() - start
+    stats = {
+        "items": len(items),
+        "retries": retries,
+        "seconds": round(seconds, 3),
+        "itemsPerSecond": round(len(items) / seconds) if seconds > 0 else len(items)
+    }
+    print(f"Wrote {stats['items']} items to {table.name} in {stats['seconds']}s "
+          f"({stats['itemsPerSecond']} items/s) with {stats['retries']} retries.")
+    return stats
@@ -0,0 +1,131 @@
+from decimal import Decimal
+from shared.serialization import number_value
+
+# Response formats the snapshot endpoints can return: an array of items, or one array per attribute
+response_formats = ("json", "columnar")
+
+# Attributes stored as strings that the columnar format sends as numbers
+numeric_attributes = ("latitude", "longitude")
+
+
+def parse_format(query_params):
+    """
+    Reads the requested response format.
+
+    Args:
+        query_params (dict): The query string parameters.
+
+    Returns:
+        str: "json" or "columnar".
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    response_format = query_params.get("format") or "json"
+    if response_format not in response_formats:
+        raise ValueError(f"format must be one of {', '.join(response_formats)}")
+    return response_format
+
+
+def to_number(value):
+    """
+    Parses a coordinate, which is stored as a string, as a number.
+
+    Args:
+        value: The stored value.
+
+    Returns:
+        float: The number, or None if the value isn't one.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def encode_column(name, values):
+    """
+    Encodes the values of one attribute across every item.
+    Coordinates become numbers, and strings that repeat become a dictionary of distinct values
+    and an index into it for each item. Everything else is sent as is.
+
+    Args:
+        name (str): The attribute name.
+        values (list): The attribute's value in each item, or None where an item lacks it.
+
+    Returns:
+        dict: {"values": [...]} or {"dictionary": [...], "codes": [...]}, with None for missing values.
+    """
+    if name in numeric_attributes:
+        return {"values": [to_number(value) for value in values]}
+
+    present = [value for value in values if value is not None]
+    if present and all(isinstance(value, str) for value in present):
+        dictionary = list(dict.fromkeys(present))
+        # Only worthwhile if values repeat; unique strings such as IDs are cheaper sent as is
+        if len(dictionary) <= len(values) // 2:
+            codes = {value: code for code, value in enumerate(dictionary)}
+            return {"dictionary": dictionary, "codes": [codes.get(value) for value in values]}
+
+    # Numbers read back from DynamoDB as Decimals are converted as to_json converts them, so that items read
+    # from the table and items rendered at ingest encode identically
+    return {"values": [number_value(value) if isinstance(value, Decimal) else value for value in values]}
+
+
+def to_columnar(items):
+    """
+    Converts items to the columnar format, in which each attribute name is sent once with an array of its values.
+    Item i is rebuilt by taking element i of each column's values, or dictionary[codes[i]] for dictionary-encoded columns.
+
+    Args:
+        items (list): The items.
+
+    Returns:
+        dict: The number of items and the encoded column of each attribute, in the order attributes first appear.
+    """
+    names = list(dict.fromkeys(name for item in items for name in item))
+    return {
+        "format": "columnar",
+        "length": len(items),
+        "columns": {name: encode_column(name, [item.get(name) for item in items]) for name in names}
+    }
+
+
+def column_values(column, length):
+    """
+    Decodes a column encoded by encode_column back to the value of each item.
+
+    Args:
+        column (dict): The encoded column, or None if no item has the attribute.
+        length (int): The number of items.
+
+    Returns:
+        list: The value of each item, or None where an item lacks it.
+    """
+    if column is None:
+        return [None] * length
+    if "dictionary" in column:
+        return [column["dictionary"][code] if code is not None else None for code in column["codes"]]
+    return column["values"]
+
+
+def concat_columnar(bodies):
+    """
+    Joins columnar bodies into the one to_columnar would build from all of their items in order,
+    so that the bodies of separate sets of items can be built once and combined on request.
+
+    Args:
+        bodies (list): The bodies, as returned by to_columnar.
+
+    Returns:
+        dict: The combined body.
+    """
+    names = list(dict.fromkeys(name for body in bodies for name in body["columns"]))
+    return {
+        "format": "columnar",
+        "length": sum(body["length"] for body in bodies),
+        "columns": {
+            name: encode_column(name, [value for body in bodies for value in column_values(body["columns"].get(name), body["length"])])
+            for name in names
+        }
+    }
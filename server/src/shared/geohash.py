@@ -0,0 +1,232 @@
+import math
+
+# Alphabet of the base 32 geohash encoding
+base32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Precision of the geohash stored on each item, about 5m x 5m
+geohash_precision = 9
+
+# Precision of the geohash prefix that partitions the geohash index, about 20km x 40km at Irish latitudes
+prefix_precision = 4
+
+
+def grid_size(precision):
+    """
+    Returns the number of geohash cells along each axis at a precision.
+
+    Args:
+        precision (int): The number of geohash characters.
+
+    Returns:
+        tuple: The number of rows of latitude and columns of longitude.
+    """
+    lat_bits = 5 * precision // 2
+    return 2 ** lat_bits, 2 ** (5 * precision - lat_bits)
+
+
+def cell_index(value, low, high, cells):
+    """
+    Finds the cell of a grid axis containing a coordinate.
+
+    Args:
+        value (float): The coordinate.
+        low (float): The lowest coordinate of the axis.
+        high (float): The highest coordinate of the axis.
+        cells (int): The number of cells along the axis.
+
+    Returns:
+        int: The cell's index.
+    """
+    return min(max(int(math.floor((value - low) / (high - low) * cells)), 0), cells - 1)
+
+
+def cell_geohash(row, column, precision):
+    """
+    Encodes the geohash of a grid cell, interleaving its longitude and latitude bits.
+
+    Args:
+        row (int): The cell's index along the latitude axis.
+        column (int): The cell's index along the longitude axis.
+        precision (int): The number of geohash characters.
+
+    Returns:
+        str: The geohash.
+    """
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+
+    bits = 0
+    for position in range(5 * precision):
+        if position % 2 == 0:
+            lon_bits -= 1
+            bits = bits << 1 | (column >> lon_bits) & 1
+        else:
+            lat_bits -= 1
+            bits = bits << 1 | (row >> lat_bits) & 1
+
+    return "".join(base32[bits >> shift & 31] for shift in range(5 * (precision - 1), -1, -5))
+
+
+def encode(latitude, longitude, precision=geohash_precision):
+    """
+    Encodes a position as a geohash.
+
+    Args:
+        latitude (float): The latitude.
+        longitude (float): The longitude.
+        precision (int): The number of geohash characters.
+
+    Returns:
+        str: The geohash.
+    """
+    rows, columns = grid_size(precision)
+    return cell_geohash(cell_index(latitude, -90, 90, rows), cell_index(longitude, -180, 180, columns), precision)
+
+
+def cell_center(geohash):
+    """
+    Decodes the centre of a geohash cell.
+
+    Args:
+        geohash (str): The geohash.
+
+    Returns:
+        tuple: The latitude and longitude of the cell's centre.
+    """
+    precision = len(geohash)
+    bits = 0
+    for character in geohash:
+        bits = bits << 5 | base32.index(character)
+
+    row = column = 0
+    for position in range(5 * precision):
+        bit = bits >> (5 * precision - 1 - position) & 1
+        if position % 2 == 0:
+            column = column << 1 | bit
+        else:
+            row = row << 1 | bit
+
+    rows, columns = grid_size(precision)
+    return -90 + (row + 0.5) * 180 / rows, -180 + (column + 0.5) * 360 / columns
+
+
+def item_position(item):
+    """
+    Reads the position of an item from its latitude and longitude attributes.
+
+    Args:
+        item (dict): The item.
+
+    Returns:
+        tuple: The latitude and longitude, or None if the item has no valid position.
+    """
+    try:
+        latitude, longitude = float(item["latitude"]), float(item["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def add_geohash(item):
+    """
+    Adds the geohash and geohash index prefix of an item's position to it.
+    Items without a valid position are left unchanged, and so are left out of the geohash index.
+
+    Args:
+        item (dict): The item.
+
+    Returns:
+        dict: The item.
+    """
+    position = item_position(item)
+    if position is not None:
+        item["geohash"] = encode(*position)
+        item["geohashPrefix"] = item["geohash"][:prefix_precision]
+    return item
+
+
+def parse_bbox(bbox):
+    """
+    Parses a bounding box given as "west,south,east,north" in degrees.
+
+    Args:
+        bbox (str): The bounding box.
+
+    Returns:
+        tuple: The west, south, east and north edges.
+
+    Raises:
+        ValueError: If the bounding box is malformed.
+    """
+    try:
+        west, south, east, north = (float(edge) for edge in bbox.split(","))
+    except ValueError:
+        raise ValueError("bbox must be west,south,east,north")
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise ValueError("bbox must be west,south,east,north")
+    return west, south, east, north
+
+
+def covering_cells(bbox, precision):
+    """
+    Lists the geohash cells at a precision that together cover a bounding box.
+
+    Args:
+        bbox (tuple): The west, south, east and north edges.
+        precision (int): The number of geohash characters.
+
+    Returns:
+        list: The geohashes of the cells.
+    """
+    west, south, east, north = bbox
+    rows, columns = grid_size(precision)
+    return [
+        cell_geohash(row, column, precision)
+        for row in range(cell_index(south, -90, 90, rows), cell_index(north, -90, 90, rows) + 1)
+        for column in range(cell_index(west, -180, 180, columns), cell_index(east, -180, 180, columns) + 1)
+    ]
+
+
+def covering_prefixes(bbox, max_cells, max_precision=prefix_precision):
+    """
+    Chooses the finest geohash cells, from the index prefix precision up to max_precision,
+    that cover a bounding box in at most max_cells cells.
+
+    Args:
+        bbox (tuple): The west, south, east and north edges.
+        max_cells (int): The most cells, and so index queries, to answer the bounding box with.
+        max_precision (int): The finest precision to consider.
+
+    Returns:
+        list: The geohashes of the cells, or None if the bounding box is too large to cover at the index prefix precision.
+    """
+    west, south, east, north = bbox
+    cells = None
+    for precision in range(prefix_precision, max_precision + 1):
+        rows, columns = grid_size(precision)
+        count = ((cell_index(north, -90, 90, rows) - cell_index(south, -90, 90, rows) + 1)
+                 * (cell_index(east, -180, 180, columns) - cell_index(west, -180, 180, columns) + 1))
+        if count > max_cells:
+            break
+        cells = covering_cells(bbox, precision)
+    return cells
+
+
+def in_bbox(item, bbox):
+    """
+    Tests whether an item's position lies within a bounding box.
+
+    Args:
+        item (dict): The item.
+        bbox (tuple): The west, south, east and north edges.
+
+    Returns:
+        bool: Whether the item has a position within the bounding box.
+    """
+    position = item_position(item)
+    if position is None:
+        return False
+    west, south, east, north = bbox
+    return south <= position[0] <= north and west <= position[1] <= east
@@ -0,0 +1,63 @@
+from collections import Counter
+from shared.geohash import cell_center, encode, item_position
+
+# Precision of the geohash cells each snapshot is binned into at ingest, about 1.2km x 0.6km.
+# Coarser grids are derived from these by truncating the cells' geohashes.
+heatmap_precision = 6
+
+
+def bin_items(items, precision=heatmap_precision):
+    """
+    Counts the items in each geohash cell of a grid, using the geohash stored on each item where it has one.
+
+    Args:
+        items (list): The items, with latitude and longitude attributes.
+        precision (int): The precision of the grid's cells.
+
+    Returns:
+        Counter: A mapping of each occupied cell's geohash to the number of items in it.
+    """
+    counts = Counter()
+    for item in items:
+        geohash = item.get("geohash")
+        if geohash is None:
+            position = item_position(item)
+            if position is None:
+                continue
+            geohash = encode(*position, precision)
+        counts[geohash[:precision]] += 1
+    return counts
+
+
+def coarsen(cells, precision):
+    """
+    Re-bins cell counts into a coarser grid.
+
+    Args:
+        cells (dict): A mapping of geohash cells to counts, at a precision of at least the requested one.
+        precision (int): The precision of the coarser grid.
+
+    Returns:
+        Counter: A mapping of each cell of the coarser grid to the sum of the counts within it.
+    """
+    counts = Counter()
+    for geohash, count in cells.items():
+        counts[geohash[:precision]] += int(count)
+    return counts
+
+
+def heatmap_points(counts):
+    """
+    Converts cell counts to heatmap points at the centre of each cell.
+
+    Args:
+        counts (dict): A mapping of geohash cells to counts.
+
+    Returns:
+        list: A list of [latitude, longitude, count] points, densest first.
+    """
+    points = []
+    for geohash, count in sorted(counts.items(), key=lambda cell: (-cell[1], cell[0])):
+        latitude, longitude = cell_center(geohash)
+        points.append([round(latitude, 6), round(longitude, 6), count])
+    return points
@@ -0,0 +1,237 @@
+import base64
+import gzip
+import json
+import os
+import time
+from decimal import Decimal
+from shared.serialization import number_value
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this many bytes are sent uncompressed, as compression wouldn't pay for itself
+compression_threshold = int(os.environ.get("COMPRESSION_THRESHOLD", 1024))
+
+# Largest page a client may request with the limit parameter, and the page size when only a cursor is given
+max_page_limit = int(os.environ.get("MAX_PAGE_LIMIT", 1000))
+
+# Compression levels balancing ratio against the time spent compressing in the request path
+gzip_level = 6
+brotli_quality = 5
+
+
+def get_header(event, name):
+    """
+    Retrieves a request header case-insensitively.
+
+    Args:
+        event (dict): The API Gateway event.
+        name (str): The name of the header.
+
+    Returns:
+        str: The header's value, or None if it wasn't sent.
+    """
+    for header, value in (event.get('headers') or {}).items():
+        if header.lower() == name.lower():
+            return value
+    return None
+
+
+def etag_matches(event, etag):
+    """
+    Checks whether the request's If-None-Match header names an ETag, so that the response can be a 304.
+    The header may list several tags or be *, and tags are compared weakly, ignoring any W/ prefix.
+
+    Args:
+        event (dict): The API Gateway event.
+        etag (str): The ETag of the current response.
+
+    Returns:
+        bool: Whether the client already holds the response.
+    """
+    header = get_header(event, 'If-None-Match')
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    if '*' in tags:
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    return any((tag[2:] if tag.startswith('W/') else tag) == opaque for tag in tags)
+
+
+def accepted_encodings(event):
+    """
+    Parses the request's Accept-Encoding header.
+
+    Args:
+        event (dict): The API Gateway event.
+
+    Returns:
+        dict: A dictionary mapping each listed encoding to its quality value.
+    """
+    encodings = {}
+    for part in (get_header(event, 'Accept-Encoding') or '').split(','):
+        encoding, _, parameters = part.strip().partition(';')
+        if not encoding:
+            continue
+        quality = 1.0
+        for parameter in parameters.split(';'):
+            name, _, value = parameter.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[encoding.lower()] = quality
+    return encodings
+
+
+def choose_encoding(event):
+    """
+    Chooses the best compression the client accepts: brotli if it is available, otherwise gzip.
+
+    Args:
+        event (dict): The API Gateway event.
+
+    Returns:
+        str: "br", "gzip", or None if the client accepts neither.
+    """
+    encodings = accepted_encodings(event)
+    wildcard = encodings.get('*', 0)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    best = None
+    for encoding in candidates:
+        quality = encodings.get(encoding, wildcard)
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+
+def compress(body, encoding):
+    """
+    Compresses a response body.
+
+    Args:
+        body (bytes): The body.
+        encoding (str): "br" or "gzip".
+
+    Returns:
+        bytes: The compressed body.
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+def compress_response(event, response):
+    """
+    Compresses a handler's response with the best encoding the client accepts, if its body is large enough,
+    returning it base64-encoded as API Gateway requires for binary bodies.
+    The ratio and time taken are logged so that the threshold can be tuned on real payloads.
+
+    Args:
+        event (dict): The API Gateway event.
+        response (dict): The response, with a str body.
+
+    Returns:
+        dict: The response, compressed if worthwhile.
+    """
+    if response.get('isBase64Encoded') or not isinstance(response.get('body'), str):
+        return response
+
+    headers = dict(response.get('headers') or {})
+    headers['Vary'] = 'Accept-Encoding'
+    response = dict(response, headers=headers)
+
+    body = response['body'].encode('utf-8')
+    encoding = choose_encoding(event)
+    if len(body) < compression_threshold or encoding is None:
+        return response
+
+    start = time.time()
+    compressed = compress(body, encoding)
+    milliseconds = (time.time() - start) * 1000
+    print(f"Compressed response from {len(body)} to {len(compressed)} bytes with {encoding} "
+          f"({len(body) / max(len(compressed), 1):.1f}x) in {milliseconds:.1f}ms.")
+
+    headers['Content-Encoding'] = encoding
+    response['body'] = base64.b64encode(compressed).decode('ascii')
+    response['isBase64Encoded'] = True
+    return response
+
+
+def encode_cursor(key):
+    """
+    Encodes the key a page of results ended on as an opaque, URL-safe cursor.
+
+    Args:
+        key (dict): The key to resume after, as returned by query_page or scan_page.
+
+    Returns:
+        str: The cursor, or None if there are no more pages.
+    """
+    if key is None:
+        return None
+
+    document = json.dumps(key, default=number_value, separators=(',', ':'), sort_keys=True)
+    return base64.urlsafe_b64encode(document.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor made by encode_cursor.
+
+    Args:
+        cursor (str): The cursor.
+
+    Returns:
+        dict: The key to resume after.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        document = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(document, parse_float=Decimal)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, dict) or not key:
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def parse_page_request(event, key=None):
+    """
+    Reads the optional limit and cursor query string parameters that request a single page of results.
+
+    Args:
+        event (dict): The API Gateway event.
+        key (tuple): The attributes of the primary key the cursor must resume after, or None to accept any key.
+
+    Returns:
+        tuple: The page size and the key to resume after, or (None, None) if neither parameter was given.
+
+    Raises:
+        ValueError: If the limit or cursor is malformed, or the cursor isn't a key of the table.
+    """
+    query_params = event.get('queryStringParameters') or {}
+    if 'limit' not in query_params and 'cursor' not in query_params:
+        return None, None
+
+    try:
+        limit = int(query_params.get('limit') or max_page_limit)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+
+    cursor = query_params.get('cursor')
+    start_key = decode_cursor(cursor) if cursor else None
+    if start_key is not None and key is not None:
+        # A cursor the table didn't hand out would be rejected by DynamoDB as a server error rather than a bad request
+        if set(start_key) != set(key) or not all(isinstance(value, (str, int, Decimal)) for value in start_key.values()):
+            raise ValueError("Invalid cursor")
+    return min(limit, max_page_limit), start_key
@@ -0,0 +1,168 @@
+import re
+from functools import lru_cache
+from xml.etree.ElementTree import XMLPullParser
+
+# Lookup tables for the single-letter codes used by the Irish Rail API
+train_types_full = {
+    "M": "Mainline",
+    "S": "Suburban",
+    "D": "DART"
+}
+
+train_statuses_full = {
+    "R": "Running",
+    "T": "Terminated",
+    "N": "Not yet running"
+}
+
+# Matches positive/negative number followed by "mins late"
+punctuality_pattern = re.compile(r"(-?\d+)\s+mins\s+late")
+
+# Number of characters of the response body fed to the parser at a time
+chunk_size = 2 * 1024
+
+
+def iter_records(xml_text, record_tag):
+    """
+    Incrementally parses an Irish Rail XML response, yielding each record as soon as its closing tag is read.
+    Each record element is discarded once yielded, so the full document tree is never built.
+
+    Args:
+        xml_text (str): The XML response body.
+        record_tag (str): The tag of the record elements, e.g. objTrainPositions.
+
+    Yields:
+        dict: A dictionary mapping each child tag of the record to its text, or None if the child is empty.
+    """
+    parser = XMLPullParser(events=("end",))
+    fields = {}
+
+    # Feed the body in chunks so that only one chunk's worth of events is buffered at a time
+    for start in range(0, len(xml_text), chunk_size):
+        parser.feed(xml_text[start:start + chunk_size])
+        for _, element in parser.read_events():
+            # Strip the namespace that the Irish Rail API puts on every tag
+            tag = element.tag.rpartition("}")[2]
+
+            if tag == record_tag:
+                yield fields
+                fields = {}
+                element.clear()
+            else:
+                text = element.text.strip() if element.text else None
+                fields[tag] = text or None
+
+    parser.close()
+
+
+@lru_cache(maxsize=None)
+def describe_punctuality(punctuality):
+    """
+    Returns the punctuality status and lateness message for a punctuality in minutes.
+    Cached, as the same handful of values recur across every train in every snapshot.
+
+    Args:
+        punctuality (int): The number of minutes late, negative if early.
+
+    Returns:
+        tuple: The punctuality status and lateness message.
+    """
+    if punctuality < 0:
+        return "early", f"{-punctuality} minute{'s' if punctuality != -1 else ''} early"
+    elif punctuality == 0:
+        return "on-time", "On time"
+    else:
+        return "late", f"{punctuality} minute{'s' if punctuality != 1 else ''} late"
+
+
+def parse_public_message(public_message):
+    """
+    Derives the train details, latest update and punctuality from a train's public message.
+
+    Args:
+        public_message (str): The PublicMessage of a train, with lines separated by a literal "\\n".
+
+    Returns:
+        tuple: The train details, train update, punctuality in minutes, punctuality status and lateness message.
+    """
+    split_message = public_message.split("\\n")
+    train_details = split_message[1].split("(")[0]
+    train_update = split_message[2]
+
+    match = punctuality_pattern.search(public_message)
+    punctuality = int(match.group(1)) if match else 0  # Default to 0 if no match
+    punctuality_status, lateness_message = describe_punctuality(punctuality)
+
+    return train_details, train_update, punctuality, punctuality_status, lateness_message
+
+
+def iter_trains(xml_text, train_type, timestamp, punctuality_data):
+    """
+    Parses a getCurrentTrainsXML_WithTrainType response into finished train records.
+
+    Args:
+        xml_text (str): The XML response body.
+        train_type (str): The Irish Rail train type code (M, S or D) that was requested.
+        timestamp (int): The snapshot epoch to stamp on each train.
+        punctuality_data (dict): A dictionary mapping objectID to average punctuality.
+
+    Yields:
+        dict: A train record ready to be uploaded.
+    """
+    train_type_full = train_types_full.get(train_type, "Unknown")
+
+    for train in iter_records(xml_text, "objTrainPositions"):
+        train_code = str(train["TrainCode"])
+        object_id = "IrishRailTrain-" + train_code
+        train_status = train["TrainStatus"]
+        public_message = train["PublicMessage"]
+        train_details, train_update, punctuality, punctuality_status, lateness_message = parse_public_message(public_message)
+
+        yield {
+            "objectID": object_id,
+            "objectType": "IrishRailTrain",
+            "timestamp": timestamp,
+            "latitude": str(train["TrainLatitude"]),
+            "longitude": str(train["TrainLongitude"]),
+            "trainCode": train_code,
+            "trainType": train_type,
+            "trainTypeFull": train_type_full,
+            "trainStatus": train_status,
+            "trainStatusFull": train_statuses_full.get(train_status, "Unknown"),
+            "trainDate": str(train["TrainDate"]),
+            "trainPublicMessage": public_message,
+            "trainDirection": train["Direction"],
+            "trainPunctuality": punctuality,
+            "trainPunctualityStatus": punctuality_status,
+            "latenessMessage": lateness_message,
+            "trainDetails": train_details,
+            "trainUpdate": train_update,
+            "averagePunctuality": punctuality_data.get(object_id, 0)  # Default to 0 if not found
+        }
+
+
+def iter_stations(xml_text, station_type=None):
+    """
+    Parses a getAllStationsXML or getAllStationsXML_WithStationType response into finished station records.
+
+    Args:
+        xml_text (str): The XML response body.
+        station_type (str): The Irish Rail station type code that was requested, if any.
+
+    Yields:
+        dict: A station record ready to be uploaded.
+    """
+    for station in iter_records(xml_text, "objStation"):
+        record = {
+            "objectID": "IrishRailStation-" + station["StationCode"],
+            "objectType": "IrishRailStation",
+            "latitude": station["StationLatitude"],
+            "longitude": station["StationLongitude"],
+            "trainStationID": station["StationId"],
+            "trainStationCode": station["StationCode"],
+            "trainStationAlias": station.get("StationAlias", ""),
+            "trainStationDesc": station["StationDesc"]
+        }
+        if station_type is not None:
+            record["trainStationType"] = station_type
+        yield record
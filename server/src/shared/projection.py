@@ -0,0 +1,88 @@
+import re
+
+# Most attributes a fields parameter may name, keeping the projection expression well within DynamoDB's limits
+max_fields = 50
+
+# Attribute names a fields parameter may contain. The storage layer aliases every projected name,
+# so reserved words such as timestamp are allowed
+field_pattern = re.compile(r"^[A-Za-z0-9_\-]+$")
+
+# Attributes written only so that the geohash indexes can find items, left out of responses unless requested
+index_attributes = ("geohash", "geohashPrefix")
+
+
+def parse_fields(query_params):
+    """
+    Reads the attributes a request limits its items to.
+
+    Args:
+        query_params (dict): The query string parameters.
+
+    Returns:
+        list: The attribute names in the order given, without repeats, or None to return whole items.
+
+    Raises:
+        ValueError: If the parameter is empty or names an invalid attribute, or too many of them.
+    """
+    if query_params.get("fields") is None:
+        return None
+
+    fields = list(dict.fromkeys(field.strip() for field in query_params["fields"].split(",")))
+    if not all(field_pattern.match(field) for field in fields):
+        raise ValueError("fields must be a comma-separated list of attribute names")
+    if len(fields) > max_fields:
+        raise ValueError(f"fields may name at most {max_fields} attributes")
+    return fields
+
+
+def projection_attributes(fields, required=()):
+    """
+    Builds the projection that reads the requested attributes along with any the handler itself needs.
+
+    Args:
+        fields (list): The requested attributes, or None for whole items.
+        required (tuple): The attributes the handler reads from each item, such as those it filters on.
+
+    Returns:
+        list: The attributes to project, or None for whole items.
+    """
+    if fields is None:
+        return None
+    return fields + [attribute for attribute in required if attribute not in fields]
+
+
+def strip_index_attributes(items):
+    """
+    Removes the geohash index attributes from whole items, so that responses carry only the objects' own data.
+
+    Args:
+        items (list): The items.
+
+    Returns:
+        list: The items, copied where they had index attributes.
+    """
+    return [
+        {key: value for key, value in item.items() if key not in index_attributes}
+        if any(attribute in item for attribute in index_attributes) else item
+        for item in items
+    ]
+
+
+def select_fields(items, fields, projection):
+    """
+    Removes the attributes that were projected only for the handler's own use, so that items carry just the requested fields.
+    Whole items lose their index attributes.
+
+    Args:
+        items (list): The items read with the projection.
+        fields (list): The requested attributes, or None for whole items.
+        projection (list): The attributes that were projected.
+
+    Returns:
+        list: The items, limited to the requested fields.
+    """
+    if fields is None:
+        return strip_index_attributes(items)
+    if len(projection) == len(fields):
+        return items
+    return [{field: item[field] for field in fields if field in item} for item in items]
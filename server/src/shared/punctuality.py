@@ -0,0 +1,63 @@
+from decimal import Decimal
+
+# Running totals of a train's punctuality, added to atomically by update_average_punctuality
+sum_attribute = "punctuality_sum"
+count_attribute = "punctuality_count"
+
+# Running mean and its count, as written before the totals replaced them. Kept, and folded into the average, for existing trains
+legacy_average_attribute = "average_punctuality"
+legacy_count_attribute = "count"
+
+# Every attribute the average of a punctuality_by_objectID item is derived from
+punctuality_attributes = (sum_attribute, count_attribute, legacy_average_attribute, legacy_count_attribute)
+
+
+def punctuality_increment(punctuality):
+    """
+    Builds the amounts to add to a train's totals for one observation of its punctuality.
+
+    Args:
+        punctuality: The punctuality, in minutes.
+
+    Returns:
+        dict: A dictionary mapping each total's attribute to the amount to add.
+    """
+    return {sum_attribute: Decimal(str(punctuality)), count_attribute: 1}
+
+
+def average_punctuality(item):
+    """
+    Derives a train's average punctuality from its totals and, for trains recorded before them, its earlier running mean.
+
+    Args:
+        item (dict): The punctuality_by_objectID item.
+
+    Returns:
+        tuple: The average punctuality as a Decimal, or None if nothing has been recorded, and the number of observations.
+    """
+    total = Decimal(str(item.get(sum_attribute, 0)))
+    count = int(item.get(count_attribute, 0))
+    if item.get(legacy_average_attribute) is not None:
+        legacy_count = int(item.get(legacy_count_attribute, 1))
+        total += Decimal(str(item[legacy_average_attribute])) * legacy_count
+        count += legacy_count
+    return (total / count if count else None), count
+
+
+def with_average(item):
+    """
+    Replaces the totals of a punctuality_by_objectID item with the average and count it has always been read as.
+
+    Args:
+        item (dict): The punctuality_by_objectID item.
+
+    Returns:
+        dict: The item with average_punctuality and count in place of its totals, or unchanged if it holds none of them.
+    """
+    if not any(attribute in item for attribute in punctuality_attributes):
+        return item
+    average, count = average_punctuality(item)
+    derived = {attribute: value for attribute, value in item.items() if attribute not in punctuality_attributes}
+    derived[legacy_average_attribute] = average
+    derived[legacy_count_attribute] = count
+    return derived
@@ -0,0 +1,71 @@
+import functools
+import json
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Distinct numbers remembered by number_value; a snapshot repeats few, such as its timestamp
+number_cache_size = 4096
+
+
+@functools.lru_cache(maxsize=number_cache_size)
+def number_value(value):
+    """
+    Converts a number read back from DynamoDB as a Decimal to the int or float it represents.
+    Cached, so that the encoder converts each distinct number once and reuses it without
+    running any Python for the numbers that repeat across items.
+
+    Args:
+        value (Decimal): The number.
+
+    Returns:
+        The int, or the float if the number has a fractional part.
+
+    Raises:
+        TypeError: If the value isn't a Decimal, so that the encoder falls back to fallback_value.
+    """
+    if type(value) is not Decimal:
+        raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+    integer = int(value)
+    return integer if integer == value else float(value)
+
+
+def fallback_value(value):
+    """
+    Converts any value the JSON encoders don't support natively.
+    Decimals become numbers, sets become arrays, and anything else becomes its string form, as with default=str.
+
+    Args:
+        value: The value.
+
+    Returns:
+        A JSON-serializable value.
+    """
+    if isinstance(value, Decimal):
+        return number_value(value) if value.is_finite() else str(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    return str(value)
+
+
+def to_json(value):
+    """
+    Serializes items read from storage to JSON, emitting Decimals as JSON numbers rather than strings.
+    Uses orjson if it is installed, falling back to the standard library for anything it rejects,
+    such as integers wider than 64 bits or non-string keys. Both emit the same compact JSON.
+
+    Args:
+        value: The value to serialize.
+
+    Returns:
+        str: The JSON document.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=number_value).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(value, default=fallback_value, separators=(",", ":"))
@@ -0,0 +1,249 @@
+import gzip
+import hashlib
+import json
+from shared.columnar import to_columnar
+from shared.projection import strip_index_attributes
+from shared.serialization import to_json
+
+# Name under which the snapshot of every objectType together is rendered
+combined_artifact_name = "all"
+
+# Most objects stored in each item of a snapshot's objects, keeping items well under DynamoDB's 400 KB limit
+objects_chunk_size = 2000
+
+
+def fingerprint(item):
+    """
+    Computes a short fingerprint of an item's contents, ignoring its snapshot timestamp,
+    so that unchanged objects can be recognised between consecutive snapshots.
+
+    Args:
+        item (dict): The item to fingerprint.
+
+    Returns:
+        str: A 16 character hex digest of the item.
+    """
+    contents = {key: value for key, value in item.items() if key != "timestamp"}
+    encoded = json.dumps(contents, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+def objects_key(object_type, timestamp):
+    """
+    Builds the partition key under which the objects of a committed snapshot are stored.
+
+    Args:
+        object_type (str): The objectType of the snapshot.
+        timestamp (int): The snapshot epoch.
+
+    Returns:
+        str: The partition key.
+    """
+    return f"{object_type}#{int(timestamp)}"
+
+
+def objects_chunks(object_type, timestamp, objects, expires_at):
+    """
+    Splits the objects of a snapshot into the items they are stored in alongside its commit marker,
+    so that the marker stays the same size however many objects the snapshot holds.
+
+    Args:
+        object_type (str): The objectType of the snapshot.
+        timestamp (int): The snapshot epoch.
+        objects (dict): A dictionary mapping objectID to [baseTimestamp, fingerprint, ...].
+        expires_at (int): The epoch after which the items may be deleted by the table's TTL.
+
+    Returns:
+        list: The items, numbered from 0 by their chunk attribute.
+    """
+    object_ids = sorted(objects)
+    return [
+        {
+            "snapshot": objects_key(object_type, timestamp),
+            "chunk": index,
+            "objects": {object_id: objects[object_id] for object_id in object_ids[start:start + objects_chunk_size]},
+            "expiresAt": expires_at
+        }
+        for index, start in enumerate(range(0, len(object_ids), objects_chunk_size))
+    ]
+
+
+def load_objects(objects_table, snapshot):
+    """
+    Adds the objects of a committed snapshot to its commit marker, reading them from the items they are stored in.
+    Markers committed before the objects were moved out of them already list them, and are returned unchanged.
+
+    Args:
+        objects_table: The table holding the objects of each committed snapshot.
+        snapshot (dict): The snapshot commit marker, or None if no snapshot has been committed.
+
+    Returns:
+        dict: The marker with its objects, or the marker unchanged if it holds no reference to them.
+
+    Raises:
+        RuntimeError: If some of the snapshot's objects have expired.
+    """
+    if snapshot is None or "objects" in snapshot or "objectChunks" not in snapshot:
+        return snapshot
+
+    count = int(snapshot["objectChunks"])
+    partition = objects_key(snapshot["objectType"], snapshot["timestamp"])
+    chunks = objects_table.get_many([{"snapshot": partition, "chunk": index} for index in range(count)], ["objects"]) if count else []
+    if len(chunks) < count:
+        raise RuntimeError(f"The objects of the {snapshot['objectType']} snapshot {snapshot['timestamp']} have expired")
+
+    objects = {}
+    for chunk in chunks:
+        objects.update(chunk["objects"])
+    return dict(snapshot, objects=objects)
+
+
+def carried_keys(snapshot, prefixes=None, since=None):
+    """
+    Lists the keys of the objects a committed snapshot carries forward from an earlier snapshot,
+    i.e. those that were unchanged and so were not rewritten under the snapshot's own timestamp.
+
+    Args:
+        snapshot (dict): The snapshot commit marker.
+        prefixes (set): The geohash prefixes to limit the objects to, or None for every object.
+            Objects recorded without a geohash prefix are always included.
+        since (int): The snapshot to limit the objects to those last written after, or None for every object.
+
+    Returns:
+        list: The primary keys of the carried objects in the transient data table.
+    """
+    timestamp = int(snapshot["timestamp"])
+    keys = []
+    for object_id, entry in snapshot.get("objects", {}).items():
+        base_timestamp = int(entry[0])
+        if base_timestamp == timestamp or (since is not None and base_timestamp <= since):
+            continue
+        if prefixes is not None and len(entry) > 2 and entry[2] not in prefixes:
+            continue
+        keys.append({"objectID": object_id, "timestamp": base_timestamp})
+    return keys
+
+
+def fetch_carried_items(table, snapshot, projection=None, prefixes=None, since=None):
+    """
+    Retrieves the objects a committed snapshot carries forward, stamped with the snapshot's
+    timestamp so that readers see a complete snapshot.
+
+    Args:
+        table: The transient data table.
+        snapshot (dict): The snapshot commit marker.
+        projection (list): The attributes to retrieve, or None for whole items.
+        prefixes (set): The geohash prefixes to limit the objects to, or None for every object.
+        since (int): The snapshot to limit the objects to those last written after, or None for every object.
+
+    Returns:
+        list: The carried items.
+    """
+    keys = carried_keys(snapshot, prefixes, since)
+    if not keys:
+        return []
+
+    items = table.get_many(keys, projection)
+
+    # Restamp with the marker's own value so carried items serialise like the rest of the snapshot
+    for item in items:
+        if "timestamp" in item:
+            item["timestamp"] = snapshot["timestamp"]
+    return items
+
+
+def artifact_key(name, timestamp):
+    """
+    Builds the versioned blob key of a pre-rendered snapshot.
+
+    Args:
+        name (str): The objectType, or combined_artifact_name for every objectType together.
+        timestamp (int): The snapshot epoch.
+
+    Returns:
+        str: The blob key.
+    """
+    return f"snapshots/{name}/{timestamp}.json.gz"
+
+
+def columnar_artifact_key(key):
+    """
+    Derives the blob key of the columnar rendering of a pre-rendered snapshot from the key of its row rendering.
+
+    Args:
+        key (str): The blob key of the row rendering.
+
+    Returns:
+        str: The blob key of the columnar rendering.
+    """
+    return key[:-len(".json.gz")] + ".columnar.json.gz"
+
+
+def artifact_etag(key):
+    """
+    Derives the ETag of a pre-rendered snapshot from its key, which is unique to its contents.
+    The same snapshot is served gzip-compressed, recompressed or decompressed, so the tag is weak.
+
+    Args:
+        key (str): The blob key.
+
+    Returns:
+        str: The weak ETag.
+    """
+    return 'W/"' + hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest() + '"'
+
+
+def render_snapshot(items):
+    """
+    Renders snapshot items into the gzip-compressed JSON body the read handlers return.
+    Numbers are rendered with the same encoder the read handlers use for items read back from DynamoDB
+    as Decimals, and index attributes are left out, so the artifact matches the body built from the table.
+
+    Args:
+        items (list): The items of the snapshot.
+
+    Returns:
+        bytes: The gzip-compressed JSON body.
+    """
+    return gzip.compress(to_json(strip_index_attributes(items)).encode("utf-8"), mtime=0)
+
+
+def select_artifact_key(object_types, snapshots, all_object_types):
+    """
+    Chooses the pre-rendered snapshot that exactly answers a request, if there is one:
+    the objectType's own artifact for a single objectType, or the combined artifact when
+    every objectType is requested and all of their committed snapshots share it.
+
+    Args:
+        object_types (list): The requested objectTypes.
+        snapshots (list): The commit marker of each requested objectType, or None if uncommitted.
+        all_object_types (list): Every objectType written by fetch_transient_data.
+
+    Returns:
+        str: The blob key of the artifact, or None if the request can't be served from one.
+    """
+    if not snapshots or any(snapshot is None for snapshot in snapshots):
+        return None
+
+    if len(object_types) == 1:
+        return snapshots[0].get("artifactKey")
+
+    if sorted(object_types) == sorted(all_object_types):
+        combined_keys = {snapshot.get("combinedArtifactKey") for snapshot in snapshots}
+        if len(combined_keys) == 1:
+            return combined_keys.pop()
+
+    return None
+
+
+def render_columnar_snapshot(items):
+    """
+    Renders snapshot items into the gzip-compressed columnar body the read handlers return for format=columnar.
+
+    Args:
+        items (list): The items of the snapshot.
+
+    Returns:
+        bytes: The gzip-compressed columnar JSON body.
+    """
+    return gzip.compress(to_json(to_columnar(strip_index_attributes(items))).encode("utf-8"), mtime=0)
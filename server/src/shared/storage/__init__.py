@@ -0,0 +1,34 @@
+import os
+from shared.storage.dynamodb import DynamoDBTable
+from shared.storage.memory import MemoryTable, get_memory_table, reset_memory_tables
+from shared.storage.parallel_scan import parallel_scan
+from shared.storage.sqlite import SQLiteTable
+
+
+def get_table(name, schema):
+    """
+    Opens a table on the storage backend configured by the environment: STORAGE_BACKEND selects
+    "dynamodb" (the default), "memory" (shared by every handler in the process) or "sqlite" (the
+    database file at STORAGE_SQLITE_PATH), so the pipeline can be run and load-tested locally.
+
+    Every backend offers the same operations: get, get_many, put, put_if_newer, put_batch,
+    query, query_page, scan, scan_page, increment and estimated_item_count.
+
+    Args:
+        name (str): The table name.
+        schema (dict): The table's key schema, from shared.storage.schemas.
+
+    Returns:
+        The table.
+    """
+    backend = os.environ.get("STORAGE_BACKEND", "dynamodb")
+    if backend == "dynamodb":
+        return DynamoDBTable(name, schema)
+    if backend == "memory":
+        return get_memory_table(name, schema)
+    if backend == "sqlite":
+        return SQLiteTable(os.environ.get("STORAGE_SQLITE_PATH", "storage.sqlite3"), name, schema)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+__all__ = ["get_table", "parallel_scan", "DynamoDBTable", "MemoryTable", "SQLiteTable", "reset_memory_tables"]
@@ -0,0 +1,154 @@
+import copy
+import zlib
+from decimal import Decimal
+
+
+def to_storage(value):
+    """
+    Converts a value to the form DynamoDB would return it in: numbers become Decimals.
+    Floats are rejected, as boto3 rejects them, so that local runs catch the same mistakes.
+
+    Args:
+        value: The value to convert.
+
+    Returns:
+        The converted value.
+    """
+    if isinstance(value, bool) or value is None or isinstance(value, (str, bytes, Decimal)):
+        return value
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, dict):
+        return {key: to_storage(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_storage(item) for item in value]
+    return value
+
+
+def item_key(item, attributes):
+    """
+    Extracts the values of the given key attributes from an item.
+
+    Args:
+        item (dict): The item.
+        attributes (tuple): The names of the key attributes.
+
+    Returns:
+        tuple: The key values, or None if the item lacks any of them.
+    """
+    if any(attribute not in item for attribute in attributes):
+        return None
+    return tuple(item[attribute] for attribute in attributes)
+
+
+def project(item, projection=None):
+    """
+    Copies an item, keeping only the projected attributes.
+
+    Args:
+        item (dict): The item.
+        projection (list): The attributes to keep, or None for all of them.
+
+    Returns:
+        dict: The copy.
+    """
+    if projection is None:
+        return copy.deepcopy(item)
+    return {attribute: copy.deepcopy(item[attribute]) for attribute in projection if attribute in item}
+
+
+def matches_sort(value, condition):
+    """
+    Evaluates a sort key condition.
+
+    Args:
+        value: The sort key value of an item.
+        condition (tuple): The operator, one of eq, lt, lte, gt, gte, between or begins_with, followed by its operands.
+
+    Returns:
+        bool: Whether the value satisfies the condition.
+    """
+    operator, *operands = condition
+    operands = [to_storage(operand) for operand in operands]
+    if operator == "eq":
+        return value == operands[0]
+    if operator == "lt":
+        return value < operands[0]
+    if operator == "lte":
+        return value <= operands[0]
+    if operator == "gt":
+        return value > operands[0]
+    if operator == "gte":
+        return value >= operands[0]
+    if operator == "between":
+        return operands[0] <= value <= operands[1]
+    if operator == "begins_with":
+        return isinstance(value, str) and value.startswith(operands[0])
+    raise ValueError(f"Unknown sort key operator: {operator}")
+
+
+def matches_filters(item, filters=None):
+    """
+    Evaluates scan filters.
+
+    Args:
+        item (dict): The item.
+        filters (dict): A dictionary mapping attribute names to the values they may take, or None.
+
+    Returns:
+        bool: Whether the item passes every filter.
+    """
+    for attribute, values in (filters or {}).items():
+        if item.get(attribute) not in [to_storage(value) for value in values]:
+            return False
+    return True
+
+
+def scan_segment(key, total_segments):
+    """
+    Assigns a primary key to a scan segment, stably across calls.
+
+    Args:
+        key (tuple): The primary key values.
+        total_segments (int): The number of segments the scan is split into.
+
+    Returns:
+        int: The segment the key belongs to.
+    """
+    return zlib.crc32(repr(key).encode("utf-8")) % total_segments
+
+
+def write_stats(count, seconds):
+    """
+    Builds the statistics put_batch returns, in the same shape as bulk_write.
+
+    Args:
+        count (int): The number of items written.
+        seconds (float): The time taken.
+
+    Returns:
+        dict: The number of items written, retries made, seconds taken and items per second.
+    """
+    return {
+        "items": count,
+        "retries": 0,
+        "seconds": round(seconds, 3),
+        "itemsPerSecond": round(count / seconds) if seconds > 0 else count
+    }
+
+
+def page_attributes(index_attributes, key_attributes):
+    """
+    Lists the attributes that order paged reads and make up the key a page resumes after, as DynamoDB's
+    LastEvaluatedKey does: the attributes of the index read, followed by those of the primary key.
+
+    Args:
+        index_attributes (tuple): The key attributes of the index read.
+        key_attributes (tuple): The primary key attributes of the table.
+
+    Returns:
+        tuple: The attributes, without repeats.
+    """
+    return tuple(dict.fromkeys(tuple(index_attributes) + tuple(key_attributes)))
@@ -0,0 +1,339 @@
+import os
+import boto3
+from boto3.dynamodb.conditions import Key, Attr
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from shared.bulk_writer import backoff, base_delay, bulk_write
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+# Connections kept open to DynamoDB, shared by every table and by every handler in the process.
+# Beyond botocore's default of 10, so that concurrent requests and parallel scans don't queue for one
+max_pool_connections = int(os.environ.get("DYNAMODB_MAX_POOL_CONNECTIONS", 50))
+dynamodb = boto3.resource("dynamodb", config=Config(max_pool_connections=max_pool_connections))
+
+# Maximum number of keys DynamoDB accepts in a single BatchGetItem request
+batch_get_size = 100
+
+# BatchGetItem requests a get_many sends at once, on a pool shared by every table in the process
+batch_get_workers = int(os.environ.get("DYNAMODB_BATCH_GET_WORKERS", 8))
+batch_get_executor = ThreadPoolExecutor(max_workers=batch_get_workers, thread_name_prefix="batch-get")
+
+# Consecutive retries of a batch's unprocessed keys before giving up
+batch_get_max_retries = 10
+
+
+def projection_request(projection=None):
+    """
+    Builds the request parameters that limit a read to the given attributes,
+    aliasing each so that reserved words such as timestamp can be projected.
+
+    Args:
+        projection (list): The attributes to retrieve, or None for whole items.
+
+    Returns:
+        dict: The ProjectionExpression and ExpressionAttributeNames, or nothing if there is no projection.
+    """
+    if not projection:
+        return {}
+    names = {f"#p{index}": attribute for index, attribute in enumerate(projection)}
+    return {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names}
+
+
+def sort_condition(attribute, condition):
+    """
+    Converts a sort key condition to a boto3 key condition.
+
+    Args:
+        attribute (str): The sort key attribute.
+        condition (tuple): The operator, one of eq, lt, lte, gt, gte, between or begins_with, followed by its operands.
+
+    Returns:
+        The boto3 key condition.
+    """
+    operator, *operands = condition
+    if operator not in ("eq", "lt", "lte", "gt", "gte", "between", "begins_with"):
+        raise ValueError(f"Unknown sort key operator: {operator}")
+    return getattr(Key(attribute), operator)(*operands)
+
+
+class DynamoDBTable:
+    """
+    A DynamoDB table.
+    """
+
+    def __init__(self, name, schema):
+        self.name = name
+        self.key = tuple(schema["key"])
+        self.indexes = {None: self.key}
+        self.indexes.update(schema.get("indexes", {}))
+        self.table = dynamodb.Table(name)
+
+    def get(self, key, projection=None):
+        """
+        Retrieves an item by its primary key.
+
+        Args:
+            key (dict): The primary key of the item.
+            projection (list): The attributes to retrieve, or None for the whole item.
+
+        Returns:
+            dict: The item, or None if it doesn't exist.
+        """
+        response = self.table.get_item(Key=key, **projection_request(projection))
+        if "Item" not in response:
+            return None
+        return response["Item"]
+
+    def get_many(self, keys, projection=None):
+        """
+        Retrieves several items by their primary keys with BatchGetItem, skipping any that don't exist.
+
+        Args:
+            keys (list): The primary keys of the items.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            list: The items found.
+        """
+        request = projection_request(projection)
+        chunks = [keys[start:start + batch_get_size] for start in range(0, len(keys), batch_get_size)]
+        if len(chunks) == 1:
+            return self._get_batch(chunks[0], request)
+        # Send the batches concurrently, so that reading thousands of keys takes about one round trip per worker
+        results = batch_get_executor.map(lambda chunk: self._get_batch(chunk, request), chunks)
+        return [item for items in results for item in items]
+
+    def _get_batch(self, keys, request):
+        """
+        Reads one BatchGetItem batch, retrying the keys DynamoDB couldn't process with full-jitter backoff.
+
+        Args:
+            keys (list): At most batch_get_size primary keys.
+            request (dict): The projection parameters of the request.
+
+        Returns:
+            list: The items found.
+
+        Raises:
+            RuntimeError: If keys are still unprocessed after batch_get_max_retries retries.
+        """
+        client = self.table.meta.client
+        request_items = {self.name: dict(request, Keys=keys)}
+        items = []
+        delay = base_delay
+        attempts = 0
+
+        while True:
+            response = client.batch_get_item(RequestItems=request_items)
+            items.extend(response.get("Responses", {}).get(self.name, []))
+            request_items = response.get("UnprocessedKeys")
+            if not request_items:
+                return items
+
+            attempts += 1
+            if attempts > batch_get_max_retries:
+                raise RuntimeError(f"Gave up reading from {self.name} after {batch_get_max_retries} retries.")
+            delay = backoff(delay)
+
+    def put(self, item):
+        """
+        Writes an item, replacing any item with the same primary key.
+
+        Args:
+            item (dict): The item.
+        """
+        self.table.put_item(Item=item)
+
+    def put_if_newer(self, item, attribute):
+        """
+        Writes an item unless the stored item with the same primary key has an equal or greater value of an attribute.
+        The write is conditional, so an overlapping, older writer can never move the item backwards.
+
+        Args:
+            item (dict): The item.
+            attribute (str): The attribute to compare, e.g. timestamp.
+
+        Returns:
+            bool: Whether the item was written.
+        """
+        try:
+            self.table.put_item(
+                Item=item,
+                ConditionExpression="attribute_not_exists(#attr) OR #attr < :value",
+                ExpressionAttributeNames={"#attr": attribute},
+                ExpressionAttributeValues={":value": item[attribute]}
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def put_batch(self, items, workers=8):
+        """
+        Writes many items with concurrent, throttle-aware BatchWriteItem requests.
+
+        Args:
+            items (list): The items.
+            workers (int): The maximum number of concurrent writers.
+
+        Returns:
+            dict: The number of items written, retries made, seconds taken and items per second.
+        """
+        return bulk_write(self.table, items, self.key, workers=workers)
+
+    def _query_request(self, partition, sort=None, index=None, descending=False, projection=None):
+        attributes = self.indexes[index]
+        key_condition = Key(attributes[0]).eq(partition)
+        if sort is not None:
+            key_condition = key_condition & sort_condition(attributes[1], sort)
+
+        request = dict(KeyConditionExpression=key_condition, **projection_request(projection))
+        if index is not None:
+            request["IndexName"] = index
+        if descending:
+            request["ScanIndexForward"] = False
+        return request
+
+    def _scan_request(self, segment=0, total_segments=1, filters=None, projection=None):
+        request = projection_request(projection)
+        if total_segments > 1:
+            request.update(Segment=segment, TotalSegments=total_segments)
+        for attribute, values in (filters or {}).items():
+            condition = Attr(attribute).is_in(list(values))
+            request["FilterExpression"] = request["FilterExpression"] & condition if "FilterExpression" in request else condition
+        return request
+
+    def _page(self, operation, request, limit, start_key):
+        # Each request evaluates at most the items still wanted, so the page never overshoots
+        # the limit and LastEvaluatedKey always marks exactly where the next page starts
+        items = []
+        last_key = start_key
+        while True:
+            if last_key is not None:
+                request["ExclusiveStartKey"] = last_key
+            response = operation(Limit=limit - len(items), **request)
+            items.extend(response.get("Items", []))
+            last_key = response.get("LastEvaluatedKey")
+            if last_key is None or len(items) >= limit:
+                return items, last_key
+
+    def query(self, partition, sort=None, index=None, descending=False, limit=None, projection=None):
+        """
+        Retrieves the items of a partition of the table or of one of its indexes, in sort key order,
+        following pagination until every item or the limit has been read.
+
+        Args:
+            partition: The partition key value.
+            sort (tuple): A sort key condition, e.g. ("eq", 1234567890), or None for the whole partition.
+            index (str): The name of the index to query, or None for the table itself.
+            descending (bool): Whether to return items in descending sort key order.
+            limit (int): The maximum number of items to return, or None for all of them.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            list: The matching items.
+        """
+        request = self._query_request(partition, sort, index, descending, projection)
+        if limit is not None:
+            request["Limit"] = limit
+
+        items = []
+        response = self.table.query(**request)
+        items.extend(response.get("Items", []))
+
+        while "LastEvaluatedKey" in response and (limit is None or len(items) < limit):
+            response = self.table.query(ExclusiveStartKey=response["LastEvaluatedKey"], **request)
+            items.extend(response.get("Items", []))
+
+        return items[:limit] if limit is not None else items
+
+    def query_page(self, partition, limit, start_key=None, sort=None, index=None, descending=False, projection=None):
+        """
+        Retrieves one page of the items of a partition, resuming after the key that ended the previous page.
+
+        Args:
+            partition: The partition key value.
+            limit (int): The maximum number of items in the page.
+            start_key (dict): The key returned with the previous page, or None for the first page.
+            sort (tuple): A sort key condition, or None for the whole partition.
+            index (str): The name of the index to query, or None for the table itself.
+            descending (bool): Whether to return items in descending sort key order.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            tuple: The items of the page, and the key to resume after, or None if there are no more items.
+        """
+        request = self._query_request(partition, sort, index, descending, projection)
+        return self._page(self.table.query, request, limit, start_key)
+
+    def scan(self, segment=0, total_segments=1, filters=None, projection=None):
+        """
+        Retrieves every item in one segment of the table, following pagination.
+
+        Args:
+            segment (int): The segment to scan.
+            total_segments (int): The number of segments the scan is split into.
+            filters (dict): A dictionary mapping attribute names to the values they may take, or None.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            list: The matching items.
+        """
+        request = self._scan_request(segment, total_segments, filters, projection)
+
+        items = []
+        response = self.table.scan(**request)
+        items.extend(response.get("Items", []))
+
+        while "LastEvaluatedKey" in response:
+            response = self.table.scan(ExclusiveStartKey=response["LastEvaluatedKey"], **request)
+            items.extend(response.get("Items", []))
+
+        return items
+
+    def scan_page(self, limit, start_key=None, filters=None, projection=None):
+        """
+        Retrieves one page of the items in the table, resuming after the key that ended the previous page.
+
+        Args:
+            limit (int): The maximum number of items in the page.
+            start_key (dict): The key returned with the previous page, or None for the first page.
+            filters (dict): A dictionary mapping attribute names to the values they may take, or None.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            tuple: The items of the page, and the key to resume after, or None if there are no more items.
+        """
+        request = self._scan_request(filters=filters, projection=projection)
+        return self._page(self.table.scan, request, limit, start_key)
+
+    def estimated_item_count(self):
+        """
+        Returns DynamoDB's estimate of the number of items in the table, which it refreshes about every six hours.
+
+        Returns:
+            int: The estimated item count.
+        """
+        return self.table.item_count
+
+    def increment(self, key, amounts):
+        """
+        Atomically adds to numeric attributes of an item with a single ADD update, creating the item and attributes as needed.
+
+        Args:
+            key (dict): The primary key of the item.
+            amounts (dict): A dictionary mapping attribute names to the amounts to add.
+
+        Returns:
+            dict: The item after the update.
+        """
+        names = {f"#a{index}": attribute for index, attribute in enumerate(amounts)}
+        values = {f":a{index}": amount for index, amount in enumerate(amounts.values())}
+        response = self.table.update_item(
+            Key=key,
+            UpdateExpression="ADD " + ", ".join(f"{name} {value}" for name, value in zip(names, values)),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+            ReturnValues="ALL_NEW"
+        )
+        return response.get("Attributes", {})
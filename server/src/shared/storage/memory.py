@@ -0,0 +1,289 @@
+import threading
+import time
+from shared.storage.common import (
+    to_storage, item_key, project, matches_sort, matches_filters, scan_segment, write_stats, page_attributes
+)
+
+# Tables shared by every handler in the process, so a pipeline run locally sees its own writes
+memory_tables = {}
+memory_tables_lock = threading.Lock()
+
+
+class MemoryTable:
+    """
+    A thread-safe table held in memory, indexed like its DynamoDB counterpart.
+    """
+
+    def __init__(self, name, schema):
+        self.name = name
+        self.key = tuple(schema["key"])
+        self.indexes = {None: self.key}
+        self.indexes.update(schema.get("indexes", {}))
+        self.items = {}
+        # Maps each index to its partitions, and each partition to the primary keys of its items
+        self.partitions = {index: {} for index in self.indexes}
+        self.lock = threading.RLock()
+
+    def _store(self, item):
+        item = to_storage(item)
+        key = item_key(item, self.key)
+        if key is None:
+            raise ValueError(f"Item is missing a key attribute of {self.name}: {self.key}")
+
+        self._remove(key)
+        self.items[key] = item
+        for index, attributes in self.indexes.items():
+            index_key = item_key(item, attributes)
+            if index_key is not None:
+                self.partitions[index].setdefault(index_key[0], set()).add(key)
+
+    def _remove(self, key):
+        item = self.items.pop(key, None)
+        if item is None:
+            return
+        for index, attributes in self.indexes.items():
+            index_key = item_key(item, attributes)
+            if index_key is not None:
+                self.partitions[index][index_key[0]].discard(key)
+
+    def _key(self, key):
+        return tuple(to_storage(key[attribute]) for attribute in self.key)
+
+    def _page(self, items, limit, ordering, projection):
+        # Like DynamoDB, a full page returns the key of its last item, even if no items follow it
+        last_key = {attribute: items[-1][attribute] for attribute in ordering} if items and len(items) == limit else None
+        return [project(item, projection) for item in items], last_key
+
+    def get(self, key, projection=None):
+        """
+        Retrieves an item by its primary key.
+
+        Args:
+            key (dict): The primary key of the item.
+            projection (list): The attributes to retrieve, or None for the whole item.
+
+        Returns:
+            dict: The item, or None if it doesn't exist.
+        """
+        with self.lock:
+            item = self.items.get(self._key(key))
+            return project(item, projection) if item is not None else None
+
+    def get_many(self, keys, projection=None):
+        """
+        Retrieves several items by their primary keys, skipping any that don't exist.
+
+        Args:
+            keys (list): The primary keys of the items.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            list: The items found.
+        """
+        with self.lock:
+            items = (self.items.get(self._key(key)) for key in keys)
+            return [project(item, projection) for item in items if item is not None]
+
+    def put(self, item):
+        """
+        Writes an item, replacing any item with the same primary key.
+
+        Args:
+            item (dict): The item.
+        """
+        with self.lock:
+            self._store(item)
+
+    def put_if_newer(self, item, attribute):
+        """
+        Writes an item unless the stored item with the same primary key has an equal or greater value of an attribute.
+
+        Args:
+            item (dict): The item.
+            attribute (str): The attribute to compare, e.g. timestamp.
+
+        Returns:
+            bool: Whether the item was written.
+        """
+        with self.lock:
+            existing = self.items.get(item_key(to_storage(item), self.key))
+            if existing is not None and attribute in existing and existing[attribute] >= to_storage(item[attribute]):
+                return False
+            self._store(item)
+            return True
+
+    def put_batch(self, items, workers=8):
+        """
+        Writes many items, the last of any duplicate keys winning.
+
+        Args:
+            items (list): The items.
+            workers (int): Unused; kept for interface compatibility with DynamoDBTable.
+
+        Returns:
+            dict: The number of items written, retries made, seconds taken and items per second.
+        """
+        start = time.time()
+        with self.lock:
+            keys = set()
+            for item in items:
+                self._store(item)
+                keys.add(item_key(to_storage(item), self.key))
+        return write_stats(len(keys), time.time() - start)
+
+    def query(self, partition, sort=None, index=None, descending=False, limit=None, projection=None):
+        """
+        Retrieves the items of a partition of the table or of one of its indexes, in sort key order.
+
+        Args:
+            partition: The partition key value.
+            sort (tuple): A sort key condition, e.g. ("eq", 1234567890), or None for the whole partition.
+            index (str): The name of the index to query, or None for the table itself.
+            descending (bool): Whether to return items in descending sort key order.
+            limit (int): The maximum number of items to return, or None for all of them.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            list: The matching items.
+        """
+        attributes = self.indexes[index]
+        with self.lock:
+            items = [self.items[key] for key in self.partitions[index].get(to_storage(partition), ())]
+            if len(attributes) > 1:
+                items = [item for item in items if attributes[1] in item]
+                if sort is not None:
+                    items = [item for item in items if matches_sort(item[attributes[1]], sort)]
+                items.sort(key=lambda item: item[attributes[1]], reverse=descending)
+            if limit is not None:
+                items = items[:limit]
+            return [project(item, projection) for item in items]
+
+    def query_page(self, partition, limit, start_key=None, sort=None, index=None, descending=False, projection=None):
+        """
+        Retrieves one page of the items of a partition, resuming after the key that ended the previous page.
+
+        Args:
+            partition: The partition key value.
+            limit (int): The maximum number of items in the page.
+            start_key (dict): The key returned with the previous page, or None for the first page.
+            sort (tuple): A sort key condition, or None for the whole partition.
+            index (str): The name of the index to query, or None for the table itself.
+            descending (bool): Whether to return items in descending sort key order.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            tuple: The items of the page, and the key to resume after, or None if there are no more items.
+        """
+        attributes = self.indexes[index]
+        ordering = page_attributes(attributes, self.key)
+        with self.lock:
+            items = [self.items[key] for key in self.partitions[index].get(to_storage(partition), ())]
+            items = [item for item in items if item_key(item, ordering) is not None]
+            if sort is not None:
+                items = [item for item in items if matches_sort(item[attributes[1]], sort)]
+            if start_key is not None:
+                start = tuple(to_storage(start_key[attribute]) for attribute in ordering)
+                if descending:
+                    items = [item for item in items if item_key(item, ordering) < start]
+                else:
+                    items = [item for item in items if item_key(item, ordering) > start]
+            items.sort(key=lambda item: item_key(item, ordering), reverse=descending)
+            return self._page(items[:limit], limit, ordering, projection)
+
+    def scan(self, segment=0, total_segments=1, filters=None, projection=None):
+        """
+        Retrieves every item in one segment of the table.
+
+        Args:
+            segment (int): The segment to scan.
+            total_segments (int): The number of segments the scan is split into.
+            filters (dict): A dictionary mapping attribute names to the values they may take, or None.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            list: The matching items.
+        """
+        with self.lock:
+            return [
+                project(item, projection) for key, item in self.items.items()
+                if scan_segment(key, total_segments) == segment and matches_filters(item, filters)
+            ]
+
+    def scan_page(self, limit, start_key=None, filters=None, projection=None):
+        """
+        Retrieves one page of the items in the table, in primary key order, resuming after the key that ended the previous page.
+
+        Args:
+            limit (int): The maximum number of items in the page.
+            start_key (dict): The key returned with the previous page, or None for the first page.
+            filters (dict): A dictionary mapping attribute names to the values they may take, or None.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            tuple: The items of the page, and the key to resume after, or None if there are no more items.
+        """
+        with self.lock:
+            keys = sorted(self.items)
+            if start_key is not None:
+                start = self._key(start_key)
+                keys = [key for key in keys if key > start]
+            items = []
+            for key in keys:
+                if matches_filters(self.items[key], filters):
+                    items.append(self.items[key])
+                    if len(items) == limit:
+                        break
+            return self._page(items, limit, self.key, projection)
+
+    def estimated_item_count(self):
+        """
+        Returns the number of items in the table.
+
+        Returns:
+            int: The item count.
+        """
+        with self.lock:
+            return len(self.items)
+
+    def increment(self, key, amounts):
+        """
+        Atomically adds to numeric attributes of an item, creating the item and attributes as needed.
+
+        Args:
+            key (dict): The primary key of the item.
+            amounts (dict): A dictionary mapping attribute names to the amounts to add.
+
+        Returns:
+            dict: The item after the update.
+        """
+        with self.lock:
+            item = dict(self.items.get(self._key(key)) or to_storage(key))
+            for attribute, amount in amounts.items():
+                item[attribute] = item.get(attribute, 0) + to_storage(amount)
+            self._store(item)
+            return project(item)
+
+
+def get_memory_table(name, schema):
+    """
+    Returns the process-wide in-memory table with the given name, creating it if needed.
+
+    Args:
+        name (str): The table name.
+        schema (dict): The table's key schema.
+
+    Returns:
+        MemoryTable: The table.
+    """
+    with memory_tables_lock:
+        if name not in memory_tables:
+            memory_tables[name] = MemoryTable(name, schema)
+        return memory_tables[name]
+
+
+def reset_memory_tables():
+    """
+    Discards every in-memory table.
+    """
+    with memory_tables_lock:
+        memory_tables.clear()
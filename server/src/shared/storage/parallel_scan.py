@@ -0,0 +1,78 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Bounds of the parallel scan: roughly one segment per scan_segment_items items, at most scan_max_segments
+# segments, read by at most scan_workers threads at a time
+scan_segment_items = int(os.environ.get("SCAN_SEGMENT_ITEMS", 5000))
+scan_max_segments = int(os.environ.get("SCAN_MAX_SEGMENTS", 32))
+scan_workers = int(os.environ.get("SCAN_WORKERS", 8))
+
+# Item count estimates cached in a warm container, as DynamoDB only refreshes them every few hours
+item_count_ttl = 3600
+item_counts = {}
+item_counts_lock = threading.Lock()
+
+
+def estimate_item_count(table):
+    """
+    Returns the table's estimated item count, cached for an hour.
+
+    Args:
+        table: The table.
+
+    Returns:
+        int: The estimated item count.
+    """
+    with item_counts_lock:
+        cached = item_counts.get(table.name)
+        if cached and time.time() < cached[1]:
+            return cached[0]
+
+    count = table.estimated_item_count()
+    with item_counts_lock:
+        item_counts[table.name] = (count, time.time() + item_count_ttl)
+    return count
+
+
+def segment_count(item_count):
+    """
+    Chooses how many segments to split a scan of a table into.
+
+    Args:
+        item_count (int): The estimated number of items in the table.
+
+    Returns:
+        int: The number of segments, between 1 and scan_max_segments.
+    """
+    return max(1, min(scan_max_segments, math.ceil(item_count / scan_segment_items)))
+
+
+def parallel_scan(table, filters=None, projection=None, total_segments=None, workers=None):
+    """
+    Scans a whole table as concurrent segments, sized to the table, and merges them in segment order
+    so that the result is stable for a given table and segment count.
+
+    Args:
+        table: The table.
+        filters (dict): A dictionary mapping attribute names to the values they may take, or None.
+        projection (list): The attributes to retrieve, or None for whole items.
+        total_segments (int): The number of segments, or None to size them to the table.
+        workers (int): The maximum number of concurrent segment readers, or None for SCAN_WORKERS.
+
+    Returns:
+        list: The matching items.
+    """
+    if total_segments is None:
+        total_segments = segment_count(estimate_item_count(table))
+    if total_segments == 1:
+        return table.scan(filters=filters, projection=projection)
+
+    with ThreadPoolExecutor(max_workers=min(workers or scan_workers, total_segments)) as executor:
+        segments = executor.map(
+            lambda segment: table.scan(segment, total_segments, filters=filters, projection=projection),
+            range(total_segments)
+        )
+        return [item for segment in segments for item in segment]
@@ -0,0 +1,29 @@
+# Key schemas of the tables, as (partition key, sort key) attribute names, with their global secondary indexes.
+# DynamoDB defines these when a table is created; the local backends need them to index items the same way.
+
+transient_data = {
+    "key": ("objectID", "timestamp"),
+    "indexes": {
+        "objectType-index": ("objectType", "timestamp"),
+        "geohash-index": ("geohashPrefix", "timestamp")
+    }
+}
+
+transient_snapshots = {"key": ("objectType",)}
+
+transient_heatmaps = {"key": ("objectType", "timestamp")}
+
+transient_snapshot_history = {"key": ("objectType", "timestamp")}
+
+transient_snapshot_objects = {"key": ("snapshot", "chunk")}
+
+permanent_data = {
+    "key": ("objectType", "objectID"),
+    "indexes": {"geohash-index": ("geohashPrefix", "geohash")}
+}
+
+punctuality_by_objectID = {"key": ("objectID",)}
+
+punctuality_by_timestamp = {"key": ("timestamp",)}
+
+dataset_versions = {"key": ("dataset",)}
@@ -0,0 +1,407 @@
+import json
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+from shared.storage.common import to_storage, item_key, project, matches_filters, scan_segment, write_stats, page_attributes
+from shared.serialization import number_value
+
+# One connection per database file, shared by every table in it and serialised by its lock
+connections = {}
+connections_lock = threading.Lock()
+
+
+def connect(path):
+    """
+    Returns the shared connection to a SQLite database and the lock that serialises its use.
+
+    Args:
+        path (str): The path of the database file.
+
+    Returns:
+        tuple: The connection and its lock.
+    """
+    with connections_lock:
+        if path not in connections:
+            connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Lets a segmented scan pick out its rows by their key columns without reading the others
+            connection.create_function("scan_segment", -1, lambda *values: scan_segment(values[:-1], values[-1]), deterministic=True)
+            connections[path] = (connection, threading.RLock())
+        return connections[path]
+
+
+def encode_item(item):
+    """
+    Serialises an item to JSON, tagging Decimals so that they are restored exactly.
+
+    Args:
+        item (dict): The item.
+
+    Returns:
+        str: The JSON document.
+    """
+    def default(value):
+        if isinstance(value, Decimal):
+            return {"__decimal__": str(value)}
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    return json.dumps(item, default=default)
+
+
+def decode_item(document):
+    """
+    Restores an item serialised by encode_item.
+
+    Args:
+        document (str): The JSON document.
+
+    Returns:
+        dict: The item.
+    """
+    def object_hook(value):
+        if len(value) == 1 and "__decimal__" in value:
+            return Decimal(value["__decimal__"])
+        return value
+
+    return json.loads(document, object_hook=object_hook)
+
+
+def to_column(value):
+    """
+    Converts a key attribute value to a type SQLite can store and compare.
+
+    Args:
+        value: The key attribute value.
+
+    Returns:
+        The value as an int, float or str.
+    """
+    value = to_storage(value)
+    return number_value(value) if isinstance(value, Decimal) else value
+
+
+def quote(identifier):
+    """
+    Quotes a table or column name for use in SQL.
+
+    Args:
+        identifier (str): The name.
+
+    Returns:
+        str: The quoted name.
+    """
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class SQLiteTable:
+    """
+    A table stored in a SQLite database, with its key attributes as indexed columns and each item as a JSON document.
+    """
+
+    def __init__(self, path, name, schema):
+        self.name = name
+        self.key = tuple(schema["key"])
+        self.indexes = {None: self.key}
+        self.indexes.update(schema.get("indexes", {}))
+        self.columns = list(dict.fromkeys(attribute for attributes in self.indexes.values() for attribute in attributes))
+        self.connection, self.lock = connect(path)
+
+        columns = ", ".join(quote(column) for column in self.columns)
+        with self.lock:
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {quote(name)} ({columns}, item TEXT NOT NULL, "
+                f"PRIMARY KEY ({', '.join(quote(attribute) for attribute in self.key)}))"
+            )
+            for index, attributes in self.indexes.items():
+                if index is not None:
+                    self.connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS {quote(name + '_' + index)} ON {quote(name)} "
+                        f"({', '.join(quote(attribute) for attribute in attributes)})"
+                    )
+
+    def _store(self, item):
+        item = to_storage(item)
+        if item_key(item, self.key) is None:
+            raise ValueError(f"Item is missing a key attribute of {self.name}: {self.key}")
+
+        values = [to_column(item[column]) if column in item else None for column in self.columns]
+        placeholders = ", ".join("?" for _ in range(len(self.columns) + 1))
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO {quote(self.name)} ({', '.join(quote(column) for column in self.columns)}, item) "
+            f"VALUES ({placeholders})",
+            values + [encode_item(item)]
+        )
+
+    def _fetch(self, key):
+        condition = " AND ".join(f"{quote(attribute)} = ?" for attribute in self.key)
+        row = self.connection.execute(
+            f"SELECT item FROM {quote(self.name)} WHERE {condition}",
+            [to_column(key[attribute]) for attribute in self.key]
+        ).fetchone()
+        return decode_item(row[0]) if row else None
+
+    def get(self, key, projection=None):
+        """
+        Retrieves an item by its primary key.
+
+        Args:
+            key (dict): The primary key of the item.
+            projection (list): The attributes to retrieve, or None for the whole item.
+
+        Returns:
+            dict: The item, or None if it doesn't exist.
+        """
+        with self.lock:
+            item = self._fetch(key)
+        return project(item, projection) if item is not None else None
+
+    def get_many(self, keys, projection=None):
+        """
+        Retrieves several items by their primary keys, skipping any that don't exist.
+
+        Args:
+            keys (list): The primary keys of the items.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            list: The items found.
+        """
+        with self.lock:
+            items = [self._fetch(key) for key in keys]
+        return [project(item, projection) for item in items if item is not None]
+
+    def put(self, item):
+        """
+        Writes an item, replacing any item with the same primary key.
+
+        Args:
+            item (dict): The item.
+        """
+        with self.lock:
+            self._store(item)
+
+    def put_if_newer(self, item, attribute):
+        """
+        Writes an item unless the stored item with the same primary key has an equal or greater value of an attribute.
+
+        Args:
+            item (dict): The item.
+            attribute (str): The attribute to compare, e.g. timestamp.
+
+        Returns:
+            bool: Whether the item was written.
+        """
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._fetch(item)
+                written = existing is None or attribute not in existing or existing[attribute] < to_storage(item[attribute])
+                if written:
+                    self._store(item)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return written
+
+    def put_batch(self, items, workers=8):
+        """
+        Writes many items in a single transaction, the last of any duplicate keys winning.
+
+        Args:
+            items (list): The items.
+            workers (int): Unused; kept for interface compatibility with DynamoDBTable.
+
+        Returns:
+            dict: The number of items written, retries made, seconds taken and items per second.
+        """
+        start = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                for item in items:
+                    self._store(item)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        count = len({item_key(to_storage(item), self.key) for item in items})
+        return write_stats(count, time.time() - start)
+
+    def _query_sql(self, partition, sort=None, index=None):
+        attributes = self.indexes[index]
+        sql = f"SELECT item FROM {quote(self.name)} WHERE {quote(attributes[0])} = ?"
+        parameters = [to_column(partition)]
+
+        if len(attributes) > 1:
+            sort_column = quote(attributes[1])
+            sql += f" AND {sort_column} IS NOT NULL"
+            if sort is not None:
+                operator, *operands = sort
+                if operator == "begins_with":
+                    sql += f" AND substr({sort_column}, 1, length(?)) = ?"
+                    parameters += [operands[0], operands[0]]
+                elif operator == "between":
+                    sql += f" AND {sort_column} BETWEEN ? AND ?"
+                    parameters += [to_column(operands[0]), to_column(operands[1])]
+                else:
+                    comparisons = {"eq": "=", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+                    if operator not in comparisons:
+                        raise ValueError(f"Unknown sort key operator: {operator}")
+                    sql += f" AND {sort_column} {comparisons[operator]} ?"
+                    parameters.append(to_column(operands[0]))
+        return sql, parameters
+
+    def _page(self, sql, parameters, limit, start_key, ordering, descending=False, filters=None, projection=None):
+        columns = ", ".join(quote(attribute) for attribute in ordering)
+        direction = "DESC" if descending else "ASC"
+        if start_key is not None:
+            sql += f" AND ({columns}) {'<' if descending else '>'} ({', '.join('?' for _ in ordering)})"
+            parameters = parameters + [to_column(start_key[attribute]) for attribute in ordering]
+        sql += " ORDER BY " + ", ".join(f"{quote(attribute)} {direction}" for attribute in ordering)
+
+        items = []
+        with self.lock:
+            cursor = self.connection.execute(sql, parameters)
+            try:
+                for row in cursor:
+                    item = decode_item(row[0])
+                    if matches_filters(item, filters):
+                        items.append(item)
+                        if len(items) == limit:
+                            break
+            finally:
+                cursor.close()
+
+        # Like DynamoDB, a full page returns the key of its last item, even if no items follow it
+        last_key = {attribute: items[-1][attribute] for attribute in ordering} if items and len(items) == limit else None
+        return [project(item, projection) for item in items], last_key
+
+    def query(self, partition, sort=None, index=None, descending=False, limit=None, projection=None):
+        """
+        Retrieves the items of a partition of the table or of one of its indexes, in sort key order.
+
+        Args:
+            partition: The partition key value.
+            sort (tuple): A sort key condition, e.g. ("eq", 1234567890), or None for the whole partition.
+            index (str): The name of the index to query, or None for the table itself.
+            descending (bool): Whether to return items in descending sort key order.
+            limit (int): The maximum number of items to return, or None for all of them.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            list: The matching items.
+        """
+        attributes = self.indexes[index]
+        sql, parameters = self._query_sql(partition, sort, index)
+        if len(attributes) > 1:
+            sql += f" ORDER BY {quote(attributes[1])} {'DESC' if descending else 'ASC'}"
+
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+
+        with self.lock:
+            rows = self.connection.execute(sql, parameters).fetchall()
+        return [project(decode_item(row[0]), projection) for row in rows]
+
+    def query_page(self, partition, limit, start_key=None, sort=None, index=None, descending=False, projection=None):
+        """
+        Retrieves one page of the items of a partition, resuming after the key that ended the previous page.
+
+        Args:
+            partition: The partition key value.
+            limit (int): The maximum number of items in the page.
+            start_key (dict): The key returned with the previous page, or None for the first page.
+            sort (tuple): A sort key condition, or None for the whole partition.
+            index (str): The name of the index to query, or None for the table itself.
+            descending (bool): Whether to return items in descending sort key order.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            tuple: The items of the page, and the key to resume after, or None if there are no more items.
+        """
+        sql, parameters = self._query_sql(partition, sort, index)
+        ordering = page_attributes(self.indexes[index], self.key)
+        return self._page(sql, parameters, limit, start_key, ordering, descending=descending, projection=projection)
+
+    def scan(self, segment=0, total_segments=1, filters=None, projection=None):
+        """
+        Retrieves every item in one segment of the table.
+
+        Args:
+            segment (int): The segment to scan.
+            total_segments (int): The number of segments the scan is split into.
+            filters (dict): A dictionary mapping attribute names to the values they may take, or None.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            list: The matching items.
+        """
+        sql = f"SELECT item FROM {quote(self.name)}"
+        parameters = []
+        if total_segments > 1:
+            # Each segment reads only its own rows, so a parallel scan reads the table once between them
+            sql += f" WHERE scan_segment({', '.join(quote(attribute) for attribute in self.key)}, ?) = ?"
+            parameters = [total_segments, segment]
+
+        with self.lock:
+            rows = self.connection.execute(sql, parameters).fetchall()
+
+        items = []
+        for row in rows:
+            item = decode_item(row[0])
+            if matches_filters(item, filters):
+                items.append(project(item, projection))
+        return items
+
+    def scan_page(self, limit, start_key=None, filters=None, projection=None):
+        """
+        Retrieves one page of the items in the table, in primary key order, resuming after the key that ended the previous page.
+
+        Args:
+            limit (int): The maximum number of items in the page.
+            start_key (dict): The key returned with the previous page, or None for the first page.
+            filters (dict): A dictionary mapping attribute names to the values they may take, or None.
+            projection (list): The attributes to retrieve, or None for whole items.
+
+        Returns:
+            tuple: The items of the page, and the key to resume after, or None if there are no more items.
+        """
+        sql = f"SELECT item FROM {quote(self.name)} WHERE 1"
+        return self._page(sql, [], limit, start_key, self.key, filters=filters, projection=projection)
+
+    def estimated_item_count(self):
+        """
+        Returns the number of items in the table.
+
+        Returns:
+            int: The item count.
+        """
+        with self.lock:
+            return self.connection.execute(f"SELECT COUNT(*) FROM {quote(self.name)}").fetchone()[0]
+
+    def increment(self, key, amounts):
+        """
+        Atomically adds to numeric attributes of an item, creating the item and attributes as needed.
+
+        Args:
+            key (dict): The primary key of the item.
+            amounts (dict): A dictionary mapping attribute names to the amounts to add.
+
+        Returns:
+            dict: The item after the update.
+        """
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                item = self._fetch(key) or to_storage(dict(key))
+                for attribute, amount in amounts.items():
+                    item[attribute] = item.get(attribute, 0) + to_storage(amount)
+                self._store(item)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return item
@@ -0,0 +1,140 @@
+"""
+Load-tests API endpoints with concurrent keep-alive clients, reporting throughput and latency percentiles,
+so that the single-process API server can be compared with the per-function Lambda deployment under the same load.
+
+Given URLs, each is load-tested in turn: pass the API Gateway URLs to measure the deployed functions, and the same
+paths on a server started with python -m servers.api to measure it. Without URLs, an API server is started on a
+SQLite database seeded with synthetic snapshots, and its transient and coordinate endpoints are load-tested.
+
+Run from server/src:
+    python test/benchmarks/benchmark_api.py [concurrency] [seconds] [url ...]
+"""
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+CONCURRENCY = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+URLS = sys.argv[3:]
+VEHICLES = 1000
+SNAPSHOTS = 5
+PORT = 8089
+LOCAL_PATHS = ["/transient_data", "/transient_data?objectType=Bus&bbox=-6.5,53.2,-6.0,53.5", "/return_all_coordinates?precision=5"]
+
+
+def load(url, deadline, latencies, failures):
+    """Requests a URL over one kept-alive connection until the deadline."""
+    parts = urllib.parse.urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    connection = connection_class(parts.netloc, timeout=30)
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            connection.request("GET", target, headers={"Accept-Encoding": "gzip"})
+            response = connection.getresponse()
+            response.read()
+            if response.status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            failures.append(type(e).__name__)
+            connection.close()
+            connection = connection_class(parts.netloc, timeout=30)
+    connection.close()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def benchmark(url):
+    latencies = []
+    failures = []
+    deadline = time.time() + SECONDS
+    threads = [threading.Thread(target=load, args=(url, deadline, latencies, failures)) for _ in range(CONCURRENCY)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    print(url)
+    if not latencies:
+        print(f"    no successful requests, {len(failures)} failures: {sorted(set(map(str, failures)))}")
+        return
+    print(f"    {len(latencies) / SECONDS:>9.1f} requests/s, {len(failures)} failures")
+    print(f"    latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p95 {percentile(latencies, 0.95) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms")
+
+
+def seed(environment):
+    """Ingests synthetic snapshots into the database the local server will read."""
+    os.environ.update(environment)
+    from functions.fetch_transient_data import lambda_function as ingest
+
+    random.seed(0)
+    positions = {f"Bus-{index}": (53.35, -6.26) for index in range(VEHICLES)}
+    for index in range(SNAPSHOTS):
+        timestamp = 1700000000 + index * 60
+        for object_id in random.sample(list(positions), VEHICLES // 3):
+            latitude, longitude = positions[object_id]
+            positions[object_id] = (latitude + random.uniform(-0.01, 0.01), longitude + random.uniform(-0.01, 0.01))
+        data = [{
+            "objectID": object_id, "objectType": "Bus", "timestamp": timestamp,
+            "latitude": f"{latitude:.6f}", "longitude": f"{longitude:.6f}"
+        } for object_id, (latitude, longitude) in positions.items()]
+        changed_items, snapshot_objects = ingest.split_changed_items(timestamp, data)
+        ingest.batch_upload_to_dynamodb(changed_items)
+        ingest.commit_snapshots(timestamp, snapshot_objects, {}, data)
+
+
+def start_local_server(environment):
+    server = subprocess.Popen([sys.executable, "-m", "servers.api", "--port", str(PORT)], env=dict(os.environ, **environment),
+                              stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", PORT), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("The API server didn't start")
+
+
+def main():
+    print(f"{CONCURRENCY} concurrent clients for {SECONDS:.0f}s per URL")
+    if URLS:
+        for url in URLS:
+            benchmark(url)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        environment = {
+            "STORAGE_BACKEND": "sqlite",
+            "STORAGE_SQLITE_PATH": os.path.join(directory, "storage.sqlite3"),
+            "TRANSIENT_TABLE": "transient_data2",
+            "TABLE_NAME": "transient_data2"
+        }
+        seed(environment)
+        server = start_local_server(environment)
+        try:
+            for path in LOCAL_PATHS:
+                benchmark(f"http://127.0.0.1:{PORT}{path}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
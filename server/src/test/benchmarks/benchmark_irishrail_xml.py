@@ -0,0 +1,138 @@
+"""
+Benchmarks the streaming Irish Rail XML parser against the previous xmltodict path
+using the recorded fixtures in test/fixtures/irishrail.
+
+Run from server/src:
+    python test/benchmarks/benchmark_irishrail_xml.py
+"""
+import os
+import re
+import sys
+import timeit
+import tracemalloc
+import xmltodict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from shared.irishrail_xml import iter_trains, iter_stations
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), '..', 'fixtures', 'irishrail')
+ITERATIONS = 200
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as file:
+        return file.read()
+
+
+def legacy_trains(xml, train_type, timestamp, punctuality_data):
+    """The xmltodict-based train parsing previously done in fetch_trains."""
+    trains = []
+    trains_json = xmltodict.parse(xml)
+    for train in trains_json["ArrayOfObjTrainPositions"].get("objTrainPositions", []):
+        train_code = str(train["TrainCode"])
+        train_status = train["TrainStatus"]
+        public_message = train["PublicMessage"]
+        avg_punctuality = punctuality_data.get("IrishRailTrain-" + train_code, 0)
+
+        split_message = public_message.split("\\n")
+        trainDetails = split_message[1].split("(")[0]
+        trainUpdate = split_message[2]
+
+        match = re.search(r"(-?\d+)\s+mins\s+late", public_message)
+        punctuality = int(match.group(1)) if match else 0
+
+        if punctuality < 0:
+            punctuality_status = "early"
+            lateness_message = f"{-punctuality} minute{'s' if punctuality != -1 else ''} early"
+        elif punctuality == 0:
+            punctuality_status = "on-time"
+            lateness_message = "On time"
+        else:
+            punctuality_status = "late"
+            lateness_message = f"{punctuality} minute{'s' if punctuality != 1 else ''} late"
+
+        train_type_full = {"M": "Mainline", "S": "Suburban", "D": "DART"}.get(train_type, "Unknown")
+        train_status_full = {"R": "Running", "T": "Terminated", "N": "Not yet running"}.get(train_status, "Unknown")
+
+        trains.append({
+            "objectID": "IrishRailTrain-" + train_code,
+            "objectType": "IrishRailTrain",
+            "timestamp": timestamp,
+            "latitude": str(train["TrainLatitude"]),
+            "longitude": str(train["TrainLongitude"]),
+            "trainCode": train_code,
+            "trainType": train_type,
+            "trainTypeFull": train_type_full,
+            "trainStatus": train_status,
+            "trainStatusFull": train_status_full,
+            "trainDate": str(train["TrainDate"]),
+            "trainPublicMessage": public_message,
+            "trainDirection": train["Direction"],
+            "trainPunctuality": punctuality,
+            "trainPunctualityStatus": punctuality_status,
+            "latenessMessage": lateness_message,
+            "trainDetails": trainDetails,
+            "trainUpdate": trainUpdate,
+            "averagePunctuality": avg_punctuality
+        })
+    return trains
+
+
+def legacy_stations(xml):
+    """The xmltodict-based station parsing previously done in fetch_train_stations."""
+    stations_json = xmltodict.parse(xml)
+    return [{
+        "objectID": "IrishRailStation-" + station["StationCode"],
+        "objectType": "IrishRailStation",
+        "latitude": station["StationLatitude"],
+        "longitude": station["StationLongitude"],
+        "trainStationID": station["StationId"],
+        "trainStationCode": station["StationCode"],
+        "trainStationAlias": station.get("StationAlias", ""),
+        "trainStationDesc": station["StationDesc"]
+    } for station in stations_json["ArrayOfObjStation"]["objStation"]]
+
+
+def measure(label, function):
+    """Prints the mean time per call and the peak memory allocated by a single call."""
+    seconds = timeit.timeit(function, number=ITERATIONS) / ITERATIONS
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<28} {seconds * 1000:>8.3f} ms {peak / 1024:>10.1f} KiB")
+    return seconds, peak
+
+
+def main():
+    train_fixtures = {train_type: read_fixture(f"getCurrentTrainsXML_WithTrainType_{train_type}.xml") for train_type in ["M", "S", "D"]}
+    stations_xml = read_fixture("getAllStationsXML.xml")
+    punctuality_data = {}
+
+    def legacy_snapshot():
+        for train_type, xml in train_fixtures.items():
+            legacy_trains(xml, train_type, 0, punctuality_data)
+
+    def streaming_snapshot():
+        for train_type, xml in train_fixtures.items():
+            list(iter_trains(xml, train_type, 0, punctuality_data))
+
+    # Both paths must produce identical records before their timings mean anything
+    for train_type, xml in train_fixtures.items():
+        assert legacy_trains(xml, train_type, 0, punctuality_data) == list(iter_trains(xml, train_type, 0, punctuality_data))
+    assert legacy_stations(stations_xml) == list(iter_stations(stations_xml))
+
+    print(f"{'path':<28} {'time/call':>11} {'peak memory':>14}")
+    for name, legacy, streaming in [
+        ("trains (M, S, D)", legacy_snapshot, streaming_snapshot),
+        ("stations", lambda: legacy_stations(stations_xml), lambda: list(iter_stations(stations_xml)))
+    ]:
+        legacy_time, legacy_peak = measure(f"{name} xmltodict", legacy)
+        streaming_time, streaming_peak = measure(f"{name} streaming", streaming)
+        print(f"{name}: {legacy_time / streaming_time:.2f}x faster, {legacy_peak / streaming_peak:.2f}x lower peak memory\n")
+
+
+if __name__ == "__main__":
+    main()
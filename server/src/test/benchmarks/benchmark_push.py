@@ -0,0 +1,108 @@
+"""
+Measures how long the push server takes to deliver a new snapshot to many concurrent subscribers,
+using synthetic snapshots where a fraction of the vehicles move between ingests.
+
+Run from server/src:
+    python test/benchmarks/benchmark_push.py [subscribers] [vehicles] [snapshots]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+SUBSCRIBERS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+VEHICLES = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+SNAPSHOTS = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+MOVING_FRACTION = 0.3
+
+# A few viewports shared by many viewers, as on a map centred on the same cities
+VIEWPORTS = [None, "-6.5,53.2,-6.0,53.5", "-8.7,51.8,-8.3,52.0", "-9.2,53.2,-8.9,53.4"]
+
+os.environ.update({"STORAGE_BACKEND": "memory", "TABLE_NAME": "transient_data2"})
+
+from functions.fetch_transient_data import lambda_function as ingest
+from servers.feed import SnapshotFeed
+from servers import push
+from servers.push import PushServer
+
+
+def make_snapshot(timestamp, positions):
+    """Moves a fraction of the vehicles and returns the snapshot's items."""
+    for object_id in random.sample(list(positions), int(len(positions) * MOVING_FRACTION)):
+        latitude, longitude = positions[object_id]
+        positions[object_id] = (latitude + random.uniform(-0.01, 0.01), longitude + random.uniform(-0.01, 0.01))
+    return [{
+        "objectID": object_id,
+        "objectType": "Bus",
+        "timestamp": timestamp,
+        "latitude": f"{latitude:.6f}",
+        "longitude": f"{longitude:.6f}"
+    } for object_id, (latitude, longitude) in positions.items()]
+
+
+def ingest_snapshot(timestamp, positions):
+    changed_items, snapshot_objects = ingest.split_changed_items(timestamp, make_snapshot(timestamp, positions))
+    ingest.batch_upload_to_dynamodb(changed_items)
+    ingest.commit_snapshots(timestamp, snapshot_objects, {}, [])
+
+
+async def subscribe(port, viewport):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=2 ** 24)
+    query = "objectType=Bus" + (f"&bbox={viewport}" if viewport else "")
+    writer.write(f"GET /events?{query} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode("latin-1"))
+    await reader.readuntil(b"\r\n\r\n")
+    await reader.readuntil(b"\n\n")
+    return reader, writer
+
+
+async def next_snapshot(reader):
+    """Reads events until one arrives, returning the bytes received."""
+    return len(await reader.readuntil(b"\n\n"))
+
+
+async def run():
+    random.seed(0)
+    cities = [(53.35, -6.26), (51.9, -8.47), (53.27, -9.05)]
+    positions = {f"Bus-{index}": random.choice(cities) for index in range(VEHICLES)}
+    ingest_snapshot(1700000000, positions)
+
+    server = PushServer(SnapshotFeed(ingest.table, ingest.snapshot_table, ingest.objects_table, ["Bus"]))
+    await server.refresh()
+    listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0, backlog=push.listen_backlog)
+    port = listener.sockets[0].getsockname()[1]
+
+    start = time.time()
+    connections = await asyncio.gather(*(subscribe(port, VIEWPORTS[index % len(VIEWPORTS)]) for index in range(SUBSCRIBERS)))
+    print(f"{SUBSCRIBERS} subscribers, {VEHICLES} vehicles, {MOVING_FRACTION:.0%} moving per snapshot")
+    print(f"connect + initial snapshot:  {(time.time() - start) * 1000:>9.2f} ms for all subscribers")
+
+    fan_out = []
+    delivered = 0
+    for index in range(1, SNAPSHOTS + 1):
+        ingest_snapshot(1700000000 + index * 60, positions)
+        start = time.time()
+        receiving = asyncio.gather(*(next_snapshot(reader) for reader, _ in connections))
+        await server.refresh()
+        delivered += sum(await receiving)
+        fan_out.append(time.time() - start)
+
+    print(f"snapshot to every viewer:    {sum(fan_out) / len(fan_out) * 1000:>9.2f} ms/snapshot (one table read per snapshot)")
+    print(f"resynchronised:              {server.resyncs:>9} slow subscribers")
+    print(f"pushed:                      {delivered / SNAPSHOTS / SUBSCRIBERS:>9.0f} bytes/subscriber/snapshot")
+
+    for _, writer in connections:
+        writer.close()
+    # Lets the server see the disconnections before the loop shuts down
+    await asyncio.sleep(0.5)
+    listener.close()
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
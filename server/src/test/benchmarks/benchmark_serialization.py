@@ -0,0 +1,68 @@
+"""
+Compares serializing snapshot items read back from DynamoDB, with their numbers as Decimals,
+using json.dumps(default=str) and the shared to_json encoder, with and without orjson.
+
+Run from server/src:
+    python test/benchmarks/benchmark_serialization.py [items ...]
+"""
+import json
+import os
+import random
+import sys
+import timeit
+from decimal import Decimal
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from shared import serialization
+from shared.serialization import to_json
+
+SIZES = [int(size) for size in sys.argv[1:]] or [1000, 5000, 20000]
+ITERATIONS = 20
+
+
+def make_items(count):
+    """Builds a snapshot of buses and trains as the table returns them, with Decimal numbers."""
+    random.seed(0)
+    items = []
+    for index in range(count):
+        item = {
+            "objectID": f"Bus-{index}",
+            "objectType": "Bus",
+            "timestamp": Decimal(1700000000),
+            "latitude": f"{53.3 + random.uniform(-0.2, 0.2):.6f}",
+            "longitude": f"{-6.2 + random.uniform(-0.2, 0.2):.6f}",
+            "geohash": "gc7x3r04z",
+            "geohashPrefix": "gc7x",
+            "busRoute": random.choice(["46A", "39A", "C1", "155"]),
+            "busDirection": Decimal(random.randint(0, 1))
+        }
+        if index % 10 == 0:
+            item.update({"objectID": f"IrishRailTrain-{index}", "objectType": "IrishRailTrain",
+                         "trainPunctuality": Decimal(random.randint(-2, 15)), "averagePunctuality": Decimal(random.randint(0, 100)) / 10})
+        items.append(item)
+    return items
+
+
+def main():
+    encoders = {"json.dumps(default=str)": lambda items: json.dumps(items, default=str)}
+    if serialization.orjson is not None:
+        encoders["to_json (orjson)"] = to_json
+
+    def to_json_stdlib(items):
+        with patch.object(serialization, "orjson", None):
+            return to_json(items)
+    encoders["to_json (stdlib)"] = to_json_stdlib
+
+    print(f"{'items':>7} {'encoder':<25} {'bytes':>10} {'time':>12} {'speedup':>8}")
+    for size in SIZES:
+        items = make_items(size)
+        baseline = None
+        for name, encode in encoders.items():
+            seconds = timeit.timeit(lambda: encode(items), number=ITERATIONS) / ITERATIONS
+            baseline = baseline or seconds
+            print(f"{size:>7} {name:<25} {len(encode(items)):>10} {seconds * 1000:>9.2f} ms {baseline / seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Load-tests the ingest and read paths end to end against a local storage backend,
+using synthetic snapshots where a fraction of the vehicles move between ingests.
+
+Run from server/src:
+    python test/benchmarks/benchmark_storage.py [memory|sqlite] [snapshots] [vehicles]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+BACKEND = sys.argv[1] if len(sys.argv) > 1 else "memory"
+SNAPSHOTS = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+VEHICLES = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+MOVING_FRACTION = 0.3
+READS = 50
+
+# The handlers open their tables when imported, so the backend must be configured first
+directory = tempfile.TemporaryDirectory()
+os.environ.update({
+    "STORAGE_BACKEND": BACKEND,
+    "STORAGE_SQLITE_PATH": os.path.join(directory.name, "storage.sqlite3"),
+    "TABLE_NAME": "transient_data2"
+})
+
+from functions.fetch_transient_data import lambda_function as ingest
+from functions.return_transient_data.lambda_function import lambda_handler as return_transient_data
+from functions.return_all_coordinates.lambda_function import lambda_handler as return_all_coordinates
+
+
+def make_snapshot(timestamp, positions):
+    """Moves a fraction of the vehicles and returns the snapshot's items."""
+    for object_id in random.sample(list(positions), int(len(positions) * MOVING_FRACTION)):
+        latitude, longitude = positions[object_id]
+        positions[object_id] = (latitude + random.uniform(-0.01, 0.01), longitude + random.uniform(-0.01, 0.01))
+
+    return [{
+        "objectID": object_id,
+        "objectType": "IrishRailTrain" if object_id.startswith("IrishRailTrain") else "Bus",
+        "timestamp": timestamp,
+        "latitude": f"{latitude:.6f}",
+        "longitude": f"{longitude:.6f}"
+    } for object_id, (latitude, longitude) in positions.items()]
+
+
+def time_reads(handler, event):
+    start = time.time()
+    for _ in range(READS):
+        response = handler(event, {})
+        assert response["statusCode"] == 200, response
+    return (time.time() - start) / READS
+
+
+def main():
+    random.seed(0)
+    train_count = VEHICLES // 10
+    positions = {f"IrishRailTrain-{index}": (53.3, -6.2) for index in range(train_count)}
+    positions.update({f"Bus-{index}": (53.3, -6.2) for index in range(VEHICLES - train_count)})
+
+    written = 0
+    start = time.time()
+    for index in range(SNAPSHOTS):
+        timestamp = 1700000000 + index * 60
+        data = make_snapshot(timestamp, positions)
+        changed_items, snapshot_objects = ingest.split_changed_items(timestamp, data)
+        ingest.batch_upload_to_dynamodb(changed_items)
+        ingest.commit_snapshots(timestamp, snapshot_objects, {}, data)
+        written += len(changed_items)
+    ingest_seconds = time.time() - start
+
+    print(f"backend: {BACKEND}, {SNAPSHOTS} snapshots of {VEHICLES} vehicles, {written} items written")
+    print(f"ingest:                  {ingest_seconds / SNAPSHOTS * 1000:>9.2f} ms/snapshot")
+    print(f"return_transient_data:   {time_reads(return_transient_data, {'queryStringParameters': None}) * 1000:>9.2f} ms/request")
+    print(f"return_all_coordinates:  {time_reads(return_all_coordinates, {}) * 1000:>9.2f} ms/request")
+
+    # A client refreshing every snapshot only needs the changes since the one before
+    since = {'since': str(timestamp - 60)}
+    print(f"return_transient_data?since: {time_reads(return_transient_data, {'queryStringParameters': since}) * 1000:>5.2f} ms/request")
+    full_bytes = len(return_transient_data({'queryStringParameters': None}, {})["body"])
+    delta_bytes = len(return_transient_data({'queryStringParameters': since}, {})["body"])
+    print(f"refresh body:            {full_bytes:>9} bytes in full, {delta_bytes} bytes as a delta ({delta_bytes / full_bytes:.0%})")
+
+
+if __name__ == "__main__":
+    main()
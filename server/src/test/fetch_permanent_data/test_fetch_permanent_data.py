@@ -1,65 +1,48 @@
 import unittest
 from unittest.mock import patch, MagicMock
-import json
-import os
 from functions.fetch_permanent_data.lambda_function import (
     fetch_train_stations_with_type,
     fetch_train_stations,
     fetch_luas,
     fetch_gtfs,
     batch_upload_to_dynamodb,
-    lambda_handler,
-    table_name,
-    table
+    lambda_handler
 )
+from shared.storage import MemoryTable
+from shared.storage import schemas
+
+STATIONS_XML = '''<?xml version="1.0" encoding="utf-8"?>
+<ArrayOfObjStation xmlns="http://api.irishrail.ie/realtime/">
+    <objStation>
+        <StationDesc>Dublin</StationDesc>
+        <StationAlias>DUB</StationAlias>
+        <StationLatitude>53.0</StationLatitude>
+        <StationLongitude>-6.0</StationLongitude>
+        <StationCode>DUB</StationCode>
+        <StationId>1</StationId>
+    </objStation>
+</ArrayOfObjStation>
+'''
 
 class TestPermanentData(unittest.TestCase):
 
     @patch('functions.fetch_permanent_data.lambda_function.session.get')
-    @patch('functions.fetch_permanent_data.lambda_function.xmltodict.parse')
-    def test_fetch_train_stations_with_type(self, mock_parse, mock_get):
-        mock_get.return_value.text = '<xml></xml>'
-        mock_parse.return_value = {
-            "ArrayOfObjStation": {
-                "objStation": [
-                    {
-                        "StationCode": "DUB",
-                        "StationLatitude": "53.0",
-                        "StationLongitude": "-6.0",
-                        "StationId": "1",
-                        "StationDesc": "Dublin",
-                        "StationAlias": "DUB"
-                    }
-                ]
-            }
-        }
+    def test_fetch_train_stations_with_type(self, mock_get):
+        mock_get.return_value.text = STATIONS_XML
 
         result = fetch_train_stations_with_type()
         self.assertEqual(len(result), 3)  # Three types: M, S, D
         self.assertEqual(result[0]['trainStationCode'], 'DUB')
+        self.assertEqual(result[0]['trainStationType'], 'M')
 
     @patch('functions.fetch_permanent_data.lambda_function.session.get')
-    @patch('functions.fetch_permanent_data.lambda_function.xmltodict.parse')
-    def test_fetch_train_stations(self, mock_parse, mock_get):
-        mock_get.return_value.text = '<xml></xml>'
-        mock_parse.return_value = {
-            "ArrayOfObjStation": {
-                "objStation": [
-                    {
-                        "StationCode": "DUB",
-                        "StationLatitude": "53.0",
-                        "StationLongitude": "-6.0",
-                        "StationId": "1",
-                        "StationDesc": "Dublin",
-                        "StationAlias": "DUB"
-                    }
-                ]
-            }
-        }
+    def test_fetch_train_stations(self, mock_get):
+        mock_get.return_value.text = STATIONS_XML
 
         result = fetch_train_stations()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0]['trainStationCode'], 'DUB')
+        self.assertEqual(result[0]['trainStationAlias'], 'DUB')
 
     @patch('functions.fetch_permanent_data.lambda_function.session.get')
     def test_fetch_luas(self, mock_get):
@@ -106,21 +89,23 @@ class TestPermanentData(unittest.TestCase):
             self.assertEqual(result[1]['busRouteLongName'], 'Ballinteer to Phoenix Park')
             self.assertEqual(result[2]['busStopName'], 'Stop 1')
 
-    @patch('functions.fetch_permanent_data.lambda_function.table')
-    def test_batch_upload_to_dynamodb(self, mock_table):
-        mock_batch_writer = MagicMock()
-        mock_table.batch_writer.return_value.__enter__.return_value = mock_batch_writer
+    @patch('functions.fetch_permanent_data.lambda_function.table',
+           new_callable=lambda: MemoryTable('permanent_data', schemas.permanent_data))
+    def test_batch_upload_to_dynamodb(self, table):
+        data = [{"objectID": "1", "objectType": "TestType"}, {"objectID": "1", "objectType": "TestType", "name": "Renamed"}]
+        stats = batch_upload_to_dynamodb(data)
 
-        data = [{"objectID": "1", "objectType": "TestType"}]
-        batch_upload_to_dynamodb(data)
-
-        mock_batch_writer.put_item.assert_called_once_with(Item=data[0])
+        self.assertEqual(stats['items'], 1)
+        self.assertEqual(table.get({"objectType": "TestType", "objectID": "1"})["name"], "Renamed")
 
     @patch('functions.fetch_permanent_data.lambda_function.fetch_train_stations')
     @patch('functions.fetch_permanent_data.lambda_function.fetch_luas')
     @patch('functions.fetch_permanent_data.lambda_function.fetch_gtfs')
     @patch('functions.fetch_permanent_data.lambda_function.batch_upload_to_dynamodb')
-    def test_lambda_handler(self, mock_upload, mock_gtfs, mock_luas, mock_stations):
+    @patch('functions.fetch_permanent_data.lambda_function.version_table',
+           new_callable=lambda: MemoryTable('dataset_versions', schemas.dataset_versions))
+    def test_lambda_handler(self, version_table, mock_upload, mock_gtfs, mock_luas, mock_stations):
+        version_table.put({"dataset": "permanent_data#BusStop", "version": 4})
         mock_stations.return_value = [{"objectID": "station1", "objectType": "IrishRailStation"}]
         mock_luas.return_value = [{"objectID": "luas1", "objectType": "LuasStop"}]
         mock_gtfs.return_value = [{"objectID": "bus1", "objectType": "BusStop"}]
@@ -131,5 +116,10 @@ class TestPermanentData(unittest.TestCase):
         self.assertIn('Data uploaded successfully', result['body'])
         self.assertEqual(mock_upload.call_count, 1)
 
+        # Each loaded objectType's version, and the table's, is bumped after the upload
+        self.assertEqual(version_table.get({"dataset": "permanent_data#BusStop"})["version"], 5)
+        self.assertEqual(version_table.get({"dataset": "permanent_data#LuasStop"})["version"], 1)
+        self.assertEqual(version_table.get({"dataset": "permanent_data"})["version"], 1)
+
 if __name__ == "__main__":
     unittest.main()
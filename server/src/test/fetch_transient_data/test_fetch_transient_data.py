@@ -1,10 +1,30 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import os
+import json
+import time
+import gzip
+import tempfile
+from decimal import Decimal
 from functions.fetch_transient_data.lambda_function import (
-    fetch_trains,
-    fetch_buses
+    fetch_buses,
+    fetch_all_sources,
+    commit_snapshot,
+    commit_snapshots,
+    fetch_missing_source_items,
+    get_punctuality_data,
+    punctuality_cache,
+    previous_snapshots,
+    split_changed_items
 )
+from shared.geohash import add_geohash
+from shared.blob_store import LocalBlobStore
+from shared.storage import MemoryTable
+from shared.storage import schemas
+from shared.snapshots import fingerprint, load_objects, objects_chunks
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), '..', 'fixtures', 'gtfsr')
+
 
 class TestTransientData(unittest.TestCase):
     """
@@ -36,62 +56,277 @@ class TestTransientData(unittest.TestCase):
         mock_get.side_effect = [mock_response_1, mock_response_2]
 
         # Run the function
-        result = fetch_buses()
+        result = fetch_buses(1234567890)
 
         # Assertions
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0]['busID'], 'bus1')
         self.assertEqual(result[0]['busRouteAgencyName'], 'Dublin Bus')
 
+    @patch.dict(os.environ, {"PERMANENT_DATA_API": "http://mockapi.com"})
     @patch('functions.fetch_transient_data.lambda_function.session.get')
-    @patch('functions.fetch_transient_data.lambda_function.timestamp', '1234567890')
-    def test_fetch_trains(self, mock_get):
-        """
-        Test the fetch_trains function to ensure it returns the correct data.
-        """
-        # Mock response for train API
-        mock_response = MagicMock()
-        mock_response.text = '''
-        <ArrayOfObjTrainPositions>
-            <objTrainPositions>
-                <TrainCode>A123</TrainCode>
-                <TrainLatitude>53.0</TrainLatitude>
-                <TrainLongitude>-6.0</TrainLongitude>
-                <TrainStatus>R</TrainStatus>
-                <TrainDate>2025-03-09</TrainDate>
-                <PublicMessage>P322\\n17:10 - M3 Parkway to Docklands (1 mins late)\\nArrived Castleknock next stop Navan Road Parkway</PublicMessage>
-                <Direction>Northbound</Direction>
-            </objTrainPositions>
-        </ArrayOfObjTrainPositions>
-        '''
-        mock_get.return_value = mock_response
-
-        with patch('functions.fetch_transient_data.lambda_function.xmltodict.parse') as mock_parse:
-            # Mock xmltodict to return a dictionary directly
-            mock_parse.return_value = {
-                "ArrayOfObjTrainPositions": {
-                    "objTrainPositions": [
-                        {
-                            "TrainCode": "A123",
-                            "TrainLatitude": "53.0",
-                            "TrainLongitude": "-6.0",
-                            "TrainStatus": "R",
-                            "TrainDate": "2025-03-09",
-                            "PublicMessage": "P322\\n17:10 - M3 Parkway to Docklands (1 mins late)\\nArrived Castleknock next stop Navan Road Parkway",
-                            "Direction": "Northbound"
-                        }
-                    ]
-                }
-            }
-
-            result = fetch_trains()
-            self.assertEqual(len(result), 3)  # 3 train types: M, S, D
-            self.assertEqual(result[0]['trainCode'], 'A123')
-            self.assertEqual(result[0]['trainStatus'], 'R')
-            self.assertEqual(result[0]['trainStatusFull'], 'Running')
-            self.assertEqual(result[0]['trainPunctuality'], 1)
-            self.assertEqual(result[0]['trainPunctualityStatus'], 'late')
-            self.assertEqual(result[0]['latenessMessage'], '1 minute late')
+    def test_fetch_buses_protobuf_matches_json(self, mock_get):
+        """
+        Test that decoding the protobuf feed produces identical Bus records to the JSON feed.
+        """
+        with open(os.path.join(FIXTURES_DIR, "Vehicles.json")) as file:
+            buses_json = json.load(file)
+        with open(os.path.join(FIXTURES_DIR, "Vehicles.pb"), "rb") as file:
+            buses_protobuf = file.read()
+
+        routes_response = MagicMock()
+        routes_response.json.return_value = [
+            {"busRouteID": "4452_87", "busRouteAgencyName": "Dublin Bus", "busRouteShortName": "46A"}]
+
+        results = {}
+        for gtfs_format in ["json", "protobuf"]:
+            feed_response = MagicMock()
+            feed_response.json.return_value = buses_json
+            feed_response.content = buses_protobuf
+            mock_get.side_effect = [feed_response, routes_response]
+
+            with patch('functions.fetch_transient_data.lambda_function.gtfs_format', gtfs_format):
+                results[gtfs_format] = fetch_buses(1234567890)
+
+        self.assertEqual(len(results["json"]), 250)
+        self.assertEqual(results["protobuf"], results["json"])
+        self.assertIn("format=json", mock_get.call_args_list[0].args[0])
+        self.assertNotIn("format=json", mock_get.call_args_list[2].args[0])
+
+    @patch('functions.fetch_transient_data.lambda_function.objects_table', new_callable=lambda: MemoryTable("transient_snapshot_objects", schemas.transient_snapshot_objects))
+    @patch('functions.fetch_transient_data.lambda_function.history_table', new_callable=lambda: MemoryTable("transient_snapshot_history", schemas.transient_snapshot_history))
+    @patch.dict(previous_snapshots, {}, clear=True)
+    @patch('functions.fetch_transient_data.lambda_function.snapshot_table', new_callable=lambda: MemoryTable("transient_snapshots", schemas.transient_snapshots))
+    def test_commit_snapshots(self, snapshot_table, history_table, objects_table):
+        """
+        Test that a commit marker is written for each objectType, with the snapshot's objects stored in chunks beside it.
+        """
+        snapshot_objects = {
+            "IrishRailTrain": {},
+            "Bus": {"Bus-1": [1234567890, "aaaa"], "Bus-2": [1234567800, "bbbb"]}
+        }
+
+        with patch('shared.snapshots.objects_chunk_size', 1):
+            commit_snapshots(1234567890, snapshot_objects)
+
+        items = {object_type: snapshot_table.get({"objectType": object_type}) for object_type in snapshot_objects}
+        self.assertEqual(items["Bus"]["timestamp"], 1234567890)
+        self.assertEqual(items["Bus"]["itemCount"], 2)
+        self.assertEqual(items["Bus"]["writtenCount"], 1)
+        self.assertNotIn("objects", items["Bus"])
+        self.assertEqual(items["Bus"]["objectChunks"], 2)
+        self.assertEqual(load_objects(objects_table, items["Bus"])["objects"], snapshot_objects["Bus"])
+        self.assertEqual(items["IrishRailTrain"]["itemCount"], 0)
+        self.assertEqual(load_objects(objects_table, items["IrishRailTrain"])["objects"], {})
+        self.assertEqual(previous_snapshots["Bus"]["timestamp"], 1234567890)
+
+        # The snapshot's objects are recorded for delta reads until they expire
+        history = history_table.get({"objectType": "Bus", "timestamp": 1234567890})
+        self.assertEqual(history["objectIDs"], ["Bus-1", "Bus-2"])
+        self.assertGreater(history["expiresAt"], 1234567890)
+
+    @patch('functions.fetch_transient_data.lambda_function.objects_table', new_callable=lambda: MemoryTable("transient_snapshot_objects", schemas.transient_snapshot_objects))
+    @patch('functions.fetch_transient_data.lambda_function.history_table', new_callable=lambda: MemoryTable("transient_snapshot_history", schemas.transient_snapshot_history))
+    @patch.dict(previous_snapshots, {}, clear=True)
+    @patch('functions.fetch_transient_data.lambda_function.heatmap_table', new_callable=lambda: MemoryTable("transient_heatmaps", schemas.transient_heatmaps))
+    @patch('functions.fetch_transient_data.lambda_function.snapshot_table', new_callable=lambda: MemoryTable("transient_snapshots", schemas.transient_snapshots))
+    def test_commit_snapshots_publishes_artifacts(self, snapshot_table, heatmap_table, history_table, objects_table):
+        """
+        Test that each committed objectType's artifact, and the combined one, are written and referenced by the markers,
+        and that each snapshot is binned into a heatmap grid.
+        """
+        data = [
+            {"objectID": "IrishRailTrain-A1", "objectType": "IrishRailTrain", "timestamp": 1234567890},
+            add_geohash({"objectID": "Bus-1", "objectType": "Bus", "timestamp": 1234567890, "latitude": "53.3498", "longitude": "-6.2603"}),
+            add_geohash({"objectID": "Bus-2", "objectType": "Bus", "timestamp": 1234567890, "latitude": "53.3499", "longitude": "-6.2604"})
+        ]
+        snapshot_objects = {"IrishRailTrain": {"IrishRailTrain-A1": [1234567890, "aaaa"]}, "Bus": {"Bus-1": [1234567890, "bbbb"], "Bus-2": [1234567890, "cccc"]}}
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = LocalBlobStore(directory)
+            with patch('functions.fetch_transient_data.lambda_function.blob_store', store):
+                commit_snapshots(1234567890, snapshot_objects, {}, data)
+
+            items = {object_type: snapshot_table.get({"objectType": object_type}) for object_type in snapshot_objects}
+            self.assertEqual(items["Bus"]["artifactKey"], "snapshots/Bus/1234567890.json.gz")
+            self.assertEqual(items["Bus"]["combinedArtifactKey"], "snapshots/all/1234567890.json.gz")
+
+            bus_body = json.loads(gzip.decompress(store.get(items["Bus"]["artifactKey"])))
+            combined_body = json.loads(gzip.decompress(store.get(items["Bus"]["combinedArtifactKey"])))
+            self.assertEqual([item["objectID"] for item in bus_body], ["Bus-1", "Bus-2"])
+            self.assertEqual([item["objectID"] for item in combined_body], ["IrishRailTrain-A1", "Bus-1", "Bus-2"])
+
+            columnar_body = json.loads(gzip.decompress(store.get("snapshots/Bus/1234567890.columnar.json.gz")))
+            self.assertEqual(columnar_body["columns"]["objectID"]["values"], ["Bus-1", "Bus-2"])
+            self.assertIsNotNone(store.get("snapshots/all/1234567890.columnar.json.gz"))
+
+        heatmap = heatmap_table.get({"objectType": "Bus", "timestamp": 1234567890})
+        self.assertEqual(heatmap["cells"], {"gc7x98": 2})
+        self.assertEqual(heatmap["itemCount"], 2)
+        self.assertEqual(heatmap_table.get({"objectType": "IrishRailTrain", "timestamp": 1234567890})["cells"], {})
+
+    @patch('functions.fetch_transient_data.lambda_function.objects_table', new_callable=lambda: MemoryTable("transient_snapshot_objects", schemas.transient_snapshot_objects))
+    @patch('functions.fetch_transient_data.lambda_function.history_table', new_callable=lambda: MemoryTable("transient_snapshot_history", schemas.transient_snapshot_history))
+    @patch('functions.fetch_transient_data.lambda_function.snapshot_table', new_callable=lambda: MemoryTable("transient_snapshots", schemas.transient_snapshots))
+    def test_commit_snapshots_with_missing_sources(self, snapshot_table, history_table, objects_table):
+        """
+        Test that partially fetched objectTypes are tagged and fully missing ones are not committed.
+        """
+        snapshot_objects = {"IrishRailTrain": {"IrishRailTrain-A1": [1234567890, "aaaa"]}, "Bus": {}}
+        missing_sources = {"IrishRailTrain": ["IrishRailTrain-D"], "Bus": ["Bus"]}
+
+        commit_snapshots(1234567890, snapshot_objects, missing_sources)
+
+        self.assertIsNone(snapshot_table.get({"objectType": "Bus"}))
+        self.assertIsNone(history_table.get({"objectType": "Bus", "timestamp": 1234567890}))
+        item = snapshot_table.get({"objectType": "IrishRailTrain"})
+        self.assertEqual(item["missingSources"], ["IrishRailTrain-D"])
+
+    @patch('functions.fetch_transient_data.lambda_function.table', new_callable=lambda: MemoryTable("transient_data", schemas.transient_data))
+    @patch('functions.fetch_transient_data.lambda_function.objects_table', new_callable=lambda: MemoryTable("transient_snapshot_objects", schemas.transient_snapshot_objects))
+    @patch('functions.fetch_transient_data.lambda_function.history_table', new_callable=lambda: MemoryTable("transient_snapshot_history", schemas.transient_snapshot_history))
+    @patch.dict(previous_snapshots, {}, clear=True)
+    @patch('functions.fetch_transient_data.lambda_function.snapshot_table', new_callable=lambda: MemoryTable("transient_snapshots", schemas.transient_snapshots))
+    def test_missing_train_type_is_carried_forward(self, snapshot_table, history_table, objects_table, table):
+        """
+        Test that the trains of a failed train type keep their entries, while finished trains of the others are removed.
+        """
+        mainline = {"objectID": "IrishRailTrain-A1", "objectType": "IrishRailTrain", "timestamp": 1000, "trainType": "M"}
+        suburban = {"objectID": "IrishRailTrain-E1", "objectType": "IrishRailTrain", "timestamp": 1000, "trainType": "S"}
+        finished = {"objectID": "IrishRailTrain-E2", "objectType": "IrishRailTrain", "timestamp": 1000, "trainType": "S"}
+        table.put_batch([mainline, suburban, finished])
+        commit_snapshot("IrishRailTrain", 1000, {item["objectID"]: [1000, fingerprint(item)] for item in (mainline, suburban, finished)})
+
+        # The mainline source fails, and the suburban train finished
+        data = [dict(suburban, timestamp=2000)]
+        missing_sources = {"IrishRailTrain": ["IrishRailTrain-M"], "Bus": []}
+        data += fetch_missing_source_items(data, missing_sources)
+        changed_items, snapshot_objects = split_changed_items(2000, data)
+        commit_snapshots(2000, snapshot_objects, missing_sources)
+
+        self.assertEqual(changed_items, [{"objectID": "IrishRailTrain-E2", "timestamp": 2000, "removed": True}])
+        objects = load_objects(objects_table, snapshot_table.get({"objectType": "IrishRailTrain"}))["objects"]
+        self.assertEqual(objects, {
+            "IrishRailTrain-A1": [1000, fingerprint(mainline)],
+            "IrishRailTrain-E1": [1000, fingerprint(suburban)]
+        })
+
+        # When every source fails, the objectType isn't committed, so nothing needs carrying
+        self.assertEqual(fetch_missing_source_items([], {"IrishRailTrain": ["IrishRailTrain-M", "IrishRailTrain-S", "IrishRailTrain-D"]}), [])
+
+    @patch('functions.fetch_transient_data.lambda_function.objects_table', new_callable=lambda: MemoryTable("transient_snapshot_objects", schemas.transient_snapshot_objects))
+    @patch.dict(previous_snapshots, {}, clear=True)
+    @patch('functions.fetch_transient_data.lambda_function.snapshot_table', new_callable=lambda: MemoryTable("transient_snapshots", schemas.transient_snapshots))
+    def test_commit_snapshot_never_moves_backwards(self, snapshot_table, objects_table):
+        """
+        Test that an overlapping, older invocation can't replace a newer commit marker.
+        """
+        self.assertTrue(commit_snapshot("Bus", 2000, {"Bus-1": [2000, "aaaa"]}))
+        self.assertFalse(commit_snapshot("Bus", 1900, {"Bus-1": [1900, "bbbb"]}))
+
+        self.assertEqual(snapshot_table.get({"objectType": "Bus"})["timestamp"], 2000)
+        self.assertEqual(previous_snapshots["Bus"]["timestamp"], 2000)
+
+    @patch('functions.fetch_transient_data.lambda_function.objects_table', new_callable=lambda: MemoryTable("transient_snapshot_objects", schemas.transient_snapshot_objects))
+    @patch.dict(previous_snapshots, {}, clear=True)
+    @patch('functions.fetch_transient_data.lambda_function.snapshot_table', new_callable=lambda: MemoryTable("transient_snapshots", schemas.transient_snapshots))
+    def test_split_changed_items(self, snapshot_table, objects_table):
+        """
+        Test that only changed, new or too-old objects are written, unchanged ones keep their base timestamp,
+        and removed ones get a removal row.
+        """
+        unchanged = {"objectID": "Bus-1", "objectType": "Bus", "timestamp": 2000, "latitude": "53.1"}
+        moved = {"objectID": "Bus-2", "objectType": "Bus", "timestamp": 2000, "latitude": "53.3"}
+        new = {"objectID": "Bus-3", "objectType": "Bus", "timestamp": 2000, "latitude": "53.4"}
+        stale = {"objectID": "Bus-4", "objectType": "Bus", "timestamp": 2000, "latitude": "53.5"}
+
+        chunks = objects_chunks("Bus", 1900, {
+            "Bus-1": [1800, fingerprint(unchanged)],
+            "Bus-2": [1800, fingerprint(dict(moved, latitude="53.2"))],
+            "Bus-4": [2000 - 3601, fingerprint(stale)],
+            "Bus-5": [1800, "gone"]
+        }, 5500)
+        objects_table.put_batch(chunks)
+        snapshot_table.put({"objectType": "Bus", "timestamp": 1900, "objectChunks": len(chunks)})
+
+        changed_items, snapshot_objects = split_changed_items(2000, [unchanged, moved, new, stale])
+
+        self.assertEqual([item["objectID"] for item in changed_items], ["Bus-2", "Bus-3", "Bus-4", "Bus-5"])
+        self.assertEqual(changed_items[-1], {"objectID": "Bus-5", "timestamp": 2000, "removed": True})
+        self.assertEqual(snapshot_objects["Bus"]["Bus-1"], [1800, fingerprint(unchanged)])
+        self.assertEqual(snapshot_objects["Bus"]["Bus-2"][0], 2000)
+        self.assertEqual(snapshot_objects["IrishRailTrain"], {})
+
+    @patch.dict(previous_snapshots, {}, clear=True)
+    @patch('functions.fetch_transient_data.lambda_function.snapshot_table', new_callable=lambda: MemoryTable("transient_snapshots", schemas.transient_snapshots))
+    def test_split_changed_items_records_geohash_prefix(self, snapshot_table):
+        """
+        Test that each object's geohash prefix is recorded in its snapshot entry, and that entries with one are read back.
+        """
+        located = add_geohash({"objectID": "Bus-1", "objectType": "Bus", "timestamp": 2000, "latitude": "53.3498", "longitude": "-6.2603"})
+        unlocated = {"objectID": "Bus-2", "objectType": "Bus", "timestamp": 2000}
+        snapshot_table.put({"objectType": "Bus", "timestamp": 1900, "objects": {"Bus-1": [1800, fingerprint(located), "gc7x"]}})
+
+        changed_items, snapshot_objects = split_changed_items(2000, [located, unlocated])
+
+        self.assertEqual([item["objectID"] for item in changed_items], ["Bus-2"])
+        self.assertEqual(snapshot_objects["Bus"]["Bus-1"], [1800, fingerprint(located), "gc7x"])
+        self.assertEqual(snapshot_objects["Bus"]["Bus-2"], [2000, fingerprint(unlocated)])
+
+    @patch('functions.fetch_transient_data.lambda_function.ingest_deadline', 0.2)
+    @patch('functions.fetch_transient_data.lambda_function.fetch_buses')
+    @patch('functions.fetch_transient_data.lambda_function.fetch_trains_by_type')
+    def test_fetch_all_sources_partial(self, mock_fetch_trains_by_type, mock_fetch_buses):
+        """
+        Test that failing and slow sources are reported missing while healthy ones are kept.
+        """
+        def fetch_trains_by_type(train_type, timestamp):
+            if train_type == "S":
+                raise Exception("Irish Rail error")
+            if train_type == "D":
+                time.sleep(1)
+            return [{"objectID": f"IrishRailTrain-{train_type}1", "objectType": "IrishRailTrain"}]
+
+        mock_fetch_trains_by_type.side_effect = fetch_trains_by_type
+        mock_fetch_buses.return_value = [{"objectID": "Bus-1", "objectType": "Bus"}]
+
+        start = time.time()
+        data, missing_sources = fetch_all_sources(1234567890)
+
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(sorted(item["objectID"] for item in data), ["Bus-1", "IrishRailTrain-M1"])
+        self.assertEqual(sorted(missing_sources["IrishRailTrain"]), ["IrishRailTrain-D", "IrishRailTrain-S"])
+        self.assertEqual(missing_sources["Bus"], [])
+
+    @patch.dict(punctuality_cache, {"data": None, "version": None, "expires": 0})
+    @patch('functions.fetch_transient_data.lambda_function.version_table')
+    @patch('functions.fetch_transient_data.lambda_function.punctuality_table')
+    def test_get_punctuality_data_cache(self, mock_punctuality_table, mock_version_table):
+        """
+        Test that the punctuality lookup is read from the table once and only reloaded when its version changes.
+        """
+        mock_punctuality_table.scan.return_value = [
+            {"objectID": "IrishRailTrain-A1", "average_punctuality": "2.6"},
+            {"objectID": "IrishRailTrain-A2", "punctuality_sum": Decimal("-7"), "punctuality_count": Decimal("2")}
+        ]
+        mock_version_table.get.return_value = {"dataset": "punctuality_by_objectID", "version": 1}
+
+        expected = {"IrishRailTrain-A1": 3, "IrishRailTrain-A2": -4}
+        self.assertEqual(get_punctuality_data(), expected)
+        self.assertEqual(get_punctuality_data(), expected)
+        self.assertEqual(mock_punctuality_table.scan.call_count, 1)
+        self.assertEqual(mock_version_table.get.call_count, 1)
+
+        # TTL expired but version unchanged: no reload
+        punctuality_cache["expires"] = 0
+        get_punctuality_data()
+        self.assertEqual(mock_punctuality_table.scan.call_count, 1)
+
+        # TTL expired and version bumped: reload
+        punctuality_cache["expires"] = 0
+        mock_version_table.get.return_value = {"dataset": "punctuality_by_objectID", "version": 2}
+        get_punctuality_data()
+        self.assertEqual(mock_punctuality_table.scan.call_count, 2)
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,30 +1,59 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 import json
 import os
 from functions.return_all_coordinates.lambda_function import lambda_handler
+from shared.storage import get_table, reset_memory_tables
+from shared.storage import schemas
+
+
+def seed_tables(markers, items):
+    """
+    Writes commit markers to the in-memory snapshot table and items to the in-memory transient table.
+
+    Args:
+        markers (dict): objectType -> committed snapshot marker, without its objectType.
+        items (list): Items of the transient table; objectType defaults to Bus and objectID to a counter.
+    """
+    snapshot_table = get_table('transient_snapshots', schemas.transient_snapshots)
+    for object_type, marker in markers.items():
+        snapshot_table.put(dict(marker, objectType=object_type))
+
+    transient_table = get_table('test-table', schemas.transient_data)
+    transient_table.put_batch([
+        dict({'objectID': f'Bus-{index}', 'objectType': 'Bus'}, **item) for index, item in enumerate(items)
+    ])
+
+
+def seed_heatmaps(heatmaps):
+    """
+    Writes the binned grids of snapshots to the in-memory heatmap table.
+
+    Args:
+        heatmaps (list): The heatmap items.
+    """
+    heatmap_table = get_table('transient_heatmaps', schemas.transient_heatmaps)
+    for heatmap in heatmaps:
+        heatmap_table.put(heatmap)
 
 
 class TestReturnLatestCoordinates(unittest.TestCase):
 
     def setUp(self):
-        patch.dict(os.environ, {'TABLE_NAME': 'test-table'}).start()
+        patch.dict(os.environ, {'TABLE_NAME': 'test-table', 'STORAGE_BACKEND': 'memory'}).start()
+        reset_memory_tables()
 
     def tearDown(self):
         patch.stopall()
+        reset_memory_tables()
 
-    @patch('functions.return_all_coordinates.lambda_function.dynamodb.Table')
-    def test_lambda_handler_with_coordinates(self, mock_table):
+    def test_lambda_handler_with_coordinates(self):
         """Test function when the database contains valid latitude and longitude values."""
-        # First scan returns timestamps
-        # Second scan returns matching items
-        mock_table.return_value.scan.side_effect = [
-            {'Items': [{'timestamp': '1001'}, {'timestamp': '1002'}]},  # First scan: get timestamps
-            {'Items': [  # Second scan: get items with latest timestamp
-                {'timestamp': '1002', 'latitude': 53.3498, 'longitude': -6.2603},
-                {'timestamp': '1002', 'latitude': 51.8985, 'longitude': -8.4756}
-            ]}
-        ]
+        seed_tables({'Bus': {'timestamp': 1002}}, [
+            {'timestamp': 1002, 'latitude': '53.3498', 'longitude': '-6.2603'},
+            {'timestamp': 1002, 'latitude': '51.8985', 'longitude': '-8.4756'},
+            {'timestamp': 1001, 'latitude': '54.5973', 'longitude': '-5.9301'}
+        ])
 
         event = {}
         result = lambda_handler(event, {})
@@ -32,43 +61,43 @@ class TestReturnLatestCoordinates(unittest.TestCase):
 
         body = json.loads(result['body'])
         self.assertEqual(len(body['coordinates']), 2)
-        self.assertEqual(body['coordinates'][0], [53.3498, -6.2603])
-        self.assertEqual(body['coordinates'][1], [51.8985, -8.4756])
-
-    @patch('functions.return_all_coordinates.lambda_function.dynamodb.Table')
-    def test_lambda_handler_with_pagination(self, mock_table):
-        """Test function correctly handles paginated responses from DynamoDB."""
-        # First scan returns paginated timestamps
-        # Then paginated scan with latest timestamp
-        mock_table.return_value.scan.side_effect = [
-            {'Items': [{'timestamp': '1001'}], 'LastEvaluatedKey': 'key1'},
-            {'Items': [{'timestamp': '1002'}]},  # Final timestamp batch
-
-            {'Items': [{'timestamp': '1002', 'latitude': 53.3498, 'longitude': -6.2603}], 'LastEvaluatedKey': 'key2'},
-            {'Items': [{'timestamp': '1002', 'latitude': 51.8985, 'longitude': -8.4756}], 'LastEvaluatedKey': 'key3'},
-            {'Items': [{'timestamp': '1002', 'latitude': 54.5973, 'longitude': -5.9301}]}
-        ]
+        self.assertIn(['53.3498', '-6.2603'], body['coordinates'])
+        self.assertIn(['51.8985', '-8.4756'], body['coordinates'])
+
+    def test_lambda_handler_with_carried_objects(self):
+        """Test function includes objects the committed snapshot carries forward from earlier snapshots."""
+        seed_tables({'Bus': {'timestamp': 1002, 'objects': {'Bus-0': [1002, 'aaaa'], 'Bus-1': [1001, 'bbbb']}}}, [
+            {'timestamp': 1002, 'latitude': '53.3498', 'longitude': '-6.2603'},
+            {'timestamp': 1001, 'latitude': '51.8985', 'longitude': '-8.4756'}
+        ])
 
         event = {}
         result = lambda_handler(event, {})
         self.assertEqual(result['statusCode'], 200)
 
         body = json.loads(result['body'])
-        self.assertEqual(len(body['coordinates']), 3)
-        self.assertEqual(body['coordinates'][0], [53.3498, -6.2603])
-        self.assertEqual(body['coordinates'][1], [51.8985, -8.4756])
-        self.assertEqual(body['coordinates'][2], [54.5973, -5.9301])
+        self.assertEqual(sorted(body['coordinates']), [['51.8985', '-8.4756'], ['53.3498', '-6.2603']])
 
-    @patch('functions.return_all_coordinates.lambda_function.dynamodb.Table')
-    def test_lambda_handler_with_no_coordinates(self, mock_table):
+    def test_lambda_handler_without_commit_marker(self):
+        """Test function falls back to the newest GSI timestamp when no snapshot is committed."""
+        seed_tables({}, [
+            {'timestamp': 1001, 'latitude': '51.8985', 'longitude': '-8.4756'},
+            {'timestamp': 1002, 'latitude': '53.3498', 'longitude': '-6.2603'}
+        ])
+
+        event = {}
+        result = lambda_handler(event, {})
+        self.assertEqual(result['statusCode'], 200)
+
+        body = json.loads(result['body'])
+        self.assertEqual(body['coordinates'], [['53.3498', '-6.2603']])
+
+    def test_lambda_handler_with_no_coordinates(self):
         """Test function when no items contain latitude or longitude."""
-        mock_table.return_value.scan.side_effect = [
-            {'Items': [{'timestamp': '1001'}, {'timestamp': '1002'}]},
-            {'Items': [
-                {'timestamp': '1002', 'objectType': 'Bus'},
-                {'timestamp': '1002', 'name': 'Train Station'}
-            ]}
-        ]
+        seed_tables({'Bus': {'timestamp': 1002}}, [
+            {'timestamp': 1002},
+            {'timestamp': 1002, 'name': 'Train Station'}
+        ])
 
         event = {}
         result = lambda_handler(event, {})
@@ -78,17 +107,13 @@ class TestReturnLatestCoordinates(unittest.TestCase):
         self.assertIn('coordinates', body)
         self.assertEqual(len(body['coordinates']), 0)
 
-    @patch('functions.return_all_coordinates.lambda_function.dynamodb.Table')
-    def test_lambda_handler_with_partial_data(self, mock_table):
+    def test_lambda_handler_with_partial_data(self):
         """Test function when some items have lat/lon while others do not."""
-        mock_table.return_value.scan.side_effect = [
-            {'Items': [{'timestamp': '1002'}]},
-            {'Items': [
-                {'timestamp': '1002', 'latitude': 53.3498, 'longitude': -6.2603},
-                {'timestamp': '1002', 'objectType': 'Train'},
-                {'timestamp': '1002', 'latitude': 54.5973}
-            ]}
-        ]
+        seed_tables({'IrishRailTrain': {'timestamp': 1002}}, [
+            {'objectType': 'IrishRailTrain', 'timestamp': 1002, 'latitude': '53.3498', 'longitude': '-6.2603'},
+            {'objectType': 'IrishRailTrain', 'timestamp': 1002},
+            {'objectType': 'IrishRailTrain', 'timestamp': 1002, 'latitude': '54.5973'}
+        ])
 
         event = {}
         result = lambda_handler(event, {})
@@ -96,12 +121,12 @@ class TestReturnLatestCoordinates(unittest.TestCase):
 
         body = json.loads(result['body'])
         self.assertEqual(len(body['coordinates']), 1)
-        self.assertEqual(body['coordinates'][0], [53.3498, -6.2603])
+        self.assertEqual(body['coordinates'][0], ['53.3498', '-6.2603'])
 
-    @patch('functions.return_all_coordinates.lambda_function.dynamodb.Table')
-    def test_lambda_handler_error(self, mock_table):
-        """Test function when DynamoDB scan raises an exception."""
-        mock_table.return_value.scan.side_effect = Exception('DynamoDB error')
+    @patch('functions.return_all_coordinates.lambda_function.get_table')
+    def test_lambda_handler_error(self, mock_get_table):
+        """Test function when DynamoDB raises an exception."""
+        mock_get_table.return_value.get.side_effect = Exception('DynamoDB error')
 
         event = {}
         result = lambda_handler(event, {})
@@ -112,5 +137,53 @@ class TestReturnLatestCoordinates(unittest.TestCase):
         self.assertEqual(body['error'], 'DynamoDB error')
 
 
-if __name__ == "__main__":
+    def test_lambda_handler_heatmap_from_binned_grid(self):
+        """Test function returns the latest snapshot's grid binned at ingest, coarsened to the requested precision."""
+        seed_tables({'Bus': {'timestamp': 1002}}, [{'timestamp': 1002, 'latitude': '53.3498', 'longitude': '-6.2603'}])
+        seed_heatmaps([
+            {'objectType': 'Bus', 'timestamp': 1002, 'cells': {'gc7x98': 3, 'gc7x99': 1, 'gc7mxx': 2}},
+            {'objectType': 'Bus', 'timestamp': 1001, 'cells': {'gc7x98': 5}}
+        ])
+
+        result = lambda_handler({'queryStringParameters': {'precision': '4'}}, {})
+        self.assertEqual(result['statusCode'], 200)
+
+        body = json.loads(result['body'])
+        self.assertEqual((body['precision'], body['snapshots']), (4, 1))
+        self.assertEqual([cell[2] for cell in body['cells']], [4, 2])
+        self.assertAlmostEqual(body['cells'][0][0], 53.349609, places=5)
+
+    def test_lambda_handler_heatmap_without_binned_grid(self):
+        """Test function bins the latest snapshot's items itself when ingest has not binned it."""
+        seed_tables({'Bus': {'timestamp': 1002, 'objects': {'Bus-0': [1002, 'aaaa'], 'Bus-1': [1001, 'bbbb']}}}, [
+            {'timestamp': 1002, 'latitude': '53.3498', 'longitude': '-6.2603'},
+            {'timestamp': 1001, 'latitude': '53.3499', 'longitude': '-6.2604'}
+        ])
+
+        body = json.loads(lambda_handler({'queryStringParameters': {'precision': '6'}}, {})['body'])
+        self.assertEqual(len(body['cells']), 1)
+        self.assertEqual(body['cells'][0][2], 2)
+
+    def test_lambda_handler_heatmap_window(self):
+        """Test function sums the grids of every snapshot in the window."""
+        seed_heatmaps([
+            {'objectType': 'Bus', 'timestamp': 1000, 'cells': {'gc7x98': 1}},
+            {'objectType': 'Bus', 'timestamp': 1060, 'cells': {'gc7x98': 2, 'gc7x99': 1}},
+            {'objectType': 'IrishRailTrain', 'timestamp': 1060, 'cells': {'gc7x99': 4}},
+            {'objectType': 'Bus', 'timestamp': 1120, 'cells': {'gc7x98': 8}}
+        ])
+
+        body = json.loads(lambda_handler({'queryStringParameters': {'from': '1000', 'to': '1060'}}, {})['body'])
+        self.assertEqual(body['snapshots'], 2)
+        self.assertEqual([cell[2] for cell in body['cells']], [5, 3])
+
+    def test_lambda_handler_heatmap_invalid(self):
+        """Test function rejects malformed heatmap parameters."""
+        for query_params in [{'precision': '0'}, {'precision': 'fine'}, {'to': '1000'}, {'from': '2000', 'to': '1000'},
+                             {'from': '0', 'to': '1000000'}]:
+            result = lambda_handler({'queryStringParameters': query_params}, {})
+            self.assertEqual(result['statusCode'], 400)
+
+
+if __name__ == '__main__':
     unittest.main()
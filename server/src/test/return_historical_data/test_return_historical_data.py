@@ -1,29 +1,34 @@
+import base64
+import gzip
 import unittest
 from unittest.mock import patch, MagicMock
 import json
 import os
-from functions.return_historical_data.lambda_function import lambda_handler
+from functions.return_historical_data.lambda_function import lambda_handler, downsample
+from shared.http import encode_cursor
+from shared.storage import get_table, reset_memory_tables
+from shared.storage import schemas
 
 
 class TestLambdaFunction(unittest.TestCase):
 
-    # Mock environment variable before each test
+    # Use an empty in-memory table for each test
     def setUp(self):
-        patch.dict(os.environ, {'TABLE_NAME': 'test-table'}).start()
+        patch.dict(os.environ, {'TABLE_NAME': 'test-table', 'STORAGE_BACKEND': 'memory'}).start()
+        reset_memory_tables()
+        self.table = get_table('test-table', schemas.transient_data)
 
     # Clean up patches after each test
     def tearDown(self):
         patch.stopall()
+        reset_memory_tables()
 
-    @patch('functions.return_historical_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_with_object_type(self, mock_table):
-        # Mock scan response for specific object types
-        mock_table.return_value.scan.return_value = {
-            'Items': [
-                {'objectID': '1', 'objectType': 'Bus'},
-                {'objectID': '2', 'objectType': 'Train'}
-            ]
-        }
+    def test_lambda_handler_with_object_type(self):
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1234567890},
+            {'objectID': '2', 'objectType': 'Train', 'timestamp': 1234567890},
+            {'objectID': '3', 'objectType': 'Luas', 'timestamp': 1234567890}
+        ])
 
         # Mock event with objectType query parameter
         event = {
@@ -35,66 +40,193 @@ class TestLambdaFunction(unittest.TestCase):
         result = lambda_handler(event, {})
         self.assertEqual(result['statusCode'], 200)
 
-        # Parse result body
+        # Only the requested object types are returned
         body = json.loads(result['body'])
         self.assertEqual(len(body), 2)
-        self.assertEqual(body[0]['objectType'], 'Bus')
-        self.assertEqual(body[1]['objectType'], 'Train')
-
-    @patch('functions.return_historical_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_with_pagination(self, mock_table):
-        # Mock paginated scan responses
-        mock_table.return_value.scan.side_effect = [
-            {'Items': [{'objectID': '1', 'objectType': 'Bus'}], 'LastEvaluatedKey': 'key1'},
-            {'Items': [{'objectID': '2', 'objectType': 'Train'}], 'LastEvaluatedKey': 'key2'},
-            {'Items': [{'objectID': '3', 'objectType': 'Luas'}]}
-        ]
+        self.assertEqual(sorted(item['objectType'] for item in body), ['Bus', 'Train'])
+
+    def test_lambda_handler_without_object_type(self):
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1234567890},
+            {'objectID': '2', 'objectType': 'Train', 'timestamp': 1234567890}
+        ])
 
+        # Mock event without objectType query parameter
         event = {
-            'queryStringParameters': {
-                'objectType': 'Bus,Train,Luas'
-            }
+            'queryStringParameters': None
         }
 
         result = lambda_handler(event, {})
         self.assertEqual(result['statusCode'], 200)
 
         body = json.loads(result['body'])
-        self.assertEqual(len(body), 3)
-        self.assertEqual(body[0]['objectType'], 'Bus')
-        self.assertEqual(body[1]['objectType'], 'Train')
-        self.assertEqual(body[2]['objectType'], 'Luas')
-
-    @patch('functions.return_historical_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_without_object_type(self, mock_table):
-        # Mock scan response for full table scan
-        mock_table.return_value.scan.return_value = {
-            'Items': [
-                {'objectID': '1', 'objectType': 'Bus'},
-                {'objectID': '2', 'objectType': 'Train'}
-            ]
-        }
+        self.assertEqual(len(body), 2)
+        self.assertEqual(sorted(item['objectType'] for item in body), ['Bus', 'Train'])
 
-        # Mock event without objectType query parameter
-        event = {
-            'queryStringParameters': None
-        }
+    def test_lambda_handler_paginates(self):
+        self.table.put_batch([
+            {'objectID': str(index), 'objectType': 'Bus' if index % 2 else 'Train', 'timestamp': 1234567890}
+            for index in range(5)
+        ])
 
+        event = {'queryStringParameters': {'objectType': 'Bus', 'limit': '1'}}
         result = lambda_handler(event, {})
         self.assertEqual(result['statusCode'], 200)
-
         body = json.loads(result['body'])
+        self.assertEqual([item['objectID'] for item in body['items']], ['1'])
+
+        event['queryStringParameters']['cursor'] = body['next']
+        event['queryStringParameters']['limit'] = '5'
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual([item['objectID'] for item in body['items']], ['3'])
+        self.assertIsNone(body['next'])
+
+        result = lambda_handler({'queryStringParameters': {'limit': '-1'}}, {})
+        self.assertEqual(result['statusCode'], 400)
+
+        # Cursors must be keys of the table
+        for key in [{'a': 1}, {'objectID': '1'}, {'objectID': ['1'], 'timestamp': 1234567890}]:
+            result = lambda_handler({'queryStringParameters': {'cursor': encode_cursor(key)}}, {})
+            self.assertEqual(result['statusCode'], 400)
+
+    def test_lambda_handler_with_object_id(self):
+        self.table.put_batch([{'objectID': 'Bus-1', 'objectType': 'Bus', 'timestamp': timestamp} for timestamp in range(1000, 2000, 60)])
+        self.table.put_batch([{'objectID': 'Bus-2', 'objectType': 'Bus', 'timestamp': 1000}])
+        table = MagicMock(wraps=self.table)
+
+        with patch('functions.return_historical_data.lambda_function.get_table', return_value=table):
+            event = {'queryStringParameters': {'objectID': 'Bus-1', 'from': '1100', 'to': '1500'}}
+            result = lambda_handler(event, {})
+            self.assertEqual(result['statusCode'], 200)
+            body = json.loads(result['body'])
+            # The row written before the range describes the object at its start
+            self.assertEqual([item['timestamp'] for item in body], [1100] + list(range(1120, 1500, 60)))
+
+            # One sample per 300 seconds from the start of the range
+            event['queryStringParameters']['resolution'] = '300'
+            body = json.loads(lambda_handler(event, {})['body'])
+            self.assertEqual([item['timestamp'] for item in body], [1120, 1420])
+
+            # At most three samples across the whole history
+            body = json.loads(lambda_handler({'queryStringParameters': {'objectID': 'Bus-1', 'maxPoints': '3'}}, {})['body'])
+            self.assertLessEqual(len(body), 3)
+            self.assertEqual(body[0]['timestamp'], 1000)
+
+        # The object's partition is queried rather than the table scanned
+        table.query.assert_called_with('Bus-1', sort=None, projection=None)
+        table.scan.assert_not_called()
+
+    def test_lambda_handler_with_object_id_paginates(self):
+        self.table.put_batch([{'objectID': 'Bus-1', 'objectType': 'Bus', 'timestamp': timestamp} for timestamp in (1000, 2000, 3000)])
+
+        event = {'queryStringParameters': {'objectID': 'Bus-1', 'from': '1500', 'limit': '1'}}
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual([item['timestamp'] for item in body['items']], [1500, 2000])
+
+        event['queryStringParameters']['cursor'] = body['next']
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual([item['timestamp'] for item in body['items']], [3000])
+
+        # A cursor from another object's history is rejected
+        event['queryStringParameters']['cursor'] = encode_cursor({'objectID': 'Bus-2', 'timestamp': 1000})
+        self.assertEqual(lambda_handler(event, {})['statusCode'], 400)
+
+    def test_lambda_handler_with_fields(self):
+        self.table.put_batch([{'objectID': 'Bus-1', 'objectType': 'Bus', 'timestamp': timestamp, 'latitude': '53.3', 'busRoute': '46A'}
+                              for timestamp in range(1000, 1300, 60)])
+
+        # Downsampling reads the timestamp, which is left out of the samples unless requested
+        event = {'queryStringParameters': {'objectID': 'Bus-1', 'fields': 'latitude', 'resolution': '120', 'to': '1299'}}
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual(body, [{'latitude': '53.3'}] * 3)
+
+        event = {'queryStringParameters': {'objectType': 'Bus', 'fields': 'timestamp,busRoute', 'limit': '1'}}
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual(body['items'], [{'timestamp': 1000, 'busRoute': '46A'}])
+
+        self.assertEqual(lambda_handler({'queryStringParameters': {'fields': ''}}, {})['statusCode'], 400)
+
+    def test_lambda_handler_carries_unchanged_objects(self):
+        # Bus-1 was written at 1000, rewritten unchanged an hour later, and removed at 5000
+        self.table.put_batch([{'objectID': 'Bus-1', 'objectType': 'Bus', 'timestamp': timestamp, 'latitude': '53.3'}
+                              for timestamp in (1000, 4600)])
+        self.table.put_batch([{'objectID': 'Bus-1', 'timestamp': 5000, 'removed': True}])
+
+        # A window with no rows of its own is described by the row before it
+        event = {'queryStringParameters': {'objectID': 'Bus-1', 'from': '2000', 'to': '3000'}}
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual(body, [{'objectID': 'Bus-1', 'objectType': 'Bus', 'timestamp': 2000, 'latitude': '53.3'}])
+
+        # Every interval the object was reported in has a sample, and none after its removal
+        event['queryStringParameters'].update({'to': '5999', 'resolution': '1000', 'fields': 'timestamp'})
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual([item['timestamp'] for item in body], [2000, 3000, 4600])
+
+        # Pages carry on from the last row of the previous page without repeating its interval
+        event['queryStringParameters']['limit'] = '1'
+        timestamps = []
+        while True:
+            body = json.loads(lambda_handler(event, {})['body'])
+            timestamps += [item['timestamp'] for item in body['items']]
+            if body['next'] is None:
+                break
+            event['queryStringParameters']['cursor'] = body['next']
+        self.assertEqual(timestamps, [2000, 3000, 4600])
+
+        # Removal rows are left out of scans
+        body = json.loads(lambda_handler({'queryStringParameters': None}, {})['body'])
+        self.assertEqual(sorted(item['timestamp'] for item in body), [1000, 4600])
+
+        # Rows stop describing the object once they are older than an unchanged object would be rewritten
+        self.table.put_batch([{'objectID': 'Bus-2', 'objectType': 'Bus', 'timestamp': 1000}])
+        event = {'queryStringParameters': {'objectID': 'Bus-2', 'from': '5000'}}
+        self.assertEqual(json.loads(lambda_handler(event, {})['body']), [])
+
+    def test_lambda_handler_rejects_invalid_history(self):
+        for query_params in [{'objectID': 'Bus-1', 'from': 'yesterday'}, {'objectID': 'Bus-1', 'from': '20', 'to': '10'},
+                             {'objectID': 'Bus-1', 'resolution': '0'}, {'objectID': 'Bus-1', 'maxPoints': '5', 'limit': '5'}]:
+            result = lambda_handler({'queryStringParameters': query_params}, {})
+            self.assertEqual(result['statusCode'], 400)
+
+    def test_downsample(self):
+        items = [{'timestamp': timestamp} for timestamp in (0, 10, 20, 30, 40, 50)]
+        self.assertEqual(downsample(items), items)
+        self.assertEqual([item['timestamp'] for item in downsample(items, resolution=25)], [0, 30, 50])
+        self.assertEqual([item['timestamp'] for item in downsample(items, resolution=25, start=-10)], [0, 20, 40])
+        self.assertEqual([item['timestamp'] for item in downsample(items, max_points=2)], [0, 30])
+        self.assertEqual(downsample([], resolution=10), [])
+
+    @patch('shared.http.compression_threshold', 10)
+    def test_lambda_handler_compresses_large_responses(self):
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1234567890},
+            {'objectID': '2', 'objectType': 'Train', 'timestamp': 1234567890}
+        ])
+
+        event = {'queryStringParameters': None, 'headers': {'Accept-Encoding': 'gzip'}}
+
+        result = lambda_handler(event, {})
+        self.assertEqual(result['statusCode'], 200)
+        self.assertTrue(result['isBase64Encoded'])
+        self.assertEqual(result['headers']['Content-Encoding'], 'gzip')
+
+        body = json.loads(gzip.decompress(base64.b64decode(result['body'])))
         self.assertEqual(len(body), 2)
-        self.assertEqual(body[0]['objectType'], 'Bus')
-        self.assertEqual(body[1]['objectType'], 'Train')
-
-    @patch('functions.return_historical_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_with_no_items(self, mock_table):
-        # Mock empty scan response
-        mock_table.return_value.scan.return_value = {
-            'Items': []
-        }
 
+    @patch.dict('shared.storage.parallel_scan.item_counts', clear=True)
+    @patch('shared.storage.parallel_scan.scan_segment_items', 2)
+    def test_lambda_handler_with_parallel_segments(self):
+        self.table.put_batch([{'objectID': str(index), 'objectType': 'Bus' if index % 2 else 'Train', 'timestamp': 1234567890} for index in range(20)])
+
+        result = lambda_handler({'queryStringParameters': None}, {})
+        self.assertEqual(result['statusCode'], 200)
+
+        # Every segment is merged in, in the same order on each request
+        body = json.loads(result['body'])
+        self.assertEqual(sorted(int(item['objectID']) for item in body), list(range(20)))
+        self.assertEqual(json.loads(lambda_handler({'queryStringParameters': None}, {})['body']), body)
+
+    def test_lambda_handler_with_no_items(self):
         # Mock event without objectType query parameter
         event = {
             'queryStringParameters': None
@@ -106,10 +238,11 @@ class TestLambdaFunction(unittest.TestCase):
         body = json.loads(result['body'])
         self.assertEqual(len(body), 0)
 
-    @patch('functions.return_historical_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_error(self, mock_table):
+    @patch('functions.return_historical_data.lambda_function.get_table')
+    def test_lambda_handler_error(self, mock_get_table):
         # Mock table scan to raise an exception
-        mock_table.return_value.scan.side_effect = Exception('DynamoDB error')
+        mock_get_table.return_value.estimated_item_count.return_value = 0
+        mock_get_table.return_value.scan.side_effect = Exception('DynamoDB error')
 
         event = {
             'queryStringParameters': None
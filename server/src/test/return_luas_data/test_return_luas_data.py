@@ -5,8 +5,8 @@ from functions.return_luas_data.lambda_function import lambda_handler
 
 class TestLambdaFunction(unittest.TestCase):
 
-    @patch('src.functions.return_luas_data.lambda_function.requests.get')
-    @patch('src.functions.return_luas_data.lambda_function.xmltodict.parse')
+    @patch('functions.return_luas_data.lambda_function.session.get')
+    @patch('functions.return_luas_data.lambda_function.xmltodict.parse')
     def test_lambda_handler_returns_forecast_for_valid_luasStopCode(self, mock_parse, mock_get):
         mock_response = MagicMock()
         mock_response.text = '<xml>test</xml>'
@@ -23,7 +23,7 @@ class TestLambdaFunction(unittest.TestCase):
         self.assertEqual(response['statusCode'], 200)
         self.assertEqual(json.loads(response['body']), {'forecast': 'data'})
 
-    @patch('src.functions.return_luas_data.lambda_function.requests.get')
+    @patch('functions.return_luas_data.lambda_function.session.get')
     def test_lambda_handler_returns_error_on_exception(self, mock_get):
         mock_get.side_effect = Exception('Test exception')
 
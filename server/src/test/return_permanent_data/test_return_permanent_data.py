@@ -2,28 +2,35 @@ import unittest
 from unittest.mock import patch, MagicMock
 import json
 import os
-from functions.return_permanent_data.lambda_function import lambda_handler
+import threading
+from functions.return_permanent_data.lambda_function import lambda_handler, permanent_cache, max_fetch_workers
+from shared.geohash import add_geohash
+from shared.http import encode_cursor
+from shared.storage import get_table, reset_memory_tables
+from shared.storage import schemas
 
 
 class TestLambdaFunction(unittest.TestCase):
 
-    # Mock environment variable before each test
+    # Use an empty in-memory table for each test
     def setUp(self):
-        patch.dict(os.environ, {'TABLE_NAME': 'test-table'}).start()
+        patch.dict(os.environ, {'TABLE_NAME': 'test-table', 'STORAGE_BACKEND': 'memory'}).start()
+        reset_memory_tables()
+        permanent_cache.clear()
+        self.table = get_table('test-table', schemas.permanent_data)
+        self.version_table = get_table('dataset_versions', schemas.dataset_versions)
 
     # Clean up patches after each test
     def tearDown(self):
         patch.stopall()
+        reset_memory_tables()
 
-    @patch('functions.return_permanent_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_with_object_type(self, mock_table):
-        # Mock scan response for specific object types
-        mock_table.return_value.scan.return_value = {
-            'Items': [
-                {'objectID': '1', 'objectType': 'Bus'},
-                {'objectID': '2', 'objectType': 'Train'}
-            ]
-        }
+    def test_lambda_handler_with_object_type(self):
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'Bus'},
+            {'objectID': '2', 'objectType': 'Train'},
+            {'objectID': '3', 'objectType': 'Luas'}
+        ])
 
         # Mock event with objectType query parameter
         event = {
@@ -35,45 +42,96 @@ class TestLambdaFunction(unittest.TestCase):
         result = lambda_handler(event, {})
         self.assertEqual(result['statusCode'], 200)
 
-        # Parse result body
+        # Only the requested object types are returned
         body = json.loads(result['body'])
         self.assertEqual(len(body), 2)
-        self.assertEqual(body[0]['objectType'], 'Bus')
-        self.assertEqual(body[1]['objectType'], 'Train')
-
-    @patch('functions.return_permanent_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_with_pagination(self, mock_table):
-        # Mock paginated scan responses
-        mock_table.return_value.scan.side_effect = [
-            {'Items': [{'objectID': '1', 'objectType': 'Bus'}], 'LastEvaluatedKey': 'key1'},
-            {'Items': [{'objectID': '2', 'objectType': 'Train'}], 'LastEvaluatedKey': 'key2'},
-            {'Items': [{'objectID': '3', 'objectType': 'Luas'}]}
-        ]
+        self.assertEqual(sorted(item['objectType'] for item in body), ['Bus', 'Train'])
 
-        event = {
-            'queryStringParameters': {
-                'objectType': 'Bus,Train,Luas'
-            }
-        }
+    @patch('functions.return_permanent_data.lambda_function.get_table')
+    def test_lambda_handler_queries_requested_partitions(self, mock_get_table):
+        table = MagicMock(wraps=self.table)
+        mock_get_table.side_effect = lambda name, schema: table if name == 'test-table' else get_table(name, schema)
+        self.table.put_batch([
+            {'objectID': '2', 'objectType': 'LuasStop'},
+            {'objectID': '1', 'objectType': 'BusStop'},
+            {'objectID': '3', 'objectType': 'BusRoute'}
+        ])
+
+        event = {'queryStringParameters': {'objectType': 'LuasStop, BusStop,LuasStop'}}
 
         result = lambda_handler(event, {})
         self.assertEqual(result['statusCode'], 200)
 
+        # Each requested type is read once from its own partition, without scanning the table
         body = json.loads(result['body'])
-        self.assertEqual(len(body), 3)
-        self.assertEqual(body[0]['objectType'], 'Bus')
-        self.assertEqual(body[1]['objectType'], 'Train')
-        self.assertEqual(body[2]['objectType'], 'Luas')
-
-    @patch('functions.return_permanent_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_without_object_type(self, mock_table):
-        # Mock scan response for full table scan
-        mock_table.return_value.scan.return_value = {
-            'Items': [
-                {'objectID': '1', 'objectType': 'Bus'},
-                {'objectID': '2', 'objectType': 'Train'}
-            ]
-        }
+        self.assertEqual([item['objectType'] for item in body], ['LuasStop', 'BusStop'])
+        self.assertEqual(sorted(call.args[0] for call in table.query.call_args_list), ['BusStop', 'LuasStop'])
+        table.scan.assert_not_called()
+
+    def test_lambda_handler_bounds_threads(self):
+        self.table.put({'objectID': '1', 'objectType': 'Bus'})
+        threads = threading.active_count()
+
+        event = {'queryStringParameters': {'objectType': ','.join(f'T{index}' for index in range(500)) + ',Bus'}}
+        result = lambda_handler(event, {})
+
+        self.assertEqual(result['statusCode'], 200)
+        self.assertEqual([item['objectID'] for item in json.loads(result['body'])], ['1'])
+        # Partitions are read on the shared pool, however many objectTypes are requested
+        self.assertLessEqual(threading.active_count(), threads + max_fetch_workers)
+
+    def test_lambda_handler_caches_by_version(self):
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'BusStop'},
+            {'objectID': '2', 'objectType': 'LuasStop'}
+        ])
+        self.version_table.put({'dataset': 'permanent_data#BusStop', 'version': 1})
+        self.version_table.put({'dataset': 'permanent_data#LuasStop', 'version': 1})
+        event = {'queryStringParameters': {'objectType': 'BusStop,LuasStop'}}
+
+        first = lambda_handler(event, {})
+        self.assertEqual(len(json.loads(first['body'])), 2)
+        self.assertIn('max-age', first['headers']['Cache-Control'])
+
+        # Unchanged versions are served from the warm container, even if the table has been written since
+        self.table.put({'objectID': '3', 'objectType': 'BusStop'})
+        self.assertEqual(lambda_handler(event, {})['body'], first['body'])
+
+        # A client holding the current ETag gets a 304
+        revalidated = lambda_handler(dict(event, headers={'If-None-Match': first['headers']['ETag']}), {})
+        self.assertEqual(revalidated['statusCode'], 304)
+        self.assertEqual(revalidated['headers']['Vary'], 'Accept-Encoding')
+
+        # The ETag is weak, since the body is sent in whichever encoding is accepted, and varies with every parameter shaping the body
+        self.assertTrue(first['headers']['ETag'].startswith('W/"'))
+        etags = {first['headers']['ETag']}
+        for query_params in [{'format': 'columnar'}, {'bbox': '-6.30,53.33,-6.24,53.36'}, {'limit': '1'}, {'limit': '2'},
+                             {'limit': '1', 'cursor': encode_cursor({'objectType': 'BusStop', 'objectID': '1'})}]:
+            etags.add(lambda_handler({'queryStringParameters': dict(event['queryStringParameters'], **query_params)}, {})['headers']['ETag'])
+        self.assertEqual(len(etags), 6)
+
+        # Bumping one type's version reloads it and changes the ETag
+        self.version_table.increment({'dataset': 'permanent_data#BusStop'}, {'version': 1})
+        reloaded = lambda_handler(dict(event, headers={'If-None-Match': first['headers']['ETag']}), {})
+        self.assertEqual(reloaded['statusCode'], 200)
+        self.assertNotEqual(reloaded['headers']['ETag'], first['headers']['ETag'])
+        self.assertEqual([item['objectID'] for item in json.loads(reloaded['body'])], ['1', '3', '2'])
+
+    def test_lambda_handler_without_versions(self):
+        self.table.put({'objectID': '1', 'objectType': 'BusStop'})
+        event = {'queryStringParameters': {'objectType': 'BusStop'}}
+
+        # Types that have never been loaded by fetch_permanent_data are neither cached nor tagged
+        first = lambda_handler(event, {})
+        self.assertNotIn('ETag', first['headers'])
+        self.table.put({'objectID': '2', 'objectType': 'BusStop'})
+        self.assertEqual(len(json.loads(lambda_handler(event, {})['body'])), 2)
+
+    def test_lambda_handler_without_object_type(self):
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'Bus'},
+            {'objectID': '2', 'objectType': 'Train'}
+        ])
 
         # Mock event without objectType query parameter
         event = {
@@ -85,16 +143,163 @@ class TestLambdaFunction(unittest.TestCase):
 
         body = json.loads(result['body'])
         self.assertEqual(len(body), 2)
-        self.assertEqual(body[0]['objectType'], 'Bus')
-        self.assertEqual(body[1]['objectType'], 'Train')
-
-    @patch('functions.return_permanent_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_with_no_items(self, mock_table):
-        # Mock empty scan response
-        mock_table.return_value.scan.return_value = {
-            'Items': []
-        }
+        self.assertEqual(sorted(item['objectType'] for item in body), ['Bus', 'Train'])
+
+    @patch.dict('shared.storage.parallel_scan.item_counts', clear=True)
+    @patch('shared.storage.parallel_scan.scan_segment_items', 2)
+    def test_lambda_handler_with_parallel_segments(self):
+        self.table.put_batch([{'objectID': str(index), 'objectType': 'Bus' if index % 2 else 'Train'} for index in range(20)])
+
+        result = lambda_handler({'queryStringParameters': None}, {})
+        self.assertEqual(result['statusCode'], 200)
+
+        # Every segment is merged in, in the same order on each request
+        body = json.loads(result['body'])
+        self.assertEqual(sorted(int(item['objectID']) for item in body), list(range(20)))
+        self.assertEqual(json.loads(lambda_handler({'queryStringParameters': None}, {})['body']), body)
+
+    def test_lambda_handler_paginates(self):
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'BusStop'},
+            {'objectID': '2', 'objectType': 'BusStop'},
+            {'objectID': '3', 'objectType': 'LuasStop'},
+            {'objectID': '4', 'objectType': 'TrainStation'}
+        ])
+
+        # Pages run across objectTypes in the order requested, ending with a null cursor
+        pages = []
+        query_params = {'objectType': 'LuasStop,BusStop', 'limit': '2'}
+        while True:
+            result = lambda_handler({'queryStringParameters': dict(query_params)}, {})
+            self.assertEqual(result['statusCode'], 200)
+            body = json.loads(result['body'])
+            pages.append([item['objectID'] for item in body['items']])
+            if body['next'] is None:
+                break
+            query_params['cursor'] = body['next']
+        self.assertEqual(pages, [['3', '1'], ['2']])
+
+        # The whole table is paged in key order
+        result = lambda_handler({'queryStringParameters': {'limit': '3'}}, {})
+        body = json.loads(result['body'])
+        self.assertEqual(len(body['items']), 3)
+        result = lambda_handler({'queryStringParameters': {'limit': '3', 'cursor': body['next']}}, {})
+        self.assertEqual(json.loads(result['body'])['items'][0]['objectID'], '4')
+
+    @patch('functions.return_permanent_data.lambda_function.get_table')
+    def test_lambda_handler_with_bbox(self, mock_get_table):
+        table = MagicMock(wraps=self.table)
+        mock_get_table.side_effect = lambda name, schema: table if name == 'test-table' else get_table(name, schema)
+        self.table.put_batch([
+            add_geohash({'objectID': '1', 'objectType': 'BusStop', 'latitude': '53.3498', 'longitude': '-6.2603'}),
+            add_geohash({'objectID': '2', 'objectType': 'LuasStop', 'latitude': '53.3500', 'longitude': '-6.2600'}),
+            add_geohash({'objectID': '3', 'objectType': 'BusStop', 'latitude': '51.8985', 'longitude': '-8.4756'}),
+            {'objectID': '4', 'objectType': 'BusStop'}
+        ])
+
+        event = {'queryStringParameters': {'objectType': 'BusStop', 'bbox': '-6.27,53.345,-6.25,53.355'}}
+        result = lambda_handler(event, {})
+        self.assertEqual(result['statusCode'], 200)
+        self.assertEqual([item['objectID'] for item in json.loads(result['body'])], ['1'])
+
+        # Only the fine cells covering the box are queried, on the geohash GSI
+        self.assertTrue(table.query.call_args_list)
+        for call in table.query.call_args_list:
+            self.assertEqual(call.args[0], 'gc7x')
+            self.assertEqual(call.kwargs['index'], 'geohash-index')
+            self.assertEqual(call.kwargs['sort'][0], 'begins_with')
+        table.scan.assert_not_called()
+
+        # A box too large to cover is answered by a full read, filtered to the box
+        event = {'queryStringParameters': {'bbox': '-10.5,51.4,-6.0,55.4'}}
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual(sorted(item['objectID'] for item in body), ['1', '2', '3'])
+
+        result = lambda_handler({'queryStringParameters': {'bbox': '-6.27,53.345,-6.25,53.355', 'limit': '10'}}, {})
+        self.assertEqual(result['statusCode'], 400)
+
+    @patch('functions.return_permanent_data.lambda_function.get_table')
+    def test_lambda_handler_with_fields(self, mock_get_table):
+        table = MagicMock(wraps=self.table)
+        table.key = self.table.key
+        mock_get_table.side_effect = lambda name, schema: table if name == 'test-table' else get_table(name, schema)
+        self.table.put_batch([add_geohash(item) for item in [
+            {'objectID': '1', 'objectType': 'BusStop', 'busStopName': 'Parnell Square', 'latitude': '53.3531', 'longitude': '-6.2640'},
+            {'objectID': '2', 'objectType': 'BusStop', 'busStopName': 'Patrick Street', 'latitude': '51.8985', 'longitude': '-8.4756'},
+            {'objectID': '3', 'objectType': 'LuasStop', 'luasStopName': 'Abbey Street'}
+        ]])
+        self.version_table.put({'dataset': 'permanent_data#BusStop', 'version': 1})
+
+        # Only the requested attributes are read and returned, bypassing the cache of whole items
+        event = {'queryStringParameters': {'objectType': 'BusStop', 'fields': 'busStopName'}}
+        result = lambda_handler(event, {})
+        self.assertEqual(json.loads(result['body']), [{'busStopName': 'Parnell Square'}, {'busStopName': 'Patrick Street'}])
+        table.query.assert_called_once_with('BusStop', projection=['busStopName'])
+
+        # The ETag varies with the fields
+        whole = lambda_handler({'queryStringParameters': {'objectType': 'BusStop'}}, {})
+        self.assertNotEqual(result['headers']['ETag'], whole['headers']['ETag'])
+        # Whole items are returned without the attributes written for the geohash index
+        self.assertEqual(len(json.loads(whole['body'])[0]), 5)
+        self.assertNotIn('geohashPrefix', json.loads(whole['body'])[0])
+
+        # Pages read the key too, to resume after their last item, but only return the requested fields
+        query_params = {'objectType': 'BusStop,LuasStop', 'fields': 'objectType', 'limit': '2'}
+        body = json.loads(lambda_handler({'queryStringParameters': query_params}, {})['body'])
+        self.assertEqual(body['items'], [{'objectType': 'BusStop'}, {'objectType': 'BusStop'}])
+        query_params['cursor'] = body['next']
+        body = json.loads(lambda_handler({'queryStringParameters': query_params}, {})['body'])
+        self.assertEqual(body['items'], [{'objectType': 'LuasStop'}])
+
+        # Bounding boxes read positions to filter on
+        event = {'queryStringParameters': {'fields': 'objectID', 'bbox': '-6.30,53.33,-6.24,53.36'}}
+        self.assertEqual(json.loads(lambda_handler(event, {})['body']), [{'objectID': '1'}])
+
+        self.assertEqual(lambda_handler({'queryStringParameters': {'fields': 'a b'}}, {})['statusCode'], 400)
+
+    def test_lambda_handler_columnar(self):
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'BusStop', 'latitude': '53.3498', 'longitude': '-6.2603'},
+            {'objectID': '2', 'objectType': 'BusStop', 'latitude': '53.3500', 'longitude': '-6.2600'},
+            {'objectID': '3', 'objectType': 'LuasStop', 'latitude': '53.3400', 'longitude': '-6.2700'}
+        ])
+        self.version_table.put({'dataset': 'permanent_data#BusStop', 'version': 1})
+        self.version_table.put({'dataset': 'permanent_data#LuasStop', 'version': 1})
+
+        event = {'queryStringParameters': {'objectType': 'BusStop,LuasStop', 'format': 'columnar'}}
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual(body['length'], 3)
+        self.assertEqual(body['columns']['objectType'], {'values': ['BusStop', 'BusStop', 'LuasStop']})
+        self.assertEqual(body['columns']['objectID'], {'values': ['1', '2', '3']})
+        self.assertEqual(body['columns']['latitude'], {'values': [53.3498, 53.35, 53.34]})
+
+        # The columnar body is cached until a version changes
+        self.table.put({'objectID': '4', 'objectType': 'BusStop'})
+        self.assertEqual(json.loads(lambda_handler(event, {})['body'])['length'], 3)
+        self.version_table.increment({'dataset': 'permanent_data#BusStop'}, {'version': 1})
+        self.assertEqual(json.loads(lambda_handler(event, {})['body'])['length'], 4)
+
+        # Each objectType is cached once, however the objectTypes are combined
+        event = {'queryStringParameters': {'objectType': 'LuasStop,BusStop', 'format': 'columnar'}}
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual(body['columns']['objectID'], {'values': ['3', '1', '2', '4']})
+        self.assertEqual(sorted(key for key in permanent_cache if isinstance(key, tuple)),
+                         [('columnar', 'BusStop'), ('columnar', 'LuasStop')])
+
+        # Pages can be columnar too
+        body = json.loads(lambda_handler({'queryStringParameters': {'format': 'columnar', 'limit': '2'}}, {})['body'])
+        self.assertEqual(body['length'], 2)
+        self.assertIsNotNone(body['next'])
+
+    def test_lambda_handler_rejects_invalid_pages(self):
+        for query_params in [{'limit': 'ten'}, {'limit': '0'}, {'cursor': 'not-a-cursor'}, {'cursor': encode_cursor({'a': 1})},
+                             {'objectType': 'BusStop', 'cursor': encode_cursor({'objectType': 'BusStop'})},
+                             {'objectType': 'BusStop', 'cursor': encode_cursor({'objectType': 'LuasStop', 'objectID': '1'})}]:
+            result = lambda_handler({'queryStringParameters': query_params}, {})
+            self.assertEqual(result['statusCode'], 400)
+            self.assertIn('error', json.loads(result['body']))
 
+    def test_lambda_handler_with_no_items(self):
         # Mock event without objectType query parameter
         event = {
             'queryStringParameters': None
@@ -106,10 +311,12 @@ class TestLambdaFunction(unittest.TestCase):
         body = json.loads(result['body'])
         self.assertEqual(len(body), 0)
 
-    @patch('functions.return_permanent_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_error(self, mock_table):
+    @patch('functions.return_permanent_data.lambda_function.get_table')
+    def test_lambda_handler_error(self, mock_get_table):
         # Mock table scan to raise an exception
-        mock_table.return_value.scan.side_effect = Exception('DynamoDB error')
+        mock_get_table.return_value.estimated_item_count.return_value = 0
+        mock_get_table.return_value.get_many.return_value = []
+        mock_get_table.return_value.scan.side_effect = Exception('DynamoDB error')
 
         event = {
             'queryStringParameters': None
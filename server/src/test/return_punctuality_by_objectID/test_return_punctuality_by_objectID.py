@@ -1,42 +1,67 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 import json
 from functions.return_punctuality_by_objectID.lambda_function import lambda_handler
+from shared.storage import MemoryTable
+from shared.storage import schemas
 
 class TestPunctualityLambda(unittest.TestCase):
     """
     Unit tests for the Lambda function that fetches punctuality data.
     """
 
-    @patch("functions.return_punctuality_by_objectID.lambda_function.table.scan")
-    def test_lambda_handler_success(self, mock_scan):
+    def test_lambda_handler_success(self):
         """
-        Test Lambda function when DynamoDB returns valid data.
+        Test Lambda function when the table holds valid data.
         """
-        mock_scan.return_value = {
-            "Items": [
-                {"objectID": "Train-1", "average_punctuality": "95"},
-                {"objectID": "Bus-2", "average_punctuality": "88"}
-            ]
-        }
+        table = MemoryTable("punctuality_by_objectID", schemas.punctuality_by_objectID)
+        table.put_batch([
+            {"objectID": "Train-1", "average_punctuality": "95"},
+            {"objectID": "Bus-2", "average_punctuality": "88"}
+        ])
 
         event = {}
-        result = lambda_handler(event, {})
+        with patch("functions.return_punctuality_by_objectID.lambda_function.table", table):
+            result = lambda_handler(event, {})
 
         self.assertEqual(result["statusCode"], 200)
         body = json.loads(result["body"])
         self.assertIsInstance(body, list)  # Ensure response is a list
         self.assertEqual(len(body), 2)  # Expecting only 2 items
         self.assertEqual(body[0]["objectID"], "Train-1")
-        self.assertEqual(body[1]["average_punctuality"], "88")
+        # Averages are derived when read, so they are sent as numbers
+        self.assertEqual(body[1]["average_punctuality"], 88)
+        self.assertEqual(body[1]["count"], 1)
 
-    @patch("functions.return_punctuality_by_objectID.lambda_function.table.scan")
-    def test_lambda_handler_empty_response(self, mock_scan):
+    def test_lambda_handler_derives_average(self):
         """
-        Test Lambda function when DynamoDB returns an empty response.
+        Test that the average is derived from a train's totals and any running mean recorded before them, including when projected.
         """
-        mock_scan.return_value = {"Items": []}  # Mock empty response
+        table = MemoryTable("punctuality_by_objectID", schemas.punctuality_by_objectID)
+        table.put_batch([
+            {"objectID": "Train-1", "average_punctuality": 90, "count": 2, "punctuality_sum": 96, "punctuality_count": 1},
+            {"objectID": "Train-2", "punctuality_sum": 15, "punctuality_count": 6}
+        ])
+
+        with patch("functions.return_punctuality_by_objectID.lambda_function.table", table):
+            result = lambda_handler({}, {})
+            projected = lambda_handler({"queryStringParameters": {"fields": "objectID,average_punctuality"}}, {})
+
+        self.assertEqual(json.loads(result["body"]), [
+            {"objectID": "Train-1", "average_punctuality": 92, "count": 3},
+            {"objectID": "Train-2", "average_punctuality": 2.5, "count": 6}
+        ])
+        self.assertEqual(json.loads(projected["body"]), [
+            {"objectID": "Train-1", "average_punctuality": 92},
+            {"objectID": "Train-2", "average_punctuality": 2.5}
+        ])
 
+    @patch("functions.return_punctuality_by_objectID.lambda_function.table",
+           MemoryTable("punctuality_by_objectID", schemas.punctuality_by_objectID))
+    def test_lambda_handler_empty_response(self):
+        """
+        Test Lambda function when the table is empty.
+        """
         event = {}
         result = lambda_handler(event, {})
 
@@ -45,12 +70,12 @@ class TestPunctualityLambda(unittest.TestCase):
         self.assertIsInstance(body, list)
         self.assertEqual(len(body), 0)  # Expecting an empty list
 
-    @patch("functions.return_punctuality_by_objectID.lambda_function.table.scan")
-    def test_lambda_handler_exception(self, mock_scan):
+    @patch("functions.return_punctuality_by_objectID.lambda_function.table")
+    def test_lambda_handler_exception(self, mock_table):
         """
         Test Lambda function when an exception occurs (e.g., DynamoDB error).
         """
-        mock_scan.side_effect = Exception("DynamoDB error")  # Simulate exception
+        mock_table.scan.side_effect = Exception("DynamoDB error")  # Simulate exception
 
         event = {}
         result = lambda_handler(event, {})
@@ -1,24 +1,35 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 import json
+import os
 from functions.return_punctuality_by_timestamp.lambda_function import lambda_handler
+from shared.storage import get_table, reset_memory_tables
+from shared.storage import schemas
 
 class TestPunctualityLambda(unittest.TestCase):
     """
     Unit tests for the Lambda function that retrieves punctuality data by timestamp.
     """
 
-    @patch("functions.return_punctuality_by_timestamp.lambda_function.dynamodb.Table")
-    def test_lambda_handler_success(self, mock_table):
+    # Use an empty in-memory table for each test
+    def setUp(self):
+        patch.dict(os.environ, {"STORAGE_BACKEND": "memory"}).start()
+        reset_memory_tables()
+        self.table = get_table("punctuality_by_timestamp", schemas.punctuality_by_timestamp)
+
+    # Clean up patches after each test
+    def tearDown(self):
+        patch.stopall()
+        reset_memory_tables()
+
+    def test_lambda_handler_success(self):
         """
-        Test Lambda function when DynamoDB returns valid data.
+        Test Lambda function when the table holds valid data.
         """
-        mock_table.return_value.scan.return_value = {
-            "Items": [
-                {"timestamp": "1711814400", "average_punctuality": "95"},
-                {"timestamp": "1711900800", "average_punctuality": "88"}
-            ]
-        }
+        self.table.put_batch([
+            {"timestamp": 1711814400, "average_punctuality": "95"},
+            {"timestamp": 1711900800, "average_punctuality": "88"}
+        ])
 
         event = {}
         result = lambda_handler(event, {})
@@ -27,57 +38,40 @@ class TestPunctualityLambda(unittest.TestCase):
         body = json.loads(result["body"])
         self.assertIsInstance(body, list)
         self.assertEqual(len(body), 2)  # Expecting 2 items
-        self.assertEqual(body[0]["timestamp"], "1711814400")
+        body.sort(key=lambda item: item["timestamp"])
+        self.assertEqual(body[0]["timestamp"], 1711814400)
         self.assertEqual(body[1]["average_punctuality"], "88")
 
-    @patch("functions.return_punctuality_by_timestamp.lambda_function.dynamodb.Table")
-    def test_lambda_handler_empty_response(self, mock_table):
+    def test_lambda_handler_with_fields(self):
         """
-        Test Lambda function when DynamoDB returns an empty response.
+        Test Lambda function when the response is limited to some fields.
         """
-        mock_table.return_value.scan.return_value = {"Items": []}  # Empty dataset
+        self.table.put({"timestamp": 1711814400, "average_punctuality": "95", "count": 12})
 
-        event = {}
-        result = lambda_handler(event, {})
+        result = lambda_handler({"queryStringParameters": {"fields": "timestamp,average_punctuality"}}, {})
+        self.assertEqual(json.loads(result["body"]), [{"timestamp": 1711814400, "average_punctuality": "95"}])
 
-        self.assertEqual(result["statusCode"], 200)
-        body = json.loads(result["body"])
-        self.assertIsInstance(body, list)
-        self.assertEqual(len(body), 0)  # Expecting an empty list
+        result = lambda_handler({"queryStringParameters": {"fields": "timestamp;count"}}, {})
+        self.assertEqual(result["statusCode"], 400)
 
-    @patch("functions.return_punctuality_by_timestamp.lambda_function.dynamodb.Table")
-    def test_lambda_handler_pagination(self, mock_table):
+    def test_lambda_handler_empty_response(self):
         """
-        Test Lambda function handles paginated DynamoDB results correctly.
+        Test Lambda function when the table is empty.
         """
-        # Simulate paginated responses
-        def scan_side_effect(*args, **kwargs):
-            if "ExclusiveStartKey" not in kwargs:
-                return {"Items": [{"timestamp": "1711814400", "average_punctuality": "95"}], "LastEvaluatedKey": "key1"}
-            elif kwargs["ExclusiveStartKey"] == "key1":
-                return {"Items": [{"timestamp": "1711900800", "average_punctuality": "88"}], "LastEvaluatedKey": "key2"}
-            elif kwargs["ExclusiveStartKey"] == "key2":
-                return {"Items": [{"timestamp": "1711987200", "average_punctuality": "92"}]}  # Last page
-
-        mock_table.return_value.scan.side_effect = scan_side_effect
-
         event = {}
         result = lambda_handler(event, {})
 
         self.assertEqual(result["statusCode"], 200)
         body = json.loads(result["body"])
         self.assertIsInstance(body, list)
-        self.assertEqual(len(body), 3)  # Expecting 3 items
-        self.assertEqual(body[0]["timestamp"], "1711814400")
-        self.assertEqual(body[1]["timestamp"], "1711900800")
-        self.assertEqual(body[2]["timestamp"], "1711987200")
+        self.assertEqual(len(body), 0)  # Expecting an empty list
 
-    @patch("functions.return_punctuality_by_timestamp.lambda_function.dynamodb.Table")
-    def test_lambda_handler_exception(self, mock_table):
+    @patch("functions.return_punctuality_by_timestamp.lambda_function.get_table")
+    def test_lambda_handler_exception(self, mock_get_table):
         """
         Test Lambda function when an exception occurs (e.g., DynamoDB error).
         """
-        mock_table.return_value.scan.side_effect = Exception("DynamoDB error")  # Simulate error
+        mock_get_table.return_value.scan.side_effect = Exception("DynamoDB error")  # Simulate error
 
         event = {}
         result = lambda_handler(event, {})
@@ -4,8 +4,8 @@ from functions.return_station_data.lambda_function import lambda_handler
 
 class TestLambdaFunction(unittest.TestCase):
 
-    @patch('src.functions.return_station_data.lambda_function.requests.get')
-    @patch('src.functions.return_station_data.lambda_function.xmltodict.parse')
+    @patch('functions.return_station_data.lambda_function.session.get')
+    @patch('functions.return_station_data.lambda_function.xmltodict.parse')
     def lambda_handler_returns_station_data_for_valid_stationCode(self, mock_parse, mock_get):
         mock_response = MagicMock()
         mock_response.text = '<xml>test</xml>'
@@ -22,7 +22,7 @@ class TestLambdaFunction(unittest.TestCase):
         self.assertEqual(response['statusCode'], 200)
         self.assertEqual(json.loads(response['body']), {'station': 'data'})
 
-    @patch('src.functions.return_station_data.lambda_function.requests.get')
+    @patch('functions.return_station_data.lambda_function.session.get')
     def lambda_handler_returns_error_on_exception(self, mock_get):
         mock_get.side_effect = Exception('Test exception')
 
@@ -36,7 +36,7 @@ class TestLambdaFunction(unittest.TestCase):
         self.assertEqual(response['statusCode'], 500)
         self.assertIn('error', json.loads(response['body']))
 
-    @patch('src.functions.return_station_data.lambda_function.requests.get')
+    @patch('functions.return_station_data.lambda_function.session.get')
     def lambda_handler_returns_error_for_missing_stationCode(self, mock_get):
         event = {
             'queryStringParameters': {}
@@ -48,8 +48,8 @@ class TestLambdaFunction(unittest.TestCase):
         self.assertEqual(response['statusCode'], 500)
         self.assertIn('error', json.loads(response['body']))
 
-    @patch('src.functions.return_station_data.lambda_function.requests.get')
-    @patch('src.functions.return_station_data.lambda_function.xmltodict.parse')
+    @patch('functions.return_station_data.lambda_function.session.get')
+    @patch('functions.return_station_data.lambda_function.xmltodict.parse')
     def handles_non_xml_response(self, mock_parse, mock_get):
         mock_response = MagicMock()
         mock_response.text = 'Not XML'
@@ -64,7 +64,7 @@ class TestLambdaFunction(unittest.TestCase):
         self.assertEqual(result['statusCode'], 500)
         self.assertIn('error', json.loads(result['body']))
 
-    @patch('src.functions.return_station_data.lambda_function.requests.get')
+    @patch('functions.return_station_data.lambda_function.session.get')
     def handles_empty_response(self, mock_get):
         mock_response = MagicMock()
         mock_response.text = ''
@@ -78,8 +78,8 @@ class TestLambdaFunction(unittest.TestCase):
         self.assertEqual(result['statusCode'], 500)
         self.assertIn('error', json.loads(result['body']))
 
-    @patch('src.functions.return_station_data.lambda_function.requests.get')
-    @patch('src.functions.return_station_data.lambda_function.xmltodict.parse')
+    @patch('functions.return_station_data.lambda_function.session.get')
+    @patch('functions.return_station_data.lambda_function.xmltodict.parse')
     def handles_invalid_station_code(self, mock_parse, mock_get):
         mock_response = MagicMock()
         mock_response.text = '<root></root>'
@@ -94,7 +94,7 @@ class TestLambdaFunction(unittest.TestCase):
         self.assertEqual(result['statusCode'], 200)
         self.assertEqual(json.loads(result['body']), {})
 
-    @patch('src.functions.return_station_data.lambda_function.requests.get')
+    @patch('functions.return_station_data.lambda_function.session.get')
     def lambda_handler_handles_timeout(self, mock_get):
         mock_get.side_effect = TimeoutError('Request timed out')
 
@@ -108,7 +108,7 @@ class TestLambdaFunction(unittest.TestCase):
         self.assertEqual(response['statusCode'], 504)
         self.assertIn('error', json.loads(response['body']))
 
-    @patch('src.functions.return_station_data.lambda_function.requests.get')
+    @patch('functions.return_station_data.lambda_function.session.get')
     def lambda_handler_handles_http_error(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 404
@@ -2,26 +2,38 @@ import unittest
 from unittest.mock import patch, MagicMock
 import json
 import os
+import gzip
+import brotli
+import base64
+import tempfile
+from shared.blob_store import LocalBlobStore
+from shared.geohash import add_geohash
+from shared.snapshots import objects_chunks
+from shared.storage import get_table, reset_memory_tables
+from shared.storage import schemas
 from functions.return_transient_data.lambda_function import lambda_handler
 
 
 class TestLambdaFunction(unittest.TestCase):
 
-    # Mock environment variable before each test
+    # Use empty in-memory tables for each test
     def setUp(self):
-        patch.dict(os.environ, {'TABLE_NAME': 'test-table'}).start()
+        patch.dict(os.environ, {'TABLE_NAME': 'test-table', 'STORAGE_BACKEND': 'memory'}).start()
+        reset_memory_tables()
+        self.table = get_table('test-table', schemas.transient_data)
+        self.snapshot_table = get_table('transient_snapshots', schemas.transient_snapshots)
 
     # Clean up patches after each test
     def tearDown(self):
         patch.stopall()
+        reset_memory_tables()
 
-    @patch('functions.return_transient_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_with_object_type(self, mock_table):
-        # Mock scan responses for timestamps
-        mock_table.return_value.scan.side_effect = [
-            {'Items': [{'timestamp': '1234567890'}, {'timestamp': '1234567891'}]},  # First scan for timestamps
-            {'Items': [{'objectID': '1', 'objectType': 'Bus', 'timestamp': '1234567891'}]}  # Fetch latest items
-        ]
+    def test_lambda_handler_with_object_type(self):
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1234567891},
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1234567890},
+            {'objectID': '2', 'objectType': 'IrishRailTrain', 'timestamp': 1234567891}
+        ])
 
         # Mock event with objectType query parameter
         event = {
@@ -33,18 +45,17 @@ class TestLambdaFunction(unittest.TestCase):
         result = lambda_handler(event, {})
         self.assertEqual(result['statusCode'], 200)
 
-        # Parse result body
+        # Only the newest snapshot of the requested objectType is returned
         body = json.loads(result['body'])
         self.assertEqual(len(body), 1)
         self.assertEqual(body[0]['objectType'], 'Bus')
+        self.assertEqual(body[0]['timestamp'], 1234567891)
 
-    @patch('functions.return_transient_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_without_object_type(self, mock_table):
-        # Mock scan responses for timestamps and data
-        mock_table.return_value.scan.side_effect = [
-            {'Items': [{'timestamp': '1234567890'}, {'timestamp': '1234567891'}]},  # First scan for timestamps
-            {'Items': [{'objectID': '1', 'objectType': 'Bus', 'timestamp': '1234567891'}]}  # Fetch latest items
-        ]
+    def test_lambda_handler_without_object_type(self):
+        self.table.put_batch([
+            {'objectID': '2', 'objectType': 'IrishRailTrain', 'timestamp': 1234567891},
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1234567891}
+        ])
 
         # Mock event without objectType query parameter
         event = {
@@ -55,23 +66,74 @@ class TestLambdaFunction(unittest.TestCase):
         self.assertEqual(result['statusCode'], 200)
 
         # Parse result body
+        body = json.loads(result['body'])
+        self.assertEqual(len(body), 2)
+        self.assertEqual(body[0]['objectType'], 'IrishRailTrain')
+        self.assertEqual(body[1]['objectType'], 'Bus')
+
+    def test_lambda_handler_with_multiple_object_types(self):
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1234567891},
+            {'objectID': '3', 'objectType': 'Bus', 'timestamp': 1234567891},
+            {'objectID': '2', 'objectType': 'IrishRailTrain', 'timestamp': 1234567891}
+        ])
+
+        event = {
+            'queryStringParameters': {
+                # Repeated types are read once
+                'objectType': 'Bus,IrishRailTrain,Bus'
+            }
+        }
+
+        result = lambda_handler(event, {})
+        self.assertEqual(result['statusCode'], 200)
+
+        body = json.loads(result['body'])
+        self.assertEqual(len(body), 3)
+        self.assertEqual([item['objectType'] for item in body], ['Bus', 'Bus', 'IrishRailTrain'])
+
+    def test_lambda_handler_rejects_unknown_object_types(self):
+        result = lambda_handler({'queryStringParameters': {'objectType': 'Bus,' + ','.join(f'T{index}' for index in range(3000))}}, {})
+
+        self.assertEqual(result['statusCode'], 400)
+        self.assertIn('T0', json.loads(result['body'])['error'])
+
+    def test_lambda_handler_with_committed_snapshot(self):
+        # The committed marker points at an older snapshot than a partially written one
+        self.snapshot_table.put({'objectType': 'Bus', 'timestamp': 1234567890})
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1234567890},
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1234567891}
+        ])
+
+        event = {
+            'queryStringParameters': {
+                'objectType': 'Bus'
+            }
+        }
+
+        result = lambda_handler(event, {})
+        self.assertEqual(result['statusCode'], 200)
+
         body = json.loads(result['body'])
         self.assertEqual(len(body), 1)
-        self.assertEqual(body[0]['objectType'], 'Bus')
+        self.assertEqual(body[0]['timestamp'], 1234567890)
 
-    @patch('functions.return_transient_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_with_pagination(self, mock_table):
-        # Mock paginated scan responses for timestamps and data
-        mock_table.return_value.scan.side_effect = [
-            {'Items': [{'timestamp': '1234567890'}], 'LastEvaluatedKey': 'key1'},
-            {'Items': [{'timestamp': '1234567891'}]},  # Last page for timestamps
-            {'Items': [{'objectID': '1', 'objectType': 'Bus', 'timestamp': '1234567891'}], 'LastEvaluatedKey': 'key2'},
-            {'Items': [{'objectID': '2', 'objectType': 'Train', 'timestamp': '1234567891'}]}  # Last page for data
-        ]
+    def test_lambda_handler_with_carried_objects(self):
+        # Bus 2 was unchanged, so it is carried forward from the snapshot it was last written in
+        self.snapshot_table.put({
+            'objectType': 'Bus',
+            'timestamp': 1234567891,
+            'objects': {'1': [1234567891, 'aaaa'], '2': [1234567800, 'bbbb']}
+        })
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1234567891},
+            {'objectID': '2', 'objectType': 'Bus', 'timestamp': 1234567800}
+        ])
 
         event = {
             'queryStringParameters': {
-                'objectType': 'Bus,Train'
+                'objectType': 'Bus'
             }
         }
 
@@ -79,15 +141,229 @@ class TestLambdaFunction(unittest.TestCase):
         self.assertEqual(result['statusCode'], 200)
 
         body = json.loads(result['body'])
-        self.assertEqual(len(body), 2)
-        self.assertEqual(body[0]['objectType'], 'Bus')
-        self.assertEqual(body[1]['objectType'], 'Train')
+        self.assertEqual([item['objectID'] for item in body], ['1', '2'])
+        self.assertEqual({item['timestamp'] for item in body}, {1234567891})
+
+    def test_lambda_handler_with_fields(self):
+        self.snapshot_table.put({
+            'objectType': 'IrishRailTrain',
+            'timestamp': 1234567891,
+            'objects': {'A1': [1234567891, 'aaaa', 'gc7x'], 'A2': [1234567800, 'bbbb', 'gc7x']},
+            'artifactKey': 'snapshots/IrishRailTrain/1234567891.json.gz'
+        })
+        self.table.put_batch([add_geohash(item) for item in [
+            {'objectID': 'A1', 'objectType': 'IrishRailTrain', 'timestamp': 1234567891, 'trainStatusFull': 'Running',
+             'trainPublicMessage': 'A1\\nDublin Connolly to Howth', 'latitude': '53.3531', 'longitude': '-6.2466'},
+            {'objectID': 'A2', 'objectType': 'IrishRailTrain', 'timestamp': 1234567800, 'trainStatusFull': 'Not yet running',
+             'trainPublicMessage': 'A2\\nDublin Connolly to Sligo', 'latitude': '53.3500', 'longitude': '-6.2450'}
+        ]])
+
+        # Pre-rendered artifacts hold whole items, so projected reads go to the table
+        with tempfile.TemporaryDirectory() as directory:
+            with patch('functions.return_transient_data.lambda_function.blob_store', LocalBlobStore(directory)) as store:
+                store.put('snapshots/IrishRailTrain/1234567891.json.gz', gzip.compress(b'[]'))
+                event = {'queryStringParameters': {'objectType': 'IrishRailTrain', 'fields': 'objectType,trainStatusFull,timestamp'}}
+                body = json.loads(lambda_handler(event, {})['body'])
+
+        self.assertEqual(body, [
+            {'objectType': 'IrishRailTrain', 'trainStatusFull': 'Running', 'timestamp': 1234567891},
+            {'objectType': 'IrishRailTrain', 'trainStatusFull': 'Not yet running', 'timestamp': 1234567891}
+        ])
+
+        # Attributes a bounding box is filtered on are read but not returned unless requested
+        event = {'queryStringParameters': {'objectType': 'IrishRailTrain', 'fields': 'trainStatusFull', 'bbox': '-6.30,53.33,-6.24,53.36'}}
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual(sorted(body, key=lambda item: item['trainStatusFull']),
+                         [{'trainStatusFull': 'Not yet running'}, {'trainStatusFull': 'Running'}])
+
+        result = lambda_handler({'queryStringParameters': {'fields': 'objectType,'}}, {})
+        self.assertEqual(result['statusCode'], 400)
+
+    def test_lambda_handler_since(self):
+        # Since the client's snapshot at 1000, Bus 2 moved at 1060, Bus 3 left service and Bus 4 joined at 1120
+        history_table = get_table('transient_snapshot_history', schemas.transient_snapshot_history)
+        history_table.put({'objectType': 'Bus', 'timestamp': 1000, 'objectIDs': ['1', '2', '3']})
+        history_table.put({'objectType': 'Bus', 'timestamp': 1060, 'objectIDs': ['1', '2', '3']})
+        # The marker's objects are stored in chunks beside it, as fetch_transient_data commits them
+        chunks = objects_chunks('Bus', 1120, {'1': [1000, 'aaaa'], '2': [1060, 'bbbb'], '4': [1120, 'dddd']}, 4720)
+        get_table('transient_snapshot_objects', schemas.transient_snapshot_objects).put_batch(chunks)
+        self.snapshot_table.put({'objectType': 'Bus', 'timestamp': 1120, 'objectChunks': len(chunks)})
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1000, 'latitude': '53.1'},
+            {'objectID': '2', 'objectType': 'Bus', 'timestamp': 1000, 'latitude': '53.2'},
+            {'objectID': '3', 'objectType': 'Bus', 'timestamp': 1000, 'latitude': '53.3'},
+            {'objectID': '2', 'objectType': 'Bus', 'timestamp': 1060, 'latitude': '53.25'},
+            {'objectID': '4', 'objectType': 'Bus', 'timestamp': 1120, 'latitude': '53.4'},
+            {'objectID': 'A1', 'objectType': 'IrishRailTrain', 'timestamp': 1110}
+        ])
+
+        event = {'queryStringParameters': {'objectType': 'Bus', 'since': '1000'}}
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual(body['snapshot'], 1120)
+        self.assertEqual(body['full'], [])
+        self.assertEqual(sorted((item['objectID'], item['latitude'], item['timestamp']) for item in body['items']),
+                         [('2', '53.25', 1120), ('4', '53.4', 1120)])
+        self.assertEqual(body['removed'], ['3'])
+
+        # Nothing has changed since the latest snapshot
+        event = {'queryStringParameters': {'objectType': 'Bus', 'since': '1120', 'fields': 'latitude'}}
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual((body['items'], body['removed'], body['full']), ([], [], []))
+
+        # Deltas keep the objectID, which clients apply them by
+        event = {'queryStringParameters': {'objectType': 'Bus', 'since': '1060', 'fields': 'latitude'}}
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual((body['items'], body['removed']), ([{'latitude': '53.4', 'objectID': '4'}], ['3']))
+
+        # Snapshots without history, and objectTypes without a committed snapshot, are sent in full
+        for since in ('0', '1001'):
+            event = {'queryStringParameters': {'objectType': 'Bus,IrishRailTrain', 'since': since}}
+            body = json.loads(lambda_handler(event, {})['body'])
+            self.assertEqual(body['full'], ['Bus', 'IrishRailTrain'])
+            self.assertEqual(sorted(item['objectID'] for item in body['items']), ['1', '2', '4', 'A1'])
+
+        for query_params in [{'since': 'yesterday'}, {'since': '1000', 'bbox': '-6.30,53.33,-6.24,53.36'},
+                             {'objectType': 'Bus', 'since': 'IrishRailTrain:1000'}, {'since': 'Bus:'}]:
+            self.assertEqual(lambda_handler({'queryStringParameters': query_params}, {})['statusCode'], 400)
+
+    def test_lambda_handler_since_per_object_type(self):
+        # The trains' snapshot lags behind the buses', so each objectType's own snapshot is sent back as since
+        self.snapshot_table.put({'objectType': 'Bus', 'timestamp': 1120, 'objects': {'1': [1120, 'aaaa']}})
+        self.snapshot_table.put({'objectType': 'IrishRailTrain', 'timestamp': 1110, 'objects': {'A1': [1110, 'bbbb']}})
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1120},
+            {'objectID': 'A1', 'objectType': 'IrishRailTrain', 'timestamp': 1110}
+        ])
+
+        event = {'queryStringParameters': {'since': '0'}}
+        body = json.loads(lambda_handler(event, {})['body'])
+        self.assertEqual(body['snapshots'], {'IrishRailTrain': 1110, 'Bus': 1120})
+        self.assertEqual(body['snapshot'], 1120)
+
+        since = ','.join(f'{object_type}:{timestamp}' for object_type, timestamp in body['snapshots'].items())
+        body = json.loads(lambda_handler({'queryStringParameters': {'since': since}}, {})['body'])
+        self.assertEqual((body['items'], body['removed'], body['full']), ([], [], []))
+
+        # ObjectTypes the client holds no snapshot of are sent in full
+        body = json.loads(lambda_handler({'queryStringParameters': {'since': 'Bus:1120'}}, {})['body'])
+        self.assertEqual(body['full'], ['IrishRailTrain'])
+        self.assertEqual([item['objectID'] for item in body['items']], ['A1'])
+
+    def test_lambda_handler_with_bbox(self):
+        # Bus 1 is in Dublin and Bus 2 in Cork; Bus 3 is in Dublin but was carried forward, and Bus 4 has no position
+        buses = [
+            add_geohash({'objectID': '1', 'objectType': 'Bus', 'timestamp': 1234567891, 'latitude': '53.3498', 'longitude': '-6.2603'}),
+            add_geohash({'objectID': '2', 'objectType': 'Bus', 'timestamp': 1234567891, 'latitude': '51.8985', 'longitude': '-8.4756'}),
+            add_geohash({'objectID': '3', 'objectType': 'Bus', 'timestamp': 1234567800, 'latitude': '53.3400', 'longitude': '-6.2700'}),
+            {'objectID': '4', 'objectType': 'Bus', 'timestamp': 1234567891}
+        ]
+        self.table.put_batch(buses)
+        self.table.put_batch([add_geohash({'objectID': 'A1', 'objectType': 'IrishRailTrain', 'timestamp': 1234567891,
+                                           'latitude': '53.3531', 'longitude': '-6.2466'})])
+        self.snapshot_table.put({
+            'objectType': 'Bus',
+            'timestamp': 1234567891,
+            'objects': {'1': [1234567891, 'aaaa', 'gc7x'], '2': [1234567891, 'bbbb', 'gc1z'], '3': [1234567800, 'cccc', 'gc7x'],
+                        '4': [1234567891, 'dddd']}
+        })
+
+        table = MagicMock(wraps=self.table)
+        with patch('functions.return_transient_data.lambda_function.get_table',
+                   side_effect=lambda name, schema: table if name == 'test-table' else get_table(name, schema)):
+            event = {'queryStringParameters': {'objectType': 'Bus', 'bbox': '-6.30,53.33,-6.24,53.36'}}
+            result = lambda_handler(event, {})
+
+            self.assertEqual(result['statusCode'], 200)
+            body = json.loads(result['body'])
+            self.assertEqual(sorted(item['objectID'] for item in body), ['1', '3'])
+            self.assertEqual({item['timestamp'] for item in body}, {1234567891})
+            # The attributes written for the geohash index aren't returned
+            self.assertFalse(any('geohash' in item or 'geohashPrefix' in item for item in body))
+
+            # The covering cell is queried on the geohash GSI rather than reading the whole snapshot
+            table.query.assert_called_once_with('gc7x', sort=('eq', 1234567891), index='geohash-index', projection=None)
+
+            # Without a committed snapshot, the objectType is read in full and filtered
+            event = {'queryStringParameters': {'objectType': 'IrishRailTrain', 'bbox': '-6.30,53.33,-6.24,53.36'}}
+            body = json.loads(lambda_handler(event, {})['body'])
+            self.assertEqual([item['objectID'] for item in body], ['A1'])
+
+        result = lambda_handler({'queryStringParameters': {'bbox': '53.33,-6.30'}}, {})
+        self.assertEqual(result['statusCode'], 400)
+
+    @patch('functions.return_transient_data.lambda_function.get_table')
+    def test_lambda_handler_serves_artifact(self, mock_get_table):
+        """
+        Test that a committed snapshot with a pre-rendered artifact is served verbatim, without querying the table.
+        """
+        key = 'snapshots/Bus/1234567890.json.gz'
+        mock_get_table.return_value.get.return_value = {'objectType': 'Bus', 'timestamp': 1234567890, 'artifactKey': key}
+        body = gzip.compress(json.dumps([{'objectID': 'Bus-1', 'objectType': 'Bus'}]).encode('utf-8'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = LocalBlobStore(directory)
+            store.put(key, body)
+            event = {'queryStringParameters': {'objectType': 'Bus'}, 'headers': {'accept-encoding': 'gzip, br'}}
+
+            with patch('functions.return_transient_data.lambda_function.blob_store', store):
+                result = lambda_handler(event, {})
+                self.assertEqual(result['statusCode'], 200)
+                self.assertTrue(result['isBase64Encoded'])
+                self.assertEqual(result['headers']['Content-Encoding'], 'gzip')
+                self.assertEqual(base64.b64decode(result['body']), body)
+
+                # Clients without gzip get the decompressed body, and revalidation is answered with a 304
+                uncompressed = lambda_handler({'queryStringParameters': {'objectType': 'Bus'}}, {})
+                self.assertEqual(json.loads(uncompressed['body'])[0]['objectID'], 'Bus-1')
+
+                # Clients accepting only brotli get the artifact recompressed, once it is large enough
+                with patch('shared.http.compression_threshold', 10):
+                    recompressed = lambda_handler({'queryStringParameters': {'objectType': 'Bus'}, 'headers': {'Accept-Encoding': 'br'}}, {})
+                self.assertEqual(recompressed['headers']['Content-Encoding'], 'br')
+                self.assertEqual(json.loads(brotli.decompress(base64.b64decode(recompressed['body'])))[0]['objectID'], 'Bus-1')
+                # Every encoding of the snapshot shares one weak ETag
+                self.assertTrue(result['headers']['ETag'].startswith('W/"'))
+                self.assertEqual({uncompressed['headers']['ETag'], recompressed['headers']['ETag']}, {result['headers']['ETag']})
+                event['headers']['If-None-Match'] = result['headers']['ETag']
+                self.assertEqual(lambda_handler(event, {})['statusCode'], 304)
+
+        mock_get_table.return_value.query.assert_not_called()
+
+    def test_lambda_handler_columnar(self):
+        self.table.put_batch([
+            {'objectID': '1', 'objectType': 'Bus', 'timestamp': 1234567890, 'latitude': '53.3498', 'longitude': '-6.2603'},
+            {'objectID': '2', 'objectType': 'Bus', 'timestamp': 1234567890, 'latitude': '51.8985', 'longitude': '-8.4756'}
+        ])
+
+        result = lambda_handler({'queryStringParameters': {'objectType': 'Bus', 'format': 'columnar'}}, {})
+        self.assertEqual(result['statusCode'], 200)
+
+        body = json.loads(result['body'])
+        self.assertEqual(body['length'], 2)
+        self.assertEqual(body['columns']['objectType'], {'dictionary': ['Bus'], 'codes': [0, 0]})
+        self.assertEqual(sorted(body['columns']['latitude']['values']), [51.8985, 53.3498])
+
+        result = lambda_handler({'queryStringParameters': {'format': 'xml'}}, {})
+        self.assertEqual(result['statusCode'], 400)
+
+    @patch('functions.return_transient_data.lambda_function.get_table')
+    def test_lambda_handler_serves_columnar_artifact(self, mock_get_table):
+        key = 'snapshots/Bus/1234567890.json.gz'
+        mock_get_table.return_value.get.return_value = {'objectType': 'Bus', 'timestamp': 1234567890, 'artifactKey': key}
+        body = gzip.compress(json.dumps({'format': 'columnar', 'length': 0, 'columns': {}}).encode('utf-8'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = LocalBlobStore(directory)
+            store.put('snapshots/Bus/1234567890.columnar.json.gz', body)
+            event = {'queryStringParameters': {'objectType': 'Bus', 'format': 'columnar'}, 'headers': {'Accept-Encoding': 'gzip'}}
+
+            with patch('functions.return_transient_data.lambda_function.blob_store', store):
+                result = lambda_handler(event, {})
+                self.assertEqual(base64.b64decode(result['body']), body)
 
-    @patch('functions.return_transient_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_no_data(self, mock_table):
-        # Mock empty scan response
-        mock_table.return_value.scan.return_value = {'Items': []}
+        mock_get_table.return_value.query.assert_not_called()
 
+    def test_lambda_handler_no_data(self):
         event = {
             'queryStringParameters': None
         }
@@ -98,10 +374,11 @@ class TestLambdaFunction(unittest.TestCase):
         body = json.loads(result['body'])
         self.assertEqual(len(body), 0)
 
-    @patch('functions.return_transient_data.lambda_function.dynamodb.Table')
-    def test_lambda_handler_error(self, mock_table):
-        # Mock table scan to raise an exception
-        mock_table.return_value.scan.side_effect = Exception('DynamoDB error')
+    @patch('functions.return_transient_data.lambda_function.get_table')
+    def test_lambda_handler_error(self, mock_get_table):
+        # Mock table query to raise an exception
+        mock_get_table.return_value.get.return_value = None
+        mock_get_table.return_value.query.side_effect = Exception('DynamoDB error')
 
         event = {
             'queryStringParameters': None
@@ -0,0 +1,121 @@
+import asyncio
+import base64
+import gzip
+import json
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+from shared.storage import reset_memory_tables
+from servers import api
+from servers.api import ApiServer, from_response, load_routes, to_event
+
+
+class TestApiServer(unittest.IsolatedAsyncioTestCase):
+    """
+    Unit tests for the single-process API server.
+    """
+
+    async def start(self, handlers):
+        self.server = ApiServer(handlers, workers=4)
+        self.listener = await asyncio.start_server(self.server.handle_connection, "127.0.0.1", 0)
+        port = self.listener.sockets[0].getsockname()[1]
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        self.addAsyncCleanup(self.stop)
+
+    async def stop(self):
+        self.writer.close()
+        self.listener.close()
+        await self.listener.wait_closed()
+        self.server.executor.shutdown()
+
+    async def request(self, target, method="GET"):
+        self.writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode("latin-1"))
+        await self.writer.drain()
+        head = (await self.reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        headers = dict(line.split(": ", 1) for line in head[1:] if line)
+        body = await self.reader.readexactly(int(headers["Content-Length"]))
+        return int(head[0].split(" ")[1]), headers, body
+
+    def test_to_event(self):
+        """
+        Test that requests become API Gateway proxy events, with no query string parameters as None.
+        """
+        request = {"method": "GET", "path": "/transient_data", "query_params": {}, "headers": {"Accept-Encoding": "gzip"}, "body": b""}
+
+        event = to_event(request)
+
+        self.assertIsNone(event["queryStringParameters"])
+        self.assertEqual(event["headers"], {"Accept-Encoding": "gzip"})
+        self.assertEqual(to_event(dict(request, query_params={"objectType": "Bus"}))["queryStringParameters"], {"objectType": "Bus"})
+
+    def test_from_response(self):
+        """
+        Test that base64-encoded bodies are decoded and handler headers are kept alongside CORS.
+        """
+        compressed = gzip.compress(b"[]")
+        response = {
+            "statusCode": 200,
+            "headers": {"Content-Encoding": "gzip"},
+            "body": base64.b64encode(compressed).decode("ascii"),
+            "isBase64Encoded": True
+        }
+
+        status, headers, body = from_response(response)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, compressed)
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertEqual(headers["Access-Control-Allow-Origin"], "*")
+        self.assertEqual(headers["Content-Type"], "application/json")
+
+    async def test_routes_requests_over_one_connection(self):
+        """
+        Test that requests on a kept-alive connection reach their handlers as proxy events.
+        """
+        handler = MagicMock(return_value={"statusCode": 200, "body": '{"ok": true}'})
+        await self.start({"/transient_data": handler})
+
+        status, _, body = await self.request("/transient_data?objectType=Bus")
+        self.assertEqual((status, json.loads(body)), (200, {"ok": True}))
+        status, _, _ = await self.request("/transient_data/")
+        self.assertEqual(status, 200)
+
+        self.assertEqual(handler.call_count, 2)
+        self.assertEqual(handler.call_args_list[0].args[0]["queryStringParameters"], {"objectType": "Bus"})
+        self.assertIsNone(handler.call_args_list[1].args[0]["queryStringParameters"])
+
+    async def test_errors(self):
+        """
+        Test unknown paths, other methods, failing handlers, and requests beyond the in-flight limit.
+        """
+        await self.start({"/transient_data": MagicMock(side_effect=KeyError("TABLE_NAME"))})
+
+        self.assertEqual((await self.request("/unknown"))[0], 404)
+        self.assertEqual((await self.request("/transient_data", "DELETE"))[0], 405)
+        self.assertEqual((await self.request("/transient_data", "OPTIONS"))[0], 204)
+        status, _, body = await self.request("/transient_data")
+        self.assertEqual(status, 500)
+        self.assertIn("TABLE_NAME", json.loads(body)["error"])
+
+        with patch.object(api, "max_in_flight", 0):
+            self.assertEqual((await self.request("/transient_data"))[0], 503)
+        status, _, body = await self.request("/health")
+        self.assertEqual(json.loads(body), {"in_flight": 0, "requests": 1, "rejected": 1})
+
+    @patch.dict(os.environ, {"STORAGE_BACKEND": "memory", "TRANSIENT_TABLE": "api-transient", "PERMANENT_TABLE": "api-permanent"})
+    async def test_serves_every_handler(self):
+        """
+        Test that every function is mounted at its API Gateway path and its name, and answers from the shared backend.
+        """
+        reset_memory_tables()
+        handlers = load_routes()
+        await self.start(handlers)
+
+        for path, module in api.routes:
+            self.assertIs(handlers[path], handlers[f"/{module}"])
+        status, _, body = await self.request("/permanent_data?objectType=Bus")
+        self.assertEqual((status, json.loads(body)), (200, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from shared.snapshots import objects_chunks
+from shared.storage import MemoryTable
+from shared.storage import schemas
+from servers.feed import SnapshotFeed, filter_changes, filter_objects, in_box
+
+
+def bus(object_id, timestamp, latitude, longitude):
+    return {"objectID": object_id, "objectType": "Bus", "timestamp": timestamp, "latitude": str(latitude), "longitude": str(longitude)}
+
+
+class TestSnapshotFeed(unittest.TestCase):
+    """
+    Unit tests for following committed snapshots and filtering their changes.
+    """
+
+    def setUp(self):
+        self.table = MemoryTable("transient_data", schemas.transient_data)
+        self.snapshot_table = MemoryTable("transient_snapshots", schemas.transient_snapshots)
+        self.objects_table = MemoryTable("transient_snapshot_objects", schemas.transient_snapshot_objects)
+        self.feed = SnapshotFeed(self.table, self.snapshot_table, self.objects_table, ["Bus", "IrishRailTrain"])
+
+    def commit(self, timestamp, objects):
+        chunks = objects_chunks("Bus", timestamp, objects, timestamp + 3600)
+        self.objects_table.put_batch(chunks)
+        self.snapshot_table.put({"objectType": "Bus", "timestamp": timestamp, "objectChunks": len(chunks)})
+
+    def test_poll_reads_the_whole_first_snapshot(self):
+        """
+        Test that the first snapshot is read in full, including carried objects, and that an unchanged marker reads nothing.
+        """
+        self.table.put_batch([bus("Bus-1", 1000, 53.3, -6.2), bus("Bus-2", 1060, 53.4, -6.3)])
+        self.commit(1060, {"Bus-1": [1000, "a"], "Bus-2": [1060, "b"]})
+
+        changes = self.feed.poll()
+
+        self.assertEqual(sorted(change.object_id for change in changes["Bus"]), ["Bus-1", "Bus-2"])
+        self.assertEqual(self.feed.snapshot(), 1060)
+        self.assertEqual(self.feed.snapshots(frozenset(["IrishRailTrain", "Bus"])), {"Bus": 1060, "IrishRailTrain": None})
+        self.assertEqual(self.feed.objects["Bus"]["Bus-1"]["timestamp"], 1060)
+        self.assertEqual(self.feed.poll(), {})
+
+    def test_poll_reads_only_changes(self):
+        """
+        Test that later snapshots read only the objects rewritten since the one held, and report removals.
+        """
+        self.table.put_batch([bus("Bus-1", 1000, 53.3, -6.2), bus("Bus-2", 1000, 53.4, -6.3), bus("Bus-3", 1000, 53.5, -6.4)])
+        self.commit(1000, {"Bus-1": [1000, "a"], "Bus-2": [1000, "b"], "Bus-3": [1000, "c"]})
+        self.feed.poll()
+
+        self.table.put(bus("Bus-2", 1060, 53.41, -6.3))
+        self.commit(1060, {"Bus-1": [1000, "a"], "Bus-2": [1060, "b2"]})
+        changes = self.feed.poll()["Bus"]
+
+        updated = [change for change in changes if change.item is not None]
+        removed = [change for change in changes if change.item is None]
+        self.assertEqual([change.object_id for change in updated], ["Bus-2"])
+        self.assertEqual(updated[0].previous_position, (53.4, -6.3))
+        self.assertEqual(updated[0].position, (53.41, -6.3))
+        self.assertEqual([change.object_id for change in removed], ["Bus-3"])
+        self.assertEqual(sorted(self.feed.objects["Bus"]), ["Bus-1", "Bus-2"])
+
+    def test_filter_changes_by_bbox(self):
+        """
+        Test that objects entering or moving within a box are updated, and those leaving it are removed.
+        """
+        self.table.put_batch([bus("Bus-1", 1000, 53.3, -6.2), bus("Bus-2", 1000, 53.3, -6.2), bus("Bus-3", 1000, 52.0, -7.0)])
+        self.commit(1000, {"Bus-1": [1000, "a"], "Bus-2": [1000, "b"], "Bus-3": [1000, "c"]})
+        self.feed.poll()
+
+        # Bus-1 moves within the box, Bus-2 leaves it, Bus-3 enters it
+        self.table.put_batch([bus("Bus-1", 1060, 53.31, -6.2), bus("Bus-2", 1060, 52.0, -7.0), bus("Bus-3", 1060, 53.3, -6.2)])
+        self.commit(1060, {"Bus-1": [1060, "a2"], "Bus-2": [1060, "b2"], "Bus-3": [1060, "c2"]})
+        changes = self.feed.poll()
+        bbox = (-6.5, 53.0, -6.0, 53.5)
+
+        items, removed = filter_changes(changes, frozenset(["Bus"]), bbox)
+
+        self.assertEqual(sorted(item["objectID"] for item in items), ["Bus-1", "Bus-3"])
+        self.assertEqual(removed, ["Bus-2"])
+        self.assertEqual(filter_changes(changes, frozenset(["IrishRailTrain"]), None), ([], []))
+        self.assertEqual(sorted(item["objectID"] for item in filter_objects(self.feed, frozenset(["Bus"]), bbox)), ["Bus-1", "Bus-3"])
+
+    def test_in_box(self):
+        """
+        Test that objects without a position are only in a subscription without a bounding box.
+        """
+        self.assertTrue(in_box(None, None))
+        self.assertFalse(in_box(None, (-7, 53, -6, 54)))
+        self.assertTrue(in_box((53.5, -6.5), (-7, 53, -6, 54)))
+        self.assertFalse(in_box((52.5, -6.5), (-7, 53, -6, 54)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+from shared.snapshots import objects_chunks
+from shared.storage import MemoryTable
+from shared.storage import schemas
+from servers.feed import SnapshotFeed
+from servers import push
+from servers.push import PushServer, Subscriber, format_event, parse_subscription
+
+
+def bus(object_id, timestamp, latitude, longitude):
+    return {"objectID": object_id, "objectType": "Bus", "timestamp": timestamp, "latitude": str(latitude), "longitude": str(longitude)}
+
+
+async def read_event(reader):
+    """Reads the next event from a stream, skipping heartbeats."""
+    while True:
+        block = (await asyncio.wait_for(reader.readuntil(b"\n\n"), 5)).decode("utf-8")
+        if not block.startswith(":"):
+            return json.loads(block.split("data: ", 1)[1])
+
+
+class TestPushServer(unittest.IsolatedAsyncioTestCase):
+    """
+    Unit tests for the server-sent events push server.
+    """
+
+    async def asyncSetUp(self):
+        self.table = MemoryTable("transient_data", schemas.transient_data)
+        self.snapshot_table = MemoryTable("transient_snapshots", schemas.transient_snapshots)
+        self.objects_table = MemoryTable("transient_snapshot_objects", schemas.transient_snapshot_objects)
+        self.table.put_batch([bus("Bus-1", 1000, 53.3, -6.2), bus("Bus-2", 1000, 52.0, -7.0)])
+        self.commit(1000, {"Bus-1": [1000, "a"], "Bus-2": [1000, "b"]})
+        self.server = PushServer(SnapshotFeed(self.table, self.snapshot_table, self.objects_table, ["IrishRailTrain", "Bus"]))
+        await self.server.refresh()
+        self.listener = await asyncio.start_server(self.server.handle_connection, "127.0.0.1", 0)
+        self.port = self.listener.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.listener.close()
+        await self.listener.wait_closed()
+
+    def commit(self, timestamp, objects):
+        chunks = objects_chunks("Bus", timestamp, objects, timestamp + 3600)
+        self.objects_table.put_batch(chunks)
+        self.snapshot_table.put({"objectType": "Bus", "timestamp": timestamp, "objectChunks": len(chunks)})
+
+    async def get(self, target):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+        head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+        return reader, writer, int(head.split(" ")[1])
+
+    def test_parse_subscription(self):
+        """
+        Test that subscriptions default to every objectType and reject unknown ones and malformed boxes.
+        """
+        known = ["IrishRailTrain", "Bus"]
+
+        self.assertEqual(parse_subscription({}, known), (frozenset(known), None))
+        self.assertEqual(parse_subscription({"objectType": "Bus", "bbox": "-7,53,-6,54"}, known), (frozenset(["Bus"]), (-7, 53, -6, 54)))
+        with self.assertRaises(ValueError):
+            parse_subscription({"objectType": "Tram"}, known)
+        with self.assertRaises(ValueError):
+            parse_subscription({"bbox": "-6,53"}, known)
+
+    async def test_slow_subscriber_is_resynchronised(self):
+        """
+        Test that a subscriber whose queue overflows has its pending events replaced by a single resynchronisation.
+        """
+        subscriber = Subscriber(frozenset(["Bus"]), None)
+        subscriber.queue.get_nowait()
+        subscriber.resync = False
+
+        for index in range(push.subscriber_queue_size):
+            self.assertFalse(subscriber.offer(f"event {index}".encode("utf-8")))
+        self.assertTrue(subscriber.offer(b"overflow"))
+
+        self.assertEqual(subscriber.queue.qsize(), 1)
+        self.assertIsNone(subscriber.queue.get_nowait())
+        # Changes arriving before the resynchronisation is sent are already part of it
+        self.assertFalse(subscriber.offer(b"later"))
+        self.assertTrue(subscriber.queue.empty())
+
+    async def test_stream_sends_snapshot_then_changes(self):
+        """
+        Test that a subscriber is sent its whole snapshot, then only the changes within its bounding box.
+        """
+        reader, writer, status = await self.get("/events?objectType=Bus&bbox=-6.5,53,-6,53.5")
+        self.assertEqual(status, 200)
+
+        first = await read_event(reader)
+        self.assertEqual(first["snapshot"], 1000)
+        self.assertEqual(first["full"], ["Bus"])
+        self.assertEqual([item["objectID"] for item in first["items"]], ["Bus-1"])
+
+        # Bus-1 leaves the box and Bus-2 enters it
+        self.table.put_batch([bus("Bus-1", 1060, 52.0, -7.0), bus("Bus-2", 1060, 53.3, -6.2)])
+        self.commit(1060, {"Bus-1": [1060, "a2"], "Bus-2": [1060, "b2"]})
+        await self.server.refresh()
+
+        second = await read_event(reader)
+        self.assertEqual(second["snapshot"], 1060)
+        self.assertEqual(second["snapshots"], {"Bus": 1060})
+        self.assertEqual(second["full"], [])
+        self.assertEqual([item["objectID"] for item in second["items"]], ["Bus-2"])
+        self.assertEqual(second["removed"], ["Bus-1"])
+
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_publish_renders_each_filter_once(self):
+        """
+        Test that subscribers with the same filter share one rendered event, and those with no changes get none.
+        """
+        subscribers = [Subscriber(frozenset(["Bus"]), None) for _ in range(3)] + [Subscriber(frozenset(["IrishRailTrain"]), None)]
+        for subscriber in subscribers:
+            subscriber.queue.get_nowait()
+            subscriber.resync = False
+        self.server.subscribers.update(subscribers)
+
+        self.table.put(bus("Bus-1", 1060, 53.31, -6.2))
+        self.commit(1060, {"Bus-1": [1060, "a2"], "Bus-2": [1000, "b"]})
+        with patch("servers.push.format_event", wraps=format_event) as mock_format_event:
+            await self.server.refresh()
+
+        mock_format_event.assert_called_once()
+        self.assertEqual([subscriber.queue.qsize() for subscriber in subscribers], [1, 1, 1, 0])
+
+    async def test_health_and_invalid_subscription(self):
+        """
+        Test the health summary, and that an unknown objectType is rejected with a 400.
+        """
+        reader, writer, status = await self.get("/health")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(await reader.read()), {"snapshot": 1000, "subscribers": 0, "resyncs": 0})
+        writer.close()
+
+        reader, writer, status = await self.get("/events?objectType=Tram")
+        self.assertEqual(status, 400)
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
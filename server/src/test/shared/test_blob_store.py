@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from shared.blob_store import LocalBlobStore, S3BlobStore, get_blob_store
+
+
+class TestBlobStore(unittest.TestCase):
+    """
+    Unit tests for the snapshot artifact blob stores.
+    """
+
+    def test_local_blob_store_round_trip(self):
+        """
+        Test that a stored blob is read back unchanged and that missing blobs read as None.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            store = LocalBlobStore(directory)
+            store.put("snapshots/Bus/1000.json.gz", b"contents")
+
+            self.assertEqual(store.get("snapshots/Bus/1000.json.gz"), b"contents")
+            self.assertIsNone(store.get("snapshots/Bus/2000.json.gz"))
+            self.assertFalse(os.path.exists(os.path.join(directory, "snapshots/Bus/1000.json.gz.tmp")))
+
+    def test_get_blob_store(self):
+        """
+        Test that the backend is chosen from the environment.
+        """
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsNone(get_blob_store())
+
+        with patch.dict(os.environ, {"SNAPSHOT_BLOB_DIR": "/tmp/artifacts"}, clear=True):
+            self.assertIsInstance(get_blob_store(), LocalBlobStore)
+
+        with patch.dict(os.environ, {"SNAPSHOT_BUCKET": "artifacts", "AWS_DEFAULT_REGION": "us-east-1"}, clear=True):
+            self.assertIsInstance(get_blob_store(), S3BlobStore)
+
+        with patch.dict(os.environ, {"BLOB_BACKEND": "ftp"}, clear=True):
+            with self.assertRaises(ValueError):
+                get_blob_store()
+
+
+if __name__ == "__main__":
+    unittest.main()
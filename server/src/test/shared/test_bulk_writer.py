@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import threading
+from botocore.exceptions import ClientError
+from shared.bulk_writer import bulk_write, dedupe_items
+
+
+def mock_table(responses):
+    """
+    Builds a mock table whose batch_write_item returns (or raises) the given responses in order,
+    then reports every request as fully processed.
+    """
+    table = MagicMock()
+    table.name = "test-table"
+    lock = threading.Lock()
+    written = []
+
+    def batch_write_item(RequestItems):
+        with lock:
+            response = responses.pop(0) if responses else {"UnprocessedItems": {}}
+            if isinstance(response, Exception):
+                raise response
+            unprocessed = response.get("UnprocessedItems", {}).get("test-table", [])
+            for request in RequestItems["test-table"]:
+                if request not in unprocessed:
+                    written.append(request["PutRequest"]["Item"])
+            return response
+
+    table.meta.client.batch_write_item.side_effect = batch_write_item
+    return table, written
+
+
+class TestBulkWriter(unittest.TestCase):
+    """
+    Unit tests for the parallel, throttle-aware DynamoDB bulk writer.
+    """
+
+    def test_dedupe_items(self):
+        """
+        Test that only the last item for each key is kept.
+        """
+        items = [{"objectID": "1", "v": 1}, {"objectID": "2", "v": 1}, {"objectID": "1", "v": 2}]
+
+        self.assertEqual(dedupe_items(items, ("objectID",)), [{"objectID": "1", "v": 2}, {"objectID": "2", "v": 1}])
+
+    def test_bulk_write_shards_batches(self):
+        """
+        Test that every item is written once, in batches of at most 25.
+        """
+        table, written = mock_table([])
+        items = [{"objectID": str(i)} for i in range(260)]
+
+        stats = bulk_write(table, items, ("objectID",), workers=4)
+
+        self.assertEqual(sorted(written, key=lambda item: int(item["objectID"])), items)
+        self.assertEqual(table.meta.client.batch_write_item.call_count, 11)
+        for call in table.meta.client.batch_write_item.call_args_list:
+            self.assertLessEqual(len(call.kwargs["RequestItems"]["test-table"]), 25)
+        self.assertEqual(stats["items"], 260)
+        self.assertEqual(stats["retries"], 0)
+
+    @patch("shared.bulk_writer.time.sleep")
+    def test_bulk_write_retries_unprocessed_and_throttled(self, mock_sleep):
+        """
+        Test that unprocessed items and throttled requests are retried with backoff and counted.
+        """
+        throttled = ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "BatchWriteItem")
+        table, written = mock_table([
+            {"UnprocessedItems": {"test-table": [{"PutRequest": {"Item": {"objectID": "1"}}}]}},
+            throttled
+        ])
+
+        stats = bulk_write(table, [{"objectID": "0"}, {"objectID": "1"}], ("objectID",))
+
+        self.assertEqual(sorted(item["objectID"] for item in written), ["0", "1"])
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch("shared.bulk_writer.time.sleep")
+    def test_bulk_write_gives_up(self, mock_sleep):
+        """
+        Test that a batch which never succeeds raises after the retry limit.
+        """
+        throttled = ClientError({"Error": {"Code": "ThrottlingException"}}, "BatchWriteItem")
+        table, _ = mock_table([throttled] * 5)
+
+        with self.assertRaises(RuntimeError):
+            bulk_write(table, [{"objectID": "0"}], ("objectID",), max_retries=3)
+
+    def test_bulk_write_raises_other_errors(self):
+        """
+        Test that errors other than throttling are not retried.
+        """
+        error = ClientError({"Error": {"Code": "ValidationException"}}, "BatchWriteItem")
+        table, _ = mock_table([error])
+
+        with self.assertRaises(ClientError):
+            bulk_write(table, [{"objectID": "0"}], ("objectID",))
+
+
+if __name__ == "__main__":
+    unittest.main()
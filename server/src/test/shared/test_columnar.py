@@ -0,0 +1,67 @@
+import unittest
+from decimal import Decimal
+from shared.columnar import concat_columnar, parse_format, to_columnar
+
+
+class TestColumnar(unittest.TestCase):
+    """
+    Unit tests for the columnar response format.
+    """
+
+    def test_to_columnar(self):
+        """
+        Test that each attribute becomes one column, with repeated strings dictionary-encoded and coordinates as numbers.
+        """
+        items = [
+            {"objectID": "Bus-1", "objectType": "Bus", "timestamp": Decimal(1000), "latitude": "53.3498", "longitude": "-6.2603"},
+            {"objectID": "Bus-2", "objectType": "Bus", "timestamp": Decimal(1000), "latitude": "51.8985", "longitude": "-8.4756"},
+            {"objectID": "Bus-3", "objectType": "Bus", "timestamp": Decimal(1000), "latitude": "", "busRoute": "46A"},
+            {"objectID": "IrishRailTrain-A1", "objectType": "IrishRailTrain", "timestamp": Decimal(1000)}
+        ]
+
+        columnar = to_columnar(items)
+
+        self.assertEqual(columnar["length"], 4)
+        columns = columnar["columns"]
+        self.assertEqual(list(columns), ["objectID", "objectType", "timestamp", "latitude", "longitude", "busRoute"])
+        self.assertEqual(columns["objectID"], {"values": ["Bus-1", "Bus-2", "Bus-3", "IrishRailTrain-A1"]})
+        self.assertEqual(columns["objectType"], {"dictionary": ["Bus", "IrishRailTrain"], "codes": [0, 0, 0, 1]})
+        self.assertEqual(columns["timestamp"], {"values": [1000, 1000, 1000, 1000]})
+        self.assertEqual(columns["latitude"], {"values": [53.3498, 51.8985, None, None]})
+        self.assertEqual(columns["busRoute"], {"dictionary": ["46A"], "codes": [None, None, 0, None]})
+
+    def test_to_columnar_matches_table_and_ingest(self):
+        """
+        Test that items read back as Decimals encode the same as the items written at ingest.
+        """
+        ingested = [{"objectID": "Bus-1", "timestamp": 1000}, {"objectID": "Bus-2", "timestamp": 1000}]
+        from_table = [{"objectID": "Bus-1", "timestamp": Decimal(1000)}, {"objectID": "Bus-2", "timestamp": Decimal(1000)}]
+        self.assertEqual(to_columnar(ingested), to_columnar(from_table))
+        self.assertEqual(to_columnar([]), {"format": "columnar", "length": 0, "columns": {}})
+
+    def test_concat_columnar(self):
+        """
+        Test that joined columnar bodies match the body of all of their items, re-encoding dictionary columns across them.
+        """
+        items = [
+            {"objectID": "1", "objectType": "BusStop", "latitude": "53.3498"},
+            {"objectID": "2", "objectType": "BusStop"},
+            {"objectID": "3", "objectType": "LuasStop", "latitude": "53.34", "route": "Green"},
+            {"objectID": "4", "objectType": "LuasStop", "latitude": "53.35", "route": "Green"}
+        ]
+
+        self.assertEqual(concat_columnar([to_columnar(items[:2]), to_columnar(items[2:])]), to_columnar(items))
+        self.assertEqual(concat_columnar([to_columnar(items[:1]), to_columnar([])]), to_columnar(items[:1]))
+
+    def test_parse_format(self):
+        """
+        Test that the format defaults to json and unknown formats are rejected.
+        """
+        self.assertEqual(parse_format({}), "json")
+        self.assertEqual(parse_format({"format": "columnar"}), "columnar")
+        with self.assertRaises(ValueError):
+            parse_format({"format": "csv"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from shared.geohash import encode, add_geohash, parse_bbox, covering_cells, covering_prefixes, in_bbox
+
+
+class TestGeohash(unittest.TestCase):
+    """
+    Unit tests for the geohash spatial index helpers.
+    """
+
+    def test_encode(self):
+        """
+        Test that positions are encoded as standard geohashes.
+        """
+        self.assertEqual(encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(encode(53.3498, -6.2603), "gc7x9813h")
+        self.assertEqual(encode(90, 180, 4), "zzzz")
+        self.assertEqual(encode(-90, -180, 4), "0000")
+
+    def test_add_geohash(self):
+        """
+        Test that items with a position get its geohash and prefix, and items without one are left alone.
+        """
+        item = add_geohash({"objectID": "Bus-1", "latitude": "53.3498", "longitude": "-6.2603"})
+        self.assertEqual((item["geohash"], item["geohashPrefix"]), ("gc7x9813h", "gc7x"))
+
+        for item in [{"objectID": "Bus-2"}, {"latitude": "", "longitude": "-6.2"}, {"latitude": "95", "longitude": "0"}]:
+            self.assertNotIn("geohash", add_geohash(item))
+
+    def test_parse_bbox(self):
+        """
+        Test that bounding boxes are parsed as west,south,east,north and malformed ones are rejected.
+        """
+        self.assertEqual(parse_bbox("-6.3,53.33,-6.24,53.36"), (-6.3, 53.33, -6.24, 53.36))
+        for bbox in ["-6.3,53.33,-6.24", "a,b,c,d", "-6.24,53.33,-6.3,53.36", "-6.3,53.36,-6.24,53.33"]:
+            with self.assertRaises(ValueError):
+                parse_bbox(bbox)
+
+    def test_covering_prefixes(self):
+        """
+        Test that a box is covered by the finest cells within the limit, or not at all if it is too large.
+        """
+        dublin = parse_bbox("-6.30,53.33,-6.24,53.36")
+        self.assertEqual(covering_prefixes(dublin, 16), ["gc7x"])
+
+        cells = covering_prefixes(dublin, 16, 7)
+        self.assertEqual(len(cells[0]), 5)
+        self.assertLessEqual(len(cells), 16)
+        self.assertIn(encode(53.3498, -6.2603, 5), cells)
+
+        ireland = parse_bbox("-10.5,51.4,-6.0,55.4")
+        self.assertIsNone(covering_prefixes(ireland, 16))
+        self.assertEqual(len(covering_cells(ireland, 4)), 312)
+
+    def test_in_bbox(self):
+        """
+        Test that items are matched against the exact box.
+        """
+        bbox = (-6.3, 53.33, -6.24, 53.36)
+        self.assertTrue(in_bbox({"latitude": "53.3498", "longitude": "-6.2603"}, bbox))
+        self.assertFalse(in_bbox({"latitude": "53.3498", "longitude": "-6.2"}, bbox))
+        self.assertFalse(in_bbox({"objectID": "Bus-1"}, bbox))
+
+
+if __name__ == '__main__':
+    unittest.main()
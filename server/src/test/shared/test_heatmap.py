@@ -0,0 +1,38 @@
+import unittest
+from decimal import Decimal
+from shared.heatmap import bin_items, coarsen, heatmap_points
+
+
+class TestHeatmap(unittest.TestCase):
+    """
+    Unit tests for the heatmap binning helpers.
+    """
+
+    def test_bin_items(self):
+        """
+        Test that items are counted per cell, using their stored geohash where they have one.
+        """
+        items = [
+            {"geohash": "gc7x9813h"},
+            {"latitude": "53.3499", "longitude": "-6.2604"},
+            {"latitude": "51.8985", "longitude": "-8.4756"},
+            {"objectID": "Bus-4"}
+        ]
+
+        self.assertEqual(bin_items(items), {"gc7x98": 2, "gc1zpp": 1})
+        self.assertEqual(bin_items(items, 3), {"gc7": 2, "gc1": 1})
+
+    def test_coarsen_and_points(self):
+        """
+        Test that counts are summed into coarser cells and returned densest first at the cells' centres.
+        """
+        counts = coarsen({"gc7x98": Decimal(2), "gc7x99": Decimal(3), "gc1zpp": Decimal(1)}, 4)
+        self.assertEqual(counts, {"gc7x": 5, "gc1z": 1})
+
+        points = heatmap_points(counts)
+        self.assertEqual([point[2] for point in points], [5, 1])
+        self.assertEqual(points[0][:2], [53.349609, -6.152344])
+
+
+if __name__ == '__main__':
+    unittest.main()
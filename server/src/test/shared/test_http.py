@@ -0,0 +1,146 @@
+import base64
+import gzip
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+import brotli
+from shared.http import (
+    accepted_encodings, choose_encoding, compress_response, get_header, etag_matches, encode_cursor, decode_cursor, parse_page_request
+)
+
+
+class TestHttp(unittest.TestCase):
+    """
+    Unit tests for the shared request and response helpers.
+    """
+
+    def test_get_header_is_case_insensitive(self):
+        """
+        Test that headers are matched regardless of case.
+        """
+        event = {'headers': {'accept-encoding': 'gzip'}}
+        self.assertEqual(get_header(event, 'Accept-Encoding'), 'gzip')
+        self.assertIsNone(get_header({'headers': None}, 'Accept-Encoding'))
+
+    def test_etag_matches(self):
+        """
+        Test that If-None-Match lists are parsed, that tags are compared weakly, and that * matches any tag.
+        """
+        def matches(if_none_match, etag='W/"abc"'):
+            return etag_matches({'headers': {'If-None-Match': if_none_match}}, etag)
+
+        self.assertTrue(matches('W/"abc"'))
+        self.assertTrue(matches('"xyz", W/"abc"'))
+        self.assertTrue(matches('"abc"'))
+        self.assertTrue(matches('W/"abc"', etag='"abc"'))
+        self.assertTrue(matches('*'))
+        self.assertFalse(matches('"xyz"'))
+        self.assertFalse(etag_matches({}, 'W/"abc"'))
+
+    def test_accepted_encodings_parses_quality_values(self):
+        """
+        Test that each encoding is mapped to its quality value, defaulting to 1.
+        """
+        event = {'headers': {'Accept-Encoding': 'gzip;q=0.8, br, identity;q=0, deflate;q=bad'}}
+        self.assertEqual(accepted_encodings(event), {'gzip': 0.8, 'br': 1.0, 'identity': 0.0, 'deflate': 0.0})
+
+    def test_choose_encoding(self):
+        """
+        Test that brotli is preferred, that quality values are honoured, and that q=0 refuses an encoding.
+        """
+        def choose(accept_encoding):
+            return choose_encoding({'headers': {'Accept-Encoding': accept_encoding}})
+
+        self.assertEqual(choose('gzip, deflate, br'), 'br')
+        self.assertEqual(choose('gzip;q=1, br;q=0.5'), 'gzip')
+        self.assertEqual(choose('br;q=0, gzip'), 'gzip')
+        self.assertEqual(choose('*'), 'br')
+        self.assertIsNone(choose('identity'))
+        self.assertIsNone(choose_encoding({}))
+
+    @patch('shared.http.brotli', None)
+    def test_choose_encoding_without_brotli(self):
+        """
+        Test that gzip is used when brotli isn't installed.
+        """
+        self.assertEqual(choose_encoding({'headers': {'Accept-Encoding': 'br, gzip'}}), 'gzip')
+        self.assertIsNone(choose_encoding({'headers': {'Accept-Encoding': 'br'}}))
+
+    @patch('shared.http.compression_threshold', 100)
+    def test_compress_response(self):
+        """
+        Test that large bodies are compressed and base64-encoded, and that small bodies are left alone.
+        """
+        body = '[' + ', '.join('{"objectID": "%d"}' % index for index in range(50)) + ']'
+        response = {'statusCode': 200, 'headers': {'Content-Type': 'application/json'}, 'body': body}
+
+        compressed = compress_response({'headers': {'Accept-Encoding': 'gzip'}}, response)
+        self.assertTrue(compressed['isBase64Encoded'])
+        self.assertEqual(compressed['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(compressed['headers']['Vary'], 'Accept-Encoding')
+        self.assertEqual(compressed['headers']['Content-Type'], 'application/json')
+        self.assertEqual(gzip.decompress(base64.b64decode(compressed['body'])).decode('utf-8'), body)
+
+        compressed = compress_response({'headers': {'Accept-Encoding': 'br'}}, response)
+        self.assertEqual(compressed['headers']['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(base64.b64decode(compressed['body'])).decode('utf-8'), body)
+
+        # The original response is not modified
+        self.assertEqual(response, {'statusCode': 200, 'headers': {'Content-Type': 'application/json'}, 'body': body})
+
+        uncompressed = compress_response({}, response)
+        self.assertNotIn('Content-Encoding', uncompressed['headers'])
+        self.assertEqual(uncompressed['body'], body)
+
+        small = compress_response({'headers': {'Accept-Encoding': 'gzip'}}, {'statusCode': 200, 'body': '[]'})
+        self.assertNotIn('isBase64Encoded', small)
+        self.assertEqual(small['body'], '[]')
+
+    def test_compress_response_skips_encoded_bodies(self):
+        """
+        Test that responses which are already base64-encoded are returned unchanged.
+        """
+        response = {'statusCode': 200, 'body': 'H4sI', 'isBase64Encoded': True, 'headers': {'Content-Encoding': 'gzip'}}
+        self.assertIs(compress_response({'headers': {'Accept-Encoding': 'br'}}, response), response)
+
+
+    def test_cursor_round_trip(self):
+        """
+        Test that a key survives encoding as a cursor, with its numbers restored.
+        """
+        key = {'objectID': 'Bus-1', 'timestamp': Decimal(1234567890)}
+        cursor = encode_cursor(key)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), {'objectID': 'Bus-1', 'timestamp': 1234567890})
+        self.assertIsNone(encode_cursor(None))
+
+        for cursor in ['not-a-cursor', encode_cursor({'a': 1})[:-2], 'W10']:
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    @patch('shared.http.max_page_limit', 100)
+    def test_parse_page_request(self):
+        """
+        Test that pages are only requested with a limit or cursor, and that the limit is capped.
+        """
+        self.assertEqual(parse_page_request({'queryStringParameters': None}), (None, None))
+        self.assertEqual(parse_page_request({'queryStringParameters': {'limit': '10'}}), (10, None))
+        self.assertEqual(parse_page_request({'queryStringParameters': {'limit': '1000'}}), (100, None))
+
+        cursor = encode_cursor({'objectID': 'Bus-1'})
+        self.assertEqual(parse_page_request({'queryStringParameters': {'cursor': cursor}}), (100, {'objectID': 'Bus-1'}))
+
+        with self.assertRaises(ValueError):
+            parse_page_request({'queryStringParameters': {'limit': '0'}})
+
+        # Given the table's key, cursors must hold exactly its attributes
+        key = ('objectID', 'timestamp')
+        cursor = encode_cursor({'objectID': 'Bus-1', 'timestamp': 1234567890})
+        self.assertEqual(parse_page_request({'queryStringParameters': {'cursor': cursor}}, key)[1], {'objectID': 'Bus-1', 'timestamp': 1234567890})
+        for start_key in [{'objectID': 'Bus-1'}, {'objectID': 'Bus-1', 'timestamp': 1234567890, 'a': 1}, {'objectID': {}, 'timestamp': 1}]:
+            with self.assertRaises(ValueError):
+                parse_page_request({'queryStringParameters': {'cursor': encode_cursor(start_key)}}, key)
+
+
+if __name__ == '__main__':
+    unittest.main()
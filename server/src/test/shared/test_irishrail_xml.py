@@ -0,0 +1,85 @@
+import unittest
+import os
+import xmltodict
+from shared.irishrail_xml import iter_records, iter_trains, iter_stations, parse_public_message
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), '..', 'fixtures', 'irishrail')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as file:
+        return file.read()
+
+
+class TestIrishRailXml(unittest.TestCase):
+    """
+    Unit tests for the streaming Irish Rail XML parser.
+    """
+
+    def test_iter_records_matches_xmltodict(self):
+        """
+        Test that the streamed records match the fields xmltodict extracts from the recorded fixtures.
+        """
+        for train_type in ["M", "S", "D"]:
+            xml = read_fixture(f"getCurrentTrainsXML_WithTrainType_{train_type}.xml")
+            expected = xmltodict.parse(xml)["ArrayOfObjTrainPositions"]["objTrainPositions"]
+            self.assertEqual(list(iter_records(xml, "objTrainPositions")), [dict(train) for train in expected])
+
+        xml = read_fixture("getAllStationsXML.xml")
+        expected = xmltodict.parse(xml)["ArrayOfObjStation"]["objStation"]
+        self.assertEqual(list(iter_records(xml, "objStation")), [dict(station) for station in expected])
+
+    def test_iter_records_single_record(self):
+        """
+        Test that a response containing a single record is still parsed as one record.
+        """
+        xml = "<ArrayOfObjStation><objStation><StationCode>DUB</StationCode><StationAlias /></objStation></ArrayOfObjStation>"
+        self.assertEqual(list(iter_records(xml, "objStation")), [{"StationCode": "DUB", "StationAlias": None}])
+
+    def test_iter_trains(self):
+        """
+        Test that finished train records are produced with the derived attributes.
+        """
+        xml = read_fixture("getCurrentTrainsXML_WithTrainType_D.xml")
+        trains = list(iter_trains(xml, "D", 1234567890, {"IrishRailTrain-E359": 4}))
+
+        self.assertEqual(len(trains), 44)
+        train = next(train for train in trains if train["trainCode"] == "E359")
+        self.assertEqual(train["objectID"], "IrishRailTrain-E359")
+        self.assertEqual(train["timestamp"], 1234567890)
+        self.assertEqual(train["trainTypeFull"], "DART")
+        self.assertEqual(train["trainStatusFull"], "Running")
+        self.assertEqual(train["trainDetails"], "17:45 - Cork to Greystones ")
+        self.assertEqual(train["trainUpdate"], "Departed Tralee next stop Galway")
+        self.assertEqual(train["trainPunctuality"], 2)
+        self.assertEqual(train["latenessMessage"], "2 minutes late")
+        self.assertEqual(train["averagePunctuality"], 4)
+
+    def test_parse_public_message(self):
+        """
+        Test punctuality extraction for early, on-time and late trains.
+        """
+        early = parse_public_message("P1\\n10:00 - A to B (-1 mins late)\\nDeparted A")
+        on_time = parse_public_message("P1\\n10:00 - A to B (0 mins late)\\nDeparted A")
+        late = parse_public_message("P1\\n10:00 - A to B (12 mins late)\\nDeparted A")
+
+        self.assertEqual(early[2:], (-1, "early", "1 minute early"))
+        self.assertEqual(on_time[2:], (0, "on-time", "On time"))
+        self.assertEqual(late[2:], (12, "late", "12 minutes late"))
+
+    def test_iter_stations(self):
+        """
+        Test that station records are produced with and without a station type.
+        """
+        xml = read_fixture("getAllStationsXML.xml")
+        stations = list(iter_stations(xml))
+        typed_stations = list(iter_stations(xml, "M"))
+
+        self.assertEqual(len(stations), 167)
+        self.assertNotIn("trainStationType", stations[0])
+        self.assertEqual(typed_stations[0]["trainStationType"], "M")
+        self.assertEqual(stations[0]["objectID"], "IrishRailStation-" + stations[0]["trainStationCode"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from shared.projection import parse_fields, projection_attributes, select_fields
+
+
+class TestProjection(unittest.TestCase):
+    """
+    Unit tests for the fields parameter of the read handlers.
+    """
+
+    def test_parse_fields(self):
+        """
+        Test that fields are read in order without repeats, including reserved words, and malformed lists are rejected.
+        """
+        self.assertIsNone(parse_fields({}))
+        self.assertEqual(parse_fields({"fields": "objectType, timestamp,objectType"}), ["objectType", "timestamp"])
+
+        for fields in ["", "objectType,,timestamp", "latitude.longitude", "#p0", ",".join(f"field{index}" for index in range(51))]:
+            with self.assertRaises(ValueError):
+                parse_fields({"fields": fields})
+
+    def test_projection_and_selection(self):
+        """
+        Test that attributes the handler needs are projected as well, and removed again from the response.
+        """
+        self.assertIsNone(projection_attributes(None, ("timestamp",)))
+        projection = projection_attributes(["objectType", "latitude"], ("objectType", "latitude", "longitude"))
+        self.assertEqual(projection, ["objectType", "latitude", "longitude"])
+
+        items = [{"objectType": "Bus", "latitude": "53.3", "longitude": "-6.2"}, {"objectType": "Bus"}]
+        self.assertEqual(select_fields(items, ["objectType", "latitude"], projection),
+                         [{"objectType": "Bus", "latitude": "53.3"}, {"objectType": "Bus"}])
+
+        # Nothing is copied when nothing extra was projected
+        self.assertIs(select_fields(items, ["objectType"], ["objectType"]), items)
+        self.assertEqual(select_fields(items, None, None), items)
+        self.assertIs(select_fields(items, None, None)[0], items[0])
+
+        # Whole items lose their index attributes, unless they are requested
+        located = [{"objectType": "Bus", "geohash": "gc7x9813h", "geohashPrefix": "gc7x"}]
+        self.assertEqual(select_fields(located, None, None), [{"objectType": "Bus"}])
+        self.assertEqual(select_fields([{"geohash": "gc7x9813h"}], ["geohash"], ["geohash"]), [{"geohash": "gc7x9813h"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from decimal import Decimal
+from shared.punctuality import average_punctuality, punctuality_increment, with_average
+
+
+class TestPunctuality(unittest.TestCase):
+    """
+    Unit tests for deriving average punctuality from atomically updated totals.
+    """
+
+    def test_punctuality_increment(self):
+        """
+        Test that each observation adds its punctuality to the sum and one to the count.
+        """
+        self.assertEqual(punctuality_increment(-3), {"punctuality_sum": Decimal("-3"), "punctuality_count": 1})
+
+    def test_average_punctuality(self):
+        """
+        Test that averages combine the totals with a running mean recorded before them, weighted by its count.
+        """
+        self.assertEqual(average_punctuality({"punctuality_sum": Decimal("10"), "punctuality_count": 4}), (Decimal("2.5"), 4))
+        self.assertEqual(average_punctuality({"average_punctuality": "4", "count": 3}), (Decimal("4"), 3))
+        self.assertEqual(average_punctuality({"average_punctuality": "4"}), (Decimal("4"), 1))
+        self.assertEqual(
+            average_punctuality({"average_punctuality": Decimal("4"), "count": 3, "punctuality_sum": Decimal("8"), "punctuality_count": 1}),
+            (Decimal("5"), 4)
+        )
+        self.assertEqual(average_punctuality({"objectID": "Train-1"}), (None, 0))
+
+    def test_with_average(self):
+        """
+        Test that totals are replaced by the average and count, and items without them are left as they are.
+        """
+        item = {"objectID": "Train-1", "punctuality_sum": Decimal("9"), "punctuality_count": 3}
+
+        self.assertEqual(with_average(item), {"objectID": "Train-1", "average_punctuality": Decimal("3"), "count": 3})
+        self.assertEqual(with_average({"objectID": "Train-1"}), {"objectID": "Train-1"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import json
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+from shared import serialization
+from shared.serialization import to_json
+
+
+class TestSerialization(unittest.TestCase):
+    """
+    Unit tests for the JSON encoder shared by the read handlers.
+    """
+
+    def test_to_json_emits_numbers(self):
+        """
+        Test that Decimals read back from DynamoDB become JSON numbers, with integers kept integral.
+        """
+        items = [{"objectID": "Bus-1", "timestamp": Decimal(1700000000), "punctuality": Decimal("-2.5"), "latitude": "53.3498"}]
+
+        documents = []
+        for encoder in (serialization.orjson, None):
+            with patch.object(serialization, "orjson", encoder):
+                documents.append(to_json(items))
+        self.assertEqual(json.loads(documents[0]), [{"objectID": "Bus-1", "timestamp": 1700000000, "punctuality": -2.5, "latitude": "53.3498"}])
+
+        # orjson and the standard library fallback render identical documents
+        self.assertEqual(documents[0], documents[1])
+
+    def test_to_json_falls_back(self):
+        """
+        Test that values orjson rejects are still serialized.
+        """
+        document = to_json({"wide": Decimal(2 ** 70), "big": 2 ** 70, "tags": {"b", "a"}, "missing": Decimal("NaN")})
+        self.assertEqual(json.loads(document), {"wide": 2 ** 70, "big": 2 ** 70, "tags": ["a", "b"], "missing": "NaN"})
+        self.assertEqual(json.loads(to_json({1: "a"})), {"1": "a"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import gzip
+import json
+import unittest
+from unittest.mock import patch
+from decimal import Decimal
+from shared.storage import MemoryTable
+from shared.storage import schemas
+from shared.columnar import to_columnar
+from shared.serialization import to_json
+from shared.snapshots import (
+    fingerprint, carried_keys, fetch_carried_items, load_objects, objects_chunks, render_snapshot, render_columnar_snapshot, select_artifact_key, columnar_artifact_key
+)
+
+
+class TestSnapshots(unittest.TestCase):
+    """
+    Unit tests for the snapshot commit marker helpers.
+    """
+
+    def test_fingerprint_ignores_timestamp(self):
+        """
+        Test that the fingerprint only changes when an item's contents change.
+        """
+        item = {"objectID": "Bus-1", "timestamp": 1000, "latitude": "53.1"}
+
+        self.assertEqual(fingerprint(item), fingerprint(dict(item, timestamp=2000)))
+        self.assertNotEqual(fingerprint(item), fingerprint(dict(item, latitude="53.2")))
+
+    def test_carried_keys(self):
+        """
+        Test that only objects written under an earlier timestamp are carried.
+        """
+        snapshot = {"timestamp": 2000, "objects": {"Bus-1": [2000, "aaaa"], "Bus-2": [1800, "bbbb"]}}
+
+        self.assertEqual(carried_keys(snapshot), [{"objectID": "Bus-2", "timestamp": 1800}])
+
+        # Only objects rewritten after a client's snapshot have changed since it
+        snapshot["objects"]["Bus-3"] = [1700, "cccc"]
+        self.assertEqual(carried_keys(snapshot, since=1700), [{"objectID": "Bus-2", "timestamp": 1800}])
+        self.assertEqual(carried_keys(snapshot, since=1800), [])
+
+    def test_carried_keys_by_geohash_prefix(self):
+        """
+        Test that carried objects are limited to the given geohash prefixes, keeping those recorded without one.
+        """
+        snapshot = {"timestamp": 2000, "objects": {
+            "Bus-1": [1800, "aaaa", "gc7x"], "Bus-2": [1800, "bbbb", "gc7w"], "Bus-3": [1800, "cccc"], "Bus-4": [2000, "dddd", "gc7x"]
+        }}
+
+        self.assertEqual([key["objectID"] for key in carried_keys(snapshot, {"gc7x"})], ["Bus-1", "Bus-3"])
+        self.assertEqual(len(carried_keys(snapshot)), 3)
+        self.assertEqual(carried_keys({"timestamp": 2000}), [])
+
+    def test_fetch_carried_items(self):
+        """
+        Test that carried items are fetched from the snapshots they were last written in and restamped.
+        """
+        table = MemoryTable("transient_data", schemas.transient_data)
+        table.put_batch([
+            {"objectID": "Bus-1", "timestamp": 2000},
+            {"objectID": "Bus-2", "timestamp": 1800},
+            {"objectID": "Bus-3", "timestamp": 1700}
+        ])
+        snapshot = {"timestamp": 2000, "objects": {"Bus-1": [2000, "aaaa"], "Bus-2": [1800, "bbbb"], "Bus-3": [1700, "cccc"]}}
+
+        items = fetch_carried_items(table, snapshot)
+
+        self.assertEqual(items, [{"objectID": "Bus-2", "timestamp": 2000}, {"objectID": "Bus-3", "timestamp": 2000}])
+        self.assertEqual(table.get({"objectID": "Bus-2", "timestamp": 1800})["timestamp"], 1800)
+
+    def test_load_objects(self):
+        """
+        Test that a marker's objects are read back from their chunks, and that markers listing them inline are left as they are.
+        """
+        objects_table = MemoryTable("transient_snapshot_objects", schemas.transient_snapshot_objects)
+        objects = {f"Bus-{index}": [2000, "aaaa"] for index in range(5)}
+        with patch("shared.snapshots.objects_chunk_size", 2):
+            chunks = objects_chunks("Bus", 2000, objects, 5600)
+        objects_table.put_batch(chunks)
+        marker = {"objectType": "Bus", "timestamp": 2000, "objectChunks": len(chunks)}
+
+        self.assertEqual([len(chunk["objects"]) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(load_objects(objects_table, marker)["objects"], objects)
+        self.assertNotIn("objects", marker)
+
+        legacy = {"objectType": "Bus", "timestamp": 1900, "objects": {"Bus-1": [1900, "aaaa"]}}
+        self.assertIs(load_objects(objects_table, legacy), legacy)
+        self.assertIsNone(load_objects(objects_table, None))
+
+        # A marker whose chunks have expired can't be resolved
+        with self.assertRaises(RuntimeError):
+            load_objects(objects_table, {"objectType": "Bus", "timestamp": 1800, "objectChunks": 1})
+
+    def test_render_snapshot_matches_table_serialization(self):
+        """
+        Test that rendered numbers match how Decimals read back from DynamoDB are serialized, as JSON numbers.
+        """
+        items = [{"objectID": "IrishRailTrain-A1", "timestamp": 1000, "trainPunctuality": 5, "averagePunctuality": Decimal("2.5")}]
+        from_table = [{"objectID": "IrishRailTrain-A1", "timestamp": Decimal(1000), "trainPunctuality": Decimal(5), "averagePunctuality": Decimal("2.5")}]
+
+        self.assertEqual(gzip.decompress(render_snapshot(items)).decode("utf-8"), to_json(from_table))
+        self.assertEqual(json.loads(gzip.decompress(render_snapshot(items)))[0]["averagePunctuality"], 2.5)
+        self.assertEqual(render_snapshot(items), render_snapshot(items))
+
+    def test_render_columnar_snapshot(self):
+        """
+        Test that the columnar artifact rendered at ingest matches the columnar body built from the table.
+        """
+        items = [{"objectID": "Bus-1", "objectType": "Bus", "timestamp": 1000, "latitude": "53.1"}]
+        from_table = [{"objectID": "Bus-1", "objectType": "Bus", "timestamp": Decimal(1000), "latitude": "53.1"}]
+
+        self.assertEqual(json.loads(gzip.decompress(render_columnar_snapshot(items))), to_columnar(from_table))
+        self.assertEqual(columnar_artifact_key("snapshots/Bus/1000.json.gz"), "snapshots/Bus/1000.columnar.json.gz")
+
+    def test_select_artifact_key(self):
+        """
+        Test that an artifact is only chosen when it answers the request exactly.
+        """
+        all_types = ["IrishRailTrain", "Bus"]
+        train = {"artifactKey": "snapshots/IrishRailTrain/1000.json.gz", "combinedArtifactKey": "snapshots/all/1000.json.gz"}
+        bus = {"artifactKey": "snapshots/Bus/1000.json.gz", "combinedArtifactKey": "snapshots/all/1000.json.gz"}
+        older_bus = {"artifactKey": "snapshots/Bus/900.json.gz", "combinedArtifactKey": "snapshots/all/900.json.gz"}
+
+        self.assertEqual(select_artifact_key(["Bus"], [bus], all_types), "snapshots/Bus/1000.json.gz")
+        self.assertEqual(select_artifact_key(all_types, [train, bus], all_types), "snapshots/all/1000.json.gz")
+        self.assertIsNone(select_artifact_key(all_types, [train, older_bus], all_types))
+        self.assertIsNone(select_artifact_key(all_types, [train, None], all_types))
+        self.assertIsNone(select_artifact_key(["Bus"], [{"timestamp": 1000}], all_types))
+
+
+if __name__ == "__main__":
+    unittest.main()
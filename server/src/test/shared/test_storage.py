@@ -0,0 +1,336 @@
+import os
+import tempfile
+import threading
+import unittest
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+from shared.storage import get_table, parallel_scan, reset_memory_tables, DynamoDBTable, MemoryTable, SQLiteTable
+from shared.storage.parallel_scan import segment_count, item_counts
+from shared.storage import schemas
+from shared.storage.sqlite import decode_item
+
+
+class StorageContract:
+    """
+    Behaviour every local storage backend must share with DynamoDB.
+    """
+
+    def make_table(self, name, schema):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.table = self.make_table("transient_data", schemas.transient_data)
+        self.table.put_batch([
+            {"objectID": "Bus-1", "objectType": "Bus", "timestamp": 1000, "latitude": "53.1"},
+            {"objectID": "Bus-1", "objectType": "Bus", "timestamp": 2000, "latitude": "53.2"},
+            {"objectID": "Bus-2", "objectType": "Bus", "timestamp": 2000, "latitude": "53.3"},
+            {"objectID": "IrishRailTrain-A1", "objectType": "IrishRailTrain", "timestamp": 2000, "latitude": "53.4"}
+        ])
+
+    def test_get(self):
+        item = self.table.get({"objectID": "Bus-1", "timestamp": 2000})
+        self.assertEqual(item["latitude"], "53.2")
+        self.assertEqual(item["timestamp"], Decimal(2000))
+        self.assertEqual(self.table.get({"objectID": "Bus-1", "timestamp": 2000}, projection=["latitude"]), {"latitude": "53.2"})
+        self.assertIsNone(self.table.get({"objectID": "Bus-9", "timestamp": 2000}))
+
+    def test_get_many(self):
+        items = self.table.get_many([
+            {"objectID": "Bus-1", "timestamp": 1000},
+            {"objectID": "Bus-9", "timestamp": 1000},
+            {"objectID": "Bus-2", "timestamp": 2000}
+        ], projection=["objectID"])
+        self.assertEqual(sorted(item["objectID"] for item in items), ["Bus-1", "Bus-2"])
+
+    def test_query_index(self):
+        newest = self.table.query("Bus", index="objectType-index", descending=True, limit=1, projection=["timestamp"])
+        self.assertEqual(newest, [{"timestamp": 2000}])
+
+        items = self.table.query("Bus", sort=("eq", 2000), index="objectType-index")
+        self.assertEqual(sorted(item["objectID"] for item in items), ["Bus-1", "Bus-2"])
+
+    def test_query_table(self):
+        items = self.table.query("Bus-1", sort=("between", 500, 1500))
+        self.assertEqual([item["latitude"] for item in items], ["53.1"])
+        self.assertEqual(len(self.table.query("Bus-1", descending=True)), 2)
+
+    def test_scan_segments(self):
+        segments = [self.table.scan(segment, 3) for segment in range(3)]
+        self.assertEqual(sum(len(items) for items in segments), 4)
+        self.assertEqual(len(self.table.scan(filters={"objectType": ["IrishRailTrain"]})), 1)
+
+    def test_scan_page(self):
+        pages, start_key = [], None
+        while True:
+            items, start_key = self.table.scan_page(3, start_key)
+            pages.append(items)
+            if start_key is None:
+                break
+        self.assertEqual([len(items) for items in pages], [3, 1])
+        keys = [(item["objectID"], item["timestamp"]) for items in pages for item in items]
+        self.assertEqual(len(set(keys)), 4)
+
+        items, start_key = self.table.scan_page(2, filters={"objectType": ["Bus"]}, projection=["objectID"])
+        self.assertEqual(items, [{"objectID": "Bus-1"}, {"objectID": "Bus-1"}])
+        items, start_key = self.table.scan_page(2, start_key, filters={"objectType": ["Bus"]}, projection=["objectID"])
+        self.assertEqual(items, [{"objectID": "Bus-2"}])
+        self.assertIsNone(start_key)
+
+    def test_query_page(self):
+        items, start_key = self.table.query_page("Bus", 2, index="objectType-index", descending=True)
+        self.assertEqual([item["timestamp"] for item in items], [2000, 2000])
+        self.assertEqual(set(start_key), {"objectType", "timestamp", "objectID"})
+
+        items, start_key = self.table.query_page("Bus", 2, start_key, index="objectType-index", descending=True)
+        self.assertEqual([(item["objectID"], item["timestamp"]) for item in items], [("Bus-1", 1000)])
+        self.assertIsNone(start_key)
+
+        items, start_key = self.table.query_page("Bus-1", 1, sort=("gte", 1000))
+        self.assertEqual(items[0]["timestamp"], 1000)
+        items, start_key = self.table.query_page("Bus-1", 1, start_key, sort=("gte", 1000))
+        self.assertEqual(items[0]["timestamp"], 2000)
+
+    def test_put_replaces(self):
+        self.table.put({"objectID": "Bus-2", "objectType": "Coach", "timestamp": 2000})
+        self.assertEqual(len(self.table.query("Bus", sort=("eq", 2000), index="objectType-index")), 1)
+        self.assertEqual(len(self.table.query("Coach", index="objectType-index")), 1)
+
+    def test_put_rejects_floats(self):
+        with self.assertRaises(TypeError):
+            self.table.put({"objectID": "Bus-3", "objectType": "Bus", "timestamp": 3000, "latitude": 53.5})
+
+    def test_put_if_newer(self):
+        snapshots = self.make_table("transient_snapshots", schemas.transient_snapshots)
+        self.assertTrue(snapshots.put_if_newer({"objectType": "Bus", "timestamp": 2000}, "timestamp"))
+        self.assertFalse(snapshots.put_if_newer({"objectType": "Bus", "timestamp": 1900}, "timestamp"))
+        self.assertFalse(snapshots.put_if_newer({"objectType": "Bus", "timestamp": 2000}, "timestamp"))
+        self.assertEqual(snapshots.get({"objectType": "Bus"})["timestamp"], 2000)
+
+    def test_increment_is_atomic(self):
+        versions = self.make_table("dataset_versions", schemas.dataset_versions)
+
+        threads = [threading.Thread(target=lambda: [versions.increment({"dataset": "d"}, {"version": 1}) for _ in range(50)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(versions.increment({"dataset": "d"}, {"version": 1, "sum": 5})["version"], 201)
+
+
+class TestMemoryTable(StorageContract, unittest.TestCase):
+    """
+    Unit tests for the in-memory storage backend.
+    """
+
+    def make_table(self, name, schema):
+        return MemoryTable(name, schema)
+
+
+class TestSQLiteTable(StorageContract, unittest.TestCase):
+    """
+    Unit tests for the SQLite storage backend.
+    """
+
+    def make_table(self, name, schema):
+        return SQLiteTable(os.path.join(self.directory.name, "storage.sqlite3"), name, schema)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        super().setUp()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_items_round_trip_exactly(self):
+        item = {"objectID": "Bus-3", "objectType": "Bus", "timestamp": 3000,
+                "nested": {"values": [Decimal("0.1"), True, None, "x"]}, "precise": Decimal("53.34981234567890123")}
+        self.table.put(item)
+        stored = self.table.get({"objectID": "Bus-3", "timestamp": 3000})
+        self.assertEqual(stored["precise"], Decimal("53.34981234567890123"))
+        self.assertEqual(stored["nested"], {"values": [Decimal("0.1"), True, None, "x"]})
+
+    def test_scan_segments_read_each_row_once(self):
+        with patch("shared.storage.sqlite.decode_item", wraps=decode_item) as mock_decode_item:
+            segments = [self.table.scan(segment, 3) for segment in range(3)]
+        self.assertEqual(sorted(item["latitude"] for items in segments for item in items), ["53.1", "53.2", "53.3", "53.4"])
+        self.assertEqual(mock_decode_item.call_count, 4)
+
+
+class TestDynamoDBTable(unittest.TestCase):
+    """
+    Unit tests for the DynamoDB storage backend's request building and pagination.
+    """
+
+    def setUp(self):
+        self.table = DynamoDBTable("transient_data", schemas.transient_data)
+        self.table.table = MagicMock()
+
+    def test_query_follows_pagination(self):
+        self.table.table.query.side_effect = [
+            {"Items": [{"objectID": "Bus-1"}], "LastEvaluatedKey": "key1"},
+            {"Items": [{"objectID": "Bus-2"}]}
+        ]
+
+        items = self.table.query("Bus", sort=("eq", 2000), index="objectType-index", projection=["objectID"])
+
+        self.assertEqual(items, [{"objectID": "Bus-1"}, {"objectID": "Bus-2"}])
+        first_call, second_call = self.table.table.query.call_args_list
+        self.assertEqual(first_call.kwargs["IndexName"], "objectType-index")
+        self.assertEqual(first_call.kwargs["ExpressionAttributeNames"], {"#p0": "objectID"})
+        self.assertEqual(second_call.kwargs["ExclusiveStartKey"], "key1")
+        condition = first_call.kwargs["KeyConditionExpression"].get_expression()
+        self.assertEqual(condition["values"][1].get_expression()["values"][1], 2000)
+
+    def test_query_with_limit(self):
+        self.table.table.query.return_value = {"Items": [{"timestamp": 2000}], "LastEvaluatedKey": "key1"}
+
+        items = self.table.query("Bus", index="objectType-index", descending=True, limit=1)
+
+        self.assertEqual(items, [{"timestamp": 2000}])
+        self.table.table.query.assert_called_once()
+        self.assertFalse(self.table.table.query.call_args.kwargs["ScanIndexForward"])
+        self.assertEqual(self.table.table.query.call_args.kwargs["Limit"], 1)
+
+    def test_scan_with_segment_and_filter(self):
+        self.table.table.scan.side_effect = [
+            {"Items": [{"objectID": "Bus-1"}], "LastEvaluatedKey": "key1"},
+            {"Items": [{"objectID": "Bus-2"}]}
+        ]
+
+        items = self.table.scan(1, 4, filters={"objectType": ["Bus"]})
+
+        self.assertEqual(len(items), 2)
+        request = self.table.table.scan.call_args_list[1].kwargs
+        self.assertEqual((request["Segment"], request["TotalSegments"]), (1, 4))
+        self.assertIn("FilterExpression", request)
+        self.assertEqual(request["ExclusiveStartKey"], "key1")
+
+    def test_scan_page_fills_page_from_filtered_requests(self):
+        self.table.table.scan.side_effect = [
+            {"Items": [{"objectID": "Bus-1"}], "LastEvaluatedKey": {"objectID": "Bus-1", "timestamp": 1000}},
+            {"Items": [{"objectID": "Bus-2"}], "LastEvaluatedKey": {"objectID": "Bus-2", "timestamp": 1000}}
+        ]
+
+        items, start_key = self.table.scan_page(2, {"objectID": "Bus-0", "timestamp": 1000}, filters={"objectType": ["Bus"]})
+
+        self.assertEqual(items, [{"objectID": "Bus-1"}, {"objectID": "Bus-2"}])
+        self.assertEqual(start_key, {"objectID": "Bus-2", "timestamp": 1000})
+        first_call, second_call = self.table.table.scan.call_args_list
+        self.assertEqual((first_call.kwargs["Limit"], second_call.kwargs["Limit"]), (2, 1))
+        self.assertEqual(first_call.kwargs["ExclusiveStartKey"], {"objectID": "Bus-0", "timestamp": 1000})
+        self.assertEqual(second_call.kwargs["ExclusiveStartKey"], {"objectID": "Bus-1", "timestamp": 1000})
+
+    def test_query_page_ends_without_last_key(self):
+        self.table.table.query.return_value = {"Items": [{"objectID": "Bus-1"}]}
+
+        items, start_key = self.table.query_page("Bus", 5, index="objectType-index")
+
+        self.assertEqual(items, [{"objectID": "Bus-1"}])
+        self.assertIsNone(start_key)
+        self.assertNotIn("ExclusiveStartKey", self.table.table.query.call_args.kwargs)
+
+    @patch("shared.bulk_writer.time.sleep")
+    def test_get_many_retries_unprocessed_keys(self, mock_sleep):
+        self.table.table.meta.client.batch_get_item.side_effect = [
+            {
+                "Responses": {"transient_data": [{"objectID": "Bus-2", "timestamp": 1800}]},
+                "UnprocessedKeys": {"transient_data": {"Keys": [{"objectID": "Bus-3", "timestamp": 1700}]}}
+            },
+            {"Responses": {"transient_data": [{"objectID": "Bus-3", "timestamp": 1700}]}}
+        ]
+
+        items = self.table.get_many([{"objectID": "Bus-2", "timestamp": 1800}, {"objectID": "Bus-3", "timestamp": 1700}])
+
+        self.assertEqual([item["objectID"] for item in items], ["Bus-2", "Bus-3"])
+        self.assertEqual(self.table.table.meta.client.batch_get_item.call_count, 2)
+        # The retry backs off rather than resending at once
+        mock_sleep.assert_called_once()
+
+    def test_get_many_sends_batches_concurrently(self):
+        keys = [{"objectID": f"Bus-{index}", "timestamp": 1000} for index in range(250)]
+        sizes = []
+        def batch_get_item(RequestItems):
+            batch = RequestItems["transient_data"]["Keys"]
+            sizes.append(len(batch))
+            return {"Responses": {"transient_data": batch}}
+        self.table.table.meta.client.batch_get_item.side_effect = batch_get_item
+
+        items = self.table.get_many(keys)
+
+        self.assertEqual(sorted(sizes), [50, 100, 100])
+        # Items are returned in the order of their batches
+        self.assertEqual(items, keys)
+
+    def test_put_if_newer_condition_failure(self):
+        error = type("ConditionalCheckFailedException", (Exception,), {})
+        self.table.table.meta.client.exceptions.ConditionalCheckFailedException = error
+        self.table.table.put_item.side_effect = error()
+
+        self.assertFalse(self.table.put_if_newer({"objectType": "Bus", "timestamp": 1900}, "timestamp"))
+        self.assertIn("#attr < :value", self.table.table.put_item.call_args.kwargs["ConditionExpression"])
+
+    def test_increment(self):
+        self.table.table.update_item.return_value = {"Attributes": {"dataset": "d", "version": 3}}
+
+        self.assertEqual(self.table.increment({"dataset": "d"}, {"version": 1})["version"], 3)
+        request = self.table.table.update_item.call_args.kwargs
+        self.assertEqual(request["UpdateExpression"], "ADD #a0 :a0")
+        self.assertEqual(request["ReturnValues"], "ALL_NEW")
+
+
+class TestParallelScan(unittest.TestCase):
+    """
+    Unit tests for parallel segmented scans.
+    """
+
+    def test_segment_count(self):
+        self.assertEqual(segment_count(0), 1)
+        self.assertEqual(segment_count(12000), 3)
+        self.assertEqual(segment_count(10 ** 9), 32)
+
+    @patch.dict(item_counts, clear=True)
+    def test_parallel_scan_merges_segments_in_order(self):
+        table = MagicMock(wraps=MemoryTable("historical_data", schemas.transient_data))
+        table.name = "historical_data"
+        table.put_batch([{"objectID": f"Bus-{index}", "objectType": "Bus", "timestamp": 1000} for index in range(100)])
+
+        with patch("shared.storage.parallel_scan.scan_segment_items", 10):
+            items = parallel_scan(table, projection=["objectID"])
+
+        self.assertEqual(table.scan.call_count, 10)
+        self.assertEqual(items, [item for segment in range(10) for item in table.scan(segment, 10, projection=["objectID"])])
+        self.assertEqual(sorted(item["objectID"] for item in items), sorted(f"Bus-{index}" for index in range(100)))
+
+        # The estimated item count is only read once per hour
+        parallel_scan(table, filters={"objectType": ["Train"]})
+        table.estimated_item_count.assert_called_once()
+
+
+class TestGetTable(unittest.TestCase):
+    """
+    Unit tests for storage backend selection.
+    """
+
+    def test_get_table(self):
+        with patch.dict(os.environ, {"STORAGE_BACKEND": "memory"}):
+            table = get_table("transient_data", schemas.transient_data)
+            self.assertIsInstance(table, MemoryTable)
+            self.assertIs(get_table("transient_data", schemas.transient_data), table)
+        reset_memory_tables()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "storage.sqlite3")
+            with patch.dict(os.environ, {"STORAGE_BACKEND": "sqlite", "STORAGE_SQLITE_PATH": path}):
+                self.assertIsInstance(get_table("transient_data", schemas.transient_data), SQLiteTable)
+
+        self.assertIsInstance(get_table("transient_data", schemas.transient_data), DynamoDBTable)
+
+        with patch.dict(os.environ, {"STORAGE_BACKEND": "cassandra"}):
+            with self.assertRaises(ValueError):
+                get_table("transient_data", schemas.transient_data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,18 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import json
-from functions.update_average_punctuality.lambda_function import lambda_handler, fetch_train_data, update_punctuality, update_punctuality_by_timestamp
+from decimal import Decimal
+from functions.update_average_punctuality.lambda_function import (
+    lambda_handler,
+    fetch_train_data,
+    update_punctuality,
+    update_punctualities,
+    update_punctuality_by_timestamp,
+    bump_punctuality_version
+)
+from shared.punctuality import average_punctuality
+from shared.storage import MemoryTable
+from shared.storage import schemas
 
 
 class TestPunctualityLambda(unittest.TestCase):
@@ -75,44 +86,67 @@ class TestPunctualityLambda(unittest.TestCase):
         self.assertEqual(result, [])
 
 
-    ### ✅ TEST PUNCTUALITY UPDATES IN DYNAMODB ✅ ###
+    ### ✅ TEST PUNCTUALITY UPDATES IN STORAGE ✅ ###
 
-    @patch("functions.update_average_punctuality.lambda_function.table_train.get_item")
-    @patch("functions.update_average_punctuality.lambda_function.table_train.update_item")
-    @patch("functions.update_average_punctuality.lambda_function.table_train.put_item")
-    def test_update_punctuality_existing_train(self, mock_put, mock_update, mock_get):
+    @patch("functions.update_average_punctuality.lambda_function.table_train",
+           new_callable=lambda: MemoryTable("punctuality_by_objectID", schemas.punctuality_by_objectID))
+    def test_update_punctuality_existing_train(self, table_train):
         """
-        Test updating punctuality for an existing train record.
+        Test that updating a train recorded as a running mean adds to its totals, and the mean is folded into the average.
         """
-        mock_get.return_value = {"Item": {"objectID": "Train-1", "average_punctuality": "90", "count": 2}}
+        table_train.put({"objectID": "Train-1", "average_punctuality": Decimal("90"), "count": 2})
 
-        update_punctuality("Train-1", 95)
+        update_punctuality("Train-1", 96)
 
-        mock_update.assert_called_once()
-        mock_put.assert_not_called()
+        item = table_train.get({"objectID": "Train-1"})
+        self.assertEqual(item["punctuality_sum"], Decimal("96"))
+        self.assertEqual(item["punctuality_count"], 1)
+        self.assertEqual(average_punctuality(item), (Decimal("92"), 3))
 
-    @patch("functions.update_average_punctuality.lambda_function.table_train.get_item")
-    @patch("functions.update_average_punctuality.lambda_function.table_train.update_item")
-    @patch("functions.update_average_punctuality.lambda_function.table_train.put_item")
-    def test_update_punctuality_new_train(self, mock_put, mock_update, mock_get):
+    @patch("functions.update_average_punctuality.lambda_function.table_train",
+           new_callable=lambda: MemoryTable("punctuality_by_objectID", schemas.punctuality_by_objectID))
+    def test_update_punctuality_new_train(self, table_train):
         """
         Test inserting a new train punctuality record when the train does not exist.
         """
-        mock_get.return_value = {}  # No existing record
-
         update_punctuality("Train-2", 88)
 
-        mock_put.assert_called_once()
-        mock_update.assert_not_called()
+        item = table_train.get({"objectID": "Train-2"})
+        self.assertEqual(item, {"objectID": "Train-2", "punctuality_sum": Decimal("88"), "punctuality_count": 1})
+        self.assertEqual(average_punctuality(item), (Decimal("88"), 1))
+
+    @patch("functions.update_average_punctuality.lambda_function.table_train",
+           new_callable=lambda: MemoryTable("punctuality_by_objectID", schemas.punctuality_by_objectID))
+    def test_update_punctualities_concurrently(self, table_train):
+        """
+        Test that concurrent updates, including several to the same train, are all counted.
+        """
+        update_punctualities([("Train-1", minutes) for minutes in range(100)] + [("Train-2", 5)])
+
+        self.assertEqual(average_punctuality(table_train.get({"objectID": "Train-1"})), (Decimal("49.5"), 100))
+        self.assertEqual(average_punctuality(table_train.get({"objectID": "Train-2"})), (Decimal("5"), 1))
 
-    @patch("functions.update_average_punctuality.lambda_function.table_timestamp.put_item")
-    def test_update_punctuality_by_timestamp(self, mock_put):
+    @patch("functions.update_average_punctuality.lambda_function.table_timestamp",
+           new_callable=lambda: MemoryTable("punctuality_by_timestamp", schemas.punctuality_by_timestamp))
+    def test_update_punctuality_by_timestamp(self, table_timestamp):
         """
         Test updating punctuality by timestamp.
         """
         update_punctuality_by_timestamp(1711814400, [90, 85, 80])
 
-        mock_put.assert_called_once()
+        item = table_timestamp.get({"timestamp": 1711814400})
+        self.assertEqual(item["average_punctuality"], Decimal("85.0"))
+
+    @patch("functions.update_average_punctuality.lambda_function.table_versions",
+           new_callable=lambda: MemoryTable("dataset_versions", schemas.dataset_versions))
+    def test_bump_punctuality_version(self, table_versions):
+        """
+        Test that each bump increments the punctuality dataset version.
+        """
+        bump_punctuality_version()
+        bump_punctuality_version()
+
+        self.assertEqual(table_versions.get({"dataset": "punctuality_by_objectID"})["version"], 2)
 
 
     ### ✅ TEST LAMBDA HANDLER EXECUTION ✅ ###
@@ -120,7 +154,8 @@ class TestPunctualityLambda(unittest.TestCase):
     @patch("functions.update_average_punctuality.lambda_function.fetch_train_data")
     @patch("functions.update_average_punctuality.lambda_function.update_punctuality")
     @patch("functions.update_average_punctuality.lambda_function.update_punctuality_by_timestamp")
-    def test_lambda_handler_success(self, mock_update_by_timestamp, mock_update_punctuality, mock_fetch_data):
+    @patch("functions.update_average_punctuality.lambda_function.bump_punctuality_version")
+    def test_lambda_handler_success(self, mock_bump_version, mock_update_by_timestamp, mock_update_punctuality, mock_fetch_data):
         """
         Test successful execution of the lambda handler.
         """
@@ -136,6 +171,7 @@ class TestPunctualityLambda(unittest.TestCase):
         self.assertIn("Punctuality data updated successfully", result["body"])
         mock_update_punctuality.assert_called()
         mock_update_by_timestamp.assert_called_once()
+        mock_bump_version.assert_called_once()
 
     @patch("functions.update_average_punctuality.lambda_function.fetch_train_data")
     def test_lambda_handler_no_data(self, mock_fetch_data):
@@ -168,7 +204,8 @@ class TestPunctualityLambda(unittest.TestCase):
     @patch("functions.update_average_punctuality.lambda_function.fetch_train_data")
     @patch("functions.update_average_punctuality.lambda_function.update_punctuality")
     @patch("functions.update_average_punctuality.lambda_function.update_punctuality_by_timestamp")
-    def test_lambda_handler_single_train_entry(self, mock_update_by_timestamp, mock_update_punctuality, mock_fetch_data):
+    @patch("functions.update_average_punctuality.lambda_function.bump_punctuality_version")
+    def test_lambda_handler_single_train_entry(self, mock_bump_version, mock_update_by_timestamp, mock_update_punctuality, mock_fetch_data):
         """
         Test lambda handler with a single train data entry.
         """